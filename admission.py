@@ -0,0 +1,154 @@
+"""
+בקרת כניסה לעבודה כבדה (הורדת סרטונים ופרסום) - מגבלת מקביליות לכל משתמש וגלובלית, תור, ודחייה כשהדיסק או הזיכרון בגבול
+"""
+import asyncio
+import os
+import shutil
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from exceptions import ResourceLimitError
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+def _rss_mb() -> Optional[float]:
+    """הזיכרון שהתהליך תופס כרגע (RSS) ב-MB - None אם לא ידוע (לא Linux)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+class AdmissionController:
+    """עד max_concurrent עבודות במקביל (ועד max_per_user למשתמש); עבודה נוספת ממתינה בתור של עד max_queue לפי סדר ההגעה
+
+    לפני כניסה נבדק שאחרי הקבצים שבדרך נשארים לפחות min_free_disk_mb פנויים ב-temp_dir,
+    ושה-RSS של התהליך מתחת ל-max_rss_mb (0 - בלי בדיקה) - אחרת ResourceLimitError.
+    """
+
+    def __init__(self, max_concurrent: int, max_per_user: int, max_queue: int,
+                 temp_dir: str, min_free_disk_mb: float = 0, max_rss_mb: float = 0):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.temp_dir = temp_dir
+        self.min_free_disk_mb = min_free_disk_mb
+        self.max_rss_mb = max_rss_mb
+
+        self.active = 0
+        self._user_active: Dict[int, int] = {}
+        self._waiters: List[Tuple[int, float, asyncio.Future]] = []
+        # גודל הקבצים של העבודות שרצות - נספר כתפוס גם לפני שההורדה הסתיימה
+        self.reserved_mb = 0.0
+
+        # מונים לניטור
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def check_resources(self, size_mb: float = 0.0):
+        """דחייה (ResourceLimitError) אם אין מספיק מקום בדיסק לקובץ או שהזיכרון בגבול"""
+        if self.min_free_disk_mb:
+            path = self.temp_dir if os.path.isdir(self.temp_dir) else '.'
+            free_mb = shutil.disk_usage(path).free / (1024 * 1024)
+            if free_mb - self.reserved_mb - size_mb < self.min_free_disk_mb:
+                self._reject(f"מקום פנוי בדיסק: {free_mb:.0f}MB")
+
+        if self.max_rss_mb:
+            rss_mb = _rss_mb()
+            if rss_mb is not None and rss_mb > self.max_rss_mb:
+                self._reject(f"זיכרון התהליך: {rss_mb:.0f}MB")
+
+    @asynccontextmanager
+    async def admit(self, user_id: int, size_mb: float = 0.0,
+                    on_queued: Optional[Callable[[int], Awaitable]] = None,
+                    check_resources: bool = True):
+        """מקום לעבודה אחת - מיד אם יש, אחרת בתור (on_queued מקבל את המקום בתור); משתחרר ביציאה"""
+        if check_resources:
+            self.check_resources(size_mb)
+
+        if self._can_start(user_id):
+            self._start(user_id, size_mb)
+        else:
+            await self._wait_in_queue(user_id, size_mb, on_queued)
+
+            # בזמן ההמתנה הדיסק או הזיכרון אולי התמלאו
+            if check_resources:
+                try:
+                    self.check_resources()
+                except ResourceLimitError:
+                    self._finish(user_id, size_mb)
+                    raise
+
+        try:
+            yield
+        finally:
+            self._finish(user_id, size_mb)
+
+    def queue_length(self) -> int:
+        """כמה עבודות ממתינות"""
+        return len(self._waiters)
+
+    def _can_start(self, user_id: int) -> bool:
+        return self.active < self.max_concurrent and self._user_active.get(user_id, 0) < self.max_per_user
+
+    def _start(self, user_id: int, size_mb: float):
+        self.active += 1
+        self._user_active[user_id] = self._user_active.get(user_id, 0) + 1
+        self.reserved_mb += size_mb
+        self.admitted += 1
+
+    def _finish(self, user_id: int, size_mb: float):
+        """שחרור המקום והעברתו לממתינים"""
+        self.active -= 1
+        self._user_active[user_id] -= 1
+        if not self._user_active[user_id]:
+            del self._user_active[user_id]
+        self.reserved_mb = max(0.0, self.reserved_mb - size_mb)
+
+        self._grant()
+
+    def _grant(self):
+        """הממתינים הראשונים שיכולים להתחיל (משתמש שכבר בגבול שלו לא עוצר את מי שאחריו)"""
+        for waiter in list(self._waiters):
+            if self.active >= self.max_concurrent:
+                return
+
+            user_id, size_mb, future = waiter
+            if self._can_start(user_id):
+                self._waiters.remove(waiter)
+                self._start(user_id, size_mb)
+                future.set_result(None)
+
+    async def _wait_in_queue(self, user_id: int, size_mb: float,
+                             on_queued: Optional[Callable[[int], Awaitable]]):
+        """המתנה בתור עד שהמקום מועבר אלינו (ב-_grant)"""
+        if len(self._waiters) >= self.max_queue:
+            self._reject(f"התור מלא ({self.max_queue})")
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (user_id, size_mb, future)
+        self._waiters.append(waiter)
+        self.queued += 1
+
+        try:
+            if on_queued:
+                try:
+                    await on_queued(len(self._waiters))
+                except Exception as e:
+                    logger.warning(f"שגיאה בהודעה על מקום בתור: {e}")
+            await future
+        except BaseException:
+            # ביטול בזמן ההמתנה - יוצאים מהתור, ואם המקום כבר הועבר אלינו משחררים אותו
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif future.done() and not future.cancelled():
+                self._finish(user_id, size_mb)
+            raise
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        logger.warning(f"עבודה חדשה נדחתה - {reason}")
+        raise ResourceLimitError(reason)
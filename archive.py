@@ -0,0 +1,88 @@
+"""
+ארכוב מסמכים לקבצי JSONL דחוסים (gzip) מחולקים לפי תאריך - ההיסטוריה נשארת זמינה לשאילתות offline
+"""
+import gzip
+import os
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List
+
+from bson import json_util
+
+from exceptions import ArchiveError
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+def iter_batches(cursor: Iterable[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    """חלוקת cursor לאצוות - המסמכים נקראים מהשרת בזרם, לא כולם לזיכרון"""
+    batch = []
+
+    for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+class PartitionedArchive:
+    """כתיבה ל-<root>/<collection>/date=YYYY-MM-DD/part-<run>-<n>.jsonl.gz - קובץ חדש לכל אצווה ויום"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.run_id = datetime.now().strftime('%Y%m%dT%H%M%S')
+        self._sequence = 0
+
+    def write_batch(self, collection_name: str, documents: List[Dict], date_field: str) -> List[str]:
+        """כתיבת אצווה, אימות כל קובץ ורק אז העברה לשם הסופי - מחזיר את נתיבי הקבצים"""
+        partitions: Dict[str, List[Dict]] = {}
+        for document in documents:
+            timestamp = document.get(date_field)
+            day = timestamp.date().isoformat() if isinstance(timestamp, datetime) else 'unknown'
+            partitions.setdefault(day, []).append(document)
+
+        self._sequence += 1
+        paths = []
+
+        for day, partition_documents in sorted(partitions.items()):
+            directory = os.path.join(self.root, collection_name, f"date={day}")
+            path = os.path.join(directory, f"part-{self.run_id}-{self._sequence:05d}.jsonl.gz")
+            temp_path = path + '.tmp'
+
+            try:
+                os.makedirs(directory, exist_ok=True)
+                self._write(temp_path, partition_documents)
+                self._verify(temp_path, [document['_id'] for document in partition_documents])
+                os.replace(temp_path, path)
+
+            except Exception as e:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                if isinstance(e, ArchiveError):
+                    raise
+                raise ArchiveError(f"{path}: {e}")
+
+            paths.append(path)
+
+        return paths
+
+    @staticmethod
+    def _write(path: str, documents: List[Dict]):
+        """כתיבת הקובץ הדחוס וסנכרון לדיסק (fsync) - לפני שהמסמכים נמחקים מהמסד"""
+        with open(path, 'wb') as raw_file:
+            with gzip.GzipFile(fileobj=raw_file, mode='wb') as archive_file:
+                for document in documents:
+                    archive_file.write((json_util.dumps(document, ensure_ascii=False) + '\n').encode('utf-8'))
+
+            raw_file.flush()
+            os.fsync(raw_file.fileno())
+
+    @staticmethod
+    def _verify(path: str, expected_ids: List):
+        """קריאה חוזרת של הקובץ - אותם מסמכים באותו סדר"""
+        with gzip.open(path, 'rt', encoding='utf-8') as archive_file:
+            archived_ids = [json_util.loads(line)['_id'] for line in archive_file]
+
+        if archived_ids != expected_ids:
+            raise ArchiveError(f"אימות {path} נכשל ({len(archived_ids)}/{len(expected_ids)} מסמכים)")
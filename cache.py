@@ -0,0 +1,73 @@
+"""
+מטמון בזיכרון עם תפוגה (TTL) ופינוי LRU
+"""
+import copy
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+class TTLCache:
+    """מטמון חסום בגודל - רשומות פגות אחרי ttl_seconds, והישנה ביותר בשימוש מפונה כשהמטמון מלא"""
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 300):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # עולה בכל ביטול - ערך שנקרא מהמסד לפני ביטול לא נשמר אחריו (ראו set)
+        self.generation = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """מחזיר עותק של הערך השמור, או default אם לא קיים / פג תוקף"""
+        entry = self._data.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        # סימון כשימוש אחרון (LRU)
+        self._data.move_to_end(key)
+        self.hits += 1
+
+        # עותק - כדי ששינוי אצל הקורא לא ישנה את המטמון
+        return copy.deepcopy(value)
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None,
+            generation: Optional[int] = None):
+        """שמירת ערך (עותק) במטמון - generation הוא self.generation מלפני הקריאה מהמסד; אם היה ביטול מאז,
+        הערך אולי כבר ישן והוא לא נשמר"""
+        if generation is not None and generation != self.generation:
+            return
+
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+
+        self._data[key] = (copy.deepcopy(value), time.monotonic() + ttl)
+        self._data.move_to_end(key)
+
+        # פינוי הרשומות הישנות ביותר
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """מחיקת רשומה מהמטמון"""
+        self._data.pop(key, None)
+        self.generation += 1
+
+    def clear(self):
+        """ריקון המטמון"""
+        self._data.clear()
+        self.generation += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,134 @@
+"""
+ביטול רשומות במטמונים המקומיים לפי change streams - שינוי שנכתב בתהליך אחד נראה מיד בכל התהליכים
+"""
+import asyncio
+from typing import Dict, List
+
+from cache import TTLCache
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# אירועים שמסמך מלא (updateLookup) מזהה בהם את הרשומה במטמון
+DOCUMENT_OPERATIONS = ('insert', 'update', 'replace')
+
+class _CacheTarget:
+    """מטמון שמאזין לקולקשן - key_field הוא השדה במסמך שמשמש כמפתח במטמון"""
+
+    def __init__(self, cache: TTLCache, key_field: str, live_ttl: float, fallback_ttl: float):
+        self.cache = cache
+        self.key_field = key_field
+        self.live_ttl = live_ttl
+        self.fallback_ttl = fallback_ttl
+
+def _change_pipeline(key_fields: List[str]) -> List[Dict]:
+    """רק סוג האירוע ושדות המפתח נשלחים מהשרת (_id נשאר - הוא ה-resume token)"""
+    projection = {'operationType': 1}
+    for field in key_fields:
+        projection[f'fullDocument.{field}'] = 1
+
+    return [{'$project': projection}]
+
+class ChangeStreamInvalidator:
+    """מאזין ל-change stream לכל קולקשן רשום ומוחק את הרשומות שהשתנו מהמטמונים"""
+
+    def __init__(self, db, retry_interval: float = 60.0):
+        self.db = db
+        self.retry_interval = retry_interval
+
+        self._targets: Dict[str, List[_CacheTarget]] = {}
+        self._tasks: List[asyncio.Task] = []
+
+        # קולקשנים שה-stream שלהם פעיל כרגע, ומונה לניטור
+        self.live = set()
+        self.invalidations = 0
+
+        # קולקשנים שכבר הוזהרנו עליהם - כדי לא להציף את הלוג בשרת ללא replica set
+        self._warned = set()
+
+    def register(self, collection_name: str, cache: TTLCache, key_field: str, live_ttl: float):
+        """רישום מטמון - כל עוד ה-stream פעיל הוא משתמש ב-live_ttl, אחרת ב-TTL המקורי שלו"""
+        self._targets.setdefault(collection_name, []).append(
+            _CacheTarget(cache, key_field, live_ttl, cache.ttl_seconds)
+        )
+
+    def start(self):
+        """הפעלת מאזין לכל קולקשן רשום (דורש לולאת אירועים פעילה)"""
+        if self._tasks:
+            return
+
+        for collection_name in self._targets:
+            self._tasks.append(
+                asyncio.create_task(self._watch(collection_name), name=f"cache-invalidator-{collection_name}")
+            )
+
+    def stop(self):
+        """עצירת המאזינים"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _watch(self, collection_name: str):
+        """לולאת האזנה - בשגיאה חוזרים ל-TTL הרגיל ומנסים שוב אחרי retry_interval"""
+        targets = self._targets[collection_name]
+        pipeline = _change_pipeline(sorted({target.key_field for target in targets}))
+        resume_token = None
+
+        while True:
+            try:
+                async with self.db[collection_name].watch(
+                    pipeline, full_document='updateLookup', resume_after=resume_token
+                ) as stream:
+                    self._go_live(collection_name)
+
+                    async for change in stream:
+                        self._apply(collection_name, change)
+                        resume_token = stream.resume_token
+
+                # ה-stream נסגר (למשל הקולקשן נמחק) - פותחים חדש בלי resume token
+                resume_token = None
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._fall_back(collection_name, e)
+                resume_token = None
+                await asyncio.sleep(self.retry_interval)
+
+    def _apply(self, collection_name: str, change: Dict):
+        """מחיקת הרשומה שהשתנתה - כולל כתיבות של התהליך הזה (קריאה נוספת אחת, בלי סיכון לערך ישן)"""
+        operation = change.get('operationType')
+        document = change.get('fullDocument') or {}
+
+        for target in self._targets[collection_name]:
+            key = document.get(target.key_field) if operation in DOCUMENT_OPERATIONS else None
+
+            if key is not None:
+                target.cache.invalidate(key)
+            else:
+                # מחיקה / drop / מסמך שכבר לא קיים - אין מפתח, מרוקנים את כל המטמון
+                target.cache.clear()
+
+            self.invalidations += 1
+
+    def _go_live(self, collection_name: str):
+        """ה-stream פעיל - המטמונים עוברים ל-TTL הארוך"""
+        for target in self._targets[collection_name]:
+            target.cache.ttl_seconds = target.live_ttl
+
+        self.live.add(collection_name)
+        logger.info(f"ביטול מטמון לפי change stream פעיל על {collection_name}")
+
+    def _fall_back(self, collection_name: str, error: Exception):
+        """אין stream - חזרה ל-TTL הקצר וריקון רשומות שנשמרו עם TTL ארוך (ייתכן שפספסנו שינויים)"""
+        for target in self._targets[collection_name]:
+            target.cache.ttl_seconds = target.fallback_ttl
+            target.cache.clear()
+
+        if collection_name in self.live or collection_name not in self._warned:
+            logger.warning(f"change stream על {collection_name} לא זמין - המטמון פג לפי TTL בלבד: {error}")
+        else:
+            logger.debug(f"change stream על {collection_name} עדיין לא זמין: {error}")
+
+        self._warned.add(collection_name)
+        self.live.discard(collection_name)
@@ -2,11 +2,20 @@
 תצורת הבוט - כל ההגדרות והקונפיגורציה
 """
 import os
+import secrets
 from dotenv import load_dotenv
 
 # טוען משתני סביבה מקובץ .env
 load_dotenv()
 
+def _operation_class(prefix: str, read_preference: str, write_concern: str, max_time_ms: int) -> dict:
+    """הגדרות סוג פעולה במסד הנתונים ממשתני סביבה DB_<prefix>_*"""
+    return {
+        'read_preference': os.getenv(f'DB_{prefix}_READ_PREFERENCE', read_preference),
+        'write_concern': os.getenv(f'DB_{prefix}_WRITE_CONCERN', write_concern),
+        'max_time_ms': int(os.getenv(f'DB_{prefix}_MAX_TIME_MS', str(max_time_ms)))
+    }
+
 class Config:
     """הגדרות כלליות של הבוט"""
     
@@ -14,10 +23,101 @@ class Config:
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
     TELEGRAM_CHANNEL_ID = os.getenv('TELEGRAM_CHANNEL_ID')  # לפרסום בערוץ טלגרם
     
+    # מצב הרצה: polling, או webhook - שרת HTTP מוטמע שמקבל את העדכונים ועונה ל-/health ו-/ready
+    # WEBHOOK_URL - הכתובת הציבורית של השירות (ב-Render נקבעת אוטומטית ב-RENDER_EXTERNAL_URL)
+    # ערך ריק (כמו ב-.env.template) נחשב כלא מוגדר
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL') or os.getenv('RENDER_EXTERNAL_URL', '')
+    BOT_RUN_MODE = (os.getenv('BOT_RUN_MODE') or ('webhook' if WEBHOOK_URL else 'polling')).lower()
+    WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    PORT = int(os.getenv('PORT', '8080'))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+    # בלי ערך - טוקן אקראי לכל הפעלה (נרשם בטלגרם ב-setWebhook); עם כמה מופעים חובה להגדיר ערך משותף
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN') or secrets.token_urlsafe(32)
+    
+    # עיבוד עדכונים במקביל - עד UPDATE_CONCURRENCY בו-זמנית (1 = אחד אחרי השני), עדכוני אותו משתמש תמיד לפי הסדר
+    # UPDATE_MAX_PENDING - מקסימום עדכונים בעיבוד (רצים + ממתינים לתור של המשתמש) - מעבר לזה עדכונים ממתינים בכניסה
+    UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '16'))
+    UPDATE_MAX_PENDING = int(os.getenv('UPDATE_MAX_PENDING', '256'))
+    
+    # תצוגות מקדימות שממתינות לאישור - עד SESSION_MAX_PER_USER למשתמש (החדשה דוחקת את הישנה), ותפוגה אחרי SESSION_TTL
+    # SESSION_PERSISTENCE - שמירת הסשנים ב-MongoDB, כדי שתצוגות מקדימות ישרדו הפעלה מחדש (הקבצים הזמניים נשארים בדיסק)
+    SESSION_TTL = int(os.getenv('SESSION_TTL', '3600'))  # שניות
+    SESSION_MAX_PER_USER = int(os.getenv('SESSION_MAX_PER_USER', '5'))
+    SESSION_PERSISTENCE = os.getenv('SESSION_PERSISTENCE', 'False').lower() == 'true'
+    
+    # עריכת הודעות התקדמות ותוצאות - עד עריכה אחת ל-MESSAGE_EDIT_CHAT_INTERVAL שניות בצ'אט ו-MESSAGE_EDIT_GLOBAL_RATE בשנייה בסך הכל
+    MESSAGE_EDIT_CHAT_INTERVAL = float(os.getenv('MESSAGE_EDIT_CHAT_INTERVAL', '1.0'))  # שניות
+    MESSAGE_EDIT_GLOBAL_RATE = float(os.getenv('MESSAGE_EDIT_GLOBAL_RATE', '25'))
+    
+    # בקרת כניסה להורדות ופרסומים - עד ADMISSION_MAX_CONCURRENT במקביל (ADMISSION_MAX_PER_USER למשתמש), השאר בתור של עד ADMISSION_MAX_QUEUE
+    # סרטון חדש נדחה אם אחריו יישארו פחות מ-ADMISSION_MIN_FREE_DISK_MB פנויים ב-TEMP_FOLDER, או שה-RSS מעל ADMISSION_MAX_RSS_MB (0 = בלי בדיקה)
+    ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', '4'))
+    ADMISSION_MAX_PER_USER = int(os.getenv('ADMISSION_MAX_PER_USER', '1'))
+    ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '50'))
+    ADMISSION_MIN_FREE_DISK_MB = float(os.getenv('ADMISSION_MIN_FREE_DISK_MB', '200'))
+    ADMISSION_MAX_RSS_MB = float(os.getenv('ADMISSION_MAX_RSS_MB', '0'))
+    
+    # אלבומים (כמה סרטונים בהודעה אחת) - הפריטים נאספים עד MEDIA_GROUP_WAIT שניות בלי פריט חדש, ומורדים עד ALBUM_DOWNLOAD_CONCURRENCY במקביל
+    MEDIA_GROUP_WAIT = float(os.getenv('MEDIA_GROUP_WAIT', '1.5'))  # שניות
+    ALBUM_DOWNLOAD_CONCURRENCY = int(os.getenv('ALBUM_DOWNLOAD_CONCURRENCY', '3'))
+    
+    # מנהלים - מזהי משתמשי טלגרם מופרדים בפסיק (פקודות ניטור כמו /dbstats)
+    ADMIN_USER_IDS = [int(user_id) for user_id in os.getenv('ADMIN_USER_IDS', '').split(',') if user_id.strip()]
+    
+    # אחסון: mongodb או sqlite (קובץ מקומי - לפריסה של שרת יחיד)
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'mongodb').lower()
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'social_media_bot.db')
+    
     # MongoDB
     MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
     DATABASE_NAME = os.getenv('DATABASE_NAME', 'social_media_bot')
     
+    # מטמון הגדרות משתמש (בזיכרון התהליך)
+    USER_SETTINGS_CACHE_SIZE = int(os.getenv('USER_SETTINGS_CACHE_SIZE', '10000'))
+    USER_SETTINGS_CACHE_TTL = int(os.getenv('USER_SETTINGS_CACHE_TTL', '300'))  # שניות
+    
+    # ביטול רשומות במטמון לפי change streams (דורש replica set) - כל עוד ה-stream פעיל המטמון משתמש ב-TTL הארוך
+    CACHE_CHANGE_STREAMS = os.getenv('CACHE_CHANGE_STREAMS', 'True').lower() == 'true'
+    USER_SETTINGS_CACHE_LIVE_TTL = int(os.getenv('USER_SETTINGS_CACHE_LIVE_TTL', '3600'))  # שניות
+    CACHE_STREAM_RETRY_INTERVAL = float(os.getenv('CACHE_STREAM_RETRY_INTERVAL', '60'))  # שניות
+    
+    # כתיבת לוגים למסד הנתונים באצוות (ברקע)
+    DB_LOG_QUEUE_SIZE = int(os.getenv('DB_LOG_QUEUE_SIZE', '10000'))
+    DB_LOG_BATCH_SIZE = int(os.getenv('DB_LOG_BATCH_SIZE', '200'))
+    DB_LOG_FLUSH_INTERVAL = float(os.getenv('DB_LOG_FLUSH_INTERVAL', '2.0'))  # שניות
+    DB_LOG_UNACKNOWLEDGED = os.getenv('DB_LOG_UNACKNOWLEDGED', 'False').lower() == 'true'  # w=0
+    DB_LOG_OVERFLOW = os.getenv('DB_LOG_OVERFLOW', 'drop')  # drop / spill
+    DB_LOG_SPILL_FILE = os.getenv('DB_LOG_SPILL_FILE', 'db_logs_spill.jsonl')
+    
+    # ניתוב פעולות מסד נתונים לפי סוג - read preference, write concern (w) ו-max time (maxTimeMS לקריאות, wtimeout לכתיבות)
+    DB_OPERATION_CLASSES = {
+        'hot_write': _operation_class('HOT_WRITE', 'primary', '1', 5000),          # שמירת פוסטים, סטטוס, הגדרות ומונים
+        'hot_read': _operation_class('HOT_READ', 'primary', '1', 2000),            # קריאות בנתיב ה-handlers (read-your-writes)
+        'analytics': _operation_class('ANALYTICS', 'secondaryPreferred', '1', 30000),  # סטטיסטיקות והיסטוריה
+        'logs': _operation_class('LOGS', 'primary', '0' if DB_LOG_UNACKNOWLEDGED else '1', 5000)
+    }
+    
+    # יומן כתיבות מקומי - פוסטים ותוצאות פרסום נשמרים בו כשהמסד לא זמין ומועברים כשהוא חוזר
+    DB_JOURNAL_FILE = os.getenv('DB_JOURNAL_FILE', 'db_journal.jsonl')
+    DB_JOURNAL_RETRY_INTERVAL = float(os.getenv('DB_JOURNAL_RETRY_INTERVAL', '5'))  # שניות
+    
+    # מדדי פעולות מסד נתונים (command monitoring) - שאילתה מעל DB_SLOW_QUERY_MS נדגמת ונרשמת כאזהרה
+    DB_METRICS_ENABLED = os.getenv('DB_METRICS_ENABLED', 'True').lower() == 'true'
+    DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '100'))
+    DB_SLOW_QUERY_SAMPLES = int(os.getenv('DB_SLOW_QUERY_SAMPLES', '20'))
+    
+    # דחיסת תעבורה מול השרת (למשל zstd,snappy - דורש את החבילה המתאימה, ריק = ללא)
+    DB_COMPRESSORS = os.getenv('DB_COMPRESSORS', '')
+    
+    # שמירת נתונים - מחיקה אוטומטית בשרת (אינדקסי TTL)
+    POST_RETENTION_DAYS = int(os.getenv('POST_RETENTION_DAYS', '30'))  # פוסטים שהסתיימו
+    LOG_RETENTION_DAYS = int(os.getenv('LOG_RETENTION_DAYS', '7'))
+    
+    # ארכוב לקבצים דחוסים (python manage.py archive) - פוסטים ולוגים שיפוגו ב-ARCHIVE_LEAD_HOURS הקרובות
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', './archive')
+    ARCHIVE_LEAD_HOURS = float(os.getenv('ARCHIVE_LEAD_HOURS', '48'))
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '1000'))
+    
     # מצב הרצה
     MOCK_MODE = os.getenv('MOCK_MODE', 'True').lower() == 'true'  # מצב בדיקה
     AUTO_POST_MODE = os.getenv('AUTO_POST_MODE', 'False').lower() == 'true'  # פרסום אוטומטי
@@ -102,6 +202,9 @@ class Messages:
 /mock - מצב בדיקה (ללא פרסום אמיתי)
 /auto - מצב פרסום אוטומטי
 /status - מצב נוכחי
+/history - היסטוריית פוסטים
+/tag - האשטגים שלכם, או פוסטים עם האשטג (/tag פסח)
+/search - חיפוש בכיתובי הפוסטים (/search מתכון עוגה)
 /help - עזרה זו
     """
     
@@ -111,6 +214,10 @@ class Messages:
     ERROR_UNSUPPORTED_FORMAT = "❌ פורמט לא נתמך. בחרו: {formats}"
     ERROR_NO_TEXT = "❌ אנא הוסיפו טקסט לסרטון"
     ERROR_POSTING_FAILED = "❌ שגיאה בפרסום: {error}"
+    ERROR_BUSY = "⚠️ הבוט עמוס כרגע ולא יכול לקבל סרטונים חדשים. נסו שוב בעוד כמה דקות."
+    
+    # הודעות מצב
+    QUEUED = "⏳ יש עומס - הסרטון ממתין בתור (מקום {position}) ויטופל אוטומטית."
     
     # הודעות הצלחה
     SUCCESS_MOCK_MODE = "📢 [בדיקה] הסרטון לא נשלח באמת – רק מדומה ✅"
@@ -126,6 +233,10 @@ class Messages:
     BUTTON_AUTO_OFF = "🤖 פרסום אוטומטי: כבוי"
 
 # בדיקת הגדרות חובה
+STORAGE_BACKENDS = ('mongodb', 'sqlite')
+BOT_RUN_MODES = ('polling', 'webhook')
+READ_PREFERENCES = ('primary', 'primaryPreferred', 'secondary', 'secondaryPreferred', 'nearest')
+
 def validate_config():
     """בודק שכל ההגדרות החיוניות קיימות"""
     errors = []
@@ -133,9 +244,43 @@ def validate_config():
     if not Config.TELEGRAM_BOT_TOKEN:
         errors.append("TELEGRAM_BOT_TOKEN חסר")
     
-    if not Config.MONGODB_URI:
+    if Config.BOT_RUN_MODE not in BOT_RUN_MODES:
+        errors.append(f"BOT_RUN_MODE לא מוכר: {Config.BOT_RUN_MODE}")
+    
+    if Config.BOT_RUN_MODE == 'webhook' and not Config.WEBHOOK_URL:
+        errors.append("WEBHOOK_URL חסר (נדרש במצב webhook)")
+    
+    if not Config.WEBHOOK_PATH.startswith('/'):
+        errors.append(f"WEBHOOK_PATH חייב להתחיל ב-/: {Config.WEBHOOK_PATH}")
+    
+    if Config.UPDATE_CONCURRENCY < 1:
+        errors.append(f"UPDATE_CONCURRENCY חייב להיות לפחות 1: {Config.UPDATE_CONCURRENCY}")
+    
+    if Config.ADMISSION_MAX_CONCURRENT < 1 or Config.ADMISSION_MAX_PER_USER < 1:
+        errors.append("ADMISSION_MAX_CONCURRENT ו-ADMISSION_MAX_PER_USER חייבים להיות לפחות 1")
+    
+    if Config.ALBUM_DOWNLOAD_CONCURRENCY < 1:
+        errors.append(f"ALBUM_DOWNLOAD_CONCURRENCY חייב להיות לפחות 1: {Config.ALBUM_DOWNLOAD_CONCURRENCY}")
+    
+    if Config.MESSAGE_EDIT_GLOBAL_RATE <= 0:
+        errors.append(f"MESSAGE_EDIT_GLOBAL_RATE חייב להיות חיובי: {Config.MESSAGE_EDIT_GLOBAL_RATE}")
+    
+    if Config.SESSION_MAX_PER_USER < 1:
+        errors.append(f"SESSION_MAX_PER_USER חייב להיות לפחות 1: {Config.SESSION_MAX_PER_USER}")
+    
+    if Config.SESSION_PERSISTENCE and Config.STORAGE_BACKEND != 'mongodb':
+        errors.append("SESSION_PERSISTENCE נתמך רק עם STORAGE_BACKEND=mongodb")
+    
+    if Config.STORAGE_BACKEND not in STORAGE_BACKENDS:
+        errors.append(f"STORAGE_BACKEND לא מוכר: {Config.STORAGE_BACKEND}")
+    
+    if Config.STORAGE_BACKEND == 'mongodb' and not Config.MONGODB_URI:
         errors.append("MONGODB_URI חסר")
     
+    for op_class, settings in Config.DB_OPERATION_CLASSES.items():
+        if settings['read_preference'] not in READ_PREFERENCES:
+            errors.append(f"read preference לא תקין עבור {op_class}: {settings['read_preference']}")
+    
     if errors:
         raise ValueError(f"שגיאות קונפיגורציה: {', '.join(errors)}")
     
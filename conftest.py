@@ -0,0 +1,10 @@
+"""
+הגדרות משותפות לבדיקות
+"""
+import os
+import tempfile
+
+def pytest_configure(config):
+    """הלוגים של הבדיקות נכתבים לתיקייה זמנית ולא ל-bot.log של הבוט
+    (ה-loggers נפתחים כבר בייבוא המודולים, לכן לפני איסוף הבדיקות)"""
+    os.environ['LOG_FILE'] = os.path.join(tempfile.mkdtemp(prefix='bot-tests-'), 'bot.log')
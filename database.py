@@ -1,159 +1,1109 @@
 """
 מערכת מסד נתונים MongoDB לבוט הפרסום
 """
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+import asyncio
+import inspect
+import time
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Callable
 import pymongo
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+from pymongo import MongoClient, ReadPreference, ReturnDocument, UpdateOne
+from pymongo.errors import (
+    BulkWriteError, ConnectionFailure, DuplicateKeyError, ExecutionTimeout, OperationFailure, PyMongoError,
+    WriteConcernError
+)
+from pymongo.write_concern import WriteConcern
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
 
 from config import Config
 from exceptions import *
+from cache import TTLCache
+from cache_invalidation import ChangeStreamInvalidator
+from db_metrics import explain_command, get_db_metrics, plan_summary
+from log_writer import BufferedLogWriter
+from journal import WriteJournal
+from archive import PartitionedArchive, iter_batches
+from storage import StorageBackend
+from utils import TextHelper
 from logger import db_logger, get_logger
 
 logger = get_logger(__name__)
 
-class DatabaseManager:
-    """מנהל מסד הנתונים"""
+# סוגי פעולות - לכל סוג read preference, write concern ו-max time משלו (Config.DB_OPERATION_CLASSES)
+OP_HOT_WRITE = 'hot_write'
+OP_HOT_READ = 'hot_read'
+OP_ANALYTICS = 'analytics'
+OP_LOGS = 'logs'
+
+_READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST
+}
+
+def _client_options() -> Dict:
+    """אפשרויות הלקוח - משותפות ל-pymongo ול-motor"""
+    options = {'serverSelectionTimeoutMS': 5000}
     
-    def __init__(self):
-        self.client: Optional[MongoClient] = None
-        self.db = None
-        self.collections = {}
-        self._connect()
+    if Config.DB_COMPRESSORS:
+        options['compressors'] = Config.DB_COMPRESSORS
     
-    def _connect(self):
-        """יצירת חיבור למסד הנתונים"""
-        try:
-            self.client = MongoClient(Config.MONGODB_URI, serverSelectionTimeoutMS=5000)
-            
-            # בדיקת חיבור
-            self.client.admin.command('ping')
-            
-            self.db = self.client[Config.DATABASE_NAME]
-            self._setup_collections()
+    # זמני פקודות, שאילתות איטיות והמתנה ל-pool
+    if Config.DB_METRICS_ENABLED:
+        options['event_listeners'] = [get_db_metrics()]
+    
+    return options
+
+def _operation_options(op_class: str) -> Dict:
+    """read preference ו-write concern לסוג פעולה (max time משמש כ-wtimeout לכתיבות)"""
+    settings = Config.DB_OPERATION_CLASSES[op_class]
+    w = settings['write_concern']
+    w = int(w) if w.isdigit() else w
+    
+    return {
+        'read_preference': _READ_PREFERENCES[settings['read_preference']],
+        'write_concern': WriteConcern(w=w, wtimeout=settings['max_time_ms'] if w != 0 else None)
+    }
+
+def _max_time_ms(op_class: str) -> int:
+    """maxTimeMS לקריאות של סוג פעולה"""
+    return Config.DB_OPERATION_CLASSES[op_class]['max_time_ms']
+
+def _build_routes(collections: Dict) -> Dict:
+    """הקולקשנים לפי סוג פעולה: routes[op_class][name]"""
+    return {
+        op_class: {name: collection.with_options(**_operation_options(op_class))
+                   for name, collection in collections.items()}
+        for op_class in Config.DB_OPERATION_CLASSES
+    }
+
+def _default_user_settings() -> Dict:
+    """הגדרות ברירת מחדל למשתמש חדש"""
+    return {
+        'mock_mode': Config.MOCK_MODE,
+        'auto_post': Config.AUTO_POST_MODE,
+        'preferred_platforms': ['TikTok', 'Twitter', 'Instagram', 'YouTube']
+    }
+
+def _create_settings_cache() -> TTLCache:
+    """מטמון הגדרות משתמש לפי הקונפיגורציה"""
+    return TTLCache(
+        max_size=Config.USER_SETTINGS_CACHE_SIZE,
+        ttl_seconds=Config.USER_SETTINGS_CACHE_TTL
+    )
+
+def _build_post_document(user_id: int, filename: str, text: str,
+                         platforms: List[str], file_size_mb: float) -> Dict:
+    """בניית מסמך פוסט חדש"""
+    return {
+        'user_id': user_id,
+        'filename': filename,
+        'text': text,
+        'text_preview': text[:100] + "..." if len(text) > 100 else text,
+        'hashtags': TextHelper.normalize_hashtags(text),
+        'platforms': platforms,
+        'file_size_mb': file_size_mb,
+        'status': 'created',
+        'created_at': datetime.now(),
+        'updated_at': datetime.now(),
+        'posting_results': {},
+        'progress': {'succeeded': 0, 'failed': 0},
+        'mock_mode': Config.MOCK_MODE
+    }
+
+# שדות לרשימת היסטוריה - בלי text המלא ו-posting_results
+POST_SUMMARY_FIELDS = ('created_at', 'status', 'text_preview', 'platforms')
+
+# סדר היסטוריה יציב - _id מכריע בין פוסטים עם אותו created_at
+POSTS_HISTORY_SORT = [('created_at', -1), ('_id', -1)]
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _post_projection(fields: Optional[List[str]]) -> Optional[Dict]:
+    """projection לשדות המבוקשים (None = כל המסמך)"""
+    if fields is None:
+        return None
+    return {field: 1 for field in fields}
+
+def _encode_page_cursor(post: Dict) -> str:
+    """סמן עמוד: <created_at במילישניות>.<_id> - קצר מספיק ל-callback_data של טלגרם"""
+    millis = (post['created_at'] - _EPOCH) // timedelta(milliseconds=1)
+    return f"{millis}.{post['_id']}"
+
+def _user_posts_page_query(user_id: int, cursor: Optional[str] = None) -> Dict:
+    """סינון עמוד היסטוריה - עם סמן, רק פוסטים שאחרי (created_at, _id) בסדר היורד"""
+    query = {'user_id': user_id}
+    
+    if cursor:
+        millis, post_id = cursor.split('.', 1)
+        created_at = _EPOCH + timedelta(milliseconds=int(millis))
+        query['$or'] = [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, '_id': {'$lt': ObjectId(post_id)}}
+        ]
+    
+    return query
+
+def _hashtag_page_query(user_id: int, tag: str, cursor: Optional[str] = None) -> Dict:
+    """סינון עמוד פוסטים עם האשטג - אותו keyset כמו בהיסטוריה, על אינדקס האשטגים"""
+    query = _user_posts_page_query(user_id, cursor)
+    query['hashtags'] = TextHelper.normalize_hashtag(tag)
+    return query
+
+def _build_posts_page(posts: List[Dict], limit: int,
+                      encode_cursor: Callable[[Dict], str] = _encode_page_cursor) -> Dict:
+    """חיתוך התוצאה לעמוד - נשלף פוסט אחד נוסף רק כדי לדעת אם יש עמוד הבא"""
+    page = posts[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(posts) > limit else None
+    
+    for post in page:
+        post['_id'] = str(post['_id'])
+    
+    return {'posts': page, 'next_cursor': next_cursor}
+
+# סטטוסים סופיים - פוסטים בסטטוסים אלו נמחקים ע"י השרת (אינדקס TTL) אחרי POST_RETENTION_DAYS
+FINAL_POST_STATUSES = ('completed', 'failed')
+
+# קוד השגיאה כשאינדקס עם אותו מפתח כבר קיים עם אפשרויות אחרות
+INDEX_OPTIONS_CONFLICT = 85
+
+# קוד השגיאה כשמוחקים אינדקס שלא קיים
+INDEX_NOT_FOUND = 27
+
+# קוד השגיאה של מפתח כפול
+DUPLICATE_KEY = 11000
+
+# אינדקס ההיסטוריה שלפני עימוד ה-keyset - מיותר מול (user_id, created_at, _id)
+LEGACY_POSTS_HISTORY_INDEX = [("user_id", 1), ("created_at", -1)]
+
+# כמה מזהי פעולות אחרונות נשמרים בכל מסמך (applied_ops) - פעולה שחוזרת מהיומן מזוהה ולא נספרת פעמיים
+APPLIED_OPS_KEPT = 100
+
+def _applied_ops_append(entry: Dict) -> Dict:
+    """ביטוי pipeline שמוסיף רשומה ל-applied_ops של הפוסט (רק האחרונות נשמרות)"""
+    return {'$slice': [
+        {'$concatArrays': [{'$ifNull': ['$applied_ops', []]}, [entry]]}, -APPLIED_OPS_KEPT
+    ]}
+
+def _not_applied(query: Dict, op_id: ObjectId) -> Dict:
+    """סינון פוסט שהפעולה op_id עוד לא הוחלה עליו"""
+    return {**query, 'applied_ops.op_id': {'$ne': op_id}}
+
+def _status_update(status: str, posting_results: Optional[Dict] = None,
+                   error: Optional[str] = None, op_id: Optional[ObjectId] = None) -> List[Dict]:
+    """בניית עדכון סטטוס (pipeline) - בסטטוס סופי נקבע expires_at, אחרת הוא מוסר; op_id נרשם עם הסטטוס הקודם"""
+    fields = {'status': status, 'updated_at': datetime.now()}
+    
+    if posting_results:
+        # $literal - כדי שהודעת שגיאה שמתחילה ב-$ לא תתפרש כשם שדה
+        fields['posting_results'] = {'$literal': posting_results}
+    
+    if error:
+        fields['error'] = {'$literal': error}
+    
+    if op_id is not None:
+        # '$status' - הערך שלפני העדכון (כל הביטויים בשלב מחושבים מול המסמך הקודם)
+        fields['applied_ops'] = _applied_ops_append({'op_id': op_id, 'from_status': '$status'})
+    
+    if status in FINAL_POST_STATUSES:
+        # אינדקסי TTL משווים מול UTC
+        fields['expires_at'] = datetime.utcnow() + timedelta(days=Config.POST_RETENTION_DAYS)
+        return [{'$set': fields}]
+    
+    return [{'$set': fields}, {'$unset': 'expires_at'}]
+
+# סטטוסי תוצאה של פלטפורמה שנחשבת "בוצעה" - לא מפרסמים בה שוב
+SUCCESS_RESULT_STATUSES = ('success', 'mock_success')
+
+def _platform_result_update(platform: str, result: Dict, op_id: Optional[ObjectId] = None) -> List[Dict]:
+    """עדכון (pipeline) של תוצאת פלטפורמה אחת ומוני ההתקדמות בפעולה אטומית אחת - נכון גם בניסיון חוזר"""
+    previous_status = f'$posting_results.{platform}.status'
+    was_succeeded = {'$in': [previous_status, list(SUCCESS_RESULT_STATUSES)]}
+    was_failed = {'$and': [{'$ne': [{'$type': previous_status}, 'missing']}, {'$not': [was_succeeded]}]}
+    
+    succeeded = 1 if result.get('status') in SUCCESS_RESULT_STATUSES else 0
+    
+    return [{'$set': {
+        # $literal - כדי שהודעת שגיאה שמתחילה ב-$ לא תתפרש כשם שדה
+        f'posting_results.{platform}': {'$literal': result},
+        'progress.succeeded': {'$add': [
+            {'$ifNull': ['$progress.succeeded', 0]}, succeeded, {'$cond': [was_succeeded, -1, 0]}
+        ]},
+        'progress.failed': {'$add': [
+            {'$ifNull': ['$progress.failed', 0]}, 1 - succeeded, {'$cond': [was_failed, -1, 0]}
+        ]},
+        'updated_at': datetime.now(),
+        **({'applied_ops': _applied_ops_append({'op_id': op_id})} if op_id is not None else {})
+    }}]
+
+def _counter_once(query: Dict, update: Dict, op_id: ObjectId) -> tuple:
+    """סינון ועדכון של מסמך מונים שמוחלים פעם אחת לכל op_id - ב-upsert, פעולה שכבר נספרה נכשלת במפתח כפול"""
+    return (
+        {**query, 'applied_ops': {'$ne': op_id}},
+        {**update, '$push': {'applied_ops': {'$each': [op_id], '$slice': -APPLIED_OPS_KEPT}}}
+    )
+
+def _raise_unless_duplicates(error: BulkWriteError, description: str):
+    """שגיאת bulk של מונים - מפתח כפול הוא פעולה שכבר נספרה; תקלת write concern עוברת הלאה, השאר נרשם"""
+    details = error.details or {}
+    if details.get('writeConcernErrors'):
+        raise error
+    
+    failed = [write_error for write_error in details.get('writeErrors', []) if write_error.get('code') != DUPLICATE_KEY]
+    if failed:
+        logger.warning(f"שגיאה בעדכון {description}: {failed[0].get('errmsg')}")
+
+def _is_transient_error(error: Exception) -> bool:
+    """תקלה זמנית של המסד (חיבור, בחירת primary, timeout, write concern) - ניסיון חוזר עשוי להצליח"""
+    if isinstance(error, (ConnectionFailure, ExecutionTimeout, WriteConcernError)):
+        return True
+    return isinstance(error, PyMongoError) and (error.has_error_label('RetryableWriteError') or error.timeout)
+
+# פעולות ביומן הכתיבות המקומי
+JOURNAL_SAVE_POST = 'save_post'
+JOURNAL_UPDATE_STATUS = 'update_post_status'
+JOURNAL_PLATFORM_RESULT = 'record_platform_result'
+
+def _with_journal_results(post: Optional[Dict], post_id: str, entries: List[Dict]) -> Dict:
+    """תוצאות הפרסום מהמסד בתוספת תוצאות שעדיין ממתינות ביומן"""
+    posting_results = dict((post or {}).get('posting_results', {}))
+    
+    for entry in entries:
+        payload = entry['payload']
+        if entry['operation'] == JOURNAL_PLATFORM_RESULT and payload['post_id'] == post_id:
+            posting_results[payload['platform']] = payload['result']
+    
+    return {'posting_results': posting_results}
+
+def _completed_platforms(post: Optional[Dict]) -> List[str]:
+    """פלטפורמות שכבר פורסמו בהצלחה"""
+    if not post:
+        return []
+    
+    return [
+        platform for platform, result in post.get('posting_results', {}).items()
+        if isinstance(result, dict) and result.get('status') in SUCCESS_RESULT_STATUSES
+    ]
+
+def _ttl_indexes() -> List[tuple]:
+    """אינדקסי התפוגה: (קולקשן, מפתח, expireAfterSeconds)"""
+    return [
+        # expires_at נקבע כבר לזמן המחיקה
+        ('posts', [("expires_at", 1)], 0)
+    ]
+
+def _ttl_coll_mod(collection_name: str, keys: List[tuple], expire_after_seconds: int) -> Dict:
+    """פקודת collMod לעדכון התפוגה של אינדקס קיים"""
+    return {
+        'collMod': collection_name,
+        'index': {'keyPattern': dict(keys), 'expireAfterSeconds': expire_after_seconds}
+    }
+
+# הלוגים נשמרים בקולקשן time-series - השדות שמסננים לפיהם ב-meta, התפוגה מובנית בקולקשן
+LOGS_TIMESERIES = {'timeField': 'timestamp', 'metaField': 'meta', 'granularity': 'seconds'}
+LOGS_USER_INDEX = [("meta.user_id", 1), ("timestamp", -1)]
+# אינדקס ה-TTL של קולקשן הלוגים הרגיל (לפני ההמרה) - אותו מפתח כמו אינדקס הלוגים המקורי
+LEGACY_LOGS_TTL_INDEX = [("timestamp", -1)]
+LEGACY_LOGS_COLLECTION = 'logs_legacy'
+
+def _logs_expire_after_seconds() -> int:
+    """תפוגת הלוגים בשניות"""
+    return Config.LOG_RETENTION_DAYS * 24 * 3600
+
+def _log_document(user_id: int, action: str, details: Optional[Dict], level: str) -> Dict:
+    """רשומת לוג בפורמט time-series"""
+    return {
+        'timestamp': datetime.now(),
+        'meta': {'user_id': user_id, 'action': action, 'level': level},
+        'details': details or {}
+    }
+
+def _legacy_log_to_timeseries(record: Dict) -> Dict:
+    """המרת רשומת לוג מהקולקשן הרגיל (שדות שטוחים) לפורמט time-series"""
+    if 'meta' in record:
+        return record
+    
+    return {
+        '_id': record['_id'],
+        'timestamp': record['timestamp'],
+        'meta': {'user_id': record.get('user_id'), 'action': record.get('action'), 'level': record.get('level')},
+        'details': record.get('details') or {}
+    }
+
+# האשטגים: פוסטים של משתמש עם תגית לפי זמן (multikey), ומונה שימושים לכל (משתמש, תגית)
+POSTS_HASHTAG_INDEX = [("user_id", 1), ("hashtags", 1), ("created_at", -1), ("_id", -1)]
+HASHTAG_COUNTS_INDEX = [("_id.user_id", 1), ("count", -1)]
+
+def _hashtag_count_updates(user_id: int, hashtags: List[str], used_at: datetime,
+                           op_id: ObjectId) -> List[UpdateOne]:
+    """$inc למונה של כל תגית בפוסט (upsert - _id = {user_id, tag}), פעם אחת לכל op_id"""
+    return [
+        UpdateOne(
+            *_counter_once({'_id': {'user_id': user_id, 'tag': tag}},
+                           {'$inc': {'count': 1}, '$max': {'last_used_at': used_at}}, op_id),
+            upsert=True
+        )
+        for tag in hashtags
+    ]
+
+def _hashtags_from_counts(documents: List[Dict]) -> List[Dict]:
+    """מסמכי המונים לרשימת {tag, count}"""
+    return [{'tag': document['_id']['tag'], 'count': document['count']} for document in documents]
+
+# חיפוש טקסט: אינדקס text עם קידומת user_id - החיפוש תמיד בתוך הפוסטים של משתמש אחד
+# בלי שפה (none) - בלי stemming ומילות עצירה של אנגלית, כך שעברית ואנגלית מטופלות באותו אופן
+POSTS_TEXT_INDEX = [("user_id", 1), ("text", "text")]
+POSTS_TEXT_INDEX_OPTIONS = {
+    'name': 'user_text_search',
+    'default_language': 'none',
+    # שדה language בפוסט לא ישנה את שפת האינדקס (ערך לא נתמך היה מכשיל את השמירה)
+    'language_override': 'text_language'
+}
+
+# אורך מקסימלי לשאילתת חיפוש, ודיוק הציון (מעוגל - כדי שהסמן יהיה קצר וההשוואה אליו מדויקת)
+SEARCH_QUERY_MAX_LENGTH = 100
+SEARCH_SCORE_DIGITS = 6
+
+def _search_query(query: str) -> str:
+    """שאילתת חיפוש מנוקה - רווחים מצומצמים ואורך מוגבל"""
+    return ' '.join(query.split())[:SEARCH_QUERY_MAX_LENGTH].strip()
+
+def _encode_search_cursor(post: Dict) -> str:
+    """סמן עמוד חיפוש: <ציון>_<_id>"""
+    return f"{post['score']}_{post['_id']}"
+
+def _decode_search_cursor(cursor: str) -> tuple:
+    """פענוח סמן חיפוש ל-(ציון, _id)"""
+    score, post_id = cursor.split('_', 1)
+    return float(score), post_id
+
+def _search_pipeline(user_id: int, query: str, limit: int, cursor: Optional[str] = None,
+                     fields: Optional[List[str]] = None) -> List[Dict]:
+    """חיפוש טקסט מדורג - keyset על (score, _id) בסדר יורד, נשלף פוסט אחד נוסף לסמן"""
+    pipeline = [
+        # $text חייב להיות בשלב הראשון, עם שוויון על קידומת האינדקס
+        {'$match': {'user_id': user_id, '$text': {'$search': query}}},
+        {'$set': {'score': {'$round': [{'$meta': 'textScore'}, SEARCH_SCORE_DIGITS]}}}
+    ]
+    
+    if cursor:
+        score, post_id = _decode_search_cursor(cursor)
+        pipeline.append({'$match': {'$or': [
+            {'score': {'$lt': score}},
+            {'score': score, '_id': {'$lt': ObjectId(post_id)}}
+        ]}})
+    
+    pipeline += [{'$sort': {'score': -1, '_id': -1}}, {'$limit': limit + 1}]
+    
+    if fields is not None:
+        pipeline.append({'$project': {**_post_projection(fields), 'score': 1}})
+    
+    return pipeline
+
+# סשנים פתוחים של הבוט (SESSION_PERSISTENCE) - השרת מוחק סשן ב-expires_at (UTC)
+SESSIONS_TTL_INDEX = [("expires_at", 1)]
+
+# גרסאות הסכימה - כל מיגרציה רצה פעם אחת ונרשמת בקולקשן schema_migrations (_id = גרסה)
+SCHEMA_MIGRATIONS = [
+    (1, 'אינדקסי פוסטים, TTL ואינדקס לוגים לפי משתמש'),
+    (2, 'אינדקס ייחודי על users.user_id (אחרי הסרת משתמשים כפולים)'),
+    (3, 'אינדקס האשטגים בפוסטים ומוני האשטגים למשתמש'),
+    (4, 'אינדקס טקסט לחיפוש בכיתובי הפוסטים'),
+    (5, 'אינדקס TTL לסשנים הפתוחים של הבוט'),
+    (6, 'הסרת אינדקס (user_id, created_at) הישן של הפוסטים'),
+    (7, 'אתחול מוני הפוסטים של כל המשתמשים')
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+# שאילתות חמות והשדות שאינדקס תומך חייב להתחיל בהם: (קולקשן, שאילתה, שדות)
+HOT_QUERY_INDEXES = [
+    ('posts', 'get_user_posts / get_user_posts_page', ['user_id', 'created_at', '_id']),
+    ('posts', 'get_posts_by_hashtag', ['user_id', 'hashtags', 'created_at', '_id']),
+    # באינדקס text המילים נשמרות בשדה הפנימי _fts
+    ('posts', 'search_posts', ['user_id', '_fts']),
+    ('hashtag_counts', 'get_user_hashtags', ['_id.user_id', 'count']),
+    ('users', 'get_user_settings / save_user_settings', ['user_id']),
+    ('logs', 'לוגים של משתמש', ['meta.user_id', 'timestamp'])
+]
+
+def _pending_migrations(applied_version: int) -> List[tuple]:
+    """מיגרציות שעוד לא הוחלו, לפי הסדר"""
+    return [migration for migration in SCHEMA_MIGRATIONS if migration[0] > applied_version]
+
+# נעילת המיגרציות - מסמך ב-schema_migrations; מופע שקרס משחרר אותה כשהיא פגה
+MIGRATION_LOCK_ID = 'lock'
+MIGRATION_LOCK_TTL = timedelta(minutes=10)
+MIGRATION_LOCK_POLL_SECONDS = 2
+
+def _migration_lock(owner: ObjectId) -> tuple:
+    """סינון ועדכון (upsert) לתפיסת הנעילה - פגה או כבר שלנו; מוחזקת ע"י מופע אחר - מפתח כפול"""
+    now = datetime.now()
+    return (
+        {'_id': MIGRATION_LOCK_ID, '$or': [{'expires_at': {'$lte': now}}, {'owner': owner}]},
+        {'$set': {'owner': owner, 'expires_at': now + MIGRATION_LOCK_TTL}}
+    )
+
+def _migration_record(version: int, description: str) -> tuple:
+    """סינון ועדכון (upsert) לרישום מיגרציה שהוחלה - בטוח גם כששני תהליכים עולים יחד"""
+    return (
+        {'_id': version},
+        {'$setOnInsert': {'description': description, 'applied_at': datetime.now()}}
+    )
+
+def _duplicate_users_pipeline() -> List[Dict]:
+    """קבוצות של מסמכי משתמש עם אותו user_id - החדש ביותר ראשון"""
+    return [
+        {'$sort': {'user_id': 1, 'updated_at': -1}},
+        {'$group': {'_id': '$user_id', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}}
+    ]
+
+def _duplicate_user_ids(groups: List[Dict]) -> List:
+    """מזהי המסמכים למחיקה - נשאר רק המסמך שעודכן אחרון בכל קבוצה"""
+    return [duplicate_id for group in groups for duplicate_id in group['ids'][1:]]
+
+def _missing_hot_indexes(indexes: Dict[str, Dict]) -> List[str]:
+    """שאילתות חמות בלי אינדקס תומך (index_information לכל קולקשן)"""
+    missing = []
+    
+    for collection_name, query, fields in HOT_QUERY_INDEXES:
+        index_keys = [
+            [field for field, _ in info['key']]
+            for info in indexes.get(collection_name, {}).values()
+        ]
+        
+        if not any(keys[:len(fields)] == fields for keys in index_keys):
+            missing.append(f"{collection_name}.{query} ({', '.join(fields)})")
+    
+    return missing
+
+def _post_expiry_backfill(retention_days: int) -> tuple:
+    """סינון ועדכון (pipeline) לקביעת expires_at לפוסטים סופיים ישנים שאין להם"""
+    return (
+        {'status': {'$in': list(FINAL_POST_STATUSES)}, 'expires_at': {'$exists': False}},
+        [{'$set': {'expires_at': {'$add': ['$updated_at', retention_days * 24 * 3600 * 1000]}}}]
+    )
+
+def _posts_archive_query(lead_hours: float) -> Dict:
+    """פוסטים שפג תוקפם או שיפוג ב-lead_hours הקרובות (לפני שאינדקס ה-TTL מוחק אותם)"""
+    return {'expires_at': {'$lte': datetime.utcnow() + timedelta(hours=lead_hours)}}
+
+def _logs_archive_query(archived_until: Optional[datetime], lead_hours: float) -> tuple:
+    """לוגים שיפוגו ב-lead_hours הקרובות ועוד לא אורכבו - (סינון, נקודת הסיום החדשה)"""
+    cutoff = datetime.now() - timedelta(days=Config.LOG_RETENTION_DAYS) + timedelta(hours=lead_hours)
+    time_range = {'$lt': cutoff}
+    
+    if archived_until:
+        time_range['$gte'] = archived_until
+    
+    return {'timestamp': time_range}, cutoff
+
+def _counter_increment(old_status: Optional[str], new_status: str) -> Dict:
+    """בניית $inc למוני המשתמש - פוסט חדש (old_status=None) או מעבר בין סטטוסים"""
+    increment = {f'by_status.{new_status}': 1}
+    
+    if old_status is None:
+        increment['total'] = 1
+    else:
+        increment[f'by_status.{old_status}'] = -1
+    
+    return increment
+
+def _user_counts_pipeline() -> List[Dict]:
+    """ספירת הפוסטים של כל משתמש לפי סטטוס - מכוסה ע"י האינדקס (user_id, status)"""
+    return [
+        {'$group': {'_id': {'user_id': '$user_id', 'status': '$status'}, 'count': {'$sum': 1}}}
+    ]
+
+def _counts_documents(rows: List[Dict]) -> Dict[int, Dict]:
+    """המרת תוצאות ה-pipeline למסמך מונים לכל משתמש"""
+    counts = {}
+    
+    for row in rows:
+        status = row['_id'].get('status')
+        if not status:
+            continue
+        user_counts = counts.setdefault(row['_id']['user_id'], {'total': 0, 'by_status': {}})
+        user_counts['by_status'][status] = row['count']
+        user_counts['total'] += row['count']
+    
+    return counts
+
+STATISTICS_TOTALS_ID = 'all'
+
+def _statistics_day_id(created_at: datetime) -> str:
+    """מזהה דלי יומי בקולקשן הסטטיסטיקות"""
+    return created_at.strftime('%Y-%m-%d')
+
+def _statistics_increment(old_status: Optional[str], new_status: str,
+                          platforms: List[str]) -> Dict:
+    """$inc לדלי סטטיסטיקות - סה"כ, לפי סטטוס, ולפי פלטפורמה וסטטוס"""
+    increment = _counter_increment(old_status, new_status)
+    
+    for platform in platforms or []:
+        increment[f'by_platform.{platform}.{new_status}'] = 1
+        if old_status is None:
+            increment[f'by_platform.{platform}.total'] = 1
+        else:
+            increment[f'by_platform.{platform}.{old_status}'] = -1
+    
+    return increment
+
+def _statistics_updates(created_at: datetime, increment: Dict, op_id: ObjectId) -> List[UpdateOne]:
+    """עדכוני הדלי היומי ודלי הסה"כ (bulk אחד), פעם אחת לכל op_id"""
+    day_id = _statistics_day_id(created_at)
+    day_start = created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    return [
+        UpdateOne(*_counter_once({'_id': day_id}, {'$inc': increment, '$setOnInsert': {'date': day_start}}, op_id),
+                  upsert=True),
+        UpdateOne(*_counter_once({'_id': STATISTICS_TOTALS_ID}, {'$inc': increment}, op_id), upsert=True)
+    ]
+
+def _statistics_from_buckets(buckets: List[Dict], total_users: int) -> Dict:
+    """בניית מילון הסטטיסטיקות מדלי הסה"כ ודלי היום"""
+    by_id = {bucket['_id']: bucket for bucket in buckets}
+    totals = by_id.get(STATISTICS_TOTALS_ID, {})
+    today = by_id.get(_statistics_day_id(datetime.now()), {})
+    
+    platforms = {
+        platform: counts.get('total', 0)
+        for platform, counts in totals.get('by_platform', {}).items()
+    }
+    popular = sorted(platforms.items(), key=lambda item: item[1], reverse=True)[:10]
+    
+    return {
+        'total_posts': totals.get('total', 0),
+        'posts_today': today.get('total', 0),
+        'successful_posts': totals.get('by_status', {}).get('completed', 0),
+        'total_users': total_users,
+        'popular_platforms': dict(popular)
+    }
+
+def _statistics_rebuild_pipeline() -> List[Dict]:
+    """קיבוץ כל הפוסטים לפי יום, סטטוס ורשימת פלטפורמות - לבנייה מחדש של הסטטיסטיקות"""
+    return [
+        {'$group': {
+            '_id': {
+                'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}},
+                'status': '$status',
+                'platforms': '$platforms'
+            },
+            'count': {'$sum': 1}
+        }}
+    ]
+
+def _statistics_buckets_from_groups(groups: List[Dict]) -> List[Dict]:
+    """המרת תוצאות קיבוץ לדליים יומיים ולדלי סה"כ"""
+    buckets = {}
+    
+    for group in groups:
+        key = group['_id']
+        count = group['count']
+        status = key.get('status') or 'unknown'
+        
+        bucket_ids = [STATISTICS_TOTALS_ID]
+        if key.get('day'):
+            bucket_ids.append(key['day'])
+        
+        for bucket_id in bucket_ids:
+            bucket = buckets.setdefault(bucket_id, {'_id': bucket_id, 'total': 0, 'by_status': {}, 'by_platform': {}})
+            if bucket_id != STATISTICS_TOTALS_ID and 'date' not in bucket:
+                bucket['date'] = datetime.strptime(bucket_id, '%Y-%m-%d')
             
-            db_logger.log_connection_status(True)
-            logger.info("חיבור למסד נתונים הצליח")
+            bucket['total'] += count
+            bucket['by_status'][status] = bucket['by_status'].get(status, 0) + count
             
-        except ConnectionFailure as e:
-            db_logger.log_connection_status(False, str(e))
-            raise ConnectionError("MongoDB")
+            for platform in key.get('platforms') or []:
+                platform_counts = bucket['by_platform'].setdefault(platform, {'total': 0})
+                platform_counts['total'] += count
+                platform_counts[status] = platform_counts.get(status, 0) + count
+    
+    return list(buckets.values())
+
+def _statistics_rebuild_updates(buckets: List[Dict]) -> List[UpdateOne]:
+    """החלפת התוכן של כל דלי ($set עם upsert) - בלי קולקשן זמני שמחליף את כולם יחד"""
+    return [
+        UpdateOne(
+            {'_id': bucket['_id']}, {'$set': {key: value for key, value in bucket.items() if key != '_id'}}, upsert=True
+        )
+        for bucket in buckets
+    ]
+
+# הקולקשנים של המנהלים (_id של user_counters הוא user_id, של hashtag_counts {user_id, tag},
+# של sessions ה-post_id; statistics - דלי יומי לכל יום + דלי סה"כ)
+MONGO_COLLECTIONS = (
+    'posts', 'users', 'logs', 'user_counters', 'statistics', 'hashtag_counts',
+    'schema_migrations', 'archive_state', 'sessions'
+)
+
+class _Many:
+    """סמן שהמנהל קורא עד הסוף - list() ב-pymongo, to_list() ב-motor"""
+    
+    __slots__ = ('cursor',)
+    
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+class _Sleep:
+    """סמן המתנה - time.sleep ב-pymongo, asyncio.sleep ב-motor"""
+    
+    __slots__ = ('seconds',)
+    
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+def _run_sync(operations):
+    """הרצת פעולות משותפות מול pymongo - הקריאות כבר בוצעו, נשאר לקרוא סמנים"""
+    result, error = None, None
+    
+    while True:
+        try:
+            call = operations.throw(error) if error is not None else operations.send(result)
+        except StopIteration as stop:
+            return stop.value
+        
+        result, error = call, None
+        if isinstance(call, _Sleep):
+            time.sleep(call.seconds)
+        elif isinstance(call, _Many):
+            try:
+                result = list(call.cursor)
+            except Exception as e:
+                error = e
+
+async def _run_async(operations):
+    """הרצת פעולות משותפות מול motor - כל קריאה ממתינה, ושגיאות חוזרות לתוך הפעולה"""
+    result, error = None, None
+    
+    while True:
+        try:
+            call = operations.throw(error) if error is not None else operations.send(result)
+        except StopIteration as stop:
+            return stop.value
+        
+        result, error = call, None
+        try:
+            if isinstance(call, _Sleep):
+                await asyncio.sleep(call.seconds)
+            elif isinstance(call, _Many):
+                cursor = await call.cursor if inspect.isawaitable(call.cursor) else call.cursor
+                result = await cursor.to_list(length=None)
+            elif inspect.isawaitable(call):
+                result = await call
         except Exception as e:
-            db_logger.log_connection_status(False, str(e))
-            raise DatabaseError(f"שגיאה בחיבור למסד נתונים: {e}")
+            error = e
+
+class _MongoOperations:
+    """הלוגיקה המשותפת ל-DatabaseManager ול-AsyncDatabaseManager - כל פעולה היא generator שמחזיר
+    (yield) קריאות דרייבר ומקבל את התוצאות; המנהלים מריצים אותה ב-_run"""
     
-    def _setup_collections(self):
-        """הגדרת קולקשנים"""
-        # קולקשן פוסטים
-        self.collections['posts'] = self.db.posts
+    def _bind_collections(self):
+        """הקולקשנים והעותקים שלהם לפי סוג פעולה (read preference / write concern)"""
+        self.collections = {name: getattr(self.db, name) for name in MONGO_COLLECTIONS}
+        self.routes = _build_routes(self.collections)
+    
+    def _create_indexes_ops(self):
+        """מיגרציות סכימה לפי גרסה ובדיקה שלכל שאילתה חמה יש אינדקס - אינדקסים נוצרים רק כשהגרסה משתנה"""
+        # לוגים - time-series עם תפוגה מובנית (לפני המיגרציות, כדי שאינדקס הלוגים לא ייצור קולקשן רגיל)
+        yield from self._ensure_logs_collection_ops()
         
-        # קולקשן משתמשים
-        self.collections['users'] = self.db.users
+        applied_version = yield from self._schema_version_ops()
         
-        # קולקשן לוגים
-        self.collections['logs'] = self.db.logs
+        if _pending_migrations(applied_version):
+            # מופע אחד מריץ את המיגרציות - מופע נוסף שעולה יחד (deploy) ממתין לו
+            owner = ObjectId()
+            yield from self._acquire_migration_lock_ops(owner)
+            try:
+                # בזמן ההמתנה מופע אחר אולי כבר החיל אותן
+                applied_version = yield from self._schema_version_ops()
+                
+                for version, description in _pending_migrations(applied_version):
+                    yield from getattr(self, f'_migrate_v{version}_ops')()
+                    yield self.collections['schema_migrations'].update_one(
+                        *_migration_record(version, description), upsert=True
+                    )
+                    logger.info(f"מיגרציית סכימה {version} הוחלה: {description}")
+            finally:
+                yield self.collections['schema_migrations'].delete_one({'_id': MIGRATION_LOCK_ID, 'owner': owner})
         
-        # יצירת אינדקסים
-        self._create_indexes()
+        yield from self._check_hot_indexes_ops()
     
-    def _create_indexes(self):
-        """יצירת אינדקסים לביצועים טובים יותר"""
+    def _acquire_migration_lock_ops(self, owner: ObjectId):
+        """תפיסת נעילת המיגרציות - ממתין כל עוד מופע אחר מחזיק בה (עד שהיא פגה)"""
+        while True:
+            try:
+                yield self.collections['schema_migrations'].find_one_and_update(
+                    *_migration_lock(owner), upsert=True
+                )
+                return
+            except DuplicateKeyError:
+                logger.info("מופע אחר מריץ מיגרציות - ממתין")
+                yield _Sleep(MIGRATION_LOCK_POLL_SECONDS)
+    
+    def _schema_version_ops(self):
+        """גרסת הסכימה האחרונה שהוחלה (0 - אף אחת; מסמך הנעילה לא נספר)"""
+        latest = yield self.collections['schema_migrations'].find_one({'_id': {'$type': 'number'}}, sort=[('_id', -1)])
+        return latest['_id'] if latest else 0
+    
+    def _migrate_v1_ops(self):
+        """אינדקסי הפוסטים, TTL ואינדקס הלוגים"""
+        # אינדקס על user_id ותאריך (כולל _id - עימוד keyset ממוין ישירות מהאינדקס)
+        yield self.collections['posts'].create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+        
+        # אינדקס על סטטוס פרסום
+        yield self.collections['posts'].create_index("status")
+        
+        # אינדקס לספירת פוסטים למשתמש לפי סטטוס (שאילתה מכוסה)
+        yield self.collections['posts'].create_index([("user_id", 1), ("status", 1)])
+        
+        # מחיקה אוטומטית של פוסטים שהסתיימו (TTL)
+        for collection_name, keys, expire_after_seconds in _ttl_indexes():
+            yield from self._ensure_ttl_index_ops(collection_name, keys, expire_after_seconds)
+        
+        # לוגים של משתמש לפי זמן
+        yield self.collections['logs'].create_index(LOGS_USER_INDEX)
+    
+    def _migrate_v2_ops(self):
+        """הסרת משתמשים כפולים ואינדקס ייחודי על user_id"""
+        groups = yield _Many(self.collections['users'].aggregate(_duplicate_users_pipeline(), allowDiskUse=True))
+        duplicate_ids = _duplicate_user_ids(groups)
+        
+        if duplicate_ids:
+            yield self.collections['users'].delete_many({'_id': {'$in': duplicate_ids}})
+            logger.warning(f"הוסרו {len(duplicate_ids)} מסמכי משתמש כפולים")
+        
+        yield self.collections['users'].create_index("user_id", unique=True)
+    
+    def _migrate_v3_ops(self):
+        """אינדקסי האשטגים (פוסטים ישנים מקבלים האשטגים ב-backfill_hashtags)"""
+        yield self.collections['posts'].create_index(POSTS_HASHTAG_INDEX)
+        yield self.collections['hashtag_counts'].create_index(HASHTAG_COUNTS_INDEX)
+    
+    def _migrate_v4_ops(self):
+        """אינדקס הטקסט לחיפוש (אינדקס text אחד לקולקשן)"""
+        yield self.collections['posts'].create_index(POSTS_TEXT_INDEX, **POSTS_TEXT_INDEX_OPTIONS)
+    
+    def _migrate_v5_ops(self):
+        """מחיקת סשנים שפגו בשרת (expireAfterSeconds=0 - לפי הזמן שב-expires_at)"""
+        yield from self._ensure_ttl_index_ops('sessions', SESSIONS_TTL_INDEX, 0)
+    
+    def _migrate_v6_ops(self):
+        """הסרת אינדקס ההיסטוריה הישן - כל כתיבה של פוסט עדכנה אותו לשווא (מסד חדש - אין מה להסיר)"""
+        try:
+            yield self.collections['posts'].drop_index(LEGACY_POSTS_HISTORY_INDEX)
+        except OperationFailure as e:
+            if e.code != INDEX_NOT_FOUND:
+                raise
+    
+    def _migrate_v7_ops(self):
+        """אתחול מוני המשתמשים מהפוסטים השמורים (מונים קיימים נשארים) - מכאן כל כתיבה מעדכנת אותם ב-$inc
+
+        הנעילה מונעת ממופע חדש אחר להריץ את האתחול במקביל, אבל מופע עם הקוד הישן (בזמן deploy) לא מכיר אותה:
+        פוסט שהוא שומר בין הקיבוץ לכתיבת המונים לא נספר - להשלמה: python manage.py rebuild-counters.
+        """
+        rows = yield _Many(self.collections['posts'].aggregate(_user_counts_pipeline(), allowDiskUse=True))
+        seeds = [
+            UpdateOne({'_id': user_id}, {'$setOnInsert': counts}, upsert=True)
+            for user_id, counts in _counts_documents(rows).items()
+        ]
+        
+        if seeds:
+            yield self.collections['user_counters'].bulk_write(seeds, ordered=False)
+            logger.info(f"אותחלו מוני פוסטים ל-{len(seeds)} משתמשים")
+    
+    def _check_hot_indexes_ops(self):
+        """עצירת האתחול אם לשאילתה חמה אין אינדקס תומך"""
+        indexes = {}
+        for collection_name in {collection for collection, _, _ in HOT_QUERY_INDEXES}:
+            indexes[collection_name] = yield self.collections[collection_name].index_information()
+        
+        missing = _missing_hot_indexes(indexes)
+        if missing:
+            raise DatabaseError(f"חסרים אינדקסים לשאילתות: {'; '.join(missing)}")
+    
+    def _ensure_ttl_index_ops(self, collection_name: str, keys: List[tuple], expire_after_seconds: int):
+        """יצירת אינדקס TTL, או עדכון התפוגה של אינדקס קיים עם אותו מפתח"""
+        try:
+            yield self.collections[collection_name].create_index(keys, expireAfterSeconds=expire_after_seconds)
+        except OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT:
+                raise
+            yield self.db.command(_ttl_coll_mod(collection_name, keys, expire_after_seconds))
+            logger.info(f"תפוגת האינדקס על {collection_name} עודכנה ל-{expire_after_seconds} שניות")
+    
+    def _logs_collection_info_ops(self):
+        """פרטי קולקשן הלוגים מ-list_collections (None אם לא קיים)"""
+        infos = yield _Many(self.db.list_collections(filter={'name': 'logs'}))
+        return infos[0] if infos else None
+    
+    def _create_logs_timeseries_ops(self):
+        """יצירת קולקשן הלוגים כ-time-series עם תפוגה מובנית"""
+        yield self.db.create_collection(
+            'logs', timeseries=LOGS_TIMESERIES, expireAfterSeconds=_logs_expire_after_seconds()
+        )
+        yield self.collections['logs'].create_index(LOGS_USER_INDEX)
+        logger.info("קולקשן הלוגים נוצר כ-time-series")
+    
+    def _ensure_logs_collection_ops(self):
+        """קולקשן הלוגים כ-time-series ותפוגה לפי LOG_RETENTION_DAYS; קולקשן רגיל ישן ממשיך עם אינדקס TTL עד migrate-logs"""
+        info = yield from self._logs_collection_info_ops()
+        expire_after_seconds = _logs_expire_after_seconds()
+        
+        if info is None:
+            yield from self._create_logs_timeseries_ops()
+        elif info.get('type') == 'timeseries':
+            if info.get('options', {}).get('expireAfterSeconds') != expire_after_seconds:
+                yield self.db.command({'collMod': 'logs', 'expireAfterSeconds': expire_after_seconds})
+                logger.info(f"תפוגת הלוגים עודכנה ל-{expire_after_seconds} שניות")
+        else:
+            logger.warning("קולקשן הלוגים עדיין רגיל - להמרה ל-time-series: python manage.py migrate-logs")
+            yield from self._ensure_ttl_index_ops('logs', LEGACY_LOGS_TTL_INDEX, expire_after_seconds)
+    
+    def _insert_post_ops(self, post_data: Dict):
+        """הוספת הפוסט ועדכון המונים (מזהה הפעולה - _id של הפוסט)
+
+        פוסט שכבר קיים (הרצה חוזרת מהיומן) לא נוסף שוב, אבל המונים מושלמים - אם החיבור נפל בין ההוספה למונים
+        הם עוד לא עודכנו, ואם כבר עודכנו מסמכי המונים מזהים את הפעולה ולא סופרים פעמיים.
+        """
+        post_id = post_data['_id']
+        try:
+            yield self.routes[OP_HOT_WRITE]['posts'].insert_one(post_data)
+            inserted = True
+        except DuplicateKeyError:
+            logger.debug(f"פוסט {post_id} כבר קיים במסד - משלים את המונים")
+            inserted = False
+        
+        yield from self._increment_user_counters_ops(
+            post_data['user_id'], _counter_increment(None, post_data['status']), post_id
+        )
+        yield from self._increment_statistics_ops(
+            post_data['created_at'], _statistics_increment(None, post_data['status'], post_data['platforms']), post_id
+        )
+        yield from self._increment_hashtag_counts_ops(
+            post_data['user_id'], post_data.get('hashtags', []), post_data['created_at'], post_id
+        )
+        
+        if inserted:
+            db_logger.log_save_post(post_data['user_id'], post_data)
+            logger.info(f"פוסט נשמר במסד נתונים: {post_id}")
+    
+    def _status_update_ops(self, post_id: str, status: str, posting_results: Optional[Dict] = None,
+                           error: Optional[str] = None, op_id: Optional[ObjectId] = None):
+        """עדכון הסטטוס והמונים - המונים זזים רק כשהסטטוס באמת השתנה
+
+        op_id נרשם בפוסט (applied_ops) באותו עדכון יחד עם הסטטוס הקודם, כך שהרצה חוזרת מהיומן אחרי שהעדכון
+        כבר הגיע לשרת יודעת מאיזה סטטוס עברנו ומשלימה את המונים (שמזהים את op_id ולא סופרים פעמיים).
+        """
+        op_id = op_id or ObjectId()
+        posts = self.routes[OP_HOT_WRITE]['posts']
+        projection = {'user_id': 1, 'status': 1, 'platforms': 1, 'created_at': 1}
+        
+        # מחזיר את המסמך שלפני העדכון כדי לדעת מאיזה סטטוס עברנו
+        previous = yield posts.find_one_and_update(
+            _not_applied({'_id': ObjectId(post_id)}, op_id),
+            _status_update(status, posting_results, error, op_id),
+            projection=projection,
+            return_document=ReturnDocument.BEFORE
+        )
+        
+        if previous is None:
+            # העדכון כבר הוחל (הרצה חוזרת) - הסטטוס הקודם נשמר עם op_id
+            applied = yield posts.find_one(
+                {'_id': ObjectId(post_id), 'applied_ops.op_id': op_id},
+                {**projection, 'applied_ops': {'$elemMatch': {'op_id': op_id}}}
+            )
+            if applied is None:
+                logger.warning(f"לא נמצא פוסט לעדכון: {post_id}")
+                return
+            previous = dict(applied, status=applied['applied_ops'][0].get('from_status'))
+        
+        if previous.get('status') != status:
+            yield from self._increment_user_counters_ops(
+                previous['user_id'], _counter_increment(previous.get('status'), status), op_id
+            )
+            if previous.get('created_at'):
+                yield from self._increment_statistics_ops(
+                    previous['created_at'],
+                    _statistics_increment(previous.get('status'), status, previous.get('platforms', [])),
+                    op_id
+                )
+        
+        logger.debug(f"סטטוס פוסט עודכן: {post_id} -> {status}")
+    
+    def _platform_result_ops(self, post_id: str, platform: str, result: Dict, op_id: Optional[ObjectId] = None):
+        """עדכון תוצאת פלטפורמה (pipeline) - פעם אחת לכל op_id, כך שהרצה חוזרת מהיומן לא סופרת את progress שוב"""
+        op_id = op_id or ObjectId()
+        posts = self.routes[OP_HOT_WRITE]['posts']
+        update_result = yield posts.update_one(
+            _not_applied({'_id': ObjectId(post_id)}, op_id),
+            _platform_result_update(platform, result, op_id)
+        )
+        
+        if update_result.matched_count == 0:
+            applied = yield posts.find_one({'_id': ObjectId(post_id)}, {'_id': 1})
+            if applied is None:
+                logger.warning(f"לא נמצא פוסט לעדכון תוצאה: {post_id}")
+    
+    def _posting_results_ops(self, post_id: str):
+        """מסמך הפוסט עם posting_results בלבד"""
+        return (yield self.routes[OP_HOT_READ]['posts'].find_one(
+            {'_id': ObjectId(post_id)}, {'posting_results': 1}, max_time_ms=_max_time_ms(OP_HOT_READ)
+        ))
+    
+    def _get_user_posts_ops(self, user_id: int, limit: int, fields: Optional[List[str]]):
+        """קבלת פוסטים של משתמש (fields - רק השדות האלה)"""
         try:
-            # אינדקס על user_id ותאריך
-            self.collections['posts'].create_index([("user_id", 1), ("created_at", -1)])
+            db_logger.log_query('posts', 'find', {'user_id': user_id})
             
-            # אינדקס על סטטוס פרסום
-            self.collections['posts'].create_index("status")
+            posts = yield _Many(self.routes[OP_ANALYTICS]['posts'].find(
+                {'user_id': user_id}, _post_projection(fields), max_time_ms=_max_time_ms(OP_ANALYTICS)
+            ).sort('created_at', -1).limit(limit))
             
-            # אינדקס על תאריך ברירת מחדל
-            self.collections['logs'].create_index([("timestamp", -1)])
+            # המרת ObjectId לstring
+            for post in posts:
+                post['_id'] = str(post['_id'])
             
-            logger.debug("אינדקסים נוצרו בהצלחה")
+            return posts
             
         except Exception as e:
-            logger.warning(f"שגיאה ביצירת אינדקסים: {e}")
+            raise DatabaseError(f"שגיאה בקבלת פוסטים: {e}")
     
-    def save_post(self, user_id: int, filename: str, text: str, 
-                  platforms: List[str], file_size_mb: float) -> str:
-        """שמירת פוסט חדש"""
+    def _get_user_posts_page_ops(self, user_id: int, limit: int, cursor: Optional[str],
+                                 fields: Optional[List[str]]):
+        """עמוד מהיסטוריית הפוסטים (keyset) - {'posts': [...], 'next_cursor': סמן לעמוד הבא או None}"""
         try:
-            post_data = {
-                'user_id': user_id,
-                'filename': filename,
-                'text': text,
-                'text_preview': text[:100] + "..." if len(text) > 100 else text,
-                'platforms': platforms,
-                'file_size_mb': file_size_mb,
-                'status': 'created',
-                'created_at': datetime.now(),
-                'updated_at': datetime.now(),
-                'posting_results': {},
-                'mock_mode': Config.MOCK_MODE
-            }
-            
-            result = self.collections['posts'].insert_one(post_data)
-            post_id = str(result.inserted_id)
+            query = _user_posts_page_query(user_id, cursor)
+            db_logger.log_query('posts', 'find', {'user_id': user_id})
             
-            db_logger.log_save_post(user_id, post_data)
-            logger.info(f"פוסט נשמר במסד נתונים: {post_id}")
+            # created_at נדרש לבניית הסמן
+            projection = _post_projection(None if fields is None else [*fields, 'created_at'])
+            posts = yield _Many(self.routes[OP_ANALYTICS]['posts'].find(
+                query, projection, max_time_ms=_max_time_ms(OP_ANALYTICS)
+            ).sort(POSTS_HISTORY_SORT).limit(limit + 1))
             
-            return post_id
+            return _build_posts_page(posts, limit)
             
         except Exception as e:
-            raise SaveError(f"שמירת פוסט: {e}")
+            raise DatabaseError(f"שגיאה בקבלת עמוד פוסטים: {e}")
     
-    def update_post_status(self, post_id: str, status: str, 
-                          posting_results: Optional[Dict] = None):
-        """עדכון סטטוס פוסט"""
+    def _increment_user_counters_ops(self, user_id: int, increment: Dict, op_id: ObjectId):
+        """עדכון מוני המשתמש ($inc, פעם אחת לכל op_id) - מסמך המונים נוצר בפוסט הראשון של המשתמש
+
+        תקלה זמנית עוברת הלאה (הכתיבה נרשמת ביומן ומושלמת בהרצה חוזרת); שגיאה אחרת רק נרשמת -
+        המונים משניים לפוסט עצמו ולא מכשילים את הפעולה.
+        """
+        try:
+            yield self.routes[OP_HOT_WRITE]['user_counters'].update_one(
+                *_counter_once({'_id': user_id}, {'$inc': increment}, op_id), upsert=True
+            )
+        except DuplicateKeyError:
+            logger.debug(f"מוני משתמש {user_id} כבר עודכנו בפעולה {op_id}")
+        except Exception as e:
+            if _is_transient_error(e):
+                raise
+            logger.warning(f"שגיאה בעדכון מוני משתמש {user_id}: {e}")
+    
+    def _increment_statistics_ops(self, created_at: datetime, increment: Dict, op_id: ObjectId):
+        """עדכון מצטבר של הדלי היומי ודלי הסה"כ (פעם אחת לכל op_id)"""
+        try:
+            yield self.routes[OP_HOT_WRITE]['statistics'].bulk_write(
+                _statistics_updates(created_at, increment, op_id), ordered=False
+            )
+        except BulkWriteError as e:
+            _raise_unless_duplicates(e, "סטטיסטיקות")
+        except Exception as e:
+            if _is_transient_error(e):
+                raise
+            logger.warning(f"שגיאה בעדכון סטטיסטיקות: {e}")
+    
+    def _increment_hashtag_counts_ops(self, user_id: int, hashtags: List[str], used_at: datetime, op_id: ObjectId):
+        """עדכון מוני ההאשטגים של המשתמש (פעם אחת לכל op_id)"""
+        if not hashtags:
+            return
+        
+        try:
+            yield self.routes[OP_HOT_WRITE]['hashtag_counts'].bulk_write(
+                _hashtag_count_updates(user_id, hashtags, used_at, op_id), ordered=False
+            )
+        except BulkWriteError as e:
+            _raise_unless_duplicates(e, "מוני האשטגים")
+        except Exception as e:
+            if _is_transient_error(e):
+                raise
+            logger.warning(f"שגיאה בעדכון מוני האשטגים: {e}")
+    
+    def _get_posts_by_hashtag_ops(self, user_id: int, tag: str, limit: int, cursor: Optional[str],
+                                  fields: Optional[List[str]]):
+        """עמוד פוסטים של משתמש עם האשטג (keyset, מאינדקס האשטגים) - {'posts': [...], 'next_cursor': ...}"""
         try:
-            from bson import ObjectId
+            query = _hashtag_page_query(user_id, tag, cursor)
+            db_logger.log_query('posts', 'find', {'user_id': user_id, 'hashtags': query['hashtags']})
             
-            update_data = {
-                'status': status,
-                'updated_at': datetime.now()
-            }
+            projection = _post_projection(None if fields is None else [*fields, 'created_at'])
+            posts = yield _Many(self.routes[OP_ANALYTICS]['posts'].find(
+                query, projection, max_time_ms=_max_time_ms(OP_ANALYTICS)
+            ).sort(POSTS_HISTORY_SORT).limit(limit + 1))
             
-            if posting_results:
-                update_data['posting_results'] = posting_results
+            return _build_posts_page(posts, limit)
             
-            result = self.collections['posts'].update_one(
-                {'_id': ObjectId(post_id)},
-                {'$set': update_data}
-            )
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בחיפוש לפי האשטג: {e}")
+    
+    def _get_user_hashtags_ops(self, user_id: int, limit: int):
+        """ההאשטגים הנפוצים של משתמש - [{'tag': ..., 'count': n}] מהמונים"""
+        try:
+            documents = yield _Many(self.routes[OP_HOT_READ]['hashtag_counts'].find(
+                {'_id.user_id': user_id}, {'count': 1}, max_time_ms=_max_time_ms(OP_HOT_READ)
+            ).sort('count', -1).limit(limit))
             
-            if result.modified_count == 0:
-                logger.warning(f"לא נמצא פוסט לעדכון: {post_id}")
-            else:
-                logger.debug(f"סטטוס פוסט עודכן: {post_id} -> {status}")
+            return _hashtags_from_counts(documents)
             
         except Exception as e:
-            raise SaveError(f"עדכון סטטוס פוסט: {e}")
+            raise DatabaseError(f"שגיאה בקבלת האשטגים: {e}")
     
-    def get_user_posts(self, user_id: int, limit: int = 10) -> List[Dict]:
-        """קבלת פוסטים של משתמש"""
+    def _search_posts_ops(self, user_id: int, query: str, limit: int, cursor: Optional[str],
+                          fields: Optional[List[str]]):
+        """חיפוש בכיתובי הפוסטים של משתמש (אינדקס text) - מדורג לפי ציון, {'posts': [...], 'next_cursor': ...}"""
+        query = _search_query(query)
+        if not query:
+            return {'posts': [], 'next_cursor': None}
+        
         try:
-            db_logger.log_query('posts', 'find', {'user_id': user_id})
-            
-            posts = list(self.collections['posts'].find(
-                {'user_id': user_id}
-            ).sort('created_at', -1).limit(limit))
+            db_logger.log_query('posts', 'aggregate', {'user_id': user_id, '$text': query})
             
-            # המרת ObjectId לstring
-            for post in posts:
-                post['_id'] = str(post['_id'])
+            posts = yield _Many(self.routes[OP_ANALYTICS]['posts'].aggregate(
+                _search_pipeline(user_id, query, limit, cursor, fields), maxTimeMS=_max_time_ms(OP_ANALYTICS)
+            ))
             
-            return posts
+            return _build_posts_page(posts, limit, _encode_search_cursor)
             
         except Exception as e:
-            raise DatabaseError(f"שגיאה בקבלת פוסטים: {e}")
+            raise DatabaseError(f"שגיאה בחיפוש פוסטים: {e}")
     
-    def get_post_by_id(self, post_id: str) -> Optional[Dict]:
-        """קבלת פוסט לפי ID"""
+    def _get_user_post_counts_ops(self, user_id: int):
+        """מוני הפוסטים של משתמש: {'total': n, 'by_status': {...}} - מצטברים, פוסטים שנמחקו (TTL / ארכוב) נשארים בספירה"""
         try:
-            from bson import ObjectId
+            counters = yield self.routes[OP_HOT_READ]['user_counters'].find_one(
+                {'_id': user_id}, max_time_ms=_max_time_ms(OP_HOT_READ)
+            )
+            if not counters:
+                return {'total': 0, 'by_status': {}}
             
-            post = self.collections['posts'].find_one({'_id': ObjectId(post_id)})
+            return {'total': counters.get('total', 0), 'by_status': counters.get('by_status', {})}
+            
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בספירת פוסטים: {e}")
+    
+    def _get_post_by_id_ops(self, post_id: str, fields: Optional[List[str]]):
+        """קבלת פוסט לפי ID (fields - רק השדות האלה)"""
+        try:
+            post = yield self.routes[OP_HOT_READ]['posts'].find_one(
+                {'_id': ObjectId(post_id)}, _post_projection(fields), max_time_ms=_max_time_ms(OP_HOT_READ)
+            )
             
             if post:
                 post['_id'] = str(post['_id'])
@@ -164,7 +1114,7 @@ class DatabaseManager:
             logger.error(f"שגיאה בקבלת פוסט {post_id}: {e}")
             return None
     
-    def save_user_settings(self, user_id: int, settings: Dict):
+    def _save_user_settings_ops(self, user_id: int, settings: Dict):
         """שמירת הגדרות משתמש"""
         try:
             user_data = {
@@ -174,149 +1124,704 @@ class DatabaseManager:
             }
             
             # upsert - עדכון או יצירה אם לא קיים
-            self.collections['users'].update_one(
+            yield self.routes[OP_HOT_WRITE]['users'].update_one(
                 {'user_id': user_id},
                 {'$set': user_data, '$setOnInsert': {'created_at': datetime.now()}},
                 upsert=True
             )
             
+            # write-through - המטמון מתעדכן רק אחרי שהכתיבה הצליחה
+            self.settings_cache.set(user_id, settings)
+            
             logger.debug(f"הגדרות משתמש {user_id} נשמרו")
             
         except Exception as e:
+            self.settings_cache.invalidate(user_id)
             raise SaveError(f"שמירת הגדרות משתמש: {e}")
     
-    def get_user_settings(self, user_id: int) -> Dict:
-        """קבלת הגדרות משתמש"""
+    def _get_user_settings_ops(self, user_id: int):
+        """קבלת הגדרות משתמש (read-through דרך המטמון)"""
+        cached = self.settings_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
+        # ביטול מ-change stream שמגיע בזמן הקריאה מבטל גם את השמירה במטמון (הקריאה אולי לפני השינוי)
+        generation = self.settings_cache.generation
+        
         try:
-            user = self.collections['users'].find_one({'user_id': user_id})
+            user = yield self.routes[OP_HOT_READ]['users'].find_one(
+                {'user_id': user_id}, max_time_ms=_max_time_ms(OP_HOT_READ)
+            )
             
             if user and 'settings' in user:
-                return user['settings']
+                settings = user['settings']
             else:
-                # הגדרות ברירת מחדל
-                default_settings = {
-                    'mock_mode': Config.MOCK_MODE,
-                    'auto_post': Config.AUTO_POST_MODE,
-                    'preferred_platforms': ['TikTok', 'Twitter', 'Instagram', 'YouTube']
-                }
-                
-                # שמירת הגדרות ברירת מחדל
-                self.save_user_settings(user_id, default_settings)
-                return default_settings
+                # הגדרות ברירת מחדל - לא נשמרות במסד עד שהמשתמש משנה משהו
+                settings = _default_user_settings()
+            
+            self.settings_cache.set(user_id, settings, generation=generation)
+            return settings
                 
         except Exception as e:
             logger.error(f"שגיאה בקבלת הגדרות משתמש {user_id}: {e}")
             # החזרת הגדרות ברירת מחדל במקרה של שגיאה
-            return {
-                'mock_mode': Config.MOCK_MODE,
-                'auto_post': Config.AUTO_POST_MODE,
-                'preferred_platforms': ['TikTok', 'Twitter', 'Instagram', 'YouTube']
-            }
+            return _default_user_settings()
+    
+    def _get_statistics_ops(self):
+        """קבלת סטטיסטיקות כלליות - מדליים מחושבים מראש; הסיכומים מצטברים מאז rebuild_statistics האחרון"""
+        try:
+            buckets = yield _Many(self.routes[OP_ANALYTICS]['statistics'].find(
+                {'_id': {'$in': [STATISTICS_TOTALS_ID, _statistics_day_id(datetime.now())]}},
+                max_time_ms=_max_time_ms(OP_ANALYTICS)
+            ))
+            
+            # משתמשים ששמרו לפחות פוסט אחד (מסמך מונים לכל אחד) - ממטא-דאטה של הקולקשן, ללא סריקה;
+            # ב-users יש רק מי ששינה הגדרה
+            total_users = yield self.routes[OP_ANALYTICS]['user_counters'].estimated_document_count(
+                maxTimeMS=_max_time_ms(OP_ANALYTICS)
+            )
+            
+            return _statistics_from_buckets(buckets, total_users)
+            
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת סטטיסטיקות: {e}")
+            return {}
+    
+    def _health_check_ops(self):
+        """בדיקת תקינות החיבור למסד נתונים"""
+        try:
+            yield self.client.admin.command('ping')
+            return True
+        except Exception:
+            return False
+
+class DatabaseManager(_MongoOperations):
+    """מנהל מסד הנתונים (pymongo) - לפקודות התחזוקה; כתיבות ישירות ללא יומן מקומי,
+    כי היומן שייך לתהליך הבוט (AsyncDatabaseManager)"""
+    
+    _run = staticmethod(_run_sync)
+    
+    def __init__(self):
+        self.client: Optional[MongoClient] = None
+        self.db = None
+        self.collections = {}
+        self.settings_cache = _create_settings_cache()
+        self._connect()
+    
+    def _connect(self):
+        """יצירת חיבור למסד הנתונים"""
+        try:
+            self.client = MongoClient(Config.MONGODB_URI, **_client_options())
+            
+            # בדיקת חיבור
+            self.client.admin.command('ping')
+            
+            self.db = self.client[Config.DATABASE_NAME]
+            self._setup_collections()
+            
+            db_logger.log_connection_status(True)
+            logger.info("חיבור למסד נתונים הצליח")
+            
+        except ConnectionFailure as e:
+            db_logger.log_connection_status(False, str(e))
+            raise ConnectionError("MongoDB")
+        except Exception as e:
+            db_logger.log_connection_status(False, str(e))
+            raise DatabaseError(f"שגיאה בחיבור למסד נתונים: {e}")
+    
+    def _setup_collections(self):
+        """הגדרת קולקשנים ויצירת אינדקסים"""
+        self._bind_collections()
+        self._create_indexes()
+    
+    def _create_indexes(self):
+        """מיגרציות סכימה ובדיקת אינדקסים (ראו _create_indexes_ops)"""
+        self._run(self._create_indexes_ops())
+    
+    def save_post(self, user_id: int, filename: str, text: str, 
+                  platforms: List[str], file_size_mb: float) -> str:
+        """שמירת פוסט חדש"""
+        post_data = _build_post_document(user_id, filename, text, platforms, file_size_mb)
+        post_data['_id'] = ObjectId()
+        
+        try:
+            self._run(self._insert_post_ops(post_data))
+        except Exception as e:
+            raise SaveError(f"שמירת פוסט: {e}")
+        
+        return str(post_data['_id'])
+    
+    def update_post_status(self, post_id: str, status: str, 
+                          posting_results: Optional[Dict] = None, error: Optional[str] = None):
+        """עדכון סטטוס פוסט (posting_results מחליף את כל התוצאות - לתוצאה בודדת ראו record_platform_result)"""
+        try:
+            self._run(self._status_update_ops(post_id, status, posting_results, error))
+        except Exception as e:
+            raise SaveError(f"עדכון סטטוס פוסט: {e}")
+    
+    def record_platform_result(self, post_id: str, platform: str, result: Dict):
+        """שמירת תוצאת פרסום של פלטפורמה אחת ברגע שהסתיימה (posting_results.<platform> + מוני progress)"""
+        try:
+            self._run(self._platform_result_ops(post_id, platform, result))
+        except Exception as e:
+            raise SaveError(f"שמירת תוצאת {platform}: {e}")
+    
+    def get_completed_platforms(self, post_id: str) -> List[str]:
+        """פלטפורמות שהפוסט כבר פורסם בהן בהצלחה - לדילוג בהפעלה חוזרת"""
+        try:
+            return _completed_platforms(self._run(self._posting_results_ops(post_id)))
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בקבלת תוצאות פרסום {post_id}: {e}")
+    
+    def get_user_posts(self, user_id: int, limit: int = 10,
+                       fields: Optional[List[str]] = None) -> List[Dict]:
+        """קבלת פוסטים של משתמש (fields - רק השדות האלה)"""
+        return self._run(self._get_user_posts_ops(user_id, limit, fields))
+    
+    def get_user_posts_page(self, user_id: int, limit: int = 10, cursor: Optional[str] = None,
+                            fields: Optional[List[str]] = POST_SUMMARY_FIELDS) -> Dict:
+        """עמוד מהיסטוריית הפוסטים (keyset) - {'posts': [...], 'next_cursor': סמן לעמוד הבא או None}"""
+        return self._run(self._get_user_posts_page_ops(user_id, limit, cursor, fields))
+    
+    def get_posts_by_hashtag(self, user_id: int, tag: str, limit: int = 10, cursor: Optional[str] = None,
+                             fields: Optional[List[str]] = POST_SUMMARY_FIELDS) -> Dict:
+        """עמוד פוסטים של משתמש עם האשטג (keyset, מאינדקס האשטגים) - {'posts': [...], 'next_cursor': ...}"""
+        return self._run(self._get_posts_by_hashtag_ops(user_id, tag, limit, cursor, fields))
+    
+    def get_user_hashtags(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """ההאשטגים הנפוצים של משתמש - [{'tag': ..., 'count': n}] מהמונים"""
+        return self._run(self._get_user_hashtags_ops(user_id, limit))
+    
+    def search_posts(self, user_id: int, query: str, limit: int = 10, cursor: Optional[str] = None,
+                     fields: Optional[List[str]] = POST_SUMMARY_FIELDS) -> Dict:
+        """חיפוש בכיתובי הפוסטים של משתמש (אינדקס text) - מדורג לפי ציון, {'posts': [...], 'next_cursor': ...}"""
+        return self._run(self._search_posts_ops(user_id, query, limit, cursor, fields))
+    
+    def get_user_post_counts(self, user_id: int) -> Dict:
+        """מוני הפוסטים של משתמש: {'total': n, 'by_status': {...}}"""
+        return self._run(self._get_user_post_counts_ops(user_id))
+    
+    def count_user_posts(self, user_id: int, status: Optional[str] = None) -> int:
+        """מספר הפוסטים של משתמש (סה"כ או לפי סטטוס)"""
+        counts = self.get_user_post_counts(user_id)
+        
+        if status is None:
+            return counts['total']
+        return counts['by_status'].get(status, 0)
+    
+    def get_post_by_id(self, post_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        """קבלת פוסט לפי ID (fields - רק השדות האלה)"""
+        return self._run(self._get_post_by_id_ops(post_id, fields))
+    
+    def save_user_settings(self, user_id: int, settings: Dict):
+        """שמירת הגדרות משתמש"""
+        self._run(self._save_user_settings_ops(user_id, settings))
+    
+    def get_user_settings(self, user_id: int) -> Dict:
+        """קבלת הגדרות משתמש (read-through דרך המטמון)"""
+        return self._run(self._get_user_settings_ops(user_id))
     
     def log_action(self, user_id: int, action: str, details: Dict = None, 
                    level: str = 'info'):
         """שמירת לוג פעולה במסד נתונים"""
         try:
-            log_data = {
-                'user_id': user_id,
-                'action': action,
-                'details': details or {},
-                'level': level,
-                'timestamp': datetime.now()
-            }
-            
-            self.collections['logs'].insert_one(log_data)
+            self.routes[OP_LOGS]['logs'].insert_one(_log_document(user_id, action, details, level))
             
         except Exception as e:
             # אם נכשלה שמירת הלוג, רק נרשום ללוג רגיל
             logger.error(f"שגיאה בשמירת לוג במסד נתונים: {e}")
     
     def get_statistics(self) -> Dict:
-        """קבלת סטטיסטיקות כלליות"""
+        """קבלת סטטיסטיקות כלליות - מדליים מחושבים מראש (ראו rebuild_statistics)"""
+        return self._run(self._get_statistics_ops())
+    
+    def rebuild_statistics(self) -> int:
+        """בנייה מחדש של דליי הסטטיסטיקות מהפוסטים השמורים - מחזיר מספר דליים;
+        $inc שנכתב לדלי בין הקיבוץ לכתיבת אותו דלי נדרס, ודליים של ימים בלי פוסטים שמורים נשארים כמו שהם"""
         try:
-            stats = {}
+            groups = list(self.routes[OP_ANALYTICS]['posts'].aggregate(
+                _statistics_rebuild_pipeline(), allowDiskUse=True, maxTimeMS=_max_time_ms(OP_ANALYTICS)
+            ))
+            buckets = _statistics_buckets_from_groups(groups)
             
-            # סך פוסטים
-            stats['total_posts'] = self.collections['posts'].count_documents({})
+            # כל דלי מוחלף במקומו ב-$set - הבוט ממשיך לעדכן את שאר הדליים ב-$inc בזמן הבנייה
+            if buckets:
+                self.routes[OP_HOT_WRITE]['statistics'].bulk_write(_statistics_rebuild_updates(buckets), ordered=False)
             
-            # פוסטים מהיום האחרון
-            yesterday = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            stats['posts_today'] = self.collections['posts'].count_documents({
-                'created_at': {'$gte': yesterday}
-            })
+            logger.info(f"סטטיסטיקות נבנו מחדש: {len(buckets)} דליים")
+            return len(buckets)
             
-            # פוסטים מוצלחים
-            stats['successful_posts'] = self.collections['posts'].count_documents({
-                'status': 'completed'
-            })
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בבניית סטטיסטיקות מחדש: {e}")
+    
+    def rebuild_user_counters(self) -> int:
+        """בנייה מחדש של מוני המשתמשים מהפוסטים השמורים ($set) - מחזיר מספר משתמשים;
+        פוסטים שכבר נמחקו (TTL / ארכוב) יוצאים מהספירה, ו-$inc שנכתב בין הקיבוץ לכתיבה נדרס"""
+        try:
+            rows = list(self.routes[OP_ANALYTICS]['posts'].aggregate(
+                _user_counts_pipeline(), allowDiskUse=True, maxTimeMS=_max_time_ms(OP_ANALYTICS)
+            ))
+            updates = [
+                UpdateOne({'_id': user_id}, {'$set': counts}, upsert=True)
+                for user_id, counts in _counts_documents(rows).items()
+            ]
             
-            # סך משתמשים
-            stats['total_users'] = self.collections['users'].count_documents({})
+            if updates:
+                self.routes[OP_HOT_WRITE]['user_counters'].bulk_write(updates, ordered=False)
             
-            # פלטפורמות פופולריות
-            pipeline = [
-                {'$unwind': '$platforms'},
-                {'$group': {'_id': '$platforms', 'count': {'$sum': 1}}},
-                {'$sort': {'count': -1}},
-                {'$limit': 10}
-            ]
+            logger.info(f"מוני פוסטים נבנו מחדש ל-{len(updates)} משתמשים")
+            return len(updates)
             
-            platform_stats = list(self.collections['posts'].aggregate(pipeline))
-            stats['popular_platforms'] = {item['_id']: item['count'] for item in platform_stats}
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בבניית מוני המשתמשים מחדש: {e}")
+    
+    def backfill_post_expiry(self) -> int:
+        """קביעת expires_at לפוסטים סופיים שנשמרו לפני אינדקס ה-TTL - מחזיר מספר פוסטים שעודכנו"""
+        try:
+            query, update = _post_expiry_backfill(Config.POST_RETENTION_DAYS)
+            result = self.collections['posts'].update_many(query, update)
             
-            return stats
+            logger.info(f"נקבעה תפוגה ל-{result.modified_count} פוסטים ישנים")
+            return result.modified_count
             
         except Exception as e:
-            logger.error(f"שגיאה בקבלת סטטיסטיקות: {e}")
-            return {}
+            raise DatabaseError(f"שגיאה בקביעת תפוגה לפוסטים: {e}")
     
-    def cleanup_old_posts(self, days_old: int = 30):
-        """ניקוי פוסטים ישנים"""
+    def backfill_hashtags(self, batch_size: int = 1000) -> int:
+        """חילוץ האשטגים לפוסטים שנשמרו לפני שדה hashtags ועדכון המונים - מחזיר מספר פוסטים שעודכנו"""
         try:
-            cutoff_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            cutoff_date = cutoff_date.replace(day=cutoff_date.day - days_old)
+            cursor = self.collections['posts'].find(
+                {'hashtags': {'$exists': False}}, {'user_id': 1, 'text': 1, 'created_at': 1}, batch_size=batch_size
+            )
+            updated = 0
             
-            result = self.collections['posts'].delete_many({
-                'created_at': {'$lt': cutoff_date},
-                'status': {'$in': ['completed', 'failed']}
-            })
+            for batch in iter_batches(cursor, batch_size):
+                hashtags = {post['_id']: TextHelper.normalize_hashtags(post.get('text', '')) for post in batch}
+                
+                self.collections['posts'].bulk_write([
+                    UpdateOne({'_id': post_id}, {'$set': {'hashtags': tags}}) for post_id, tags in hashtags.items()
+                ], ordered=False)
+                
+                for post in batch:
+                    self._run(self._increment_hashtag_counts_ops(
+                        post['user_id'], hashtags[post['_id']], post['created_at']
+                    ))
+                
+                updated += len(batch)
+            
+            logger.info(f"חולצו האשטגים ל-{updated} פוסטים ישנים")
+            return updated
+            
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בחילוץ האשטגים: {e}")
+    
+    def migrate_logs_to_timeseries(self, batch_size: int = 1000) -> int:
+        """המרת קולקשן לוגים רגיל ל-time-series - מחזיר מספר רשומות שהועברו"""
+        try:
+            info = self._run(self._logs_collection_info_ops())
+            
+            if info is not None and info.get('type') != 'timeseries':
+                if self.db.list_collection_names(filter={'name': LEGACY_LOGS_COLLECTION}):
+                    raise DatabaseError(
+                        f"גם logs וגם {LEGACY_LOGS_COLLECTION} הם קולקשנים רגילים - יש לעצור את הבוט ולהריץ שוב"
+                    )
+                # אי אפשר לשנות שם של קולקשן time-series - לכן הקולקשן הישן מועבר הצידה
+                self.collections['logs'].rename(LEGACY_LOGS_COLLECTION)
+                info = None
+            
+            if info is None:
+                self._run(self._create_logs_timeseries_ops())
+            
+            legacy = self.db[LEGACY_LOGS_COLLECTION]
+            cutoff = datetime.now() - timedelta(days=Config.LOG_RETENTION_DAYS)
+            migrated = 0
+            
+            # כל אצווה נמחקת מהקולקשן הישן אחרי שנכתבה - הרצה שנקטעה ממשיכה מאותה נקודה
+            while True:
+                batch = list(legacy.find().sort('_id', 1).limit(batch_size))
+                if not batch:
+                    break
+                
+                # רשומות שכבר עברה תפוגתן לא מועתקות
+                records = [
+                    _legacy_log_to_timeseries(record) for record in batch
+                    if record.get('timestamp') and record['timestamp'] >= cutoff
+                ]
+                if records:
+                    self.collections['logs'].insert_many(records, ordered=False)
+                
+                legacy.delete_many({'_id': {'$in': [record['_id'] for record in batch]}})
+                migrated += len(records)
+            
+            legacy.drop()
             
-            logger.info(f"נמחקו {result.deleted_count} פוסטים ישנים")
+            logger.info(f"{migrated} רשומות לוג הועברו לקולקשן time-series")
+            return migrated
             
+        except DatabaseError:
+            raise
         except Exception as e:
-            logger.error(f"שגיאה בניקוי פוסטים ישנים: {e}")
+            raise DatabaseError(f"שגיאה בהמרת הלוגים ל-time-series: {e}")
     
-    def cleanup_old_logs(self, days_old: int = 7):
-        """ניקוי לוגים ישנים"""
+    def archive_expired_posts(self, archive: PartitionedArchive, batch_size: int = 1000,
+                              lead_hours: float = 48) -> int:
+        """ארכוב פוסטים שפג (או עומד לפוג) תוקפם - כל אצווה נכתבת ומאומתת ורק אז נמחקת"""
         try:
-            cutoff_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            cutoff_date = cutoff_date.replace(day=cutoff_date.day - days_old)
+            cursor = self.collections['posts'].find(_posts_archive_query(lead_hours), batch_size=batch_size)
+            archived = 0
             
-            result = self.collections['logs'].delete_many({
-                'timestamp': {'$lt': cutoff_date}
-            })
+            for batch in iter_batches(cursor, batch_size):
+                archive.write_batch('posts', batch, 'created_at')
+                self.collections['posts'].delete_many({'_id': {'$in': [post['_id'] for post in batch]}})
+                archived += len(batch)
             
-            logger.info(f"נמחקו {result.deleted_count} לוגים ישנים")
+            logger.info(f"{archived} פוסטים אורכבו ונמחקו")
+            return archived
             
+        except DatabaseError:
+            raise
         except Exception as e:
-            logger.error(f"שגיאה בניקוי לוגים ישנים: {e}")
+            raise DatabaseError(f"שגיאה בארכוב פוסטים: {e}")
+    
+    def archive_expiring_logs(self, archive: PartitionedArchive, batch_size: int = 1000,
+                              lead_hours: float = 48) -> int:
+        """ארכוב לוגים לפני שהתפוגה המובנית מוחקת אותם - ממשיך מנקודת הסיום של הריצה הקודמת"""
+        try:
+            state = self.collections['archive_state'].find_one({'_id': 'logs'})
+            query, cutoff = _logs_archive_query(state['archived_until'] if state else None, lead_hours)
+            
+            cursor = self.collections['logs'].find(query, batch_size=batch_size)
+            archived = 0
+            
+            for batch in iter_batches(cursor, batch_size):
+                archive.write_batch('logs', batch, 'timestamp')
+                archived += len(batch)
+            
+            # הלוגים עצמם נמחקים ע"י התפוגה של קולקשן ה-time-series (מחיקה של דליים שלמים)
+            self.collections['archive_state'].update_one(
+                {'_id': 'logs'},
+                {'$set': {'archived_until': cutoff, 'updated_at': datetime.now()}},
+                upsert=True
+            )
+            
+            logger.info(f"{archived} רשומות לוג אורכבו")
+            return archived
+            
+        except DatabaseError:
+            raise
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בארכוב לוגים: {e}")
     
     def health_check(self) -> bool:
         """בדיקת תקינות החיבור למסד נתונים"""
+        return self._run(self._health_check_ops())
+    
+    def close_connection(self):
+        """סגירת החיבור למסד הנתונים"""
+        if self.client:
+            self.client.close()
+            logger.info("חיבור למסד נתונים נסגר")
+
+class AsyncDatabaseManager(_MongoOperations, StorageBackend):
+    """מנהל מסד נתונים אסינכרוני (motor) - אותו API כמו DatabaseManager, ללא חסימת לולאת האירועים"""
+    
+    _run = staticmethod(_run_async)
+    
+    def __init__(self):
+        self.client: Optional[AsyncIOMotorClient] = None
+        self.db = None
+        self.collections = {}
+        self.settings_cache = _create_settings_cache()
+        self._setup_client()
+    
+    def _setup_client(self):
+        """יצירת לקוח motor וקולקשנים (ללא פעולות רשת)"""
+        self.client = AsyncIOMotorClient(Config.MONGODB_URI, **_client_options())
+        self.db = self.client[Config.DATABASE_NAME]
+        self._bind_collections()
+        
+        # לוגים נכתבים באצוות ברקע - log_action לא ממתין לשרת
+        self.log_writer = BufferedLogWriter(
+            self.routes[OP_LOGS]['logs'],
+            max_queue_size=Config.DB_LOG_QUEUE_SIZE,
+            batch_size=Config.DB_LOG_BATCH_SIZE,
+            flush_interval=Config.DB_LOG_FLUSH_INTERVAL,
+            overflow_policy=Config.DB_LOG_OVERFLOW,
+            spill_path=Config.DB_LOG_SPILL_FILE
+        )
+        
+        # כתיבות פוסטים בזמן שהמסד לא זמין - מועברות כשהוא חוזר
+        self.journal = WriteJournal(Config.DB_JOURNAL_FILE)
+        self._replay_task: Optional[asyncio.Task] = None
+        
+        # שינויי הגדרות מתהליכים אחרים מוחקים את הרשומה במטמון
+        self.cache_invalidator = ChangeStreamInvalidator(self.db, retry_interval=Config.CACHE_STREAM_RETRY_INTERVAL)
+        self.cache_invalidator.register(
+            'users', self.settings_cache, 'user_id', live_ttl=Config.USER_SETTINGS_CACHE_LIVE_TTL
+        )
+    
+    async def connect(self):
+        """בדיקת חיבור ויצירת אינדקסים - נקרא פעם אחת באתחול"""
         try:
-            self.client.admin.command('ping')
-            return True
-        except Exception:
-            return False
+            await self.client.admin.command('ping')
+            await self._create_indexes()
+            self.log_writer.start()
+            
+            if Config.CACHE_CHANGE_STREAMS:
+                self.cache_invalidator.start()
+            
+            # כתיבות שנשארו ביומן מהרצה קודמת
+            if self.journal.pending():
+                self._start_journal_replay()
+            
+            db_logger.log_connection_status(True)
+            logger.info("חיבור אסינכרוני למסד נתונים הצליח")
+            
+        except ConnectionFailure as e:
+            db_logger.log_connection_status(False, str(e))
+            raise ConnectionError("MongoDB")
+        except Exception as e:
+            db_logger.log_connection_status(False, str(e))
+            raise DatabaseError(f"שגיאה בחיבור למסד נתונים: {e}")
+    
+    
+    async def _create_indexes(self):
+        """מיגרציות סכימה ובדיקת אינדקסים (ראו _create_indexes_ops)"""
+        await self._run(self._create_indexes_ops())
+    
+    async def save_post(self, user_id: int, filename: str, text: str, 
+                        platforms: List[str], file_size_mb: float) -> str:
+        """שמירת פוסט חדש (ביומן המקומי אם המסד לא זמין)"""
+        post_data = _build_post_document(user_id, filename, text, platforms, file_size_mb)
+        
+        # ה-ID נקבע בצד הלקוח - אותו מזהה גם אם הפוסט נרשם ביומן ומועבר למסד מאוחר יותר
+        post_data['_id'] = ObjectId()
+        
+        await self._write_or_journal(JOURNAL_SAVE_POST, {'post': post_data}, "שמירת פוסט")
+        return str(post_data['_id'])
+    
+    async def update_post_status(self, post_id: str, status: str, 
+                                 posting_results: Optional[Dict] = None, error: Optional[str] = None):
+        """עדכון סטטוס פוסט (posting_results מחליף את כל התוצאות - לתוצאה בודדת ראו record_platform_result)"""
+        # מזהה הפעולה נשמר ביומן - הרצה חוזרת של אותה כתיבה לא נספרת פעמיים
+        await self._write_or_journal(
+            JOURNAL_UPDATE_STATUS,
+            {'post_id': post_id, 'status': status, 'posting_results': posting_results, 'error': error,
+             'op_id': ObjectId()},
+            "עדכון סטטוס פוסט"
+        )
+    
+    async def record_platform_result(self, post_id: str, platform: str, result: Dict):
+        """שמירת תוצאת פרסום של פלטפורמה אחת ברגע שהסתיימה (posting_results.<platform> + מוני progress)"""
+        await self._write_or_journal(
+            JOURNAL_PLATFORM_RESULT,
+            {'post_id': post_id, 'platform': platform, 'result': result, 'op_id': ObjectId()},
+            f"שמירת תוצאת {platform}"
+        )
+    
+    async def _write_or_journal(self, operation: str, payload: Dict, description: str):
+        """כתיבה ישירה, או ליומן המקומי כשהמסד לא זמין - וגם כשיש ביומן כתיבות קודמות (שמירה על הסדר)"""
+        if not self.journal.pending():
+            try:
+                await self._apply_write(operation, payload)
+                return
+            except Exception as e:
+                if not _is_transient_error(e):
+                    raise SaveError(f"{description}: {e}")
+                logger.warning(f"מסד הנתונים לא זמין - {description} נרשם ביומן המקומי: {e}")
+        
+        try:
+            # הרישום מיידי (כתיבות שאחריו כבר רואות יומן לא ריק), ה-fsync בת'רד - לא חוסם את לולאת האירועים
+            self.journal.append(operation, payload, sync=False)
+            await asyncio.to_thread(self.journal.sync)
+        except OSError as e:
+            raise SaveError(f"{description} (יומן מקומי): {e}")
+        
+        self._start_journal_replay()
+    
+    async def _apply_write(self, operation: str, payload: Dict):
+        """ביצוע כתיבה מהיומן או ישירה - כל הפעולות בטוחות להרצה חוזרת"""
+        if operation == JOURNAL_SAVE_POST:
+            await self._insert_post(payload['post'])
+        elif operation == JOURNAL_UPDATE_STATUS:
+            await self._apply_status_update(**payload)
+        elif operation == JOURNAL_PLATFORM_RESULT:
+            await self._apply_platform_result(**payload)
+        else:
+            raise ValueError(f"פעולת יומן לא מוכרת: {operation}")
+    
+    
+    async def _insert_post(self, post_data: Dict):
+        """הוספת הפוסט ועדכון המונים (ראו _insert_post_ops)"""
+        await self._run(self._insert_post_ops(post_data))
+    
+    async def _apply_status_update(self, post_id: str, status: str, posting_results: Optional[Dict] = None,
+                                   error: Optional[str] = None, op_id: Optional[ObjectId] = None):
+        """עדכון הסטטוס והמונים (ראו _status_update_ops)"""
+        await self._run(self._status_update_ops(post_id, status, posting_results, error, op_id))
+    
+    async def _apply_platform_result(self, post_id: str, platform: str, result: Dict,
+                                     op_id: Optional[ObjectId] = None):
+        """עדכון תוצאת פלטפורמה (ראו _platform_result_ops)"""
+        await self._run(self._platform_result_ops(post_id, platform, result, op_id))
+    
+    def _start_journal_replay(self):
+        """הפעלת משימת העברת היומן (אם לא רצה כבר)"""
+        if self._replay_task is None or self._replay_task.done():
+            self._replay_task = asyncio.create_task(self._replay_journal_loop(), name="db-journal-replay")
+    
+    async def _replay_journal_loop(self):
+        """ממתין שבדיקת התקינות תצליח ומעביר את היומן למסד"""
+        while self.journal.pending():
+            await asyncio.sleep(Config.DB_JOURNAL_RETRY_INTERVAL)
+            
+            if await self.health_check():
+                await self.replay_journal()
+    
+    async def replay_journal(self) -> int:
+        """העברת היומן למסד לפי הסדר - נעצר בתקלה זמנית וממשיך מאותה רשומה בפעם הבאה, רשומה שנדחתה סופית עוברת לדחויות"""
+        applied = 0
+        
+        while self.journal.pending():
+            entry = self.journal.peek()
+            
+            try:
+                await self._apply_write(entry['operation'], entry['payload'])
+            except Exception as e:
+                if _is_transient_error(e):
+                    logger.warning(f"העברת יומן הכתיבות נעצרה ({self.journal.pending()} נותרו): {e}")
+                    break
+                self.journal.reject(e)
+                continue
+            
+            self.journal.commit()
+            applied += 1
+        
+        if applied:
+            logger.info(f"{applied} כתיבות הועברו מהיומן המקומי למסד")
+        
+        return applied
+    
+    async def get_completed_platforms(self, post_id: str) -> List[str]:
+        """פלטפורמות שהפוסט כבר פורסם בהן בהצלחה - לדילוג בהפעלה חוזרת (כולל תוצאות שעדיין ביומן)"""
+        try:
+            post = await self._run(self._posting_results_ops(post_id))
+        except ConnectionFailure as e:
+            logger.warning(f"מסד הנתונים לא זמין - תוצאות פרסום {post_id} מהיומן המקומי בלבד: {e}")
+            post = None
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בקבלת תוצאות פרסום {post_id}: {e}")
+        
+        return _completed_platforms(_with_journal_results(post, post_id, self.journal.pending_entries()))
+    
+    async def get_user_posts(self, user_id: int, limit: int = 10,
+                             fields: Optional[List[str]] = None) -> List[Dict]:
+        """קבלת פוסטים של משתמש (fields - רק השדות האלה)"""
+        return await self._run(self._get_user_posts_ops(user_id, limit, fields))
+    
+    async def get_user_posts_page(self, user_id: int, limit: int = 10, cursor: Optional[str] = None,
+                                  fields: Optional[List[str]] = POST_SUMMARY_FIELDS) -> Dict:
+        """עמוד מהיסטוריית הפוסטים (keyset) - {'posts': [...], 'next_cursor': סמן לעמוד הבא או None}"""
+        return await self._run(self._get_user_posts_page_ops(user_id, limit, cursor, fields))
+    
+    async def get_posts_by_hashtag(self, user_id: int, tag: str, limit: int = 10, cursor: Optional[str] = None,
+                                   fields: Optional[List[str]] = POST_SUMMARY_FIELDS) -> Dict:
+        """עמוד פוסטים של משתמש עם האשטג (keyset, מאינדקס האשטגים) - {'posts': [...], 'next_cursor': ...}"""
+        return await self._run(self._get_posts_by_hashtag_ops(user_id, tag, limit, cursor, fields))
+    
+    async def get_user_hashtags(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """ההאשטגים הנפוצים של משתמש - [{'tag': ..., 'count': n}] מהמונים"""
+        return await self._run(self._get_user_hashtags_ops(user_id, limit))
+    
+    async def search_posts(self, user_id: int, query: str, limit: int = 10, cursor: Optional[str] = None,
+                           fields: Optional[List[str]] = POST_SUMMARY_FIELDS) -> Dict:
+        """חיפוש בכיתובי הפוסטים של משתמש (אינדקס text) - מדורג לפי ציון, {'posts': [...], 'next_cursor': ...}"""
+        return await self._run(self._search_posts_ops(user_id, query, limit, cursor, fields))
+    
+    async def get_user_post_counts(self, user_id: int) -> Dict:
+        """מוני הפוסטים של משתמש: {'total': n, 'by_status': {...}}"""
+        return await self._run(self._get_user_post_counts_ops(user_id))
+    
+    async def get_post_by_id(self, post_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        """קבלת פוסט לפי ID (fields - רק השדות האלה)"""
+        return await self._run(self._get_post_by_id_ops(post_id, fields))
+    
+    async def save_user_settings(self, user_id: int, settings: Dict):
+        """שמירת הגדרות משתמש"""
+        await self._run(self._save_user_settings_ops(user_id, settings))
+    
+    async def get_user_settings(self, user_id: int) -> Dict:
+        """קבלת הגדרות משתמש (read-through דרך המטמון)"""
+        return await self._run(self._get_user_settings_ops(user_id))
+    
+    async def save_session(self, session: Dict):
+        """שמירת סשן פתוח (upsert לפי post_id)"""
+        try:
+            await self.routes[OP_HOT_WRITE]['sessions'].replace_one(
+                {'_id': session['post_id']}, {'_id': session['post_id'], **session}, upsert=True
+            )
+        except Exception as e:
+            raise SaveError(f"שמירת סשן: {e}")
+    
+    async def delete_session(self, post_id: str):
+        """מחיקת סשן שנסגר"""
+        await self.routes[OP_HOT_WRITE]['sessions'].delete_one({'_id': post_id})
+    
+    async def load_sessions(self) -> List[Dict]:
+        """כל הסשנים שעוד לא פגו (ה-TTL בשרת מוחק באיחור של עד דקה)"""
+        cursor = self.routes[OP_HOT_READ]['sessions'].find(
+            {'expires_at': {'$gt': datetime.utcnow()}}, {'_id': 0}, max_time_ms=_max_time_ms(OP_HOT_READ)
+        )
+        return await cursor.to_list(length=None)
+    
+    async def log_action(self, user_id: int, action: str, details: Dict = None, 
+                         level: str = 'info'):
+        """שמירת לוג פעולה במסד נתונים - נכנס לתור ונכתב באצווה ברקע"""
+        self.log_writer.enqueue(_log_document(user_id, action, details, level))
+    
+    async def flush_logs(self):
+        """עצירת כותב הלוגים ושליחת כל מה שנשאר בתור - נקרא בכיבוי"""
+        try:
+            await self.log_writer.close()
+        except Exception as e:
+            logger.error(f"שגיאה בשליחת לוגים אחרונים למסד נתונים: {e}")
+    
+    async def get_statistics(self) -> Dict:
+        """קבלת סטטיסטיקות כלליות - מדליים מחושבים מראש (ראו rebuild_statistics)"""
+        return await self._run(self._get_statistics_ops())
+    
+    async def health_check(self) -> bool:
+        """בדיקת תקינות החיבור למסד נתונים"""
+        return await self._run(self._health_check_ops())
+    
+    async def get_metrics(self) -> Dict:
+        """מדדי הפעולות - לפני ההצגה משלימים תוכנית ביצוע (explain) לשאילתות האיטיות"""
+        metrics = get_db_metrics()
+        
+        for sample in metrics.explain_targets():
+            try:
+                explain = await self.client[sample['_database']].command(explain_command(sample['_command']))
+                sample['plan'] = plan_summary(explain)
+            except Exception as e:
+                sample['plan'] = f"explain נכשל: {e}"
+        
+        return metrics.snapshot()
     
     def close_connection(self):
         """סגירת החיבור למסד הנתונים"""
+        self.cache_invalidator.stop()
+        
+        # מה שלא הועבר נשאר בקובץ היומן ויועבר בהפעלה הבאה
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+        
         if self.client:
             self.client.close()
             logger.info("חיבור למסד נתונים נסגר")
 
 # יצירת instance גלובלי
 _db_manager = None
+_async_db_manager = None
 
 def get_database() -> DatabaseManager:
     """מחזיר instance של DatabaseManager (Singleton pattern)"""
@@ -327,23 +1832,42 @@ def get_database() -> DatabaseManager:
     
     return _db_manager
 
-# פונקציות עזר מהירות
-def save_post(user_id: int, filename: str, text: str, platforms: List[str], file_size_mb: float) -> str:
+def get_async_database() -> StorageBackend:
+    """מחזיר את ה-backend האסינכרוני לפי Config.STORAGE_BACKEND (Singleton pattern)"""
+    global _async_db_manager
+    
+    if _async_db_manager is None:
+        if Config.STORAGE_BACKEND == 'sqlite':
+            from sqlite_storage import SQLiteDatabaseManager
+            _async_db_manager = SQLiteDatabaseManager(Config.SQLITE_PATH)
+        else:
+            _async_db_manager = AsyncDatabaseManager()
+    
+    return _async_db_manager
+
+# פונקציות עזר מהירות (אסינכרוניות - לשימוש מתוך handlers של הבוט)
+async def save_post(user_id: int, filename: str, text: str, platforms: List[str], file_size_mb: float) -> str:
     """פונקציית עזר לשמירת פוסט"""
-    db = get_database()
-    return db.save_post(user_id, filename, text, platforms, file_size_mb)
+    db = get_async_database()
+    return await db.save_post(user_id, filename, text, platforms, file_size_mb)
 
-def update_post_status(post_id: str, status: str, posting_results: Optional[Dict] = None):
+async def update_post_status(post_id: str, status: str, posting_results: Optional[Dict] = None,
+                             error: Optional[str] = None):
     """פונקציית עזר לעדכון סטטוס פוסט"""
-    db = get_database()
-    db.update_post_status(post_id, status, posting_results)
+    db = get_async_database()
+    await db.update_post_status(post_id, status, posting_results, error)
+
+async def record_platform_result(post_id: str, platform: str, result: Dict):
+    """פונקציית עזר לשמירת תוצאת פלטפורמה אחת"""
+    db = get_async_database()
+    await db.record_platform_result(post_id, platform, result)
 
-def get_user_settings(user_id: int) -> Dict:
+async def get_user_settings(user_id: int) -> Dict:
     """פונקציית עזר לקבלת הגדרות משתמש"""
-    db = get_database()
-    return db.get_user_settings(user_id)
+    db = get_async_database()
+    return await db.get_user_settings(user_id)
 
-def save_user_settings(user_id: int, settings: Dict):
+async def save_user_settings(user_id: int, settings: Dict):
     """פונקציית עזר לשמירת הגדרות משתמש"""
-    db = get_database()
-    db.save_user_settings(user_id, settings)
+    db = get_async_database()
+    await db.save_user_settings(user_id, settings)
@@ -0,0 +1,304 @@
+"""
+מדדי ביצועים לפעולות MongoDB - היסטוגרמת זמנים לכל קולקשן ופעולה, דגימות שאילתות איטיות וזמן המתנה לחיבור
+"""
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from pymongo import monitoring
+
+from config import Config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# גבולות עליונים של דליי ההיסטוגרמה (מילישניות) - הדלי האחרון פתוח
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# פקודות שהסינון שלהן נמצא בשדה אחר: (שם פקודה) -> פונקציה שמחזירה את הסינון
+_FILTER_FIELDS = {
+    'find': lambda command: command.get('filter'),
+    'count': lambda command: command.get('query'),
+    'distinct': lambda command: command.get('query'),
+    'findAndModify': lambda command: command.get('query'),
+    'update': lambda command: (command.get('updates') or [{}])[0].get('q'),
+    'delete': lambda command: (command.get('deletes') or [{}])[0].get('q'),
+    'aggregate': lambda command: next(
+        (stage['$match'] for stage in command.get('pipeline', []) if '$match' in stage), None
+    )
+}
+
+# פקודות שאפשר להריץ עליהן explain כדי לקבל את תוכנית הביצוע
+EXPLAINABLE_COMMANDS = ('find', 'count', 'distinct', 'aggregate', 'findAndModify', 'update', 'delete')
+
+# שדות של הפקודה המקורית שלא עוברים ל-explain (session, cluster time, write concern וכו')
+_EXPLAIN_EXCLUDED_FIELDS = ('lsid', 'txnNumber', 'writeConcern', 'readConcern', 'autocommit', 'startTransaction')
+
+def explain_command(command: Dict, verbosity: str = 'queryPlanner') -> Dict:
+    """פקודת explain לפקודה שנדגמה (queryPlanner - בלי להריץ את השאילתה)"""
+    cleaned = {
+        field: value for field, value in command.items()
+        if not field.startswith('$') and field not in _EXPLAIN_EXCLUDED_FIELDS
+    }
+    return {'explain': cleaned, 'verbosity': verbosity}
+
+def _filter_shape(value: Any) -> Any:
+    """צורת הסינון - שמות שדות ואופרטורים בלבד, ערכים מוחלפים ב-?"""
+    if isinstance(value, dict):
+        return {key: _filter_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_filter_shape(item) for item in value[:3]]
+    return '?'
+
+def _command_collection(command_name: str, command: Dict) -> str:
+    """שם הקולקשן של הפקודה ('-' לפקודות ברמת מסד הנתונים)"""
+    if command_name == 'getMore':
+        return command.get('collection', '-')
+
+    target = command.get(command_name)
+    return target if isinstance(target, str) else '-'
+
+def _explain_section(explain: Dict, section: str) -> Dict:
+    """חלק מתוצאת explain - ב-aggregate (וב-time-series) הוא נמצא בשלב ה-$cursor הראשון"""
+    if section in explain:
+        return explain[section]
+
+    for stage in explain.get('stages', []):
+        if '$cursor' in stage:
+            return stage['$cursor'].get(section, {})
+
+    return {}
+
+def winning_plan(explain: Dict) -> Dict:
+    """עץ התוכנית שנבחרה (גם במנוע SBE, שבו העץ נמצא תחת queryPlan)"""
+    plan = _explain_section(explain, 'queryPlanner').get('winningPlan', {})
+    return plan.get('queryPlan', plan)
+
+def execution_stats(explain: Dict) -> Dict:
+    """סטטיסטיקות ההרצה (explain ב-executionStats)"""
+    return _explain_section(explain, 'executionStats')
+
+def plan_summary(explain: Dict) -> str:
+    """סיכום תוכנית הביצוע מתוצאת explain - למשל FETCH > IXSCAN(user_id_1_created_at_-1__id_-1)"""
+    plan = winning_plan(explain)
+    stages = []
+
+    while plan:
+        stage = plan.get('stage', '?')
+        if plan.get('indexName'):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+
+    return ' > '.join(stages) or '?'
+
+class LatencyHistogram:
+    """היסטוגרמת זמנים בדליים קבועים"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms: float, failed: bool = False):
+        """רישום מדידה"""
+        index = next(
+            (i for i, bound in enumerate(LATENCY_BUCKETS_MS) if duration_ms <= bound), len(LATENCY_BUCKETS_MS)
+        )
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+        if failed:
+            self.failures += 1
+
+    def percentile(self, fraction: float) -> float:
+        """אחוזון (הגבול העליון של הדלי שבו הוא נמצא)"""
+        if not self.count:
+            return 0.0
+
+        threshold = fraction * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.buckets):
+            cumulative += bucket_count
+            if cumulative >= threshold:
+                return float(LATENCY_BUCKETS_MS[index]) if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+
+        return self.max_ms
+
+    def summary(self) -> Dict:
+        """סיכום להצגה"""
+        return {
+            'count': self.count,
+            'failures': self.failures,
+            'avg_ms': round(self.total_ms / self.count, 2) if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 2)
+        }
+
+class DatabaseMetrics(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    """מאזין פקודות ו-pool של pymongo - נרשם ללקוח דרך event_listeners (גם ב-motor)"""
+
+    def __init__(self, slow_query_ms: float = 100, max_slow_samples: int = 20):
+        self.slow_query_ms = slow_query_ms
+
+        self.operations: Dict[str, LatencyHistogram] = {}
+        self.pool_wait = LatencyHistogram()
+        self.slow_queries: Deque[Dict] = deque(maxlen=max_slow_samples)
+
+        # המאזינים נקראים מכמה threads (motor מריץ את pymongo ב-executor)
+        self._lock = threading.Lock()
+        self._pending: Dict[tuple, tuple] = {}
+        self._checkout = threading.local()
+
+    # --- פקודות ---
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        """שמירת הקולקשן והסינון עד לסיום הפקודה"""
+        command = event.command
+        collection = _command_collection(event.command_name, command)
+        extract = _FILTER_FIELDS.get(event.command_name)
+        query_filter = extract(command) if extract else None
+
+        explainable = event.command_name in EXPLAINABLE_COMMANDS
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                event.database_name, collection, query_filter, dict(command) if explainable else None
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        """רישום הזמן בהיסטוגרמה ודגימה אם הפקודה איטית"""
+        duration_ms = event.duration_micros / 1000
+
+        with self._lock:
+            database_name, collection, query_filter, command = self._pending.pop(
+                (event.connection_id, event.request_id), (event.database_name, '-', None, None)
+            )
+
+            key = f"{collection}.{event.command_name}"
+            histogram = self.operations.get(key)
+            if histogram is None:
+                histogram = self.operations[key] = LatencyHistogram()
+            histogram.observe(duration_ms, failed)
+
+            if duration_ms < self.slow_query_ms:
+                return
+
+            sample = {
+                'collection': collection,
+                'operation': event.command_name,
+                'duration_ms': round(duration_ms, 2),
+                'filter_shape': _filter_shape(query_filter) if query_filter is not None else None,
+                'plan': None,
+                'at': datetime.now(),
+                # הפקודה המקורית - ל-explain בלבד, לא מוצגת
+                '_database': database_name,
+                '_command': command
+            }
+            self.slow_queries.append(sample)
+
+        logger.warning(
+            f"שאילתה איטית: {key} {sample['duration_ms']}ms | סינון: {sample['filter_shape']}"
+        )
+
+    # --- pool ---
+
+    def connection_check_out_started(self, event):
+        self._checkout.started_at = time.monotonic()
+
+    def connection_checked_out(self, event):
+        self._record_pool_wait(event)
+
+    def connection_check_out_failed(self, event):
+        self._record_pool_wait(event, failed=True)
+
+    def _record_pool_wait(self, event, failed: bool = False):
+        """זמן ההמתנה לחיבור מה-pool (אותו thread שהתחיל את ה-checkout)"""
+        started_at = getattr(self._checkout, 'started_at', None)
+        if started_at is None:
+            return
+
+        self._checkout.started_at = None
+        with self._lock:
+            self.pool_wait.observe((time.monotonic() - started_at) * 1000, failed)
+
+    # שאר אירועי ה-pool לא נמדדים
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+    # --- תצוגה ---
+
+    def explain_targets(self) -> List[Dict]:
+        """דגימות איטיות שעדיין אין להן תוכנית ביצוע"""
+        with self._lock:
+            return [sample for sample in self.slow_queries if sample['plan'] is None and sample['_command']]
+
+    def snapshot(self) -> Dict:
+        """מצב המדדים - פעולות (האיטיות קודם), המתנה ל-pool ודגימות איטיות"""
+        with self._lock:
+            operations = {key: histogram.summary() for key, histogram in self.operations.items()}
+            slow_queries = [
+                {field: value for field, value in sample.items() if not field.startswith('_')}
+                for sample in self.slow_queries
+            ]
+            pool_wait = self.pool_wait.summary()
+
+        return {
+            'operations': dict(sorted(operations.items(), key=lambda item: item[1]['p95_ms'], reverse=True)),
+            'pool_wait': pool_wait,
+            'slow_queries': slow_queries
+        }
+
+    def reset(self):
+        """איפוס כל המדדים"""
+        with self._lock:
+            self.operations.clear()
+            self.pool_wait = LatencyHistogram()
+            self.slow_queries.clear()
+
+# instance גלובלי - משותף ללקוח הסינכרוני ולאסינכרוני
+_db_metrics: Optional[DatabaseMetrics] = None
+
+def get_db_metrics() -> DatabaseMetrics:
+    """קבלת מאזין המדדים"""
+    global _db_metrics
+    if _db_metrics is None:
+        _db_metrics = DatabaseMetrics(
+            slow_query_ms=Config.DB_SLOW_QUERY_MS,
+            max_slow_samples=Config.DB_SLOW_QUERY_SAMPLES
+        )
+    return _db_metrics
@@ -57,6 +57,17 @@ class SaveError(DatabaseError):
     def __init__(self, operation="save"):
         super().__init__(f"שגיאה בביצוע פעולה: {operation}", "DB_SAVE_ERROR")
 
+class ArchiveError(DatabaseError):
+    """שגיאת ארכוב - קובץ הארכיון לא נכתב או לא עבר אימות (המסמכים לא נמחקים)"""
+    def __init__(self, details=""):
+        super().__init__(f"שגיאה בארכוב: {details}", "DB_ARCHIVE_ERROR")
+
+class ResourceLimitError(SocialMediaBotException):
+    """הבוט עמוס - עבודה חדשה נדחית (מקום בדיסק, זיכרון או תור מלא)"""
+    def __init__(self, reason):
+        self.reason = reason
+        super().__init__(f"הבוט עמוס: {reason}", "RESOURCE_LIMIT")
+
 class SocialMediaAPIError(SocialMediaBotException):
     """שגיאות API של רשתות חברתיות"""
     def __init__(self, platform, message, error_code=None):
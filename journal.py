@@ -0,0 +1,124 @@
+"""
+יומן כתיבות מקומי (write-behind) - כתיבות שלא הגיעו למסד בזמן תקלה נשמרות בקובץ ומועברות לפי הסדר כשהוא חוזר
+"""
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import json_util
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# כל כמה רשומות שהועברו הקובץ נכתב מחדש בלי הרשומות שכבר הועברו
+COMPACT_EVERY = 100
+
+class WriteJournal:
+    """יומן append-only בפורמט JSONL - כל רשומה: sequence, operation, payload, journaled_at"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rejected_path = f"{path}.rejected"
+
+        self._entries: List[Dict] = self._load()
+        self._committed = 0
+        self._sequence = self._entries[-1]['sequence'] if self._entries else 0
+
+        if self._entries:
+            logger.warning(f"ביומן הכתיבות המקומי {len(self._entries)} רשומות שעוד לא הועברו למסד")
+
+    def append(self, operation: str, payload: Dict, sync: bool = True) -> Dict:
+        """רישום כתיבה - נכתבת ומסונכרנת לדיסק לפני שהפעולה נחשבת כמוצלחת (sync=False - הסנכרון ב-sync())"""
+        self._sequence += 1
+        entry = {
+            'sequence': self._sequence,
+            'operation': operation,
+            'payload': payload,
+            'journaled_at': datetime.now()
+        }
+
+        self._write_lines(self.path, [entry], mode='a', sync=sync)
+        self._entries.append(entry)
+        return entry
+
+    def sync(self):
+        """סנכרון קובץ היומן לדיסק (fsync) - אפשר מת'רד אחר; אם היומן כבר התרוקן והקובץ נמחק, אין מה לסנכרן"""
+        try:
+            fd = os.open(self.path, os.O_RDWR)
+        except FileNotFoundError:
+            return
+
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def pending(self) -> int:
+        """מספר הרשומות שעוד לא הועברו"""
+        return len(self._entries) - self._committed
+
+    def peek(self) -> Optional[Dict]:
+        """הרשומה הבאה להעברה"""
+        return self._entries[self._committed] if self.pending() else None
+
+    def pending_entries(self) -> List[Dict]:
+        """הרשומות שעוד לא הועברו, לפי הסדר"""
+        return self._entries[self._committed:]
+
+    def commit(self):
+        """סימון הרשומה הבאה כמועברת - כשהיומן מתרוקן הקובץ נמחק"""
+        self._committed += 1
+
+        if not self.pending():
+            self._entries = []
+            self._committed = 0
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        elif self._committed >= COMPACT_EVERY:
+            self._compact()
+
+    def reject(self, error: Exception):
+        """העברת הרשומה הבאה לקובץ הדחויות (השרת דחה אותה - ניסיון חוזר לא יעזור)"""
+        entry = dict(self.peek(), error=str(error))
+        self._write_lines(self.rejected_path, [entry], mode='a')
+        logger.error(f"רשומת יומן {entry['sequence']} ({entry['operation']}) נדחתה ונשמרה ב-{self.rejected_path}: {error}")
+        self.commit()
+
+    def _compact(self):
+        """כתיבה מחדש של הקובץ עם הרשומות שעוד לא הועברו בלבד (החלפה אטומית)"""
+        remaining = self.pending_entries()
+        temp_path = f"{self.path}.tmp"
+
+        self._write_lines(temp_path, remaining, mode='w')
+        os.replace(temp_path, self.path)
+
+        self._entries = remaining
+        self._committed = 0
+
+    def _load(self) -> List[Dict]:
+        """טעינת רשומות מהרצה קודמת - שורה אחרונה חלקית (קריסה באמצע כתיבה) מדולגת"""
+        if not os.path.exists(self.path):
+            return []
+
+        entries = []
+        with open(self.path, 'r', encoding='utf-8') as journal_file:
+            for line in journal_file:
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json_util.loads(line))
+                except ValueError:
+                    logger.warning(f"שורה פגומה ביומן הכתיבות דולגה: {line[:80]}")
+
+        return entries
+
+    @staticmethod
+    def _write_lines(path: str, entries: List[Dict], mode: str, sync: bool = True):
+        """כתיבת רשומות וסנכרון לדיסק"""
+        with open(path, mode, encoding='utf-8') as journal_file:
+            for entry in entries:
+                journal_file.write(json_util.dumps(entry, ensure_ascii=False) + '\n')
+            journal_file.flush()
+            if sync:
+                os.fsync(journal_file.fileno())
@@ -0,0 +1,196 @@
+"""
+כותב לוגים מצטבר למסד הנתונים - תור חסום בזיכרון ו-insert_many ברקע
+"""
+import asyncio
+import os
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from bson import json_util
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+OVERFLOW_DROP = 'drop'
+OVERFLOW_SPILL = 'spill'
+
+class BufferedLogWriter:
+    """מצבר רשומות לוג ושולח אותן ב-insert_many לפי גודל אצווה או פרק זמן"""
+
+    def __init__(self, collection, max_queue_size: int = 10000, batch_size: int = 200,
+                 flush_interval: float = 2.0, overflow_policy: str = OVERFLOW_DROP,
+                 spill_path: Optional[str] = None):
+        self.collection = collection
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+
+        self._buffer: Deque[Dict] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        # רשומות שממתינות לכתיבה לקובץ הגלישה (נכתבות ב-thread, אחת אחרי השנייה)
+        self._spill_queue: List[Dict] = []
+        self._spill_task: Optional[asyncio.Task] = None
+        self._spill_lock: Optional[asyncio.Lock] = None
+
+        # מונים לניטור
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+
+    def enqueue(self, record: Dict) -> bool:
+        """הוספת רשומה לתור - לא חוסם. מחזיר False אם התור מלא (לפי מדיניות הגלישה)"""
+        if len(self._buffer) >= self.max_queue_size:
+            self._overflow([record], "תור הלוגים מלא")
+            return False
+
+        self._buffer.append(record)
+
+        if self._wakeup and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+        return True
+
+    def start(self):
+        """הפעלת משימת הרקע (דורש לולאת אירועים פעילה)"""
+        if self._task is not None:
+            return
+
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run(), name="db-log-writer")
+        logger.debug("כותב הלוגים המצטבר הופעל")
+
+    async def _run(self):
+        """לולאת רקע - שליחה כשמגיעים לגודל אצווה או כשעובר flush_interval"""
+        await self._replay_spill()
+
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """שליחת כל מה שבתור - מחזיר מספר רשומות שנכתבו"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        written = 0
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+
+                try:
+                    await self.collection.insert_many(batch, ordered=False)
+                    written += len(batch)
+                except Exception as e:
+                    logger.error(f"שגיאה בכתיבת אצוות לוגים ({len(batch)} רשומות): {e}")
+                    self._overflow(batch, "כתיבת אצוות הלוגים נכשלה")
+
+        self.written += written
+        return written
+
+    async def close(self):
+        """עצירת משימת הרקע ושליחת כל מה שנשאר בתור"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        written = await self.flush()
+        if self._spill_task is not None:
+            await self._spill_task
+        logger.debug(f"כותב הלוגים נסגר ({written} רשומות נשלחו בסגירה)")
+
+    def pending(self) -> int:
+        """מספר רשומות שממתינות בתור"""
+        return len(self._buffer)
+
+    def _overflow(self, records: List[Dict], reason: str):
+        """טיפול ברשומות שלא נכנסו לתור / לא נכתבו - השלכה או כתיבה לדיסק (ברקע)"""
+        if self.overflow_policy == OVERFLOW_SPILL and self.spill_path:
+            self._spill_queue.extend(records)
+            if self._spill_task is None or self._spill_task.done():
+                self._spill_task = asyncio.create_task(self._spill(), name="db-log-spill")
+            return
+
+        self.dropped += len(records)
+        logger.warning(f"{reason} - {len(records)} רשומות הושלכו")
+
+    def _lock_spill(self) -> asyncio.Lock:
+        """נעילת קובץ הגלישה - כתיבה ושליחה חוזרת לא רצות במקביל"""
+        if self._spill_lock is None:
+            self._spill_lock = asyncio.Lock()
+        return self._spill_lock
+
+    async def _spill(self):
+        """כתיבת הרשומות הממתינות לקובץ הגלישה ב-thread, בלי לחסום את ה-event loop"""
+        async with self._lock_spill():
+            while self._spill_queue:
+                records, self._spill_queue = self._spill_queue, []
+
+                try:
+                    await asyncio.to_thread(self._append_spill, records)
+                    self.spilled += len(records)
+                except OSError as e:
+                    self.dropped += len(records)
+                    logger.error(f"שגיאה בכתיבת לוגים לקובץ גלישה - {len(records)} רשומות הושלכו: {e}")
+
+    def _append_spill(self, records: List[Dict]):
+        """הוספת רשומות לסוף קובץ הגלישה"""
+        with open(self.spill_path, 'a', encoding='utf-8') as spill_file:
+            for record in records:
+                spill_file.write(json_util.dumps(record, ensure_ascii=False) + '\n')
+
+    def _read_spill(self) -> List[Dict]:
+        """כל הרשומות שבקובץ הגלישה (ריק אם אין קובץ)"""
+        if not os.path.exists(self.spill_path):
+            return []
+
+        with open(self.spill_path, 'r', encoding='utf-8') as spill_file:
+            return [json_util.loads(line) for line in spill_file if line.strip()]
+
+    def _rewrite_spill(self, records: List[Dict]):
+        """החלפת קובץ הגלישה ברשומות שעוד לא נשלחו (קובץ זמני + os.replace, כך שקריסה לא משאירה קובץ חלקי)"""
+        if not records:
+            os.remove(self.spill_path)
+            return
+
+        temp_path = self.spill_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as spill_file:
+            for record in records:
+                spill_file.write(json_util.dumps(record, ensure_ascii=False) + '\n')
+        os.replace(temp_path, self.spill_path)
+
+    async def _replay_spill(self):
+        """שליחת רשומות שנשמרו בקובץ הגלישה בהרצה קודמת"""
+        if not self.spill_path:
+            return
+
+        async with self._lock_spill():
+            try:
+                records = await asyncio.to_thread(self._read_spill)
+                if not records:
+                    return
+
+                for start in range(0, len(records), self.batch_size):
+                    await self.collection.insert_many(records[start:start + self.batch_size], ordered=False)
+                    # מה שנשלח יוצא מהקובץ מיד - כישלון באצווה הבאה לא ישלח אותו שוב בהפעלה הבאה
+                    await asyncio.to_thread(self._rewrite_spill, records[start + self.batch_size:])
+
+                logger.info(f"נשלחו {len(records)} רשומות לוג מקובץ הגלישה")
+
+            except Exception as e:
+                # מה שלא נשלח נשאר בקובץ וינוסה שוב בהפעלה הבאה
+                logger.error(f"שגיאה בשליחת קובץ גלישת הלוגים: {e}")
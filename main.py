@@ -14,7 +14,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from config import Config, validate_config
 from exceptions import *
 from logger import bot_logger, get_logger
-from database import get_database
+from database import get_async_database
 from telegram_bot import get_bot
 from social_media_handler import get_social_manager
 from utils import FileHelper
@@ -74,18 +74,14 @@ class BotApplication:
     async def _initialize_database(self):
         """אתחול מסד נתונים"""
         try:
-            self.database = get_database()
+            self.database = get_async_database()
             
-            # בדיקת חיבור
-            if not self.database.health_check():
-                raise ConnectionError("MongoDB")
+            # בדיקת חיבור ויצירת אינדקסים
+            await self.database.connect()
+            if not await self.database.health_check():
+                raise ConnectionError(Config.STORAGE_BACKEND)
             
-            logger.info("✅ חיבור למסד נתונים הצליח")
-            
-            # ניקוי קבצים ישנים (אופציונלי)
-            if Config.LOG_LEVEL.upper() == 'DEBUG':
-                self.database.cleanup_old_logs(days_old=3)
-                self.database.cleanup_old_posts(days_old=14)
+            logger.info(f"✅ חיבור למסד נתונים ({Config.STORAGE_BACKEND}) הצליח")
             
         except Exception as e:
             logger.error(f"❌ שגיאה באתחול מסד נתונים: {e}")
@@ -121,6 +117,9 @@ class BotApplication:
             # חיבור מטפל הרשתות לבוט
             self.bot.set_social_handler(self.social_manager)
             
+            # תצוגות מקדימות שנשמרו לפני ההפעלה מחדש (SESSION_PERSISTENCE)
+            await self.bot.sessions.restore()
+            
             logger.info("🤖 בוט טלגרם מוכן לפעולה")
             
         except Exception as e:
@@ -199,16 +198,19 @@ class BotApplication:
             
             # סגירת חיבור למסד נתונים
             if self.database:
+                await self.database.flush_logs()
                 self.database.close_connection()
                 logger.info("✅ חיבור מסד נתונים נסגר")
             
-            # ניקוי קבצים זמניים
+            # ניקוי קבצים זמניים - חוץ מקבצים של סשנים שנשמרו במסד
             temp_files = []
             temp_dir = Config.TEMP_FOLDER
+            kept_files = self.bot.sessions.file_paths() if self.bot else set()
             if os.path.exists(temp_dir):
                 for file in os.listdir(temp_dir):
-                    if file.startswith('temp_'):
-                        temp_files.append(os.path.join(temp_dir, file))
+                    file_path = os.path.join(temp_dir, file)
+                    if file.startswith('temp_') and file_path not in kept_files:
+                        temp_files.append(file_path)
                 
                 if temp_files:
                     FileHelper.cleanup_temp_files(temp_files)
@@ -0,0 +1,177 @@
+"""
+פקודות תחזוקה לבוט הפרסום
+python manage.py <command>
+"""
+import argparse
+import sys
+import tempfile
+
+from archive import PartitionedArchive
+from config import Config
+from database import get_database
+import query_plans
+from exceptions import DatabaseError, SocialMediaBotException
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+def rebuild_stats(args):
+    """בנייה מחדש של דליי הסטטיסטיקות מהפוסטים השמורים (אפשר כשהבוט פועל)"""
+    db = get_database()
+    bucket_count = db.rebuild_statistics()
+    print(f"✅ סטטיסטיקות נבנו מחדש ({bucket_count} דליים)")
+
+def rebuild_counters(args):
+    """בנייה מחדש של מוני הפוסטים של המשתמשים מהפוסטים השמורים (למשל אחרי deploy שחפף למיגרציה 7)"""
+    db = get_database()
+    user_count = db.rebuild_user_counters()
+    print(f"✅ מוני פוסטים נבנו מחדש ({user_count} משתמשים)")
+
+def backfill_expiry(args):
+    """קביעת תפוגה (expires_at) לפוסטים שהסתיימו לפני שהוגדר אינדקס ה-TTL"""
+    db = get_database()
+    updated = db.backfill_post_expiry()
+    print(f"✅ נקבעה תפוגה ל-{updated} פוסטים")
+
+def backfill_hashtags(args):
+    """חילוץ האשטגים לפוסטים שנשמרו לפני שדה hashtags (לחיפוש ב-/tag)"""
+    db = get_database()
+    updated = db.backfill_hashtags(batch_size=args.batch_size)
+    print(f"✅ חולצו האשטגים ל-{updated} פוסטים")
+
+def migrate_logs(args):
+    """המרת קולקשן הלוגים הרגיל ל-time-series (יש לעצור את הבוט לפני ההרצה)"""
+    db = get_database()
+    migrated = db.migrate_logs_to_timeseries(batch_size=args.batch_size)
+    print(f"✅ {migrated} רשומות לוג הועברו לקולקשן time-series")
+
+def archive(args):
+    """ארכוב פוסטים ולוגים שעומדים לפוג לקבצים דחוסים, ומחיקת הפוסטים אחרי אימות"""
+    db = get_database()
+    partitioned_archive = PartitionedArchive(args.dir)
+    
+    posts = db.archive_expired_posts(partitioned_archive, args.batch_size, args.lead_hours)
+    logs = db.archive_expiring_logs(partitioned_archive, args.batch_size, args.lead_hours)
+    print(f"✅ אורכבו {posts} פוסטים ו-{logs} רשומות לוג אל {args.dir}")
+
+def check_query_plans(args):
+    """explain לכל שאילתה של DatabaseManager על מסד בדיקה זרוע, ומדידת זמנים מול קובץ הבסיס"""
+    Config.DATABASE_NAME = args.database
+    volumes = {'posts': args.posts, 'logs': args.logs, 'users': args.users}
+    db = query_plans.open_seeded_database(**volumes)
+    
+    try:
+        with tempfile.TemporaryDirectory() as archive_dir:
+            sample = query_plans.build_sample(db, archive_dir)
+            results = query_plans.check_query_plans(db, sample)
+            latencies = query_plans.measure_latencies(db, sample, args.repeats)
+    finally:
+        db.close_connection()
+    
+    for result in results:
+        mark = '❌' if result['problems'] else '✅'
+        print(f"{mark} {result['scenario']:<24} {result['collection']}.{result['operation']:<14} "
+              f"{result['plan']} | docs {result['docs_examined']} keys {result['keys_examined']} "
+              f"returned {result['returned']} {'; '.join(result['problems'])}")
+    
+    for name, latency in latencies.items():
+        print(f"⏱️ {name:<24} p50 {latency['p50_ms']}ms p95 {latency['p95_ms']}ms")
+    
+    if args.update_baseline:
+        query_plans.save_baseline(args.baseline, latencies, volumes)
+        print(f"✅ זמני הבסיס נשמרו ב-{args.baseline}")
+    
+    baseline = None if args.update_baseline else query_plans.load_baseline(args.baseline, volumes)
+    regressions = query_plans.latency_regressions(latencies, baseline) if baseline else []
+    for regression in regressions:
+        print(f"🐢 {regression}")
+    
+    failed = sum(1 for result in results if result['problems'])
+    if failed or regressions:
+        raise DatabaseError(f"{failed} שאילתות בלי תוכנית תקינה, {len(regressions)} חריגות זמן")
+
+def build_parser() -> argparse.ArgumentParser:
+    """הגדרת פקודות שורת הפקודה"""
+    parser = argparse.ArgumentParser(description="פקודות תחזוקה לבוט הפרסום")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild_parser = subparsers.add_parser(
+        'rebuild-stats',
+        help='בנייה מחדש של הסטטיסטיקות המצטברות מתוך קולקשן הפוסטים'
+    )
+    rebuild_parser.set_defaults(func=rebuild_stats)
+    
+    rebuild_counters_parser = subparsers.add_parser(
+        'rebuild-counters',
+        help='בנייה מחדש של מוני הפוסטים של המשתמשים מתוך קולקשן הפוסטים'
+    )
+    rebuild_counters_parser.set_defaults(func=rebuild_counters)
+    
+    backfill_parser = subparsers.add_parser(
+        'backfill-expiry',
+        help='קביעת תפוגה לפוסטים ישנים שהסתיימו (מחיקה אוטומטית אחרי POST_RETENTION_DAYS)'
+    )
+    backfill_parser.set_defaults(func=backfill_expiry)
+    
+    backfill_hashtags_parser = subparsers.add_parser(
+        'backfill-hashtags',
+        help='חילוץ האשטגים לפוסטים ישנים ועדכון מוני ההאשטגים'
+    )
+    backfill_hashtags_parser.add_argument('--batch-size', type=int, default=1000, help='פוסטים בכל אצווה')
+    backfill_hashtags_parser.set_defaults(func=backfill_hashtags)
+    
+    migrate_logs_parser = subparsers.add_parser(
+        'migrate-logs',
+        help='המרת קולקשן הלוגים ל-time-series (עם הבוט כבוי)'
+    )
+    migrate_logs_parser.add_argument('--batch-size', type=int, default=1000, help='רשומות בכל אצווה')
+    migrate_logs_parser.set_defaults(func=migrate_logs)
+    
+    archive_parser = subparsers.add_parser(
+        'archive',
+        help='ארכוב פוסטים ולוגים שעומדים לפוג לקבצי JSONL דחוסים לפי תאריך'
+    )
+    archive_parser.add_argument('--dir', default=Config.ARCHIVE_DIR, help='תיקיית הארכיון')
+    archive_parser.add_argument('--lead-hours', type=float, default=Config.ARCHIVE_LEAD_HOURS,
+                                help='כמה שעות לפני התפוגה לארכב')
+    archive_parser.add_argument('--batch-size', type=int, default=Config.ARCHIVE_BATCH_SIZE, help='מסמכים בכל אצווה')
+    archive_parser.set_defaults(func=archive)
+    
+    query_plans_parser = subparsers.add_parser(
+        'query-plans',
+        help='בדיקת תוכניות ביצוע וזמנים לכל שאילתה על מסד בדיקה זרוע (מוחק את מסד הבדיקה כשהנפח משתנה)'
+    )
+    query_plans_parser.add_argument('--database', help='מסד הבדיקה',
+                                    default=f"{Config.DATABASE_NAME}{query_plans.QUERY_PLAN_DATABASE_SUFFIX}")
+    query_plans_parser.add_argument('--posts', type=int, default=query_plans.DEFAULT_SEED_POSTS, help='פוסטים לזריעה')
+    query_plans_parser.add_argument('--logs', type=int, default=query_plans.DEFAULT_SEED_LOGS, help='רשומות לוג לזריעה')
+    query_plans_parser.add_argument('--users', type=int, default=query_plans.DEFAULT_SEED_USERS, help='משתמשים לזריעה')
+    query_plans_parser.add_argument('--repeats', type=int, default=20, help='הרצות לכל תרחיש במדידת הזמנים')
+    query_plans_parser.add_argument('--baseline', default=query_plans.BASELINE_FILE, help='קובץ זמני הבסיס')
+    query_plans_parser.add_argument('--update-baseline', action='store_true', help='שמירת המדידות כבסיס החדש')
+    query_plans_parser.set_defaults(func=check_query_plans)
+
+    return parser
+
+def main(argv=None) -> int:
+    """נקודת כניסה לפקודות תחזוקה"""
+    args = build_parser().parse_args(argv)
+
+    try:
+        args.func(args)
+        return 0
+    except SocialMediaBotException as e:
+        logger.error(f"❌ {e}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# איך להריץ:
+# python manage.py rebuild-stats     # מילוי הסטטיסטיקות מפוסטים קיימים (פעם אחת אחרי שדרוג)
+# python manage.py rebuild-counters  # מוני הפוסטים מחדש מפוסטים קיימים (אחרי deploy שחפף למיגרציה 7)
+# python manage.py backfill-expiry   # תפוגה לפוסטים שהסתיימו לפני אינדקס ה-TTL (פעם אחת אחרי שדרוג)
+# python manage.py backfill-hashtags # האשטגים לפוסטים שנשמרו לפני /tag (פעם אחת אחרי שדרוג)
+# python manage.py migrate-logs      # המרת הלוגים ל-time-series (פעם אחת אחרי שדרוג, עם הבוט כבוי)
+# python manage.py archive           # ארכוב לפני תפוגה (cron יומי, למשל: 0 3 * * * python manage.py archive)
+# python manage.py query-plans       # explain וזמנים לכל שאילתה על מסד בדיקה זרוע (--update-baseline לשמירת בסיס)
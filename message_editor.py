@@ -0,0 +1,186 @@
+"""
+עריכת הודעות יוצאות בקצב מבוקר - עריכות שממתינות לאותה הודעה מתמזגות למצב האחרון, עם מגבלה לכל צ'אט וגלובלית
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from telegram.error import BadRequest, RetryAfter
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+class _PendingEdit:
+    """המצב האחרון שממתין להודעה אחת, ומי שממתין למסירה שלו"""
+
+    def __init__(self, message, text: str, kwargs: Dict, final: bool):
+        self.message = message
+        self.text = text
+        self.kwargs = kwargs
+        self.final = final
+        self.waiters: List[asyncio.Future] = []
+
+    def resolve(self, error: Optional[BaseException] = None):
+        """שחרור הממתינים - עם השגיאה אם המסירה נכשלה"""
+        for waiter in self.waiters:
+            if waiter.done():
+                continue
+            if error is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(error)
+        self.waiters.clear()
+
+class MessageEditor:
+    """תור עריכות אחד לבוט - עד עריכה אחת ל-chat_interval שניות בכל צ'אט ועד global_rate עריכות בשנייה בסך הכל
+
+    עריכת התקדמות (final=False) לא ממתינה ונדרסת ע"י עריכה חדשה יותר של אותה הודעה;
+    עריכה סופית עוקפת את עריכות ההתקדמות בתור, וה-await שלה חוזר כשהיא נמסרה (או זורק את השגיאה).
+    RetryAfter מטלגרם דוחה את הצ'אט ב-retry_after שניות, והעריכה נשלחת שוב.
+    """
+
+    def __init__(self, chat_interval: float = 1.0, global_rate: float = 25.0):
+        self.chat_interval = chat_interval
+        self.global_interval = 1 / global_rate
+
+        self._pending: "OrderedDict[Tuple, _PendingEdit]" = OrderedDict()
+        self._chat_ready_at: Dict[Hashable, float] = {}
+        self._next_send_at = 0.0
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+        # מונים לניטור
+        self.sent = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+
+    async def edit(self, message, text: str, final: bool = False, **kwargs):
+        """עריכת הודעה - התקדמות נכנסת לתור וחוזרת מיד, סופית ממתינה למסירה"""
+        key = (message.chat_id, message.message_id)
+        pending = self._pending.get(key)
+
+        if pending is None:
+            pending = self._pending[key] = _PendingEdit(message, text, kwargs, final)
+        else:
+            # רק המצב האחרון נשלח; הודעה שיש לה עריכה סופית שומרת על העדיפות
+            self.coalesced += 1
+            pending.text, pending.kwargs = text, kwargs
+            pending.final = pending.final or final
+
+        self._wakeup.set()
+        self._ensure_worker()
+
+        if final:
+            waiter = asyncio.get_running_loop().create_future()
+            pending.waiters.append(waiter)
+            await waiter
+
+    def pending_count(self) -> int:
+        """כמה הודעות ממתינות לעריכה"""
+        return len(self._pending)
+
+    def stop(self):
+        """עצירת התור - עריכות שלא נשלחו נזרקות"""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+        for pending in self._pending.values():
+            for waiter in pending.waiters:
+                waiter.cancel()
+        self._pending.clear()
+
+    def _ensure_worker(self):
+        """הפעלת השליחה ברקע אם היא לא רצה"""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    def _next_ready(self, now: float) -> Tuple[Optional[Tuple], float]:
+        """העריכה הבאה שהצ'אט שלה פנוי (סופיות קודם, אחר כך לפי סדר ההגעה), או כמה לחכות לצ'אט הראשון שמתפנה"""
+        candidate = None
+        wait = None
+
+        for key, pending in self._pending.items():
+            ready_at = self._chat_ready_at.get(key[0], 0.0)
+            if ready_at > now:
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+                continue
+
+            if pending.final:
+                return key, 0.0
+            if candidate is None:
+                candidate = key
+
+        return candidate, wait or 0.0
+
+    async def _run(self):
+        """שליחת העריכות לפי המגבלות - נעצר כשהתור ריק"""
+        while self._pending:
+            now = time.monotonic()
+
+            # מרווח גלובלי בין עריכות
+            if now < self._next_send_at:
+                await asyncio.sleep(self._next_send_at - now)
+                continue
+
+            key, wait = self._next_ready(now)
+            if key is None:
+                # כל הצ'אטים בהמתנה - מתעוררים כשמישהו מתפנה או כשעריכה חדשה נכנסת
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            pending = self._pending.pop(key)
+            await self._send(key, pending)
+
+    async def _send(self, key: Tuple, pending: _PendingEdit):
+        """עריכה אחת - RetryAfter מחזיר אותה לתור (אלא אם כבר יש מצב חדש יותר)"""
+        chat_id = key[0]
+        now = time.monotonic()
+        self._next_send_at = now + self.global_interval
+        self._chat_ready_at[chat_id] = now + self.chat_interval
+
+        try:
+            await pending.message.edit_text(pending.text, **pending.kwargs)
+        except RetryAfter as e:
+            self.rate_limited += 1
+            self._chat_ready_at[chat_id] = time.monotonic() + e.retry_after
+            logger.warning(f"טלגרם הגביל עריכות בצ'אט {chat_id} ל-{e.retry_after} שניות")
+            self._requeue(key, pending)
+            return
+        except BadRequest as e:
+            # אותו טקסט כמו שכבר מוצג - אין מה לשלוח
+            if 'not modified' not in str(e).lower():
+                logger.warning(f"שגיאה בעריכת הודעה בצ'אט {chat_id}: {e}")
+                pending.resolve(e)
+                return
+        except Exception as e:
+            logger.warning(f"שגיאה בעריכת הודעה בצ'אט {chat_id}: {e}")
+            pending.resolve(e)
+            return
+
+        self.sent += 1
+        pending.resolve()
+        self._forget_idle_chats()
+
+    def _requeue(self, key: Tuple, pending: _PendingEdit):
+        """החזרת עריכה שנדחתה לתור - עריכה חדשה יותר של אותה הודעה גוברת, והממתינים עוברים אליה"""
+        newer = self._pending.get(key)
+        if newer is None:
+            self._pending[key] = pending
+            self._pending.move_to_end(key, last=False)
+            return
+
+        newer.final = newer.final or pending.final
+        newer.waiters.extend(pending.waiters)
+
+    def _forget_idle_chats(self):
+        """מחיקת זמני צ'אטים שכבר מותר לשלוח אליהם - המילון לא גדל עם מספר הצ'אטים"""
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, ready_at in self._chat_ready_at.items() if ready_at <= now]:
+            del self._chat_ready_at[chat_id]
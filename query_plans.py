@@ -0,0 +1,417 @@
+"""
+בדיקת תוכניות ביצוע לשאילתות של DatabaseManager - זריעת נתונים בנפח אמיתי, explain לכל פקודה שנשלחת
+ומדידת זמנים מול קובץ בסיס (python manage.py query-plans, או INTEGRATION_TESTS=1 pytest -k QueryPlans)
+"""
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Union
+
+from pymongo import MongoClient, monitoring
+
+from archive import PartitionedArchive
+from config import Config
+from database import (
+    DatabaseManager, FINAL_POST_STATUSES, _build_post_document, _default_user_settings, _log_document
+)
+from db_metrics import EXPLAINABLE_COMMANDS, execution_stats, explain_command, plan_summary, winning_plan
+from exceptions import DatabaseError
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# הזריעה מוחקת את המסד - רק למסד ששמו מסתיים בזה
+QUERY_PLAN_DATABASE_SUFFIX = '_query_plans'
+SEED_COLLECTION = 'query_plan_seed'
+
+# נפחי ברירת מחדל לזריעה
+DEFAULT_SEED_POSTS = 1_000_000
+DEFAULT_SEED_LOGS = 1_000_000
+DEFAULT_SEED_USERS = 50_000
+
+# משתמש עם היסטוריה ארוכה (אחוז מכל הפוסטים) - השאילתות נבדקות עליו
+HEAVY_USER_ID = 1
+HEAVY_USER_SHARE = 0.01
+
+# התפלגות סטטוסים בפוסטים שנזרעים
+SEED_STATUS_WEIGHTS = {'completed': 0.85, 'failed': 0.10, 'processing': 0.03, 'created': 0.02}
+SEED_PLATFORMS = ['TikTok', 'Twitter', 'Instagram', 'Facebook', 'YouTube']
+SEED_ACTIONS = ['upload', 'post', 'settings', 'history', 'stats']
+SEED_HASHTAGS = ['פסח', 'שבועות', 'travel', 'food', 'מתכון', 'funny', 'tutorial', 'טיול', 'music', 'news']
+
+# קובץ זמני הבסיס, וכמה מותר לחרוג ממנו (פי TOLERANCE ועוד SLACK - רעש במדידות של פחות ממילישנייה)
+BASELINE_FILE = 'query_baselines.json'
+BASELINE_TOLERANCE = 1.5
+BASELINE_SLACK_MS = 2.0
+
+class QueryScenario:
+    """קריאה למתודה של DatabaseManager - max_docs_examined לכל פקודה (None - סריקת טווח, עד מספר המוחזרים;
+    פונקציה - גבול שתלוי בנתונים, מחושב מה-sample)"""
+
+    def __init__(self, name: str, run: Callable, max_docs_examined: Optional[Union[int, Callable]],
+                 setup: Optional[Callable] = None):
+        self.name = name
+        self.run = run
+        self.max_docs_examined = max_docs_examined
+        self.setup = setup
+
+# כל מתודה של DatabaseManager שפונה למסד - sample מ-build_sample
+QUERY_SCENARIOS = [
+    QueryScenario('get_user_posts', lambda db, sample: db.get_user_posts(sample['user_id'], limit=10), 10),
+    QueryScenario(
+        'get_user_posts_page', lambda db, sample: db.get_user_posts_page(sample['user_id'], 10, sample['cursor']), 11
+    ),
+    QueryScenario(
+        'get_posts_by_hashtag', lambda db, sample: db.get_posts_by_hashtag(sample['user_id'], sample['tag'], 10), 11
+    ),
+    # חיפוש טקסט מדרג את כל ההתאמות - נבדקים רק הפוסטים של המשתמש שמכילים את המילה
+    QueryScenario(
+        'search_posts', lambda db, sample: db.search_posts(sample['user_id'], sample['tag'], 10),
+        lambda sample: sample['search_matches']
+    ),
+    QueryScenario('get_user_hashtags', lambda db, sample: db.get_user_hashtags(sample['user_id'], limit=10), 10),
+    QueryScenario('get_post_by_id', lambda db, sample: db.get_post_by_id(sample['post_id']), 1),
+    QueryScenario('get_completed_platforms', lambda db, sample: db.get_completed_platforms(sample['post_id']), 1),
+    QueryScenario('get_user_post_counts', lambda db, sample: db.get_user_post_counts(sample['user_id']), 1),
+    QueryScenario('count_user_posts', lambda db, sample: db.count_user_posts(sample['user_id'], 'completed'), 1),
+    QueryScenario(
+        'get_user_settings', lambda db, sample: db.get_user_settings(sample['user_id']), 1,
+        setup=lambda db, sample: db.settings_cache.clear()
+    ),
+    QueryScenario(
+        'save_user_settings', lambda db, sample: db.save_user_settings(sample['user_id'], _default_user_settings()), 1
+    ),
+    QueryScenario(
+        'save_post',
+        lambda db, sample: db.save_post(sample['user_id'], 'query_plan.mp4', 'בדיקת תוכנית', ['TikTok'], 1.0), 1
+    ),
+    QueryScenario(
+        'update_post_status', lambda db, sample: db.update_post_status(sample['post_id'], 'completed'), 1
+    ),
+    QueryScenario(
+        'record_platform_result',
+        lambda db, sample: db.record_platform_result(sample['post_id'], 'TikTok', {'status': 'success'}), 1
+    ),
+    QueryScenario('get_statistics', lambda db, sample: db.get_statistics(), 2),
+    QueryScenario(
+        'archive_expired_posts', lambda db, sample: db.archive_expired_posts(sample['archive'], lead_hours=0), None
+    ),
+    QueryScenario(
+        'archive_expiring_logs', lambda db, sample: db.archive_expiring_logs(sample['archive'], lead_hours=0), None
+    ),
+]
+
+# מתודות ציבוריות שלא נבדקות, והסיבה
+UNPLANNED_METHODS = {
+    'log_action': 'הוספה בלבד',
+    'rebuild_statistics': 'סריקה מלאה של posts בכוונה (פקודת תחזוקה)',
+    'rebuild_user_counters': 'סריקה מלאה של posts בכוונה (פקודת תחזוקה)',
+    'backfill_post_expiry': 'מיגרציה חד-פעמית',
+    'backfill_hashtags': 'מיגרציה חד-פעמית',
+    'migrate_logs_to_timeseries': 'מיגרציה חד-פעמית',
+    'health_check': 'ping בלבד',
+    'close_connection': 'ללא פקודות'
+}
+
+class QueryRecorder(monitoring.CommandListener):
+    """רושם את הפקודות שאפשר להריץ עליהן explain - רק בתוך capture()"""
+
+    def __init__(self):
+        self.commands: List[tuple] = []
+        self._recording = False
+
+    @contextmanager
+    def capture(self):
+        """הקלטת הפקודות שנשלחות בתוך הבלוק"""
+        self.commands = []
+        self._recording = True
+        try:
+            yield self.commands
+        finally:
+            self._recording = False
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if self._recording and event.command_name in EXPLAINABLE_COMMANDS:
+            self.commands.append((event.database_name, event.command_name, dict(event.command)))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+# instance גלובלי - נרשם ב-pymongo לפני יצירת הלקוח
+_query_recorder: Optional[QueryRecorder] = None
+
+def get_query_recorder() -> QueryRecorder:
+    """קבלת המקליט (נרשם לכל הלקוחות שנוצרים מעכשיו)"""
+    global _query_recorder
+    if _query_recorder is None:
+        _query_recorder = QueryRecorder()
+        monitoring.register(_query_recorder)
+    return _query_recorder
+
+def _single_statements(command_name: str, command: Dict) -> List[Dict]:
+    """explain תומך בהוראה אחת - update / delete עם כמה הוראות (bulk_write) מפוצלים"""
+    field = {'update': 'updates', 'delete': 'deletes'}.get(command_name)
+    if field is None or len(command.get(field, [])) <= 1:
+        return [command]
+
+    return [dict(command, **{field: [statement]}) for statement in command[field]]
+
+def _plan_stages(explain: Dict) -> List[Dict]:
+    """כל השלבים בעץ התוכנית שנבחרה"""
+    stages = []
+    pending = [winning_plan(explain)]
+
+    while pending:
+        plan = pending.pop()
+        if not plan:
+            continue
+        stages.append(plan)
+        pending.append(plan.get('inputStage'))
+        pending.extend(plan.get('inputStages', []))
+
+    return stages
+
+def _range_scan_allowance(returned: int) -> int:
+    """סריקת טווח - מותר לבדוק מעט יותר ממה שהוחזר (דליי time-series בקצה הטווח)"""
+    return returned + max(10, returned // 10)
+
+def plan_problems(explain: Dict, max_docs_examined: Optional[int]) -> Dict:
+    """תוכנית, מספרי מסמכים ובעיות (סריקה מלאה / יותר מדי מסמכים שנבדקו) לתוצאת explain ב-executionStats"""
+    stats = execution_stats(explain)
+    docs_examined = stats.get('totalDocsExamined', 0)
+    returned = stats.get('nReturned', 0)
+    problems = []
+
+    # COLLSCAN עם minRecord / maxRecord היא סריקה תחומה על האינדקס המקובץ (time-series)
+    if any(stage.get('stage') == 'COLLSCAN' and 'minRecord' not in stage and 'maxRecord' not in stage
+           for stage in _plan_stages(explain)):
+        problems.append("סריקה מלאה (COLLSCAN)")
+
+    allowed = _range_scan_allowance(returned) if max_docs_examined is None else max_docs_examined
+    if docs_examined > allowed:
+        problems.append(f"נבדקו {docs_examined} מסמכים (מותר {allowed})")
+
+    return {
+        'plan': plan_summary(explain),
+        'docs_examined': docs_examined,
+        'keys_examined': stats.get('totalKeysExamined', 0),
+        'returned': returned,
+        'problems': problems
+    }
+
+def check_query_plans(db_manager: DatabaseManager, sample: Dict,
+                      scenarios: List[QueryScenario] = QUERY_SCENARIOS) -> List[Dict]:
+    """הרצת כל תרחיש, explain לכל פקודה שנשלחה ובדיקת התוכנית - שורה לכל הוראה"""
+    recorder = get_query_recorder()
+    results = []
+
+    for scenario in scenarios:
+        if scenario.setup:
+            scenario.setup(db_manager, sample)
+
+        with recorder.capture() as commands:
+            scenario.run(db_manager, sample)
+
+        if not commands:
+            results.append({'scenario': scenario.name, 'collection': '-', 'operation': '-', 'plan': '-',
+                            'docs_examined': 0, 'keys_examined': 0, 'returned': 0,
+                            'problems': ["לא נשלחו שאילתות"]})
+            continue
+
+        max_docs_examined = scenario.max_docs_examined
+        if callable(max_docs_examined):
+            max_docs_examined = max_docs_examined(sample)
+
+        for database_name, command_name, command in commands:
+            for statement in _single_statements(command_name, command):
+                explain = db_manager.client[database_name].command(explain_command(statement, 'executionStats'))
+                results.append({
+                    'scenario': scenario.name,
+                    'collection': statement[command_name],
+                    'operation': command_name,
+                    **plan_problems(explain, max_docs_examined)
+                })
+
+    return results
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    """אחוזון מדויק מתוך המדידות"""
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+def measure_latencies(db_manager: DatabaseManager, sample: Dict, repeats: int = 20,
+                      scenarios: List[QueryScenario] = QUERY_SCENARIOS) -> Dict[str, Dict]:
+    """זמני p50 / p95 לכל תרחיש (אחרי הרצת חימום; ההכנה לא נמדדת)"""
+    latencies = {}
+
+    for scenario in scenarios:
+        scenario.run(db_manager, sample)
+        samples = []
+
+        for _ in range(repeats):
+            if scenario.setup:
+                scenario.setup(db_manager, sample)
+            started_at = time.perf_counter()
+            scenario.run(db_manager, sample)
+            samples.append((time.perf_counter() - started_at) * 1000)
+
+        latencies[scenario.name] = {'p50_ms': _percentile(samples, 0.5), 'p95_ms': _percentile(samples, 0.95)}
+
+    return latencies
+
+def load_baseline(path: str, volumes: Dict) -> Optional[Dict]:
+    """זמני הבסיס - None אם אין קובץ או שנמדד בנפח נתונים אחר"""
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r', encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+
+    if baseline.get('volumes') != volumes:
+        logger.warning(f"קובץ הבסיס {path} נמדד בנפח {baseline.get('volumes')} - לא משווים מול {volumes}")
+        return None
+
+    return baseline
+
+def save_baseline(path: str, latencies: Dict[str, Dict], volumes: Dict):
+    """שמירת המדידות הנוכחיות כבסיס"""
+    baseline = {'volumes': volumes, 'recorded_at': datetime.now().isoformat(timespec='seconds'), 'scenarios': latencies}
+
+    with open(path, 'w', encoding='utf-8') as baseline_file:
+        json.dump(baseline, baseline_file, ensure_ascii=False, indent=2, sort_keys=True)
+
+def latency_regressions(latencies: Dict[str, Dict], baseline: Dict,
+                        tolerance: float = BASELINE_TOLERANCE) -> List[str]:
+    """תרחישים שה-p95 שלהם חרג מהבסיס"""
+    regressions = []
+
+    for name, current in latencies.items():
+        recorded = baseline['scenarios'].get(name)
+        if recorded is None:
+            continue
+
+        allowed = recorded['p95_ms'] * tolerance + BASELINE_SLACK_MS
+        if current['p95_ms'] > allowed:
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms (בסיס {recorded['p95_ms']}ms, מותר {allowed:.2f}ms)")
+
+    return regressions
+
+def open_seeded_database(posts: int = DEFAULT_SEED_POSTS, logs: int = DEFAULT_SEED_LOGS,
+                         users: int = DEFAULT_SEED_USERS, batch_size: int = 10000) -> DatabaseManager:
+    """DatabaseManager על Config.DATABASE_NAME עם נתוני בדיקה - המסד נמחק ונזרע מחדש רק כשהנפח השתנה"""
+    if not Config.DATABASE_NAME.endswith(QUERY_PLAN_DATABASE_SUFFIX):
+        raise DatabaseError(f"זריעה רק למסד ששמו מסתיים ב-{QUERY_PLAN_DATABASE_SUFFIX} (התקבל {Config.DATABASE_NAME})")
+
+    # המקליט חייב להירשם לפני שהלקוח של DatabaseManager נוצר
+    get_query_recorder()
+    volumes = {'posts': posts, 'logs': logs, 'users': users}
+
+    client = MongoClient(Config.MONGODB_URI, serverSelectionTimeoutMS=5000)
+    try:
+        marker = client[Config.DATABASE_NAME][SEED_COLLECTION].find_one({'_id': 'volumes'}, {'_id': 0})
+        reseed = marker != volumes
+        if reseed:
+            client.drop_database(Config.DATABASE_NAME)
+    finally:
+        client.close()
+
+    db_manager = DatabaseManager()
+
+    if reseed:
+        _seed(db_manager, volumes, batch_size)
+
+    return db_manager
+
+def _seed(db_manager: DatabaseManager, volumes: Dict, batch_size: int):
+    """זריעת משתמשים, פוסטים ולוגים בסדר זמנים עולה (כמו בייצור), ובניית הסטטיסטיקות"""
+    rng = random.Random(42)
+    now = datetime.now()
+    started_at = time.monotonic()
+
+    _insert_batches(db_manager.collections['users'], volumes['users'], batch_size,
+                    lambda index: _seed_user(index + 1, now))
+
+    post_span = timedelta(days=Config.POST_RETENTION_DAYS)
+    hashtag_counts = Counter()
+    _insert_batches(db_manager.collections['posts'], volumes['posts'], batch_size, lambda index: _seed_post(
+        rng, volumes['users'], now - post_span + post_span * index / volumes['posts'], hashtag_counts
+    ))
+
+    # המונים כמו ש-save_post היה מעדכן אותם
+    counts = list(hashtag_counts.items())
+    _insert_batches(db_manager.collections['hashtag_counts'], len(counts), batch_size, lambda index: {
+        '_id': {'user_id': counts[index][0][0], 'tag': counts[index][0][1]}, 'count': counts[index][1], 'last_used_at': now
+    })
+
+    log_span = timedelta(days=Config.LOG_RETENTION_DAYS)
+    _insert_batches(db_manager.collections['logs'], volumes['logs'], batch_size,
+                    lambda index: _seed_log(rng, volumes['users'], now - log_span + log_span * index / volumes['logs']))
+
+    db_manager.rebuild_statistics()
+    db_manager.db[SEED_COLLECTION].replace_one({'_id': 'volumes'}, {'_id': 'volumes', **volumes}, upsert=True)
+
+    logger.info(f"מסד הבדיקה נזרע ({volumes}) ב-{time.monotonic() - started_at:.0f} שניות")
+
+def _insert_batches(collection, count: int, batch_size: int, build: Callable):
+    """הוספה באצוות"""
+    for start in range(0, count, batch_size):
+        collection.insert_many([build(index) for index in range(start, min(count, start + batch_size))], ordered=False)
+
+def _seed_user_id(rng: random.Random, users: int) -> int:
+    """משתמש אקראי - המשתמש הכבד ב-HEAVY_USER_SHARE מהמקרים"""
+    return HEAVY_USER_ID if rng.random() < HEAVY_USER_SHARE else rng.randint(HEAVY_USER_ID + 1, max(users, 2))
+
+def _seed_user(user_id: int, now: datetime) -> Dict:
+    """משתמש עם הגדרות ברירת מחדל"""
+    return {'user_id': user_id, 'settings': _default_user_settings(), 'created_at': now, 'updated_at': now}
+
+def _seed_post(rng: random.Random, users: int, created_at: datetime, hashtag_counts: Counter) -> Dict:
+    """פוסט בסטטוס אקראי עם 0-3 האשטגים - פוסט סופי עם תוצאות ותפוגה כמו שהבוט כותב"""
+    platforms = rng.sample(SEED_PLATFORMS, rng.randint(1, 3))
+    hashtags = ' '.join(f"#{tag}" for tag in rng.sample(SEED_HASHTAGS, rng.randint(0, 3)))
+    post = _build_post_document(_seed_user_id(rng, users), f"video_{rng.getrandbits(32):08x}.mp4",
+                                "פוסט לבדיקת ביצועים " * rng.randint(1, 8) + hashtags, platforms,
+                                round(rng.uniform(1, 200), 1))
+    hashtag_counts.update((post['user_id'], tag) for tag in post['hashtags'])
+    post['status'] = rng.choices(list(SEED_STATUS_WEIGHTS), weights=list(SEED_STATUS_WEIGHTS.values()))[0]
+    post['created_at'] = post['updated_at'] = created_at
+
+    if post['status'] in FINAL_POST_STATUSES:
+        result_status = 'success' if post['status'] == 'completed' else 'failed'
+        post['posting_results'] = {platform: {'status': result_status} for platform in platforms}
+        # אינדקסי TTL משווים מול UTC
+        age = datetime.now() - created_at
+        post['expires_at'] = datetime.utcnow() - age + timedelta(days=Config.POST_RETENTION_DAYS)
+
+    return post
+
+def _seed_log(rng: random.Random, users: int, timestamp: datetime) -> Dict:
+    """רשומת לוג בזמן הנתון"""
+    log = _log_document(_seed_user_id(rng, users), rng.choice(SEED_ACTIONS), {'seed': True}, 'info')
+    log['timestamp'] = timestamp
+    return log
+
+def build_sample(db_manager: DatabaseManager, archive_dir: str) -> Dict:
+    """ערכים לתרחישים - המשתמש הכבד, הפוסט האחרון שלו, סמן לעמוד השני בהיסטוריה והתגית הנפוצה שלו
+    (גם מילת החיפוש - בטקסט הנזרע היא מופיעה רק כהאשטג)"""
+    post = db_manager.collections['posts'].find_one({'user_id': HEAVY_USER_ID}, sort=[('created_at', -1)])
+    if post is None:
+        raise DatabaseError("אין פוסטים למשתמש הבדיקה - המסד לא נזרע")
+
+    tag = db_manager.get_user_hashtags(HEAVY_USER_ID, limit=1)[0]['tag']
+
+    return {
+        'user_id': HEAVY_USER_ID,
+        'post_id': str(post['_id']),
+        'cursor': db_manager.get_user_posts_page(HEAVY_USER_ID)['next_cursor'],
+        'tag': tag,
+        'search_matches': db_manager.collections['posts'].count_documents({'user_id': HEAVY_USER_ID, 'hashtags': tag}),
+        'archive': PartitionedArchive(archive_dir)
+    }
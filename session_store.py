@@ -0,0 +1,226 @@
+"""
+סשנים פתוחים של הבוט (תצוגה מקדימה שממתינה לאישור) לפי post_id - חסומים בכמות ובזמן, ואופציונלית שמורים במסד
+"""
+import asyncio
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from logger import get_logger
+from storage import StorageBackend
+
+logger = get_logger(__name__)
+
+# סיבות לפינוי סשן - מועברות ל-on_evict
+EVICT_EXPIRED = 'expired'
+EVICT_USER_LIMIT = 'user_limit'
+EVICT_FILE_MISSING = 'file_missing'
+
+def session_items(session: Dict) -> List[Dict]:
+    """הסרטונים של הסשן - לאלבום רשימת items (post_id, file_path, filename), לסרטון בודד הסשן עצמו"""
+    return session.get('items') or [session]
+
+def session_files(session: Dict) -> List[str]:
+    """הקבצים הזמניים של הסשן"""
+    return [item['file_path'] for item in session_items(session) if item.get('file_path')]
+
+class SessionStore:
+    """עד max_per_user סשנים פתוחים למשתמש (החדש דוחק את הישן), וכל סשן פג אחרי ttl_seconds
+
+    on_evict נקרא לכל סשן שמפונה (לא ל-pop) - שם משחררים את הקובץ הזמני ומעדכנים את הפוסט.
+    עם storage כל שינוי נכתב גם למסד, ו-restore טוען את הסשנים אחרי הפעלה מחדש.
+    """
+
+    def __init__(self, ttl_seconds: float, max_per_user: int,
+                 on_evict: Callable[[Dict, str], Awaitable[None]],
+                 storage: Optional[StorageBackend] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_per_user = max_per_user
+        self.on_evict = on_evict
+        self.storage = storage
+
+        # post_id -> סשן, לפי סדר התפוגה (לכולם אותו TTL)
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._by_user: Dict[int, List[str]] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+        # מונים לניטור
+        self.evicted = 0
+
+    async def add(self, session: Dict) -> Dict:
+        """שמירת סשן חדש (חייב post_id ו-user_id) - מחזיר אותו עם expires_at"""
+        session['expires_at'] = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+        self._insert(session)
+        await self._persist(session)
+
+        # הישנים של המשתמש מעבר למגבלה
+        user_posts = self._by_user[session['user_id']]
+        while len(user_posts) > self.max_per_user:
+            await self._evict(user_posts[0], EVICT_USER_LIMIT)
+
+        self._ensure_sweeper()
+        return session
+
+    def get(self, post_id: str) -> Optional[Dict]:
+        """הסשן של הפוסט (None - לא קיים או פג)"""
+        session = self._sessions.get(post_id)
+        if session is None or session['expires_at'] <= datetime.utcnow():
+            return None
+        return session
+
+    async def pop(self, post_id: str) -> Optional[Dict]:
+        """הוצאת הסשן לטיפול (אישור / ביטול) - הקובץ באחריות הקורא; סשן שפג מפונה ו-None חוזר"""
+        session = self._sessions.get(post_id)
+        if session is None:
+            return None
+
+        if session['expires_at'] <= datetime.utcnow():
+            await self._evict(post_id, EVICT_EXPIRED)
+            return None
+
+        self._remove(post_id)
+        await self._unpersist(post_id)
+        return session
+
+    def user_posts(self, user_id: int) -> List[str]:
+        """ה-post_id של הסשנים הפתוחים של משתמש, מהישן לחדש"""
+        return list(self._by_user.get(user_id, []))
+
+    def file_paths(self) -> Set[str]:
+        """הקבצים הזמניים שסשנים פתוחים משתמשים בהם"""
+        return {file_path for session in self._sessions.values() for file_path in session_files(session)}
+
+    async def evict_expired(self) -> int:
+        """פינוי כל הסשנים שפגו - מחזיר כמה פונו"""
+        now = datetime.utcnow()
+        expired = [post_id for post_id, session in self._sessions.items() if session['expires_at'] <= now]
+
+        for post_id in expired:
+            await self._evict(post_id, EVICT_EXPIRED)
+
+        return len(expired)
+
+    async def restore(self) -> int:
+        """טעינת הסשנים מהמסד אחרי הפעלה מחדש - סשן שהקובץ שלו כבר לא קיים מפונה"""
+        if self.storage is None:
+            return 0
+
+        try:
+            sessions = await self.storage.load_sessions()
+        except Exception as e:
+            logger.warning(f"שגיאה בטעינת סשנים שמורים: {e}")
+            return 0
+
+        for session in sorted(sessions, key=lambda item: item['expires_at']):
+            self._insert(session)
+
+        for session in sessions:
+            file_paths = session_files(session)
+            if not file_paths or not all(os.path.exists(file_path) for file_path in file_paths):
+                await self._evict(session['post_id'], EVICT_FILE_MISSING)
+
+        # מגבלת המשתמש אולי השתנתה מאז
+        for user_posts in list(self._by_user.values()):
+            while len(user_posts) > self.max_per_user:
+                await self._evict(user_posts[0], EVICT_USER_LIMIT)
+
+        if self._sessions:
+            self._ensure_sweeper()
+
+        logger.info(f"נטענו {len(self._sessions)} סשנים פתוחים מהמסד")
+        return len(self._sessions)
+
+    def close(self) -> List[Dict]:
+        """עצירת הפינוי ברקע - בלי storage הסשנים נמחקים ומוחזרים (לשחרור הקבצים), עם storage הם נשארים להפעלה הבאה"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+        if self.storage is not None:
+            return []
+
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        self._by_user.clear()
+        return sessions
+
+    def _insert(self, session: Dict):
+        """הוספה למבנים בזיכרון (סשן קיים עם אותו post_id מוחלף)"""
+        post_id = session['post_id']
+        if post_id in self._sessions:
+            self._remove(post_id)
+
+        self._sessions[post_id] = session
+        self._by_user.setdefault(session['user_id'], []).append(post_id)
+
+    def _remove(self, post_id: str) -> Optional[Dict]:
+        """הסרה מהמבנים בזיכרון"""
+        session = self._sessions.pop(post_id, None)
+        if session is None:
+            return None
+
+        user_posts = self._by_user[session['user_id']]
+        user_posts.remove(post_id)
+        if not user_posts:
+            del self._by_user[session['user_id']]
+
+        return session
+
+    async def _evict(self, post_id: str, reason: str):
+        """הסרה ושחרור דרך on_evict - שגיאה בשחרור לא משאירה את הסשן"""
+        session = self._remove(post_id)
+        if session is None:
+            return
+
+        self.evicted += 1
+        await self._unpersist(post_id)
+
+        try:
+            await self.on_evict(session, reason)
+        except Exception as e:
+            logger.warning(f"שגיאה בשחרור סשן {post_id} ({reason}): {e}")
+
+    async def _persist(self, session: Dict):
+        """כתיבת הסשן למסד (אם מוגדר) - כישלון משאיר אותו בזיכרון בלבד"""
+        if self.storage is None:
+            return
+
+        try:
+            await self.storage.save_session(session)
+        except Exception as e:
+            logger.warning(f"שגיאה בשמירת סשן {session['post_id']}: {e}")
+
+    async def _unpersist(self, post_id: str):
+        """מחיקת הסשן מהמסד (אם מוגדר)"""
+        if self.storage is None:
+            return
+
+        try:
+            await self.storage.delete_session(post_id)
+        except Exception as e:
+            logger.warning(f"שגיאה במחיקת סשן {post_id}: {e}")
+
+    def _ensure_sweeper(self):
+        """הפעלת הפינוי ברקע אם הוא לא רץ"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        """המתנה עד התפוגה הקרובה ופינוי - נעצר כשאין סשנים"""
+        while self._sessions:
+            earliest = next(iter(self._sessions.values()))['expires_at']
+            delay = (earliest - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            try:
+                await self.evict_expired()
+            except Exception as e:
+                logger.error(f"שגיאה בפינוי סשנים שפגו: {e}")
+
+    def __contains__(self, post_id: str) -> bool:
+        return self.get(post_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -2,8 +2,10 @@
 מטפל פרסום לכל הרשתות החברתיות
 """
 import os
+import json
 import asyncio
-from typing import Dict, Optional, Tuple
+from contextlib import ExitStack
+from typing import Dict, List, Optional, Tuple
 import requests
 import tweepy
 from facebook import GraphAPI
@@ -20,9 +22,15 @@ from utils import async_retry
 
 logger = get_logger(__name__)
 
+# מקסימום סרטונים באלבום אחד בטלגרם (sendMediaGroup)
+TELEGRAM_MEDIA_GROUP_MAX = 10
+
 class BaseSocialMediaAPI:
     """מחלקת בסיס לכל רשתות החברתיות"""
     
+    # פלטפורמה שמפרסמת כמה סרטונים יחד (post_batch) - בשאר המנהל מפרסם אחד אחרי השני
+    supports_batch = False
+    
     def __init__(self, platform_name: str):
         self.platform_name = platform_name
         self.logger = get_logger(f"{__name__}.{platform_name}")
@@ -31,6 +39,10 @@ class BaseSocialMediaAPI:
         """פונקציית פרסום בסיסית - יש להגדיר מחדש בכל מחלקה"""
         raise NotImplementedError(f"פונקציית post לא מוגדרת עבור {self.platform_name}")
     
+    async def post_batch(self, video_paths: List[str], text: str) -> List[bool]:
+        """פרסום כמה סרטונים יחד - רק בפלטפורמות עם supports_batch"""
+        raise NotImplementedError(f"פונקציית post_batch לא מוגדרת עבור {self.platform_name}")
+    
     def _validate_tokens(self) -> bool:
         """בדיקת זמינות טוקנים - יש להגדיר מחדש"""
         return True
@@ -449,6 +461,8 @@ class TumblrAPI(BaseSocialMediaAPI):
 class TelegramChannelAPI(BaseSocialMediaAPI):
     """API של ערוץ טלגרם"""
     
+    supports_batch = True
+    
     def __init__(self, bot_token: str):
         super().__init__("Telegram")
         self.bot_token = bot_token
@@ -491,6 +505,54 @@ class TelegramChannelAPI(BaseSocialMediaAPI):
         except Exception as e:
             self.logger.error(f"שגיאה בפרסום בערוץ טלגרם: {e}")
             raise self._handle_api_error(e)
+    
+    async def post_batch(self, video_paths: List[str], text: str) -> List[bool]:
+        """פרסום כאלבום בערוץ (עד 10 סרטונים בבקשה) - כל הבקשות על אותו חיבור, והכיתוב על הסרטון הראשון"""
+        if not self._validate_tokens():
+            raise TokenMissingError("Telegram")
+        
+        results = []
+        with requests.Session() as session:
+            for start in range(0, len(video_paths), TELEGRAM_MEDIA_GROUP_MAX):
+                chunk = video_paths[start:start + TELEGRAM_MEDIA_GROUP_MAX]
+                try:
+                    await asyncio.to_thread(self._send_media_group, session, chunk, text if start == 0 else None)
+                    results += [True] * len(chunk)
+                except Exception as e:
+                    self.logger.error(f"שגיאה בפרסום אלבום בערוץ טלגרם: {e}")
+                    results += [False] * len(chunk)
+        
+        self.logger.info(f"אלבום בערוץ טלגרם: {sum(results)} מתוך {len(video_paths)} סרטונים פורסמו")
+        return results
+    
+    def _send_media_group(self, session: requests.Session, video_paths: List[str], caption: Optional[str]):
+        """בקשה אחת - sendMediaGroup, או sendVideo כשנשאר סרטון בודד (אלבום צריך לפחות 2)"""
+        with ExitStack() as stack:
+            if len(video_paths) == 1:
+                url = f"https://api.telegram.org/bot{self.bot_token}/sendVideo"
+                files = {'video': stack.enter_context(open(video_paths[0], 'rb'))}
+                data = {'chat_id': self.channel_id}
+                if caption:
+                    data.update(caption=caption, parse_mode='Markdown')
+            else:
+                url = f"https://api.telegram.org/bot{self.bot_token}/sendMediaGroup"
+                files, media = {}, []
+                for index, video_path in enumerate(video_paths):
+                    files[f'video{index}'] = stack.enter_context(open(video_path, 'rb'))
+                    item = {'type': 'video', 'media': f'attach://video{index}'}
+                    if caption and index == 0:
+                        item.update(caption=caption, parse_mode='Markdown')
+                    media.append(item)
+                data = {'chat_id': self.channel_id, 'media': json.dumps(media)}
+            
+            response = session.post(url, files=files, data=data, timeout=120)
+        
+        if response.status_code != 200:
+            raise PostingError("Telegram", f"HTTP {response.status_code}")
+        
+        result = response.json()
+        if not result.get('ok'):
+            raise PostingError("Telegram", f"שגיאה: {result.get('description')}")
 
 class SocialMediaManager:
     """מנהל כל הרשתות החברתיות"""
@@ -529,6 +591,44 @@ class SocialMediaManager:
             self.logger.error(f"פרסום נכשל ב-{platform}: {e}")
             return False
     
+    async def post_batch_to_platform(self, platform: str, video_paths: List[str], text: str,
+                                     max_retries: int = 2) -> List[bool]:
+        """פרסום כמה סרטונים (אלבום) לפלטפורמה - יחד אם היא תומכת, אחרת אחד אחרי השני על אותו לקוח,
+        עם תקציב אחד של ניסיונות חוזרים לכל האצווה (ולא לכל סרטון)"""
+        if platform not in self.apis:
+            raise ValueError(f"פלטפורמה לא מוכרת: {platform}")
+        
+        api = self.apis[platform]
+        
+        if api.supports_batch and len(video_paths) > 1:
+            try:
+                return await api.post_batch(video_paths, text)
+            except Exception as e:
+                self.logger.error(f"פרסום אלבום נכשל ב-{platform}: {e}")
+                return [False] * len(video_paths)
+        
+        results = []
+        retries_left = max_retries
+        delay = 1.0
+        
+        for video_path in video_paths:
+            while True:
+                try:
+                    results.append(bool(await api.post(video_path, text)))
+                    break
+                except Exception as e:
+                    if not retries_left:
+                        self.logger.error(f"פרסום נכשל ב-{platform}: {e}")
+                        results.append(False)
+                        break
+                    
+                    retries_left -= 1
+                    self.logger.warning(f"פרסום ב-{platform} נכשל, מנסה שוב בעוד {delay} שניות ({retries_left} ניסיונות נותרו לאצווה)")
+                    await asyncio.sleep(delay)
+                    delay *= 2
+        
+        return results
+    
     async def post_to_all_platforms(self, platforms: list, video_path: str, text: str) -> Dict[str, bool]:
         """פרסום לכל הפלטפורמות"""
         results = {}
@@ -0,0 +1,730 @@
+"""
+אחסון מקומי מוטמע (SQLite) - חלופה ל-MongoDB לפריסה של שרת יחיד
+אותו ממשק כמו AsyncDatabaseManager (ראו storage.StorageBackend)
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+
+from config import Config
+from exceptions import *
+from logger import db_logger, get_logger
+from storage import StorageBackend
+from utils import TextHelper
+from database import (
+    FINAL_POST_STATUSES, POST_SUMMARY_FIELDS, SEARCH_SCORE_DIGITS, STATISTICS_TOTALS_ID, SUCCESS_RESULT_STATUSES,
+    _EPOCH, _build_post_document, _build_posts_page, _completed_platforms, _decode_search_cursor,
+    _default_user_settings, _encode_search_cursor, _search_query, _statistics_day_id, _statistics_from_buckets
+)
+
+logger = get_logger(__name__)
+
+# טבלת הפוסטים - seq הוא rowid מפורש (INTEGER PRIMARY KEY): VACUUM לא ממספר אותו מחדש, ו-posts_fts מצביע עליו
+_POSTS_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    user_id INTEGER NOT NULL,
+    filename TEXT,
+    text TEXT,
+    text_preview TEXT,
+    platforms TEXT NOT NULL DEFAULT '[]',
+    file_size_mb REAL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    expires_at TEXT,
+    posting_results TEXT NOT NULL DEFAULT '{{}}',
+    progress_succeeded INTEGER NOT NULL DEFAULT 0,
+    progress_failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    mock_mode INTEGER
+)
+"""
+
+# עמודות הפוסט שמועתקות כשטבלה מקובץ ישן נבנית מחדש עם seq
+_POSTS_COLUMNS = (
+    "id, user_id, filename, text, text_preview, platforms, file_size_mb, status, created_at, updated_at, "
+    "expires_at, posting_results, progress_succeeded, progress_failed, error, mock_mode"
+)
+
+# אותם אינדקסים כמו בקולקשנים של MongoDB
+_SCHEMA = _POSTS_TABLE.format(name='posts') + """;
+CREATE INDEX IF NOT EXISTS posts_user_created ON posts (user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS posts_status ON posts (status);
+CREATE INDEX IF NOT EXISTS posts_user_status ON posts (user_id, status);
+CREATE INDEX IF NOT EXISTS posts_created ON posts (created_at);
+CREATE INDEX IF NOT EXISTS posts_expires ON posts (expires_at) WHERE expires_at IS NOT NULL;
+
+-- האשטגים מנורמלים - שורה לכל (פוסט, תגית), נמחקות יחד עם הפוסט
+CREATE TABLE IF NOT EXISTS post_hashtags (
+    post_id TEXT NOT NULL REFERENCES posts (id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (post_id, tag)
+);
+CREATE INDEX IF NOT EXISTS post_hashtags_user_tag ON post_hashtags (user_id, tag, created_at DESC, post_id DESC);
+
+-- חיפוש טקסט (FTS5) - rowid זהה ל-seq של הפוסט, user_key מגביל את החיפוש למשתמש אחד
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+    text, user_key, tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+    INSERT INTO posts_fts (rowid, text, user_key) VALUES (new.seq, coalesce(new.text, ''), 'u' || new.user_id);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+    DELETE FROM posts_fts WHERE rowid = old.seq;
+END;
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    settings TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    action TEXT NOT NULL,
+    details TEXT,
+    level TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS logs_timestamp ON logs (timestamp);
+
+-- סטטיסטיקות מצטברות (כמו קולקשן statistics ב-MongoDB) - bucket הוא 'all' או יום (YYYY-MM-DD),
+-- platform ריק סופר פוסטים; מתעדכנות בשמירה ובשינוי סטטוס ולא יורדות כשפוסטים נמחקים
+CREATE TABLE IF NOT EXISTS statistics (
+    bucket TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    status TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (bucket, platform, status)
+) WITHOUT ROWID;
+
+-- משתמשים ששמרו לפחות פוסט אחד
+CREATE TABLE IF NOT EXISTS statistics_users (
+    user_id INTEGER PRIMARY KEY
+);
+"""
+
+# מילוי הסטטיסטיקות מפוסטים שנשמרו לפני טבלת הסיכום (פעם אחת, כשהטבלה נוצרת)
+_STATISTICS_SEED = """
+INSERT INTO statistics (bucket, platform, status, count)
+SELECT bucket, platform, status, COUNT(*) FROM (
+    SELECT 'all' AS bucket, '' AS platform, status FROM posts
+    UNION ALL SELECT substr(created_at, 1, 10), '', status FROM posts
+    UNION ALL SELECT 'all', platform.value, status FROM posts, json_each(posts.platforms) AS platform
+    UNION ALL SELECT substr(created_at, 1, 10), platform.value, status FROM posts, json_each(posts.platforms) AS platform
+)
+GROUP BY bucket, platform, status
+"""
+
+_STATISTICS_INCREMENT = """
+INSERT INTO statistics (bucket, platform, status, count) VALUES (?, ?, ?, ?)
+ON CONFLICT (bucket, platform, status) DO UPDATE SET count = count + excluded.count
+"""
+
+def _statistics_rows(created_at: datetime, status: str, platforms: List[str], delta: int) -> List[tuple]:
+    """שורות לעדכון הסטטיסטיקות - דלי הסה"כ ודלי היום, לכל הפוסטים ולכל פלטפורמה"""
+    return [
+        (bucket, platform, status, delta)
+        for bucket in (STATISTICS_TOTALS_ID, _statistics_day_id(created_at))
+        for platform in ('', *platforms)
+    ]
+
+def _statistics_buckets(rows: List[sqlite3.Row]) -> List[Dict]:
+    """שורות הסיכום לדליים באותו מבנה כמו בקולקשן statistics"""
+    buckets = {}
+
+    for row in rows:
+        bucket = buckets.setdefault(row['bucket'], {'_id': row['bucket'], 'total': 0, 'by_status': {}, 'by_platform': {}})
+
+        if row['platform']:
+            platform_counts = bucket['by_platform'].setdefault(row['platform'], {'total': 0})
+            platform_counts['total'] += row['count']
+            platform_counts[row['status']] = row['count']
+        else:
+            bucket['total'] += row['count']
+            bucket['by_status'][row['status']] = row['count']
+
+    return list(buckets.values())
+
+# שדה במסמך -> עמודות בטבלה (גם רשימה לבנה לבניית SELECT)
+_FIELD_COLUMNS = {
+    'user_id': ('user_id',), 'filename': ('filename',), 'text': ('text',),
+    'text_preview': ('text_preview',), 'platforms': ('platforms',), 'file_size_mb': ('file_size_mb',),
+    'status': ('status',), 'created_at': ('created_at',), 'updated_at': ('updated_at',),
+    'expires_at': ('expires_at',), 'posting_results': ('posting_results',),
+    'progress': ('progress_succeeded', 'progress_failed'), 'error': ('error',), 'mock_mode': ('mock_mode',)
+}
+
+_JSON_COLUMNS = ('platforms', 'posting_results')
+_DATETIME_COLUMNS = ('created_at', 'updated_at', 'expires_at')
+
+# משקלי bm25 לעמודות posts_fts (text, user_key) - user_key רק מסנן
+_FTS_WEIGHTS = (1.0, 0.0)
+
+def _fts_match(user_id: int, query: str) -> str:
+    """ביטוי MATCH - הפוסטים של המשתמש שמכילים לפחות אחת מהמילים (כל מילה במירכאות, בלי תחביר FTS)"""
+    terms = ' OR '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+    return f'user_key : "u{user_id}" AND text : ({terms})'
+
+# מחיקת פוסטים ולוגים שפג תוקפם (אין TTL ב-SQLite) - באצוות, כל אצווה טרנזקציה קצרה משלה
+PURGE_INTERVAL_SECONDS = 3600
+PURGE_BATCH_SIZE = 500
+
+def _to_db_time(value: datetime) -> str:
+    """תאריך לטקסט בר-מיון - ברזולוציית מילישניות כמו ב-BSON"""
+    return value.isoformat(sep=' ', timespec='milliseconds')
+
+def _select_columns(fields: Optional[List[str]]) -> str:
+    """רשימת עמודות ל-SELECT לפי שדות מבוקשים (None = הכל)"""
+    if fields is None:
+        return '*'
+
+    columns = ['id']
+    for field in fields:
+        for column in _FIELD_COLUMNS.get(field, ()):
+            if column not in columns:
+                columns.append(column)
+
+    return ', '.join(columns)
+
+def _row_to_post(row: sqlite3.Row) -> Dict:
+    """שורת פוסט למסמך באותו מבנה כמו ב-MongoDB"""
+    post = {'_id': row['id']}
+
+    for column in row.keys():
+        value = row[column]
+        if column in ('id', 'seq'):
+            continue
+        if value is not None and column in _JSON_COLUMNS:
+            value = json.loads(value)
+        elif value is not None and column in _DATETIME_COLUMNS:
+            value = datetime.fromisoformat(value)
+        elif value is not None and column == 'mock_mode':
+            value = bool(value)
+        post[column] = value
+
+    if 'progress_succeeded' in post:
+        post['progress'] = {'succeeded': post.pop('progress_succeeded'), 'failed': post.pop('progress_failed')}
+
+    return post
+
+class SQLiteDatabaseManager(StorageBackend):
+    """אחסון בקובץ SQLite מקומי (WAL) - ללא שרת וללא round trip ברשת"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn: Optional[sqlite3.Connection] = None
+        self._purge_task: Optional[asyncio.Task] = None
+        # החיבור משמש מ-threads של asyncio.to_thread - פעולה אחת בכל פעם
+        self._lock = threading.Lock()
+
+    async def _run(self, function, *args):
+        """הרצת פעולה על החיבור ב-thread, כך ש-busy_timeout או שאילתה ארוכה לא עוצרים את ה-event loop"""
+        def locked():
+            with self._lock:
+                return function(*args)
+
+        return await asyncio.to_thread(locked)
+
+    async def _fetchall(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
+        """כל השורות של שאילתה"""
+        return await self._run(lambda: self.conn.execute(query, params).fetchall())
+
+    async def _fetchone(self, query: str, params: tuple = ()) -> Optional[sqlite3.Row]:
+        """השורה הראשונה של שאילתה"""
+        return await self._run(lambda: self.conn.execute(query, params).fetchone())
+
+    async def _write(self, statement: str, params: tuple = ()):
+        """פקודת כתיבה אחת בטרנזקציה משלה"""
+        def write():
+            with self.conn:
+                self.conn.execute(statement, params)
+
+        await self._run(write)
+
+    async def connect(self):
+        """פתיחת הקובץ, הגדרות WAL ויצירת טבלאות ואינדקסים"""
+        try:
+            await self._run(self._open)
+            await self.purge_expired()
+            self._purge_task = asyncio.create_task(self._purge_loop())
+
+            db_logger.log_connection_status(True)
+            logger.info(f"אחסון SQLite נפתח: {self.path}")
+
+        except sqlite3.Error as e:
+            db_logger.log_connection_status(False, str(e))
+            raise ConnectionError("SQLite")
+
+    def _open(self):
+        """פתיחת החיבור ויצירת הסכמה (רץ ב-thread)"""
+        # שאילתות עם פרמטרים נשמרות כ-prepared statements במטמון החיבור
+        self.conn = sqlite3.connect(self.path, cached_statements=256, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # ב-WAL, NORMAL לא מסנכרן לדיסק בכל commit - עמיד לקריסת תהליך
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        # מחיקת פוסט מוחקת את שורות ההאשטגים שלו
+        self.conn.execute("PRAGMA foreign_keys=ON")
+
+        has_fts = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'posts_fts'"
+        ).fetchone() is not None
+        has_statistics = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'statistics'"
+        ).fetchone() is not None
+        posts_columns = [row['name'] for row in self.conn.execute("PRAGMA table_info(posts)")]
+        if posts_columns and 'seq' not in posts_columns:
+            self._add_posts_seq()
+        self.conn.executescript(_SCHEMA)
+
+        if not has_fts:
+            self._build_search_index()
+        if not has_statistics:
+            self._build_statistics()
+
+    def _add_posts_seq(self):
+        """טבלת פוסטים מקובץ ישן (בלי seq) - בנייה מחדש עם seq = ה-rowid הנוכחי, כך ש-posts_fts ממשיך להצביע על
+        אותם פוסטים; האינדקסים והטריגרים נוצרים מחדש ב-_SCHEMA"""
+        # בלי foreign keys - DROP של הטבלה הישנה היה מוחק את שורות ההאשטגים (ON DELETE CASCADE)
+        self.conn.execute("PRAGMA foreign_keys=OFF")
+        try:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.execute(_POSTS_TABLE.format(name='posts_new'))
+                self.conn.execute(
+                    f"INSERT INTO posts_new (seq, {_POSTS_COLUMNS}) SELECT rowid, {_POSTS_COLUMNS} FROM posts"
+                )
+                self.conn.execute("DROP TABLE posts")
+                self.conn.execute("ALTER TABLE posts_new RENAME TO posts")
+        finally:
+            self.conn.execute("PRAGMA foreign_keys=ON")
+
+        logger.info("טבלת הפוסטים נבנתה מחדש עם seq (rowid קבוע לאינדקס החיפוש)")
+
+    def _build_search_index(self):
+        """אינדוקס פוסטים שנשמרו לפני טבלת החיפוש (פעם אחת, כשהטבלה נוצרת)"""
+        with self.conn:
+            indexed = self.conn.execute(
+                """INSERT INTO posts_fts (rowid, text, user_key)
+                   SELECT seq, coalesce(text, ''), 'u' || user_id FROM posts"""
+            ).rowcount
+
+        if indexed:
+            logger.info(f"{indexed} פוסטים קיימים נוספו לאינדקס החיפוש")
+
+    def _build_statistics(self):
+        """מילוי טבלת הסיכום מפוסטים שנשמרו לפניה (פעם אחת, כשהטבלה נוצרת)"""
+        with self.conn:
+            self.conn.execute(_STATISTICS_SEED)
+            users = self.conn.execute(
+                "INSERT OR IGNORE INTO statistics_users (user_id) SELECT DISTINCT user_id FROM posts"
+            ).rowcount
+
+        if users:
+            logger.info(f"הסטטיסטיקות מולאו מהפוסטים הקיימים ({users} משתמשים)")
+
+    async def health_check(self) -> bool:
+        """בדיקת תקינות האחסון"""
+        try:
+            await self._fetchone("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    async def flush_logs(self):
+        """לוגים נכתבים ישירות - אין תור לרוקן"""
+
+    def close_connection(self):
+        """סגירת הקובץ"""
+        if self._purge_task:
+            self._purge_task.cancel()
+            self._purge_task = None
+
+        with self._lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+                logger.info("אחסון SQLite נסגר")
+
+    async def _purge_loop(self):
+        """מחיקה תקופתית של נתונים שפג תוקפם"""
+        while True:
+            await asyncio.sleep(PURGE_INTERVAL_SECONDS)
+            try:
+                await self.purge_expired()
+            except sqlite3.Error as e:
+                logger.warning(f"שגיאה במחיקת נתונים ישנים: {e}")
+
+    async def purge_expired(self) -> int:
+        """מחיקת פוסטים שפג תוקפם ולוגים ישנים מ-LOG_RETENTION_DAYS (בטווח אינדקס) - מחזיר מספר שורות"""
+        log_cutoff = datetime.now() - timedelta(days=Config.LOG_RETENTION_DAYS)
+
+        posts = await self._delete_in_batches(
+            "DELETE FROM posts WHERE seq IN (SELECT seq FROM posts WHERE expires_at <= ? LIMIT ?)",
+            _to_db_time(datetime.utcnow())
+        )
+        logs = await self._delete_in_batches(
+            "DELETE FROM logs WHERE id IN (SELECT id FROM logs WHERE timestamp < ? LIMIT ?)",
+            _to_db_time(log_cutoff)
+        )
+
+        if posts or logs:
+            logger.info(f"נמחקו {posts} פוסטים ו-{logs} לוגים שפג תוקפם")
+
+        return posts + logs
+
+    async def _delete_in_batches(self, statement: str, cutoff: str) -> int:
+        """DELETE של עד PURGE_BATCH_SIZE שורות בכל פעם, עד שלא נשאר מה למחוק - בין האצוות הקובץ פנוי לשאר הפעולות"""
+        def delete_batch() -> int:
+            with self.conn:
+                return self.conn.execute(statement, (cutoff, PURGE_BATCH_SIZE)).rowcount
+
+        deleted = 0
+        while True:
+            batch = await self._run(delete_batch)
+            deleted += batch
+            if batch < PURGE_BATCH_SIZE:
+                return deleted
+
+    async def save_post(self, user_id: int, filename: str, text: str,
+                        platforms: List[str], file_size_mb: float) -> str:
+        """שמירת פוסט חדש"""
+        try:
+            post_data = _build_post_document(user_id, filename, text, platforms, file_size_mb)
+            post_id = str(ObjectId())
+
+            def insert():
+                with self.conn:
+                    self.conn.execute(
+                        """INSERT INTO posts (id, user_id, filename, text, text_preview, platforms, file_size_mb,
+                                              status, created_at, updated_at, mock_mode)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (post_id, user_id, filename, text, post_data['text_preview'], json.dumps(platforms),
+                         file_size_mb, post_data['status'], _to_db_time(post_data['created_at']),
+                         _to_db_time(post_data['updated_at']), int(post_data['mock_mode']))
+                    )
+                    self.conn.executemany(
+                        "INSERT INTO post_hashtags (post_id, user_id, tag, created_at) VALUES (?, ?, ?, ?)",
+                        [(post_id, user_id, tag, _to_db_time(post_data['created_at']))
+                         for tag in post_data['hashtags']]
+                    )
+                    self.conn.executemany(
+                        _STATISTICS_INCREMENT,
+                        _statistics_rows(post_data['created_at'], post_data['status'], platforms, 1)
+                    )
+                    self.conn.execute("INSERT OR IGNORE INTO statistics_users (user_id) VALUES (?)", (user_id,))
+
+            await self._run(insert)
+
+            db_logger.log_save_post(user_id, post_data)
+            logger.info(f"פוסט נשמר במסד נתונים: {post_id}")
+
+            return post_id
+
+        except Exception as e:
+            raise SaveError(f"שמירת פוסט: {e}")
+
+    async def update_post_status(self, post_id: str, status: str,
+                                 posting_results: Optional[Dict] = None, error: Optional[str] = None):
+        """עדכון סטטוס פוסט (בסטטוס סופי נקבע expires_at, אחרת הוא מוסר)"""
+        try:
+            expires_at = None
+            if status in FINAL_POST_STATUSES:
+                expires_at = _to_db_time(datetime.utcnow() + timedelta(days=Config.POST_RETENTION_DAYS))
+
+            assignments = "status = ?, updated_at = ?, expires_at = ?"
+            params = [status, _to_db_time(datetime.now()), expires_at]
+
+            if posting_results:
+                assignments += ", posting_results = ?"
+                params.append(json.dumps(posting_results, ensure_ascii=False))
+
+            if error:
+                assignments += ", error = ?"
+                params.append(error)
+
+            def update() -> bool:
+                with self.conn:
+                    previous = self.conn.execute(
+                        "SELECT status, platforms, created_at FROM posts WHERE id = ?", (post_id,)
+                    ).fetchone()
+
+                    if previous is None:
+                        return False
+
+                    self.conn.execute(f"UPDATE posts SET {assignments} WHERE id = ?", (*params, post_id))
+
+                    # הסטטיסטיקות זזות רק כשהסטטוס באמת השתנה
+                    if previous['status'] != status:
+                        created_at = datetime.fromisoformat(previous['created_at'])
+                        platforms = json.loads(previous['platforms'])
+                        self.conn.executemany(_STATISTICS_INCREMENT, [
+                            *_statistics_rows(created_at, previous['status'], platforms, -1),
+                            *_statistics_rows(created_at, status, platforms, 1)
+                        ])
+
+                return True
+
+            if not await self._run(update):
+                logger.warning(f"לא נמצא פוסט לעדכון: {post_id}")
+                return
+
+            logger.debug(f"סטטוס פוסט עודכן: {post_id} -> {status}")
+
+        except Exception as e:
+            raise SaveError(f"עדכון סטטוס פוסט: {e}")
+
+    async def record_platform_result(self, post_id: str, platform: str, result: Dict):
+        """שמירת תוצאת פלטפורמה אחת ועדכון מוני ההתקדמות בטרנזקציה אחת"""
+        def update() -> bool:
+            with self.conn:
+                row = self.conn.execute(
+                    "SELECT posting_results FROM posts WHERE id = ?", (post_id,)
+                ).fetchone()
+
+                if row is None:
+                    return False
+
+                results = json.loads(row['posting_results'])
+                previous = results.get(platform)
+                results[platform] = result
+
+                # ניסיון חוזר מחליף תוצאה קודמת - מורידים אותה מהמונים
+                succeeded = int(result.get('status') in SUCCESS_RESULT_STATUSES)
+                was_succeeded = int(previous is not None and previous.get('status') in SUCCESS_RESULT_STATUSES)
+                was_failed = int(previous is not None and not was_succeeded)
+
+                self.conn.execute(
+                    """UPDATE posts SET posting_results = ?,
+                                        progress_succeeded = progress_succeeded + ?,
+                                        progress_failed = progress_failed + ?,
+                                        updated_at = ?
+                       WHERE id = ?""",
+                    (json.dumps(results, ensure_ascii=False), succeeded - was_succeeded,
+                     (1 - succeeded) - was_failed, _to_db_time(datetime.now()), post_id)
+                )
+
+            return True
+
+        try:
+            if not await self._run(update):
+                logger.warning(f"לא נמצא פוסט לעדכון תוצאה: {post_id}")
+
+        except Exception as e:
+            raise SaveError(f"שמירת תוצאת {platform}: {e}")
+
+    async def get_completed_platforms(self, post_id: str) -> List[str]:
+        """פלטפורמות שהפוסט כבר פורסם בהן בהצלחה"""
+        try:
+            row = await self._fetchone("SELECT posting_results FROM posts WHERE id = ?", (post_id,))
+            return _completed_platforms({'posting_results': json.loads(row['posting_results'])} if row else None)
+
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בקבלת תוצאות פרסום {post_id}: {e}")
+
+    async def get_user_posts(self, user_id: int, limit: int = 10,
+                             fields: Optional[List[str]] = None) -> List[Dict]:
+        """קבלת פוסטים של משתמש (fields - רק השדות האלה)"""
+        try:
+            rows = await self._fetchall(
+                f"""SELECT {_select_columns(fields)} FROM posts WHERE user_id = ?
+                    ORDER BY created_at DESC, id DESC LIMIT ?""",
+                (user_id, limit)
+            )
+
+            return [_row_to_post(row) for row in rows]
+
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בקבלת פוסטים: {e}")
+
+    async def get_user_posts_page(self, user_id: int, limit: int = 10, cursor: Optional[str] = None,
+                                  fields: Optional[List[str]] = POST_SUMMARY_FIELDS) -> Dict:
+        """עמוד מהיסטוריית הפוסטים (keyset על created_at, id - מאותו אינדקס)"""
+        try:
+            columns = _select_columns(None if fields is None else [*fields, 'created_at'])
+
+            if cursor:
+                millis, post_id = cursor.split('.', 1)
+                created_at = _to_db_time(_EPOCH + timedelta(milliseconds=int(millis)))
+                rows = await self._fetchall(
+                    f"""SELECT {columns} FROM posts WHERE user_id = ? AND (created_at, id) < (?, ?)
+                        ORDER BY created_at DESC, id DESC LIMIT ?""",
+                    (user_id, created_at, post_id, limit + 1)
+                )
+            else:
+                rows = await self._fetchall(
+                    f"""SELECT {columns} FROM posts WHERE user_id = ?
+                        ORDER BY created_at DESC, id DESC LIMIT ?""",
+                    (user_id, limit + 1)
+                )
+
+            return _build_posts_page([_row_to_post(row) for row in rows], limit)
+
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בקבלת עמוד פוסטים: {e}")
+
+    async def get_posts_by_hashtag(self, user_id: int, tag: str, limit: int = 10, cursor: Optional[str] = None,
+                                   fields: Optional[List[str]] = POST_SUMMARY_FIELDS) -> Dict:
+        """עמוד פוסטים עם האשטג - keyset על האינדקס (user_id, tag, created_at, post_id)"""
+        try:
+            columns = _select_columns(None if fields is None else [*fields, 'created_at'])
+            params = [user_id, TextHelper.normalize_hashtag(tag)]
+            keyset = ""
+
+            if cursor:
+                millis, post_id = cursor.split('.', 1)
+                keyset = "AND (created_at, post_id) < (?, ?)"
+                params += [_to_db_time(_EPOCH + timedelta(milliseconds=int(millis))), post_id]
+
+            rows = await self._fetchall(
+                f"""SELECT {columns} FROM posts WHERE id IN (
+                        SELECT post_id FROM post_hashtags WHERE user_id = ? AND tag = ? {keyset}
+                        ORDER BY created_at DESC, post_id DESC LIMIT ?
+                    ) ORDER BY created_at DESC, id DESC""",
+                (*params, limit + 1)
+            )
+
+            return _build_posts_page([_row_to_post(row) for row in rows], limit)
+
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בחיפוש לפי האשטג: {e}")
+
+    async def get_user_hashtags(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """ההאשטגים הנפוצים של משתמש - מהפוסטים השמורים כרגע (מכוסה ע"י האינדקס)"""
+        try:
+            rows = await self._fetchall(
+                """SELECT tag, COUNT(*) AS count FROM post_hashtags WHERE user_id = ?
+                   GROUP BY tag ORDER BY count DESC, tag LIMIT ?""",
+                (user_id, limit)
+            )
+
+            return [{'tag': row['tag'], 'count': row['count']} for row in rows]
+
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בקבלת האשטגים: {e}")
+
+    async def search_posts(self, user_id: int, query: str, limit: int = 10, cursor: Optional[str] = None,
+                           fields: Optional[List[str]] = POST_SUMMARY_FIELDS) -> Dict:
+        """חיפוש בכיתובים (FTS5, דירוג bm25) - keyset על (score, id) כמו ב-MongoDB"""
+        query = _search_query(query)
+        if not query:
+            return {'posts': [], 'next_cursor': None}
+
+        try:
+            columns = 'posts.*' if fields is None else _select_columns(fields)
+            params = [*_FTS_WEIGHTS, _fts_match(user_id, query)]
+            keyset = ""
+
+            if cursor:
+                keyset = "WHERE (matches.score, posts.id) < (?, ?)"
+                params += list(_decode_search_cursor(cursor))
+
+            # bm25 קטן יותר = רלוונטי יותר - הציון הפוך כדי שיהיה באותו כיוון כמו textScore
+            rows = await self._fetchall(
+                f"""SELECT {columns}, matches.score FROM (
+                        SELECT rowid AS post_rowid, round(-bm25(posts_fts, ?, ?), {SEARCH_SCORE_DIGITS}) AS score
+                        FROM posts_fts WHERE posts_fts MATCH ?
+                    ) AS matches JOIN posts ON posts.seq = matches.post_rowid
+                    {keyset}
+                    ORDER BY matches.score DESC, posts.id DESC LIMIT ?""",
+                (*params, limit + 1)
+            )
+
+            return _build_posts_page([_row_to_post(row) for row in rows], limit, _encode_search_cursor)
+
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בחיפוש פוסטים: {e}")
+
+    async def get_post_by_id(self, post_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        """קבלת פוסט לפי ID (fields - רק השדות האלה)"""
+        try:
+            row = await self._fetchone(f"SELECT {_select_columns(fields)} FROM posts WHERE id = ?", (post_id,))
+
+            return _row_to_post(row) if row else None
+
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת פוסט {post_id}: {e}")
+            return None
+
+    async def get_user_post_counts(self, user_id: int) -> Dict:
+        """מוני הפוסטים של משתמש - ספירה מכוסה ע"י האינדקס (user_id, status)"""
+        try:
+            rows = await self._fetchall(
+                "SELECT status, COUNT(*) AS count FROM posts WHERE user_id = ? GROUP BY status", (user_id,)
+            )
+
+            by_status = {row['status']: row['count'] for row in rows}
+            return {'total': sum(by_status.values()), 'by_status': by_status}
+
+        except Exception as e:
+            raise DatabaseError(f"שגיאה בספירת פוסטים: {e}")
+
+    async def save_user_settings(self, user_id: int, settings: Dict):
+        """שמירת הגדרות משתמש"""
+        try:
+            await self._write(
+                """INSERT INTO users (user_id, settings, updated_at) VALUES (?, ?, ?)
+                   ON CONFLICT (user_id) DO UPDATE SET settings = excluded.settings,
+                                                       updated_at = excluded.updated_at""",
+                (user_id, json.dumps(settings, ensure_ascii=False), _to_db_time(datetime.now()))
+            )
+
+            logger.debug(f"הגדרות משתמש נשמרו: {user_id}")
+
+        except Exception as e:
+            raise SaveError(f"שמירת הגדרות משתמש: {e}")
+
+    async def get_user_settings(self, user_id: int) -> Dict:
+        """קבלת הגדרות משתמש - למשתמש חדש ברירת מחדל (בלי לכתוב)"""
+        try:
+            row = await self._fetchone("SELECT settings FROM users WHERE user_id = ?", (user_id,))
+
+            if row:
+                return json.loads(row['settings'])
+            return _default_user_settings()
+
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת הגדרות משתמש {user_id}: {e}")
+            return _default_user_settings()
+
+    async def log_action(self, user_id: int, action: str, details: Dict = None,
+                         level: str = 'info'):
+        """שמירת לוג פעולה"""
+        try:
+            await self._write(
+                "INSERT INTO logs (user_id, action, details, level, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (user_id, action, json.dumps(details or {}, ensure_ascii=False, default=str),
+                 level, _to_db_time(datetime.now()))
+            )
+
+        except Exception as e:
+            # אם נכשלה שמירת הלוג, רק נרשום ללוג רגיל
+            logger.error(f"שגיאה בשמירת לוג במסד נתונים: {e}")
+
+    async def get_statistics(self) -> Dict:
+        """קבלת סטטיסטיקות כלליות - מטבלת הסיכום (דלי הסה"כ ודלי היום), בלי לסרוק את הפוסטים"""
+        try:
+            rows = await self._fetchall(
+                "SELECT bucket, platform, status, count FROM statistics WHERE bucket IN (?, ?)",
+                (STATISTICS_TOTALS_ID, _statistics_day_id(datetime.now()))
+            )
+            total_users = (await self._fetchone("SELECT COUNT(*) FROM statistics_users"))[0]
+
+            return _statistics_from_buckets(_statistics_buckets(rows), total_users)
+
+        except Exception as e:
+            logger.error(f"שגיאה בקבלת סטטיסטיקות: {e}")
+            return {}
@@ -0,0 +1,113 @@
+"""
+ממשק אחסון משותף לבוט - MongoDB (database.AsyncDatabaseManager) או SQLite מקומי (sqlite_storage)
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+class StorageBackend(ABC):
+    """הפעולות שהבוט משתמש בהן - כל backend מממש את כולן (אסינכרוני)"""
+
+    @abstractmethod
+    async def connect(self):
+        """בדיקת חיבור / פתיחת האחסון ויצירת אינדקסים - נקרא פעם אחת באתחול"""
+
+    @abstractmethod
+    async def health_check(self) -> bool:
+        """בדיקת תקינות האחסון"""
+
+    @abstractmethod
+    async def flush_logs(self):
+        """שליחת לוגים שממתינים - נקרא בכיבוי"""
+
+    @abstractmethod
+    def close_connection(self):
+        """סגירת האחסון"""
+
+    @abstractmethod
+    async def save_post(self, user_id: int, filename: str, text: str,
+                        platforms: List[str], file_size_mb: float) -> str:
+        """שמירת פוסט חדש - מחזיר את ה-ID שלו"""
+
+    @abstractmethod
+    async def update_post_status(self, post_id: str, status: str,
+                                 posting_results: Optional[Dict] = None, error: Optional[str] = None):
+        """עדכון סטטוס פוסט"""
+
+    @abstractmethod
+    async def record_platform_result(self, post_id: str, platform: str, result: Dict):
+        """שמירת תוצאת פרסום של פלטפורמה אחת"""
+
+    @abstractmethod
+    async def get_completed_platforms(self, post_id: str) -> List[str]:
+        """פלטפורמות שהפוסט כבר פורסם בהן בהצלחה"""
+
+    @abstractmethod
+    async def get_user_posts(self, user_id: int, limit: int = 10,
+                             fields: Optional[List[str]] = None) -> List[Dict]:
+        """הפוסטים האחרונים של משתמש"""
+
+    @abstractmethod
+    async def get_user_posts_page(self, user_id: int, limit: int = 10, cursor: Optional[str] = None,
+                                  fields: Optional[List[str]] = None) -> Dict:
+        """עמוד מהיסטוריית הפוסטים - {'posts': [...], 'next_cursor': ...}"""
+
+    @abstractmethod
+    async def get_posts_by_hashtag(self, user_id: int, tag: str, limit: int = 10, cursor: Optional[str] = None,
+                                   fields: Optional[List[str]] = None) -> Dict:
+        """עמוד פוסטים של משתמש עם האשטג - {'posts': [...], 'next_cursor': ...}"""
+
+    @abstractmethod
+    async def get_user_hashtags(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """ההאשטגים הנפוצים של משתמש - [{'tag': ..., 'count': n}]"""
+
+    @abstractmethod
+    async def search_posts(self, user_id: int, query: str, limit: int = 10, cursor: Optional[str] = None,
+                           fields: Optional[List[str]] = None) -> Dict:
+        """חיפוש טקסט בפוסטים של משתמש, מהרלוונטי ביותר - {'posts': [...], 'next_cursor': ...}"""
+
+    @abstractmethod
+    async def get_post_by_id(self, post_id: str, fields: Optional[List[str]] = None) -> Optional[Dict]:
+        """קבלת פוסט לפי ID"""
+
+    @abstractmethod
+    async def get_user_post_counts(self, user_id: int) -> Dict:
+        """מוני הפוסטים של משתמש: {'total': n, 'by_status': {...}}"""
+
+    async def count_user_posts(self, user_id: int, status: Optional[str] = None) -> int:
+        """מספר הפוסטים של משתמש (סה"כ או לפי סטטוס)"""
+        counts = await self.get_user_post_counts(user_id)
+
+        if status is None:
+            return counts['total']
+        return counts['by_status'].get(status, 0)
+
+    @abstractmethod
+    async def save_user_settings(self, user_id: int, settings: Dict):
+        """שמירת הגדרות משתמש"""
+
+    @abstractmethod
+    async def get_user_settings(self, user_id: int) -> Dict:
+        """קבלת הגדרות משתמש (ברירת מחדל למשתמש חדש)"""
+
+    @abstractmethod
+    async def log_action(self, user_id: int, action: str, details: Dict = None,
+                         level: str = 'info'):
+        """שמירת לוג פעולה"""
+
+    @abstractmethod
+    async def get_statistics(self) -> Dict:
+        """סטטיסטיקות כלליות"""
+
+    async def save_session(self, session: Dict):
+        """שמירת סשן פתוח של הבוט (SESSION_PERSISTENCE) - backend בלי שמירת סשנים לא שומר"""
+
+    async def delete_session(self, post_id: str):
+        """מחיקת סשן שנסגר"""
+
+    async def load_sessions(self) -> List[Dict]:
+        """הסשנים הפתוחים שנשמרו (ריק אם ה-backend לא שומר סשנים)"""
+        return []
+
+    async def get_metrics(self) -> Dict:
+        """מדדי ביצועים של האחסון (ריק אם ה-backend לא מודד)"""
+        return {}
@@ -3,7 +3,7 @@
 """
 import os
 import asyncio
-from typing import Dict, List
+from typing import Dict, List, Optional, Set, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
@@ -14,28 +14,80 @@ from config import Config, Messages
 from exceptions import *
 from logger import bot_logger, get_logger
 from utils import *
-from database import get_database, save_post, update_post_status, get_user_settings, save_user_settings
+from webhook_server import WebhookServer
+from update_processor import PerUserUpdateProcessor
+from message_editor import MessageEditor
+from admission import AdmissionController
+from session_store import SessionStore, EVICT_EXPIRED, EVICT_USER_LIMIT, EVICT_FILE_MISSING, session_items, session_files
+from database import (
+    get_async_database, save_post, update_post_status, record_platform_result,
+    get_user_settings, save_user_settings
+)
 
 logger = get_logger(__name__)
 
+# מספר פוסטים בעמוד של /history
+HISTORY_PAGE_SIZE = 5
+
+# מספר ההאשטגים ב-/tag בלי פרמטר
+TOP_HASHTAGS = 15
+
+# אורך מקסימלי של callback_data בטלגרם (בבתים)
+CALLBACK_DATA_LIMIT = 64
+
+# הסיבה שנרשמת בפוסט כשהסשן שלו מפונה בלי אישור
+EVICT_REASONS = {
+    EVICT_EXPIRED: "התצוגה המקדימה פגה בלי אישור",
+    EVICT_USER_LIMIT: "נדחק על ידי תצוגות מקדימות חדשות יותר",
+    EVICT_FILE_MISSING: "הקובץ הזמני לא נמצא אחרי הפעלה מחדש"
+}
+
+SESSION_LOST_MESSAGE = "❌ שגיאה: נתוני הסשן אבדו. אנא שלחו את הסרטון שוב."
+
 class SocialMediaBot:
     """הבוט הראשי לפרסום ברשתות חברתיות"""
     
     def __init__(self):
         self.app = None
         self.social_handler = None  # יחובר בהמשך
-        self.db = get_database()
+        self.db = get_async_database()
+        
+        # תצוגות מקדימות פתוחות לפי post_id - כמה למשתמש, עם תפוגה (ושמירה במסד אם SESSION_PERSISTENCE)
+        self.sessions = SessionStore(
+            Config.SESSION_TTL, Config.SESSION_MAX_PER_USER, on_evict=self._release_session,
+            storage=self.db if Config.SESSION_PERSISTENCE else None
+        )
+        
+        # הורדות ופרסומים - מגבלת מקביליות ותור, ודחייה כשהדיסק או הזיכרון בגבול
+        self.admission = AdmissionController(
+            Config.ADMISSION_MAX_CONCURRENT, Config.ADMISSION_MAX_PER_USER, Config.ADMISSION_MAX_QUEUE,
+            Config.TEMP_FOLDER, Config.ADMISSION_MIN_FREE_DISK_MB, Config.ADMISSION_MAX_RSS_MB
+        )
+        
+        # עריכות התקדמות ותוצאות - בקצב שלא חורג ממגבלות טלגרם
+        self.editor = MessageEditor(Config.MESSAGE_EDIT_CHAT_INTERVAL, Config.MESSAGE_EDIT_GLOBAL_RATE)
+        
+        # עיבוד העדכונים - עדכונים של משתמשים שונים במקביל, של אותו משתמש לפי הסדר (גם אלבומים שנאספו)
+        self.update_processor = PerUserUpdateProcessor(Config.UPDATE_CONCURRENCY, Config.UPDATE_MAX_PENDING)
         
-        # מצבי משתמשים (זמני - במקום DB לנתונים קטנים)
-        self.user_sessions = {}
+        # אלבומים שבאיסוף לפי media_group_id - העדכונים וה-task שמטפל בהם אחרי MEDIA_GROUP_WAIT
+        self._albums: Dict[str, Dict] = {}
+        # עבודה שרצה מחוץ לעיבוד העדכונים - איסוף אלבומים, והורדות ופרסומים (שממתינים לבקרת הכניסה)
+        self._background_tasks: Set[asyncio.Task] = set()
+        
+        # מצב webhook - השרת המוטמע ואירוע העצירה
+        self.webhook_server = None
+        self._stop_event = None
     
     def setup_application(self):
         """הגדרת האפליקציה"""
         if not Config.TELEGRAM_BOT_TOKEN:
             raise MissingConfigError("TELEGRAM_BOT_TOKEN")
         
-        # יצירת אפליקציית הבוט
-        self.app = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
+        # יצירת אפליקציית הבוט - עדכונים של משתמשים שונים מעובדים במקביל, של אותו משתמש לפי הסדר
+        self.app = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).concurrent_updates(
+            self.update_processor
+        ).build()
         
         # הוספת handlers
         self._add_handlers()
@@ -51,6 +103,10 @@ class SocialMediaBot:
         self.app.add_handler(CommandHandler("mock", self.mock_command))
         self.app.add_handler(CommandHandler("auto", self.auto_command))
         self.app.add_handler(CommandHandler("status", self.status_command))
+        self.app.add_handler(CommandHandler("history", self.history_command))
+        self.app.add_handler(CommandHandler("tag", self.tag_command))
+        self.app.add_handler(CommandHandler("search", self.search_command))
+        self.app.add_handler(CommandHandler("dbstats", self.dbstats_command))
         
         # הודעות וידאו
         self.app.add_handler(MessageHandler(filters.VIDEO, self.handle_video))
@@ -88,13 +144,13 @@ class SocialMediaBot:
         user_id = update.effective_user.id
         
         # קבלת הגדרות נוכחיות
-        settings = get_user_settings(user_id)
+        settings = await get_user_settings(user_id)
         current_mock = settings.get('mock_mode', Config.MOCK_MODE)
         
         # החלפת מצב
         new_mock = not current_mock
         settings['mock_mode'] = new_mock
-        save_user_settings(user_id, settings)
+        await save_user_settings(user_id, settings)
         
         # הודעה למשתמש
         status = "פעיל" if new_mock else "כבוי"
@@ -115,13 +171,13 @@ class SocialMediaBot:
         user_id = update.effective_user.id
         
         # קבלת הגדרות נוכחיות
-        settings = get_user_settings(user_id)
+        settings = await get_user_settings(user_id)
         current_auto = settings.get('auto_post', Config.AUTO_POST_MODE)
         
         # החלפת מצב
         new_auto = not current_auto
         settings['auto_post'] = new_auto
-        save_user_settings(user_id, settings)
+        await save_user_settings(user_id, settings)
         
         # הודעה למשתמש
         status = "פעיל" if new_auto else "כבוי"
@@ -141,7 +197,7 @@ class SocialMediaBot:
         """פקודת /status - הצגת מצב נוכחי"""
         user_id = update.effective_user.id
         
-        settings = get_user_settings(user_id)
+        settings = await get_user_settings(user_id)
         mock_mode = settings.get('mock_mode', Config.MOCK_MODE)
         auto_post = settings.get('auto_post', Config.AUTO_POST_MODE)
         
@@ -150,6 +206,8 @@ class SocialMediaBot:
         platform_status = ValidationHelper.validate_platform_tokens(all_platforms)
         available_platforms = [p for p, available in platform_status.items() if available]
         
+        post_count = await self.db.count_user_posts(user_id)
+        
         status_message = f"""
 📊 **מצב הבוט**
 
@@ -160,7 +218,7 @@ class SocialMediaBot:
 {chr(10).join([f"{'✅' if platform_status.get(p) else '❌'} {p}" for p in all_platforms])}
 
 📈 **סטטיסטיקות:**
-• פוסטים אישיים: {len(self.db.get_user_posts(user_id, 100))}
+• פוסטים שנוצרו (מצטבר, כולל שנמחקו): {post_count}
 • הגדרות: /mock /auto
         """
         
@@ -168,17 +226,200 @@ class SocialMediaBot:
         
         await update.message.reply_text(status_message.strip(), parse_mode='Markdown')
     
-    async def handle_video(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """טיפול בהודעות וידאו"""
+    async def history_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """פקודת /history - היסטוריית פוסטים בעמודים"""
+        user_id = update.effective_user.id
+        
+        message, reply_markup = await self._build_history_page(user_id)
+        
+        bot_logger.log_user_action(user_id, "history_command")
+        
+        await update.message.reply_text(message, reply_markup=reply_markup)
+    
+    async def tag_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """פקודת /tag - ההאשטגים הנפוצים, או עם פרמטר - הפוסטים עם ההאשטג"""
+        user_id = update.effective_user.id
+        
+        if context.args:
+            message, reply_markup = await self._build_tag_page(user_id, context.args[0])
+        else:
+            message = MessageHelper.create_hashtags_message(await self.db.get_user_hashtags(user_id, limit=TOP_HASHTAGS))
+            reply_markup = None
+        
+        bot_logger.log_user_action(user_id, "tag_command")
+        
+        await update.message.reply_text(message, reply_markup=reply_markup)
+    
+    async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """פקודת /search - חיפוש בכיתובי הפוסטים, מהרלוונטי ביותר"""
+        user_id = update.effective_user.id
+        
+        if not context.args:
+            await update.message.reply_text("🔎 שימוש: /search <מילים לחיפוש>")
+            return
+        
+        message, reply_markup = await self._build_search_page(user_id, ' '.join(context.args))
+        
+        bot_logger.log_user_action(user_id, "search_command")
+        
+        await update.message.reply_text(message, reply_markup=reply_markup)
+    
+    async def dbstats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """פקודת /dbstats - מדדי ביצועים של מסד הנתונים (מנהלים בלבד)"""
         user_id = update.effective_user.id
         
+        if user_id not in Config.ADMIN_USER_IDS:
+            await update.message.reply_text("⛔ פקודה זו זמינה למנהלים בלבד")
+            return
+        
+        metrics = await self.db.get_metrics()
+        
+        bot_logger.log_user_action(user_id, "dbstats_command")
+        
+        await update.message.reply_text(MessageHelper.create_db_metrics_message(metrics))
+    
+    async def _build_history_page(self, user_id: int, cursor: str = None):
+        """עמוד היסטוריה - טקסט וכפתור לעמוד הבא (הסמן נשמר ב-callback_data)"""
+        page = await self.db.get_user_posts_page(user_id, limit=HISTORY_PAGE_SIZE, cursor=cursor)
+        
+        message = MessageHelper.create_history_message(page['posts'])
+        
+        reply_markup = None
+        if page['next_cursor']:
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("◀️ ישנים יותר", callback_data=f"history:{page['next_cursor']}")
+            ]])
+        
+        return message, reply_markup
+    
+    async def _build_tag_page(self, user_id: int, tag: str, cursor: str = None):
+        """עמוד פוסטים עם האשטג - כפתור לעמוד הבא רק אם התגית והסמן נכנסים ב-callback_data"""
+        tag = TextHelper.normalize_hashtag(tag)
+        page = await self.db.get_posts_by_hashtag(user_id, tag, limit=HISTORY_PAGE_SIZE, cursor=cursor)
+        
+        message = MessageHelper.create_history_message(page['posts'], title=f"🏷️ פוסטים עם #{tag}")
+        
+        reply_markup = None
+        callback_data = f"tag:{page['next_cursor']}:{tag}"
+        if page['next_cursor'] and len(callback_data.encode('utf-8')) <= CALLBACK_DATA_LIMIT:
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("◀️ ישנים יותר", callback_data=callback_data)
+            ]])
+        
+        return message, reply_markup
+    
+    async def _build_search_page(self, user_id: int, query: str, cursor: str = None):
+        """עמוד תוצאות חיפוש - כפתור לעמוד הבא רק אם השאילתה והסמן נכנסים ב-callback_data"""
+        page = await self.db.search_posts(user_id, query, limit=HISTORY_PAGE_SIZE, cursor=cursor)
+        
+        if not page['posts'] and not cursor:
+            return f"🔎 לא נמצאו פוסטים עבור: {query}", None
+        
+        message = MessageHelper.create_history_message(page['posts'], title=f"🔎 תוצאות עבור: {query}")
+        
+        reply_markup = None
+        callback_data = f"search:{page['next_cursor']}:{query}"
+        if page['next_cursor'] and len(callback_data.encode('utf-8')) <= CALLBACK_DATA_LIMIT:
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("◀️ תוצאות נוספות", callback_data=callback_data)
+            ]])
+        
+        return message, reply_markup
+    
+    async def handle_video(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """טיפול בהודעות וידאו (סרטון מאלבום נאסף, וכל האלבום מטופל יחד)"""
+        if update.message.media_group_id:
+            self._collect_album_item(update)
+            return
+        
+        await self._handle_videos([update])
+    
+    def _collect_album_item(self, update: Update):
+        """פריט של אלבום - האלבום מטופל כשעוברות MEDIA_GROUP_WAIT שניות בלי פריט חדש"""
+        group_id = update.message.media_group_id
+        album = self._albums.setdefault(group_id, {'updates': [], 'task': None})
+        album['updates'].append(update)
+        
+        if album['task']:
+            album['task'].cancel()
+        
+        album['task'] = self._start_background_task(self._flush_album(group_id))
+    
+    def _start_background_task(self, coroutine) -> asyncio.Task:
+        """הרצת עבודה ברקע - לא תופסת מקום בעיבוד העדכונים ולא את התור של המשתמש (נעצרת ב-stop)"""
+        task = asyncio.create_task(coroutine)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+    
+    async def _flush_album(self, group_id: str):
+        """המתנה לפריטים נוספים, ואז טיפול בכל האלבום לפי סדר ההודעות - בתור של המשתמש ובמגבלת העיבוד"""
+        await asyncio.sleep(Config.MEDIA_GROUP_WAIT)
+        
+        updates = self._albums.pop(group_id)['updates']
+        updates.sort(key=lambda item: item.message.message_id)
+        await self.update_processor.run_for_user(updates[0].effective_user.id, self._handle_videos(updates))
+    
+    async def _handle_videos(self, updates: List[Update]):
+        """סרטון בודד או אלבום - ולידציה בעדכון עצמו, ובקרת הכניסה, ההורדה והתצוגה המקדימה ברקע"""
+        update = updates[0]
+        
         try:
             # בדיקת הודעה
-            video_file, text = ValidationHelper.validate_telegram_message(update.message)
-            
-            # הורדת הקובץ
-            file_path = await self._download_video(video_file, user_id)
-            
+            if len(updates) == 1:
+                video_file, text = ValidationHelper.validate_telegram_message(update.message)
+                video_files = [video_file]
+            else:
+                video_files, text = ValidationHelper.validate_telegram_album([item.message for item in updates])
+        
+        except Exception as e:
+            await self._report_video_error(update, e)
+            return
+        
+        # ההמתנה לבקרת הכניסה לא תופסת מקום בעיבוד העדכונים - /start של משתמשים אחרים ו-/status
+        # של אותו משתמש לא ממתינים להורדה, ו-ADMISSION_MAX_PER_USER הוא שמגביל הורדות במקביל למשתמש
+        self._start_background_task(self._admit_videos(update, video_files, text))
+    
+    async def _admit_videos(self, update: Update, video_files: List, text: str):
+        """בקרת כניסה - ממתינים למקום פנוי (עם הודעה על המקום בתור), או נדחים כשהדיסק / הזיכרון בגבול"""
+        user_id = update.effective_user.id
+        
+        async def notify_queued(position: int):
+            await update.message.reply_text(Messages.QUEUED.format(position=position))
+        
+        try:
+            size_mb = sum(video_file.file_size or 0 for video_file in video_files) / (1024 * 1024)
+            async with self.admission.admit(user_id, size_mb, on_queued=notify_queued):
+                if len(video_files) == 1:
+                    await self._accept_video(update, user_id, video_files[0], text)
+                else:
+                    await self._accept_album(update, user_id, video_files, text)
+        
+        except Exception as e:
+            await self._report_video_error(update, e)
+    
+    async def _report_video_error(self, update: Update, error: Exception):
+        """הודעה למשתמש על סרטון שלא התקבל - ולידציה, עומס או שגיאה כללית"""
+        user_id = update.effective_user.id
+        
+        if isinstance(error, (NoVideoError, NoTextError, FileTooLargeError, UnsupportedFileFormatError)):
+            await update.message.reply_text(MessageHelper.get_error_message(error))
+            bot_logger.error("שגיאת ולידציה", user_id=user_id, error=error)
+        
+        elif isinstance(error, ResourceLimitError):
+            await update.message.reply_text(MessageHelper.get_error_message(error))
+            bot_logger.warning(f"סרטון נדחה: {error.reason}", user_id=user_id)
+        
+        else:
+            await update.message.reply_text("❌ שגיאה בעיבוד הסרטון. אנא נסו שוב.")
+            bot_logger.error("שגיאה בטיפול בוידאו", user_id=user_id, error=error)
+    
+    async def _accept_video(self, update: Update, user_id: int, video_file, text: str):
+        """הורדה, שמירת הפוסט ותצוגה מקדימה (או פרסום אוטומטי) - רץ בתוך מקום מבקרת הכניסה"""
+        # הורדת הקובץ
+        file_path = await self._download_video(video_file, user_id)
+        
+        try:
             # בדיקת תקינות הקובץ
             FileHelper.validate_video_file(file_path)
             
@@ -188,50 +429,122 @@ class SocialMediaBot:
                 user_id
             )
             
-            # קבלת הגדרות משתמש
-            settings = get_user_settings(user_id)
-            mock_mode = settings.get('mock_mode', Config.MOCK_MODE)
-            auto_post = settings.get('auto_post', Config.AUTO_POST_MODE)
-            
-            # רשתות זמינות
-            all_platforms = ['TikTok', 'Twitter', 'Facebook', 'Instagram', 'LinkedIn', 'YouTube', 'Tumblr', 'Telegram']
-            platform_status = ValidationHelper.validate_platform_tokens(all_platforms)
-            available_platforms = [p for p, available in platform_status.items() if available]
+            mock_mode, auto_post, available_platforms = await self._posting_settings(user_id)
             
             if not available_platforms:
+                FileHelper.cleanup_temp_files([file_path])
                 await update.message.reply_text("❌ אין רשתות זמינות. אנא בדקו הגדרות הטוקנים.")
                 return
             
             # שמירת הפוסט במסד נתונים
             file_size = FileHelper.get_file_size_mb(file_path)
-            post_id = save_post(user_id, unique_filename, text, available_platforms, file_size)
-            
-            # שמירת נתוני הסשן
-            self.user_sessions[user_id] = {
-                'post_id': post_id,
-                'file_path': file_path,
-                'filename': unique_filename,
-                'text': text,
-                'platforms': available_platforms,
-                'mock_mode': mock_mode
-            }
-            
-            bot_logger.log_post_attempt(user_id, available_platforms, unique_filename, text)
-            
-            # פרסום אוטומטי או תצוגה מקדימה
-            if auto_post:
-                await self._process_posting(update, user_id, skip_confirmation=True)
-            else:
-                await self._show_preview(update, user_id)
+            post_id = await save_post(user_id, unique_filename, text, available_platforms, file_size)
         
-        except (NoVideoError, NoTextError, FileTooLargeError, UnsupportedFileFormatError) as e:
-            error_msg = MessageHelper.get_error_message(e)
-            await update.message.reply_text(error_msg)
-            bot_logger.error("שגיאת ולידציה", user_id=user_id, error=e)
+        except Exception:
+            # הקובץ עוד לא שייך לסשן - לא משאירים אותו בדיסק
+            FileHelper.cleanup_temp_files([file_path])
+            raise
+        
+        # שמירת נתוני הסשן
+        await self.sessions.add({
+            'post_id': post_id,
+            'user_id': user_id,
+            'file_path': file_path,
+            'filename': unique_filename,
+            'text': text,
+            'platforms': available_platforms,
+            'mock_mode': mock_mode
+        })
+        
+        bot_logger.log_post_attempt(user_id, available_platforms, unique_filename, text)
+        
+        # פרסום אוטומטי או תצוגה מקדימה
+        if auto_post:
+            await self._process_posting(update, post_id, skip_confirmation=True)
+        else:
+            await self._show_preview(update, post_id)
+    
+    async def _accept_album(self, update: Update, user_id: int, video_files: List, text: str):
+        """אלבום - הורדה במקביל (עד ALBUM_DOWNLOAD_CONCURRENCY), פוסט לכל סרטון, וסשן ותצוגה מקדימה אחת לכולם"""
+        downloads = asyncio.Semaphore(Config.ALBUM_DOWNLOAD_CONCURRENCY)
+        
+        async def download(video_file) -> str:
+            async with downloads:
+                return await self._download_video(video_file, user_id)
+        
+        results = await asyncio.gather(*(download(video_file) for video_file in video_files), return_exceptions=True)
+        file_paths = [result for result in results if isinstance(result, str)]
+        items = []
+        
+        try:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            
+            for file_path in file_paths:
+                FileHelper.validate_video_file(file_path)
+            
+            mock_mode, auto_post, available_platforms = await self._posting_settings(user_id)
+            
+            if not available_platforms:
+                FileHelper.cleanup_temp_files(file_paths)
+                await update.message.reply_text("❌ אין רשתות זמינות. אנא בדקו הגדרות הטוקנים.")
+                return
+            
+            # שמות וגדלים לכל הסרטונים לפני שנשמר פוסט כלשהו
+            prepared = [
+                (file_path, FileHelper.generate_unique_filename(video_file.file_name or f"video_{index}.mp4", user_id),
+                 FileHelper.get_file_size_mb(file_path))
+                for index, (video_file, file_path) in enumerate(zip(video_files, file_paths), start=1)
+            ]
+            
+            # פוסט לכל סרטון
+            for file_path, unique_filename, file_size in prepared:
+                post_id = await save_post(user_id, unique_filename, text, available_platforms, file_size)
+                items.append({'post_id': post_id, 'file_path': file_path, 'filename': unique_filename})
         
         except Exception as e:
-            await update.message.reply_text("❌ שגיאה בעיבוד הסרטון. אנא נסו שוב.")
-            bot_logger.error("שגיאה בטיפול בוידאו", user_id=user_id, error=e)
+            # פוסטים שכבר נשמרו לא נשארים ב-created בלי סשן
+            for item in items:
+                try:
+                    await update_post_status(item['post_id'], 'failed', error=str(e))
+                except Exception as mark_error:
+                    logger.error(f"לא ניתן לסמן את הפוסט {item['post_id']} כנכשל: {mark_error}")
+            FileHelper.cleanup_temp_files(file_paths)
+            raise
+        
+        # סשן אחד לאלבום (לפי הפוסט הראשון) - נספר כתצוגה אחת במגבלת המשתמש
+        post_id = items[0]['post_id']
+        album_name = f"אלבום - {len(items)} סרטונים"
+        await self.sessions.add({
+            'post_id': post_id,
+            'user_id': user_id,
+            'items': items,
+            'filename': album_name,
+            'text': text,
+            'platforms': available_platforms,
+            'mock_mode': mock_mode
+        })
+        
+        bot_logger.log_post_attempt(user_id, available_platforms, album_name, text)
+        
+        if auto_post:
+            await self._process_posting(update, post_id, skip_confirmation=True)
+        else:
+            await self._show_preview(update, post_id)
+    
+    async def _posting_settings(self, user_id: int) -> Tuple[bool, bool, List[str]]:
+        """הגדרות המשתמש (מצב בדיקה, פרסום אוטומטי) והרשתות הזמינות"""
+        settings = await get_user_settings(user_id)
+        mock_mode = settings.get('mock_mode', Config.MOCK_MODE)
+        auto_post = settings.get('auto_post', Config.AUTO_POST_MODE)
+        
+        # רשתות זמינות
+        all_platforms = ['TikTok', 'Twitter', 'Facebook', 'Instagram', 'LinkedIn', 'YouTube', 'Tumblr', 'Telegram']
+        platform_status = ValidationHelper.validate_platform_tokens(all_platforms)
+        available_platforms = [p for p, available in platform_status.items() if available]
+        
+        return mock_mode, auto_post, available_platforms
     
     async def _download_video(self, video_file, user_id: int) -> str:
         """הורדת קובץ וידאו"""
@@ -242,8 +555,8 @@ class SocialMediaBot:
             # הורדת הקובץ
             file = await video_file.get_file()
             
-            # יצירת נתיב זמני
-            temp_filename = f"temp_{user_id}_{TimeHelper.get_filename_timestamp()}.mp4"
+            # יצירת נתיב זמני (עם מזהה הקובץ - סרטוני אלבום מורדים באותה שנייה)
+            temp_filename = f"temp_{user_id}_{TimeHelper.get_filename_timestamp()}_{video_file.file_unique_id}.mp4"
             file_path = os.path.join(temp_dir, temp_filename)
             
             await file.download_to_drive(file_path)
@@ -254,11 +567,11 @@ class SocialMediaBot:
         except Exception as e:
             raise FileValidationError(f"שגיאה בהורדת קובץ: {e}")
     
-    async def _show_preview(self, update: Update, user_id: int):
-        """הצגת תצוגה מקדימה עם כפתורי אישור"""
-        session = self.user_sessions.get(user_id)
+    async def _show_preview(self, update: Update, post_id: str):
+        """הצגת תצוגה מקדימה עם כפתורי אישור (ה-post_id בכפתורים - לכל סרטון תצוגה משלו)"""
+        session = self.sessions.get(post_id)
         if not session:
-            await update.message.reply_text("❌ שגיאה: נתוני הסשן אבדו. אנא שלחו את הסרטון שוב.")
+            await update.message.reply_text(SESSION_LOST_MESSAGE)
             return
         
         # יצירת הודעת תצוגה מקדימה
@@ -271,8 +584,8 @@ class SocialMediaBot:
         # יצירת כפתורים
         keyboard = [
             [
-                InlineKeyboardButton(Messages.BUTTON_CONFIRM, callback_data=f"confirm_{user_id}"),
-                InlineKeyboardButton(Messages.BUTTON_CANCEL, callback_data=f"cancel_{user_id}")
+                InlineKeyboardButton(Messages.BUTTON_CONFIRM, callback_data=f"confirm:{post_id}"),
+                InlineKeyboardButton(Messages.BUTTON_CANCEL, callback_data=f"cancel:{post_id}")
             ]
         ]
         
@@ -292,11 +605,31 @@ class SocialMediaBot:
         try:
             await query.answer()
             
-            if query.data.startswith("confirm_"):
-                await self._process_posting(update, user_id)
+            if query.data.startswith("confirm:"):
+                # פרסום הוא עבודה כבדה - ברקע, מחוץ לעיבוד העדכונים (ביטול ו-/status לא ממתינים לו)
+                self._start_background_task(self._admit_posting(update, query.data.split(":", 1)[1]))
+            
+            elif query.data.startswith("cancel:"):
+                await self._cancel_posting(update, query.data.split(":", 1)[1])
             
-            elif query.data.startswith("cancel_"):
-                await self._cancel_posting(update, user_id)
+            elif query.data.startswith(("confirm_", "cancel_")):
+                # כפתורים מגרסה קודמת (לפי user_id) - הסשנים שלהם כבר לא קיימים
+                await query.edit_message_text(SESSION_LOST_MESSAGE)
+            
+            elif query.data.startswith("history:"):
+                cursor = query.data.split(":", 1)[1]
+                message, reply_markup = await self._build_history_page(user_id, cursor)
+                await query.edit_message_text(message, reply_markup=reply_markup)
+            
+            elif query.data.startswith("tag:"):
+                _, cursor, tag = query.data.split(":", 2)
+                message, reply_markup = await self._build_tag_page(user_id, tag, cursor)
+                await query.edit_message_text(message, reply_markup=reply_markup)
+            
+            elif query.data.startswith("search:"):
+                _, cursor, search_query = query.data.split(":", 2)
+                message, reply_markup = await self._build_search_page(user_id, search_query, cursor)
+                await query.edit_message_text(message, reply_markup=reply_markup)
             
             else:
                 logger.warning(f"callback לא מוכר: {query.data}")
@@ -305,22 +638,51 @@ class SocialMediaBot:
             bot_logger.error("שגיאה בטיפול בכפתור", user_id=user_id, error=e)
             await query.edit_message_text("❌ שגיאה בעיבוד הבקשה")
     
-    async def _process_posting(self, update: Update, user_id: int, skip_confirmation: bool = False):
+    async def _admit_posting(self, update: Update, post_id: str):
+        """פרסום באותה בקרת כניסה כמו הורדות (הקובץ כבר בדיסק, בלי בדיקת משאבים)"""
+        query = update.callback_query
+        
+        async def notify_queued(position: int):
+            await query.edit_message_text(Messages.QUEUED.format(position=position))
+        
+        try:
+            async with self.admission.admit(update.effective_user.id, on_queued=notify_queued, check_resources=False):
+                await self._process_posting(update, post_id)
+        
+        except ResourceLimitError as e:
+            # התור מלא - הכפתורים נשארים כדי שאפשר יהיה לאשר שוב
+            await query.edit_message_text(MessageHelper.get_error_message(e), reply_markup=query.message.reply_markup)
+        
+        except Exception as e:
+            bot_logger.error("שגיאה בפרסום", user_id=update.effective_user.id, error=e)
+            await query.edit_message_text("❌ שגיאה בעיבוד הבקשה")
+    
+    def _user_session(self, update: Update, post_id: str) -> Optional[Dict]:
+        """הסשן של הפוסט, רק אם הוא שייך למשתמש שלחץ"""
+        session = self.sessions.get(post_id)
+        if session and session['user_id'] == update.effective_user.id:
+            return session
+        return None
+    
+    async def _process_posting(self, update: Update, post_id: str, skip_confirmation: bool = False):
         """עיבוד ופרסום הסרטון"""
-        session = self.user_sessions.get(user_id)
+        session = self._user_session(update, post_id)
         if not session:
-            message = "❌ שגיאה: נתוני הסשן אבדו. אנא שלחו את הסרטון שוב."
             if skip_confirmation:
-                await update.message.reply_text(message)
+                await update.message.reply_text(SESSION_LOST_MESSAGE)
             else:
-                await update.callback_query.edit_message_text(message)
+                await update.callback_query.edit_message_text(SESSION_LOST_MESSAGE)
             return
         
-        post_id = session['post_id']
+        # הסשן יוצא מהמאגר - לחיצה כפולה לא מפרסמת פעמיים, ותפוגה לא מוחקת את הקובץ באמצע הפרסום
+        await self.sessions.pop(post_id)
+        user_id = session['user_id']
+        items = session_items(session)
         
         try:
             # עדכון סטטוס לעיבוד
-            update_post_status(post_id, 'processing')
+            for item in items:
+                await update_post_status(item['post_id'], 'processing')
             
             # הודעת התחלה
             processing_msg = "🔄 מעבד ומפרסם את הסרטון..."
@@ -335,24 +697,24 @@ class SocialMediaBot:
                 bot_logger.log_mock_mode(user_id, session['filename'], session['platforms'])
             else:
                 await self._real_posting(session, processing_message)
-            
-            # ניקוי קבצים זמניים
-            FileHelper.cleanup_temp_files([session['file_path']])
-            
-            # ניקוי סשן
-            del self.user_sessions[user_id]
         
         except Exception as e:
             # עדכון סטטוס לכישלון
-            update_post_status(post_id, 'failed', {'error': str(e)})
+            # בלי posting_results - לא דורסים תוצאות פלטפורמה שכבר נשמרו
+            for item in items:
+                await update_post_status(item['post_id'], 'failed', error=str(e))
             
             error_msg = f"❌ שגיאה בפרסום: {str(e)}"
             try:
-                await processing_message.edit_text(error_msg)
+                await self.editor.edit(processing_message, error_msg, final=True)
             except:
                 pass
             
             bot_logger.error("שגיאה בפרסום", user_id=user_id, error=e)
+        
+        finally:
+            # ניקוי קבצים זמניים
+            FileHelper.cleanup_temp_files(session_files(session))
     
     async def _mock_posting(self, session: Dict, message):
         """פרסום מדומה (מצב בדיקה)"""
@@ -360,30 +722,41 @@ class SocialMediaBot:
         await asyncio.sleep(2)
         
         # עדכון הודעה
-        success_msg = Messages.SUCCESS_MOCK_MODE + f"\n\n📁 {session['filename']}\n🌐 {len(session['platforms'])} רשתות"
-        await message.edit_text(success_msg)
+        files = "\n".join(f"📁 {item['filename']}" for item in session_items(session))
+        success_msg = Messages.SUCCESS_MOCK_MODE + f"\n\n{files}\n🌐 {len(session['platforms'])} רשתות"
+        await self.editor.edit(message, success_msg, final=True)
         
         # עדכון במסד נתונים
         mock_results = {platform: {'status': 'mock_success', 'posted_at': TimeHelper.get_timestamp()} 
                        for platform in session['platforms']}
         
-        update_post_status(session['post_id'], 'completed', mock_results)
+        for item in session_items(session):
+            await update_post_status(item['post_id'], 'completed', mock_results)
     
     async def _real_posting(self, session: Dict, message):
         """פרסום אמיתי לרשתות"""
         if not self.social_handler:
             # טעינת social_media_handler (יחובר בהמשך)
-            await message.edit_text("❌ שגיאה: מודול הפרסום לא זמין")
+            await self.editor.edit(message, "❌ שגיאה: מודול הפרסום לא זמין", final=True)
+            return
+        
+        if 'items' in session:
+            await self._real_album_posting(session, message)
             return
         
-        results = {}
-        successful_platforms = []
+        # פלטפורמות שכבר פורסמו בהרצה קודמת (למשל לפני קריסה) - לא מפרסמים בהן שוב
+        already_posted = await self.db.get_completed_platforms(session['post_id'])
+        successful_platforms = [p for p in session['platforms'] if p in already_posted]
         failed_platforms = []
         
         # פרסום לכל פלטפורמה
         for platform in session['platforms']:
+            if platform in already_posted:
+                continue
+            
             try:
-                await message.edit_text(f"🔄 מפרסם ב-{platform}...")
+                # התקדמות - לא ממתינה, ואם הפרסום מהיר נשלח רק המצב האחרון
+                await self.editor.edit(message, f"🔄 מפרסם ב-{platform}...")
                 
                 # פרסום (זה יחובר ל-social_media_handler)
                 success = await self.social_handler.post_to_platform(
@@ -394,41 +767,107 @@ class SocialMediaBot:
                 
                 if success:
                     successful_platforms.append(platform)
-                    results[platform] = {'status': 'success', 'posted_at': TimeHelper.get_timestamp()}
+                    result = {'status': 'success', 'posted_at': TimeHelper.get_timestamp()}
                     bot_logger.log_post_result(session.get('user_id'), platform, True)
                 else:
                     failed_platforms.append(platform)
-                    results[platform] = {'status': 'failed', 'error': 'Unknown error'}
+                    result = {'status': 'failed', 'error': 'Unknown error'}
                     bot_logger.log_post_result(session.get('user_id'), platform, False, "Unknown error")
                 
             except Exception as e:
                 failed_platforms.append(platform)
-                results[platform] = {'status': 'failed', 'error': str(e)}
+                result = {'status': 'failed', 'error': str(e)}
                 bot_logger.log_post_result(session.get('user_id'), platform, False, str(e))
+            
+            # שמירה מיידית - ההתקדמות גלויה במסד, ותוצאות שהושגו לא אובדות בקריסה
+            try:
+                await record_platform_result(session['post_id'], platform, result)
+            except SaveError as e:
+                logger.warning(f"שגיאה בשמירת תוצאת {platform}: {e}")
         
         # הודעת סיכום
         final_message = MessageHelper.create_success_message(successful_platforms, failed_platforms)
-        await message.edit_text(final_message, parse_mode='Markdown')
+        await self.editor.edit(message, final_message, final=True, parse_mode='Markdown')
         
-        # עדכון במסד נתונים
+        # עדכון במסד נתונים (התוצאות עצמן כבר נשמרו)
         final_status = 'completed' if len(failed_platforms) == 0 else 'partial'
-        update_post_status(session['post_id'], final_status, results)
+        await update_post_status(session['post_id'], final_status)
     
-    async def _cancel_posting(self, update: Update, user_id: int):
+    async def _real_album_posting(self, session: Dict, message):
+        """פרסום אלבום - כל הסרטונים לכל פלטפורמה כאצווה אחת; פלטפורמה מצליחה רק אם כל הסרטונים פורסמו בה"""
+        items = session['items']
+        
+        # פלטפורמות שכבר פורסמו לכל סרטון בהרצה קודמת - לא מפרסמים בהן שוב
+        already_posted = {item['post_id']: await self.db.get_completed_platforms(item['post_id']) for item in items}
+        successful_platforms, failed_platforms = [], []
+        failed_posts = set()
+        
+        for platform in session['platforms']:
+            pending = [item for item in items if platform not in already_posted[item['post_id']]]
+            if not pending:
+                successful_platforms.append(platform)
+                continue
+            
+            await self.editor.edit(message, f"🔄 מפרסם {len(pending)} סרטונים ב-{platform}...")
+            
+            try:
+                outcomes = await self.social_handler.post_batch_to_platform(
+                    platform,
+                    [item['file_path'] for item in pending],
+                    session['text']
+                )
+                errors = [None if success else 'Unknown error' for success in outcomes]
+            except Exception as e:
+                errors = [str(e)] * len(pending)
+            
+            for item, error in zip(pending, errors):
+                if error is None:
+                    result = {'status': 'success', 'posted_at': TimeHelper.get_timestamp()}
+                else:
+                    result = {'status': 'failed', 'error': error}
+                    failed_posts.add(item['post_id'])
+                
+                try:
+                    await record_platform_result(item['post_id'], platform, result)
+                except SaveError as e:
+                    logger.warning(f"שגיאה בשמירת תוצאת {platform}: {e}")
+            
+            error = next((error for error in errors if error), None)
+            if error is None:
+                successful_platforms.append(platform)
+                bot_logger.log_post_result(session['user_id'], platform, True)
+            else:
+                failed_platforms.append(platform)
+                bot_logger.log_post_result(session['user_id'], platform, False, error)
+        
+        # הודעת סיכום
+        final_message = MessageHelper.create_success_message(successful_platforms, failed_platforms)
+        await self.editor.edit(message, final_message, final=True, parse_mode='Markdown')
+        
+        for item in items:
+            await update_post_status(item['post_id'], 'partial' if item['post_id'] in failed_posts else 'completed')
+    
+    async def _cancel_posting(self, update: Update, post_id: str):
         """ביטול פרסום"""
-        session = self.user_sessions.get(user_id)
-        if session:
+        if self._user_session(update, post_id):
+            session = await self.sessions.pop(post_id)
+            
             # ניקוי קבצים
-            FileHelper.cleanup_temp_files([session['file_path']])
+            FileHelper.cleanup_temp_files(session_files(session))
             
             # עדכון סטטוס במסד נתונים
-            update_post_status(session['post_id'], 'cancelled')
-            
-            # ניקוי סשן
-            del self.user_sessions[user_id]
+            for item in session_items(session):
+                await update_post_status(item['post_id'], 'cancelled')
         
         await update.callback_query.edit_message_text("❌ פרסום בוטל")
-        bot_logger.log_user_action(user_id, "posting_cancelled")
+        bot_logger.log_user_action(update.effective_user.id, "posting_cancelled")
+    
+    async def _release_session(self, session: Dict, reason: str):
+        """סשן שפונה בלי אישור (תפוגה / מגבלת משתמש) - מחיקת הקובץ הזמני וסימון הפוסט כמבוטל"""
+        FileHelper.cleanup_temp_files(session_files(session))
+        for item in session_items(session):
+            await update_post_status(item['post_id'], 'cancelled', error=EVICT_REASONS.get(reason, reason))
+        logger.info(f"סשן {session['post_id']} של משתמש {session['user_id']} פונה: {reason}")
     
     async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """טיפול בהודעות טקסט רגילות"""
@@ -443,24 +882,74 @@ class SocialMediaBot:
         logger.info("מטפל רשתות חברתיות חובר לבוט")
     
     async def run(self):
-        """הרצת הבוט"""
+        """הרצת הבוט - polling או webhook לפי BOT_RUN_MODE"""
         try:
-            logger.info("מתחיל את בוט הטלגרם...")
-            await self.app.run_polling(drop_pending_updates=True)
+            logger.info(f"מתחיל את בוט הטלגרם ({Config.BOT_RUN_MODE})...")
+            if Config.BOT_RUN_MODE == 'webhook':
+                await self._run_webhook()
+            else:
+                await self.app.run_polling(drop_pending_updates=True)
         except Exception as e:
             logger.critical(f"שגיאה קריטית בהרצת הבוט: {e}")
             raise
     
+    async def _run_webhook(self):
+        """מצב webhook - טלגרם שולח עדכונים לשרת המוטמע, והם נכנסים לתור של האפליקציה (בלי polling)"""
+        self._stop_event = asyncio.Event()
+        self.webhook_server = WebhookServer(
+            Config.WEBHOOK_HOST, Config.PORT, Config.WEBHOOK_PATH, Config.WEBHOOK_SECRET_TOKEN,
+            on_update=self._enqueue_update, readiness=self.readiness
+        )
+        
+        # /health עונה כבר בזמן האתחול (ו-/ready מחזיר 503 עד שהאפליקציה רצה)
+        await self.webhook_server.start()
+        try:
+            await self.app.initialize()
+            await self.app.bot.set_webhook(
+                url=Config.WEBHOOK_URL.rstrip('/') + Config.WEBHOOK_PATH,
+                secret_token=Config.WEBHOOK_SECRET_TOKEN,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=True
+            )
+            await self.app.start()
+            logger.info(f"webhook הוגדר: {Config.WEBHOOK_URL.rstrip('/')}{Config.WEBHOOK_PATH}")
+            
+            await self._stop_event.wait()
+        finally:
+            await self.webhook_server.stop()
+            if self.app.running:
+                await self.app.stop()
+            await self.app.shutdown()
+    
+    async def _enqueue_update(self, data: Dict):
+        """עדכון שהתקבל ב-webhook - לתור העדכונים של האפליקציה"""
+        await self.app.update_queue.put(Update.de_json(data, self.app.bot))
+    
+    async def readiness(self) -> Dict[str, bool]:
+        """בדיקות מוכנות ל-/ready - האפליקציה מעבדת עדכונים והאחסון זמין"""
+        return {
+            'telegram': bool(self.app and self.app.running),
+            'storage': await self.db.health_check()
+        }
+    
     def stop(self):
         """עצירת הבוט"""
         if self.app:
             logger.info("עוצר את בוט הטלגרם...")
-            # ניקוי קבצים זמניים
-            for session in self.user_sessions.values():
-                if 'file_path' in session:
-                    FileHelper.cleanup_temp_files([session['file_path']])
-            
-            self.user_sessions.clear()
+            # ניקוי קבצים זמניים (סשנים שנשמרים במסד משאירים את הקבצים להפעלה הבאה)
+            for session in self.sessions.close():
+                FileHelper.cleanup_temp_files(session_files(session))
+        
+        # אלבומים שעוד נאספים, והורדות ופרסומים שרצים ברקע
+        for task in list(self._background_tasks):
+            task.cancel()
+        self._albums.clear()
+        
+        self.editor.stop()
+        
+        # מצב webhook - שחרור run()
+        if self._stop_event:
+            self._stop_event.set()
 
 # יצירת instance גלובלי
 _bot_instance = None
@@ -5,7 +5,9 @@ pytest test_bot.py -v
 import pytest
 import asyncio
 import os
+import time
 import tempfile
+from datetime import datetime, timedelta
 from unittest.mock import Mock, AsyncMock, patch, MagicMock
 from telegram import Update, Message, Video, User, Chat
 from telegram.ext import ContextTypes
@@ -17,7 +19,13 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from telegram_bot import SocialMediaBot, get_bot
 from config import Config, Messages
 from exceptions import *
-from database import get_database
+from database import get_async_database
+from utils import MessageHelper, TextHelper
+from webhook_server import SECRET_TOKEN_HEADER, WebhookServer
+from update_processor import PerUserUpdateProcessor
+from message_editor import MessageEditor
+from admission import AdmissionController
+from session_store import SessionStore, EVICT_EXPIRED, EVICT_USER_LIMIT
 
 class TestSocialMediaBot:
     """בדיקות למחלקת הבוט הראשית"""
@@ -55,7 +63,7 @@ class TestSocialMediaBot:
         """בדיקת אתחול הבוט"""
         assert bot is not None
         assert bot.app is not None
-        assert bot.user_sessions == {}
+        assert len(bot.sessions) == 0
         assert bot.social_handler is None
     
     @pytest.mark.asyncio
@@ -81,8 +89,8 @@ class TestSocialMediaBot:
         call_args = mock_update.message.reply_text.call_args
         assert Messages.HELP_MESSAGE in call_args[0][0]
     
-    @patch('telegram_bot.get_user_settings')
-    @patch('telegram_bot.save_user_settings')
+    @patch('telegram_bot.get_user_settings', new_callable=AsyncMock)
+    @patch('telegram_bot.save_user_settings', new_callable=AsyncMock)
     @pytest.mark.asyncio
     async def test_mock_command_toggle(self, mock_save, mock_get, bot, mock_update, mock_context):
         """בדיקת החלפת מצב בדיקה"""
@@ -102,8 +110,8 @@ class TestSocialMediaBot:
         call_args = mock_update.message.reply_text.call_args[0][0]
         assert "פעיל" in call_args
     
-    @patch('telegram_bot.get_user_settings')
-    @patch('telegram_bot.save_user_settings')
+    @patch('telegram_bot.get_user_settings', new_callable=AsyncMock)
+    @patch('telegram_bot.save_user_settings', new_callable=AsyncMock)
     @pytest.mark.asyncio
     async def test_auto_command_toggle(self, mock_save, mock_get, bot, mock_update, mock_context):
         """בדיקת החלפת מצב אוטומטי"""
@@ -117,7 +125,7 @@ class TestSocialMediaBot:
         assert saved_settings['auto_post'] == True
     
     @patch('telegram_bot.ValidationHelper.validate_platform_tokens')
-    @patch('telegram_bot.get_user_settings')
+    @patch('telegram_bot.get_user_settings', new_callable=AsyncMock)
     @pytest.mark.asyncio
     async def test_status_command(self, mock_get, mock_validate, bot, mock_update, mock_context):
         """בדיקת פקודת /status"""
@@ -202,8 +210,8 @@ class TestVideoHandling:
     @patch('telegram_bot.ValidationHelper.validate_telegram_message')
     @patch('telegram_bot.FileHelper.validate_video_file')
     @patch('telegram_bot.ValidationHelper.validate_platform_tokens')
-    @patch('telegram_bot.get_user_settings')
-    @patch('telegram_bot.save_post')
+    @patch('telegram_bot.get_user_settings', new_callable=AsyncMock)
+    @patch('telegram_bot.save_post', new_callable=AsyncMock)
     @pytest.mark.asyncio
     async def test_handle_video_success(self, mock_save_post, mock_get_settings, 
                                       mock_validate_tokens, mock_validate_file,
@@ -227,6 +235,7 @@ class TestVideoHandling:
                 mock_context = Mock()
                 
                 await bot.handle_video(mock_video_update, mock_context)
+                await asyncio.gather(*bot._background_tasks)
                 
                 # בדיקות
                 mock_validate_message.assert_called_once()
@@ -276,7 +285,7 @@ class TestCallbackHandling:
         
         query = Mock()
         query.answer = AsyncMock()
-        query.data = "confirm_12345"
+        query.data = "confirm:test_post_123"
         query.from_user = user
         query.edit_message_text = AsyncMock()
         
@@ -291,9 +300,10 @@ class TestCallbackHandling:
         """בדיקת לחיצה על כפתור אישור"""
         with patch.object(bot, '_process_posting') as mock_process:
             await bot.handle_callback(mock_callback_query, mock_context)
+            await asyncio.gather(*bot._background_tasks)
             
             mock_callback_query.callback_query.answer.assert_called_once()
-            mock_process.assert_called_once_with(mock_callback_query, 12345)
+            mock_process.assert_called_once_with(mock_callback_query, 'test_post_123')
     
     @pytest.mark.asyncio
     async def test_handle_callback_cancel(self, bot, mock_context):
@@ -302,7 +312,7 @@ class TestCallbackHandling:
         
         query = Mock()
         query.answer = AsyncMock()
-        query.data = "cancel_12345"
+        query.data = "cancel:test_post_123"
         query.from_user = user
         query.edit_message_text = AsyncMock()
         
@@ -314,7 +324,7 @@ class TestCallbackHandling:
             await bot.handle_callback(update, mock_context)
             
             query.answer.assert_called_once()
-            mock_cancel.assert_called_once_with(update, 12345)
+            mock_cancel.assert_called_once_with(update, 'test_post_123')
 
 class TestPostProcessing:
     """בדיקות לעיבוד פרסומים"""
@@ -326,18 +336,20 @@ class TestPostProcessing:
         bot.setup_application()
         
         # הוספת session מדומה
-        bot.user_sessions[12345] = {
+        bot.sessions._insert({
             'post_id': 'test_post_123',
+            'user_id': 12345,
             'file_path': '/tmp/test_video.mp4',
             'filename': 'test_video.mp4',
             'text': 'טקסט בדיקה',
             'platforms': ['TikTok', 'Twitter'],
-            'mock_mode': True
-        }
+            'mock_mode': True,
+            'expires_at': datetime.utcnow() + timedelta(hours=1)
+        })
         
         return bot
     
-    @patch('telegram_bot.update_post_status')
+    @patch('telegram_bot.update_post_status', new_callable=AsyncMock)
     @patch('telegram_bot.FileHelper.cleanup_temp_files')
     @pytest.mark.asyncio
     async def test_mock_posting(self, mock_cleanup, mock_update_status, bot_with_session):
@@ -345,7 +357,7 @@ class TestPostProcessing:
         message = Mock()
         message.edit_text = AsyncMock()
         
-        session = bot_with_session.user_sessions[12345]
+        session = bot_with_session.sessions.get('test_post_123')
         
         await bot_with_session._mock_posting(session, message)
         
@@ -359,7 +371,7 @@ class TestPostProcessing:
         assert status_args[0][0] == 'test_post_123'  # post_id
         assert status_args[0][1] == 'completed'  # status
     
-    @patch('telegram_bot.update_post_status')
+    @patch('telegram_bot.update_post_status', new_callable=AsyncMock)
     @pytest.mark.asyncio
     async def test_cancel_posting(self, mock_update_status, bot_with_session):
         """בדיקת ביטול פרסום"""
@@ -370,9 +382,10 @@ class TestPostProcessing:
         
         update = Mock()
         update.callback_query = query
+        update.effective_user = User(id=user_id, first_name="Test", is_bot=False)
         
         with patch('telegram_bot.FileHelper.cleanup_temp_files') as mock_cleanup:
-            await bot_with_session._cancel_posting(update, user_id)
+            await bot_with_session._cancel_posting(update, 'test_post_123')
             
             # בדיקות
             query.edit_message_text.assert_called_once()
@@ -383,7 +396,7 @@ class TestPostProcessing:
             mock_cleanup.assert_called_once()
             
             # בדיקה שהsession נמחק
-            assert user_id not in bot_with_session.user_sessions
+            assert bot_with_session.sessions.user_posts(user_id) == []
 
 class TestBotSingleton:
     """בדיקות לpattern של Singleton"""
@@ -400,7 +413,7 @@ class TestIntegration:
     """בדיקות אינטגרציה"""
     
     @pytest.mark.asyncio
-    @patch('telegram_bot.get_database')
+    @patch('telegram_bot.get_async_database')
     async def test_database_integration(self, mock_get_db):
         """בדיקת אינטגרציה עם מסד נתונים"""
         mock_db = Mock()
@@ -452,6 +465,613 @@ def test_messages_in_hebrew():
         has_hebrew = any('\u0590' <= char <= '\u05FF' for char in message)
         assert has_hebrew, f"הודעה ללא עברית: {message[:50]}..."
 
+def test_history_message():
+    """הודעת היסטוריה מציגה תאריך, רשתות ותצוגה מקדימה לכל פוסט"""
+    posts = [{
+        'created_at': datetime(2024, 3, 1, 9, 30),
+        'status': 'completed',
+        'platforms': ['TikTok', 'Twitter'],
+        'text_preview': 'פוסט ראשון'
+    }]
+    
+    message = MessageHelper.create_history_message(posts)
+    
+    assert '✅ 01/03/2024 09:30 • TikTok, Twitter' in message
+    assert 'פוסט ראשון' in message
+    assert MessageHelper.create_history_message([]) == "📭 אין פוסטים להצגה"
+
+def test_hashtags_normalized():
+    """האשטגים בעברית ובאנגלית - בלי #, באותיות קטנות וללא כפילויות"""
+    text = "טיול לצפון #טיול #Travel #travel #קיץ_2024"
+    
+    assert TextHelper.extract_hashtags(text) == ['#טיול', '#Travel', '#travel', '#קיץ_2024']
+    assert TextHelper.normalize_hashtags(text) == ['טיול', 'travel', 'קיץ_2024']
+    assert TextHelper.normalize_hashtag('#Travel ') == 'travel'
+    
+    message = MessageHelper.create_hashtags_message([{'tag': 'טיול', 'count': 3}])
+    assert '#טיול • 3' in message
+
+@pytest.mark.asyncio
+async def test_search_callback_page():
+    """כפתור "תוצאות נוספות" - השאילתה (גם עם נקודתיים) והסמן עוברים לחיפוש"""
+    bot = SocialMediaBot()
+    
+    query = Mock()
+    query.answer = AsyncMock()
+    query.data = "search:1.5_65f000000000000000000000:עוגה: שוקולד"
+    query.edit_message_text = AsyncMock()
+    
+    update = Mock()
+    update.callback_query = query
+    update.effective_user = User(id=12345, first_name="Test", is_bot=False)
+    
+    page = {'posts': [], 'next_cursor': None}
+    with patch.object(bot.db, 'search_posts', AsyncMock(return_value=page)) as mock_search:
+        await bot.handle_callback(update, Mock())
+    
+    mock_search.assert_awaited_once_with(12345, 'עוגה: שוקולד', limit=5, cursor='1.5_65f000000000000000000000')
+    query.edit_message_text.assert_awaited_once()
+
+def test_db_metrics_message():
+    """הודעת מדדי מסד נתונים מציגה פעולות, המתנה ל-pool ושאילתות איטיות"""
+    metrics = {
+        'operations': {'posts.find': {'count': 12, 'failures': 0, 'avg_ms': 3.1,
+                                      'p50_ms': 2.0, 'p95_ms': 10.0, 'p99_ms': 25.0, 'max_ms': 180.5}},
+        'pool_wait': {'count': 12, 'failures': 0, 'avg_ms': 0.1,
+                      'p50_ms': 1.0, 'p95_ms': 1.0, 'p99_ms': 1.0, 'max_ms': 0.4},
+        'slow_queries': [{'collection': 'posts', 'operation': 'find', 'duration_ms': 180.5,
+                          'filter_shape': {'user_id': '?'}, 'plan': 'COLLSCAN', 'at': datetime(2024, 3, 1)}]
+    }
+    
+    message = MessageHelper.create_db_metrics_message(metrics)
+    
+    assert '• posts.find: 12 | 2 / 10 / 180.5' in message
+    assert 'COLLSCAN' in message
+    assert MessageHelper.create_db_metrics_message({}) == "📉 אין מדדים עבור האחסון הנוכחי"
+
+class TestSessionStore:
+    """בדיקות למאגר הסשנים הפתוחים לפי post_id"""
+    
+    @staticmethod
+    def _session(post_id, user_id=1):
+        return {'post_id': post_id, 'user_id': user_id, 'file_path': f'/tmp/{post_id}.mp4'}
+    
+    @pytest.mark.asyncio
+    async def test_user_limit_evicts_oldest(self):
+        """כמה תצוגות פתוחות למשתמש - מעבר למגבלה הישנה מפונה, ושל משתמש אחר לא נוגעים"""
+        on_evict = AsyncMock()
+        store = SessionStore(ttl_seconds=60, max_per_user=2, on_evict=on_evict)
+        
+        for post_id in ['a', 'b', 'c']:
+            await store.add(self._session(post_id))
+        await store.add(self._session('d', user_id=2))
+        
+        assert store.user_posts(1) == ['b', 'c']
+        assert 'a' not in store and 'd' in store
+        on_evict.assert_awaited_once()
+        assert on_evict.await_args.args[0]['post_id'] == 'a'
+        assert on_evict.await_args.args[1] == EVICT_USER_LIMIT
+        
+        # pop לא עובר ב-on_evict - הקובץ באחריות מי שלקח את הסשן
+        assert (await store.pop('b'))['post_id'] == 'b'
+        assert await store.pop('b') is None
+        assert on_evict.await_count == 1
+        
+        assert store.close() and len(store) == 0
+    
+    @pytest.mark.asyncio
+    async def test_ttl_eviction_in_background(self):
+        """סשן שפג מפונה ברקע (on_evict משחרר את הקובץ) וגם pop שלו מחזיר None"""
+        released = []
+        
+        async def on_evict(session, reason):
+            released.append((session['post_id'], reason))
+        
+        store = SessionStore(ttl_seconds=0.05, max_per_user=5, on_evict=on_evict)
+        await store.add(self._session('a'))
+        assert store.get('a') is not None
+        
+        await asyncio.sleep(0.1)
+        
+        assert released == [('a', EVICT_EXPIRED)]
+        assert len(store) == 0 and store.user_posts(1) == []
+        assert await store.pop('a') is None
+    
+    @pytest.mark.asyncio
+    async def test_persistent_restore(self, tmp_path):
+        """עם storage - כל שינוי נכתב, הסשנים נטענים בהפעלה מחדש, וסשן שהקובץ שלו חסר מפונה"""
+        storage = Mock()
+        storage.save_session = AsyncMock()
+        storage.delete_session = AsyncMock()
+        
+        video = tmp_path / 'temp_1.mp4'
+        video.write_bytes(b'video')
+        expires_at = datetime.utcnow() + timedelta(minutes=5)
+        storage.load_sessions = AsyncMock(return_value=[
+            {'post_id': 'a', 'user_id': 1, 'file_path': str(video), 'expires_at': expires_at},
+            {'post_id': 'b', 'user_id': 1, 'file_path': str(tmp_path / 'gone.mp4'), 'expires_at': expires_at}
+        ])
+        on_evict = AsyncMock()
+        store = SessionStore(ttl_seconds=60, max_per_user=5, on_evict=on_evict, storage=storage)
+        
+        assert await store.restore() == 1
+        assert store.user_posts(1) == ['a']
+        storage.delete_session.assert_awaited_once_with('b')
+        
+        await store.add(self._session('c'))
+        assert storage.save_session.await_args.args[0]['post_id'] == 'c'
+        
+        # בכיבוי הסשנים והקבצים נשארים להפעלה הבאה
+        assert store.close() == []
+        assert store.file_paths() == {str(video), '/tmp/c.mp4'}
+
+@pytest.mark.asyncio
+async def test_preview_buttons_carry_post_id():
+    """שני סרטונים של אותו משתמש - לכל אחד תצוגה עם הכפתורים שלו, ואישור של משתמש אחר נדחה"""
+    bot = SocialMediaBot()
+    for post_id in ['post_a', 'post_b']:
+        await bot.sessions.add({
+            'post_id': post_id, 'user_id': 12345, 'file_path': f'/tmp/{post_id}.mp4',
+            'filename': f'{post_id}.mp4', 'text': 'טקסט', 'platforms': ['Telegram'], 'mock_mode': True
+        })
+    
+    update = Mock()
+    update.message.reply_text = AsyncMock()
+    await bot._show_preview(update, 'post_a')
+    
+    keyboard = update.message.reply_text.call_args.kwargs['reply_markup'].inline_keyboard
+    assert [button.callback_data for button in keyboard[0]] == ['confirm:post_a', 'cancel:post_a']
+    
+    other_user = Mock()
+    other_user.effective_user = User(id=999, first_name="Other", is_bot=False)
+    other_user.callback_query.edit_message_text = AsyncMock()
+    await bot._process_posting(other_user, 'post_b')
+    
+    other_user.callback_query.edit_message_text.assert_awaited_once()
+    assert bot.sessions.user_posts(12345) == ['post_a', 'post_b']
+    bot.sessions.close()
+
+class TestAdmissionController:
+    """בדיקות לבקרת הכניסה להורדות ופרסומים"""
+    
+    @pytest.mark.asyncio
+    async def test_limits_and_queue_positions(self, tmp_path):
+        """מגבלה לכל משתמש וגלובלית - העודף בתור עם מקום, ומשתמש שבגבול שלו לא עוצר את מי שאחריו"""
+        controller = AdmissionController(max_concurrent=2, max_per_user=1, max_queue=2, temp_dir=str(tmp_path))
+        release = asyncio.Event()
+        order, positions = [], []
+        
+        async def job(user_id, name):
+            async def on_queued(position):
+                positions.append((name, position))
+            
+            async with controller.admit(user_id, on_queued=on_queued):
+                order.append(name)
+                await release.wait()
+        
+        tasks = [asyncio.create_task(job(user_id, name)) for user_id, name in [(1, 'a1'), (1, 'a2'), (2, 'b1'), (3, 'c1')]]
+        await asyncio.sleep(0.01)
+        
+        # a2 ממתין ל-a1, c1 ממתין למקום גלובלי
+        assert order == ['a1', 'b1']
+        assert positions == [('a2', 1), ('c1', 2)]
+        
+        # התור מלא
+        with pytest.raises(ResourceLimitError):
+            async with controller.admit(4):
+                pass
+        
+        release.set()
+        await asyncio.gather(*tasks)
+        
+        assert sorted(order[2:]) == ['a2', 'c1']
+        assert controller.active == 0 and controller.queue_length() == 0 and controller.rejected == 1
+    
+    @pytest.mark.asyncio
+    async def test_resource_thresholds(self, tmp_path):
+        """סרטון שאחריו לא יישאר מספיק מקום בדיסק, או RSS מעל הסף - נדחים"""
+        controller = AdmissionController(max_concurrent=2, max_per_user=2, max_queue=5, temp_dir=str(tmp_path),
+                                         min_free_disk_mb=100, max_rss_mb=500)
+        
+        with patch('admission.shutil.disk_usage', return_value=Mock(free=150 * 1024 * 1024)), \
+             patch('admission._rss_mb', return_value=100.0):
+            async with controller.admit(1, size_mb=40):
+                # הקובץ שבדרך נספר כתפוס
+                with pytest.raises(ResourceLimitError):
+                    controller.check_resources(size_mb=40)
+            
+            controller.check_resources(size_mb=40)
+        
+        with patch('admission._rss_mb', return_value=600.0):
+            with pytest.raises(ResourceLimitError):
+                controller.check_resources()
+
+@pytest.mark.asyncio
+async def test_video_refused_when_busy():
+    """סרטון שנדחה בבקרת הכניסה מקבל הודעת עומס ולא מורד"""
+    bot = SocialMediaBot()
+    bot.admission.check_resources = Mock(side_effect=ResourceLimitError("מקום פנוי בדיסק: 10MB"))
+    bot._download_video = AsyncMock()
+    
+    update = Mock()
+    update.effective_user = User(id=12345, first_name="Test", is_bot=False)
+    update.message.media_group_id = None
+    update.message.video.file_size = 10 * 1024 * 1024
+    update.message.caption = "טקסט לסרטון"
+    update.message.reply_text = AsyncMock()
+    
+    await bot.handle_video(update, Mock())
+    await asyncio.gather(*bot._background_tasks)
+    
+    update.message.reply_text.assert_awaited_once_with(Messages.ERROR_BUSY)
+    bot._download_video.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_confirm_waits_for_admission_outside_update_processing():
+    """אישור שממתין לבקרת הכניסה לא תופס את העדכון - עדכון נוסף של אותו משתמש (ביטול, /status) רץ מיד"""
+    bot = SocialMediaBot()
+    bot.admission = AdmissionController(max_concurrent=1, max_per_user=1, max_queue=5, temp_dir='.')
+    bot._process_posting = AsyncMock()
+    
+    update = Mock()
+    update.effective_user = User(id=12345, first_name="Test", is_bot=False)
+    update.callback_query.data = "confirm:p1"
+    update.callback_query.answer = AsyncMock()
+    update.callback_query.edit_message_text = AsyncMock()
+    
+    async with bot.admission.admit(999):
+        await asyncio.wait_for(bot.update_processor.process_update(update, bot.handle_callback(update, Mock())), 1)
+        await asyncio.sleep(0.01)
+        
+        # הפרסום ממתין בתור של בקרת הכניסה, והעדכון הבא של המשתמש לא ממתין לו
+        status = AsyncMock()
+        await asyncio.wait_for(bot.update_processor.process_update(update, status()), 1)
+        status.assert_awaited_once()
+        assert bot.admission.queue_length() == 1
+        bot._process_posting.assert_not_awaited()
+    
+    await asyncio.gather(*bot._background_tasks)
+    bot._process_posting.assert_awaited_once_with(update, 'p1')
+    assert bot.update_processor.active == 0
+    bot.sessions.close()
+
+@pytest.mark.asyncio
+async def test_user_admission_limit_applies_to_videos():
+    """שני סרטונים של אותו משתמש דרך עיבוד העדכונים - ADMISSION_MAX_PER_USER מעביר את השני לתור"""
+    bot = SocialMediaBot()
+    bot.admission = AdmissionController(max_concurrent=4, max_per_user=1, max_queue=5, temp_dir='.')
+    release = asyncio.Event()
+    accepted = []
+    
+    async def accept_video(update, user_id, video_file, text):
+        accepted.append(update)
+        await release.wait()
+    
+    bot._accept_video = accept_video
+    
+    updates = []
+    for _ in range(2):
+        update = Mock()
+        update.effective_user = User(id=12345, first_name="Test", is_bot=False)
+        update.message.media_group_id = None
+        update.message.video.file_size = 1024 * 1024
+        update.message.caption = "טקסט לסרטון"
+        update.message.reply_text = AsyncMock()
+        updates.append(update)
+        await asyncio.wait_for(bot.update_processor.process_update(update, bot.handle_video(update, Mock())), 1)
+    await asyncio.sleep(0.01)
+    
+    assert accepted == [updates[0]]
+    updates[1].message.reply_text.assert_awaited_once_with(Messages.QUEUED.format(position=1))
+    
+    release.set()
+    await asyncio.gather(*bot._background_tasks)
+    assert accepted == updates
+    bot.sessions.close()
+
+@pytest.mark.asyncio
+async def test_album_collected_into_one_preview(tmp_path):
+    """אלבום של שלושה סרטונים - הורדה במקביל עד הגבול, פוסט לכל סרטון, וסשן ותצוגה מקדימה אחת לפי סדר ההודעות"""
+    bot = SocialMediaBot()
+    active, peak = 0, 0
+    
+    async def download(video_file, user_id):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        file_path = tmp_path / f'{video_file.file_unique_id}.mp4'
+        file_path.write_bytes(b'video')
+        return str(file_path)
+    
+    bot._download_video = download
+    
+    updates = []
+    for message_id in [3, 1, 2]:
+        update = Mock()
+        update.effective_user = User(id=12345, first_name="Test", is_bot=False)
+        update.message.message_id = message_id
+        update.message.media_group_id = 'album_1'
+        update.message.video.file_unique_id = f'v{message_id}'
+        update.message.video.file_name = None
+        update.message.video.file_size = 1024 * 1024
+        update.message.caption = "כיתוב לאלבום" if message_id == 2 else None
+        update.message.reply_text = AsyncMock()
+        updates.append(update)
+    
+    with patch.object(Config, 'MEDIA_GROUP_WAIT', 0.01), \
+         patch.object(Config, 'ALBUM_DOWNLOAD_CONCURRENCY', 2), \
+         patch('telegram_bot.FileHelper.validate_video_file'), \
+         patch('telegram_bot.get_user_settings', AsyncMock(return_value={'mock_mode': True, 'auto_post': False})), \
+         patch('telegram_bot.ValidationHelper.validate_platform_tokens', return_value={'Telegram': True}), \
+         patch('telegram_bot.save_post', AsyncMock(side_effect=['p1', 'p2', 'p3'])) as mock_save_post:
+        for update in updates:
+            await bot.handle_video(update, Mock())
+        await bot._albums['album_1']['task']
+        await asyncio.gather(*bot._background_tasks)
+    
+    assert peak == 2
+    assert mock_save_post.await_count == 3
+    assert bot.sessions.user_posts(12345) == ['p1']
+    
+    session = bot.sessions.get('p1')
+    assert session['text'] == "כיתוב לאלבום"
+    assert [item['file_path'] for item in session['items']] == [str(tmp_path / f'v{i}.mp4') for i in [1, 2, 3]]
+    assert bot.sessions.file_paths() == {item['file_path'] for item in session['items']}
+    
+    # התצוגה המקדימה - תשובה להודעה הראשונה באלבום
+    first = updates[1]
+    first.message.reply_text.assert_awaited_once()
+    assert "3 סרטונים" in first.message.reply_text.call_args.args[0]
+    updates[0].message.reply_text.assert_not_awaited()
+    bot.sessions.close()
+
+@pytest.mark.asyncio
+async def test_album_save_failure_marks_saved_posts_failed(tmp_path):
+    """שמירת פריט באלבום נכשלה - הפוסטים שכבר נשמרו מסומנים failed והקבצים נמחקים"""
+    bot = SocialMediaBot()
+    
+    async def download(video_file, user_id):
+        file_path = tmp_path / f'{video_file.file_unique_id}.mp4'
+        file_path.write_bytes(b'video')
+        return str(file_path)
+    
+    bot._download_video = download
+    video_files = []
+    for index in range(3):
+        video_file = Mock()
+        video_file.file_unique_id = f'v{index}'
+        video_file.file_name = None
+        video_files.append(video_file)
+    
+    with patch('telegram_bot.FileHelper.validate_video_file'), \
+         patch('telegram_bot.get_user_settings', AsyncMock(return_value={'mock_mode': True, 'auto_post': False})), \
+         patch('telegram_bot.ValidationHelper.validate_platform_tokens', return_value={'Telegram': True}), \
+         patch('telegram_bot.save_post', AsyncMock(side_effect=['p1', SaveError("שגיאה בשמירה")])) as mock_save_post, \
+         patch('telegram_bot.update_post_status', AsyncMock()) as mock_update_status:
+        with pytest.raises(SaveError):
+            await bot._accept_album(Mock(), 12345, video_files, "כיתוב")
+    
+    assert mock_save_post.await_count == 2
+    mock_update_status.assert_awaited_once()
+    assert mock_update_status.call_args.args == ('p1', 'failed')
+    assert list(tmp_path.iterdir()) == []
+    assert bot.sessions.user_posts(12345) == []
+    bot.sessions.close()
+
+class TestMessageEditor:
+    """בדיקות לעריכת הודעות בקצב מבוקר"""
+    
+    @staticmethod
+    def _message(chat_id, sent):
+        """הודעה מדומה שרושמת כל עריכה ב-sent"""
+        message = Mock()
+        message.chat_id = chat_id
+        message.message_id = 1
+        
+        async def edit_text(text, **kwargs):
+            sent.append((chat_id, text))
+        
+        message.edit_text = AsyncMock(side_effect=edit_text)
+        return message
+    
+    @pytest.mark.asyncio
+    async def test_coalesce_and_final_first(self):
+        """עריכות שממתינות לאותה הודעה מתמזגות לאחרונה, ועריכה סופית עוקפת התקדמות של צ'אטים אחרים"""
+        sent = []
+        editor = MessageEditor(chat_interval=0.05, global_rate=1000)
+        progress, other, result = self._message(1, sent), self._message(2, sent), self._message(3, sent)
+        
+        for platform in ['TikTok', 'Twitter', 'Facebook']:
+            await editor.edit(progress, f"מפרסם ב-{platform}")
+        await editor.edit(other, "מפרסם ב-LinkedIn")
+        await editor.edit(result, "הסתיים", final=True, parse_mode='Markdown')
+        
+        assert sent[0] == (3, "הסתיים")
+        result.edit_text.assert_awaited_once_with("הסתיים", parse_mode='Markdown')
+        
+        while editor.pending_count():
+            await asyncio.sleep(0.01)
+        
+        assert sorted(sent[1:]) == [(1, "מפרסם ב-Facebook"), (2, "מפרסם ב-LinkedIn")]
+        assert editor.coalesced == 2 and editor.sent == 3
+        editor.stop()
+    
+    @pytest.mark.asyncio
+    async def test_chat_interval_and_retry_after(self):
+        """עריכות לאותו צ'אט מרוחקות ב-chat_interval, ו-RetryAfter דוחה את הצ'אט ושולח שוב"""
+        from telegram.error import RetryAfter
+        
+        sent = []
+        editor = MessageEditor(chat_interval=0.1, global_rate=1000)
+        message = self._message(1, sent)
+        message.edit_text.side_effect = [RetryAfter(0), None, None]
+        
+        started = time.monotonic()
+        await editor.edit(message, "א", final=True)
+        await editor.edit(message, "ב", final=True)
+        
+        assert time.monotonic() - started >= 0.1
+        assert [call.args[0] for call in message.edit_text.await_args_list] == ["א", "א", "ב"]
+        assert editor.rate_limited == 1
+        editor.stop()
+
+class TestPerUserUpdateProcessor:
+    """בדיקות לעיבוד עדכונים במקביל עם סדר לכל משתמש"""
+    
+    @staticmethod
+    def _update(user_id):
+        """עדכון מדומה של משתמש (None - בלי משתמש)"""
+        update = Mock()
+        update.effective_user = User(id=user_id, first_name="Test", is_bot=False) if user_id else None
+        return update
+    
+    @pytest.mark.asyncio
+    async def test_same_user_in_order_other_users_concurrent(self):
+        """עדכוני אותו משתמש רצים אחד אחרי השני לפי הסדר, משתמש אחר לא ממתין להם"""
+        processor = PerUserUpdateProcessor(max_concurrent_updates=4, max_pending_updates=16)
+        events = []
+        release = asyncio.Event()
+        
+        async def handle(name, wait):
+            events.append(f"start {name}")
+            if wait:
+                await release.wait()
+            events.append(f"end {name}")
+        
+        tasks = [
+            asyncio.create_task(processor.process_update(self._update(1), handle('a1', True))),
+            asyncio.create_task(processor.process_update(self._update(1), handle('a2', False))),
+            asyncio.create_task(processor.process_update(self._update(2), handle('b1', False)))
+        ]
+        await asyncio.sleep(0.01)
+        
+        # a1 חוסם - a2 עוד לא התחיל, b1 כבר הסתיים
+        assert events == ['start a1', 'start b1', 'end b1']
+        
+        release.set()
+        await asyncio.gather(*tasks)
+        
+        assert events[3:] == ['end a1', 'start a2', 'end a2']
+        assert processor.processed == 3 and processor._user_locks == {}
+    
+    @pytest.mark.asyncio
+    async def test_global_limit(self):
+        """לא יותר מ-max_concurrent_updates עדכונים רצים יחד, גם ממשתמשים שונים"""
+        processor = PerUserUpdateProcessor(max_concurrent_updates=2, max_pending_updates=16)
+        peak = 0
+        
+        async def handle():
+            nonlocal peak
+            peak = max(peak, processor.active)
+            await asyncio.sleep(0.01)
+        
+        await asyncio.gather(*(
+            processor.process_update(self._update(user_id), handle()) for user_id in [1, 2, 3, 4, None]
+        ))
+        
+        assert peak == 2
+        assert processor.processed == 5
+    
+    @pytest.mark.asyncio
+    async def test_run_for_user_waits_for_user_turn(self):
+        """עבודה שלא הגיעה כעדכון (אלבום שנאסף) ממתינה לעדכון שרץ של אותו משתמש ונספרת במגבלה"""
+        processor = PerUserUpdateProcessor(max_concurrent_updates=4, max_pending_updates=16)
+        events = []
+        release = asyncio.Event()
+        
+        async def handle(name, wait):
+            events.append(f"start {name}")
+            if wait:
+                await release.wait()
+            events.append(f"end {name}")
+        
+        update_task = asyncio.create_task(processor.process_update(self._update(1), handle('update', True)))
+        await asyncio.sleep(0.01)
+        album_task = asyncio.create_task(processor.run_for_user(1, handle('album', False)))
+        await asyncio.sleep(0.01)
+        
+        assert events == ['start update']
+        
+        release.set()
+        await asyncio.gather(update_task, album_task)
+        
+        assert events == ['start update', 'end update', 'start album', 'end album']
+        assert processor.processed == 2 and processor._user_locks == {}
+
+class TestWebhookServer:
+    """בדיקות לשרת ה-webhook המוטמע - מול socket אמיתי על localhost"""
+    
+    @pytest.fixture
+    def received(self):
+        """העדכונים שהגיעו ל-on_update"""
+        return []
+    
+    @pytest.fixture
+    def checks(self):
+        """תוצאות בדיקות המוכנות"""
+        return {'telegram': True, 'storage': True}
+    
+    @pytest.fixture
+    def server(self, received, checks):
+        """שרת על פורט פנוי"""
+        async def on_update(update):
+            received.append(update)
+        
+        async def readiness():
+            return dict(checks)
+        
+        return WebhookServer('127.0.0.1', 0, '/telegram', 'secret-token', on_update, readiness)
+    
+    async def _request(self, server, method, path, body=b'', headers=None):
+        """בקשת HTTP גולמית - מחזיר (status, גוף)"""
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n"
+        for name, value in (headers or {}).items():
+            head += f"{name}: {value}\r\n"
+        writer.write(head.encode() + b"\r\n" + body)
+        await writer.drain()
+        
+        response = await reader.read()
+        writer.close()
+        
+        status_line, _, response_body = response.partition(b"\r\n\r\n")
+        return int(status_line.split()[1]), response_body
+    
+    @pytest.mark.asyncio
+    async def test_update_requires_secret_token(self, server, received):
+        """עדכון עם הטוקן הנכון מועבר, בלי טוקן / עם טוקן שגוי - 403 ולא מועבר"""
+        await server.start()
+        try:
+            body = b'{"update_id": 1}'
+            assert (await self._request(server, 'POST', '/telegram', body))[0] == 403
+            assert (await self._request(server, 'POST', '/telegram', body, {SECRET_TOKEN_HEADER: 'wrong'}))[0] == 403
+            assert (await self._request(server, 'POST', '/telegram', body, {SECRET_TOKEN_HEADER: 'secret-token'}))[0] == 200
+            assert (await self._request(server, 'POST', '/telegram', b'{', {SECRET_TOKEN_HEADER: 'secret-token'}))[0] == 400
+        finally:
+            await server.stop()
+        
+        assert received == [{'update_id': 1}]
+        assert server.updates_received == 1
+    
+    @pytest.mark.asyncio
+    async def test_health_and_readiness(self, server, checks):
+        """/health תמיד 200, /ready - 503 כשבדיקה נכשלת, נתיב לא מוכר - 404"""
+        await server.start()
+        try:
+            assert await self._request(server, 'GET', '/health') == (200, b'{"status": "ok"}')
+            assert (await self._request(server, 'GET', '/ready'))[0] == 200
+            
+            checks['storage'] = False
+            status, body = await self._request(server, 'GET', '/ready')
+            assert status == 503 and b'"storage": false' in body
+            
+            assert (await self._request(server, 'GET', '/other'))[0] == 404
+            assert (await self._request(server, 'GET', '/telegram'))[0] == 405
+        finally:
+            await server.stop()
+
 @pytest.mark.integration
 class TestFullWorkflow:
     """בדיקות workflow מלא - רק אם יש סביבה מתאימה"""
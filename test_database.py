@@ -2,21 +2,39 @@
 בדיקות למסד הנתונים MongoDB
 pytest test_database.py -v
 """
+import asyncio
+import gzip
 import pytest
+import pytest_asyncio
 import os
 import tempfile
-from datetime import datetime, timedelta
-from unittest.mock import Mock, patch, MagicMock
-from pymongo.errors import ConnectionFailure, OperationFailure
-from bson import ObjectId
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, AsyncMock, patch, MagicMock
+from pymongo import ReadPreference
+from pymongo.errors import (
+    BulkWriteError, ConnectionFailure, DuplicateKeyError, ExecutionTimeout, OperationFailure, WriteError, WTimeoutError
+)
+from bson import ObjectId, json_util
 
 # ייבוא המודולים שלנו
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database import DatabaseManager, get_database, save_post, update_post_status
+from database import (
+    DatabaseManager, AsyncDatabaseManager, get_database, get_async_database,
+    save_post, update_post_status, get_user_settings, _operation_options,
+    SCHEMA_MIGRATIONS, SCHEMA_VERSION, APPLIED_OPS_KEPT
+)
 from exceptions import *
 from config import Config
+from cache import TTLCache
+from log_writer import BufferedLogWriter
+from cache_invalidation import ChangeStreamInvalidator
+from db_metrics import DatabaseMetrics, LatencyHistogram, explain_command, plan_summary
+from archive import PartitionedArchive
+from journal import WriteJournal
+import query_plans
+from sqlite_storage import _POSTS_COLUMNS, _POSTS_TABLE, SQLiteDatabaseManager
 
 class TestDatabaseManager:
     """בדיקות למחלקת ניהול מסד הנתונים"""
@@ -29,9 +47,14 @@ class TestDatabaseManager:
         mock_collections = {
             'posts': Mock(),
             'users': Mock(),
-            'logs': Mock()
+            'logs': Mock(),
+            'user_counters': Mock(),
+            'statistics': Mock()
         }
         
+        for collection in mock_collections.values():
+            collection.with_options.return_value = collection
+        
         mock_client.admin.command.return_value = {'ok': 1}
         mock_client.__getitem__.return_value = mock_db
         mock_db.__getitem__ = lambda self, key: mock_collections[key]
@@ -132,10 +155,10 @@ class TestDatabaseManager:
         mock_client, mock_db, mock_collections = self.mock_mongo_client()
         mock_mongo_client_class.return_value = mock_client
         
-        # הגדרת תגובה מדומה
-        mock_result = Mock()
-        mock_result.modified_count = 1
-        mock_collections['posts'].update_one.return_value = mock_result
+        # הגדרת תגובה מדומה - המסמך שלפני העדכון
+        mock_collections['posts'].find_one_and_update.return_value = {
+            '_id': ObjectId("507f1f77bcf86cd799439011"), 'user_id': 12345, 'status': 'processing'
+        }
         
         db_manager = DatabaseManager()
         
@@ -144,16 +167,16 @@ class TestDatabaseManager:
         db_manager.update_post_status("507f1f77bcf86cd799439011", "completed", posting_results)
         
         # בדיקות
-        mock_collections['posts'].update_one.assert_called_once()
+        mock_collections['posts'].find_one_and_update.assert_called_once()
         
-        call_args = mock_collections['posts'].update_one.call_args
+        call_args = mock_collections['posts'].find_one_and_update.call_args
         filter_arg = call_args[0][0]
         update_arg = call_args[0][1]
         
         assert isinstance(filter_arg['_id'], ObjectId)
-        assert update_arg['$set']['status'] == 'completed'
-        assert update_arg['$set']['posting_results'] == posting_results
-        assert 'updated_at' in update_arg['$set']
+        assert update_arg[0]['$set']['status'] == 'completed'
+        assert update_arg[0]['$set']['posting_results'] == {'$literal': posting_results}
+        assert 'updated_at' in update_arg[0]['$set']
     
     @patch('database.MongoClient')
     def test_get_user_posts(self, mock_mongo_client_class):
@@ -195,7 +218,9 @@ class TestDatabaseManager:
         assert posts[0]['user_id'] == 12345
         
         # בדיקת הפרמטרים של השאילתה
-        mock_collections['posts'].find.assert_called_once_with({'user_id': 12345})
+        mock_collections['posts'].find.assert_called_once_with(
+            {'user_id': 12345}, None, max_time_ms=Config.DB_OPERATION_CLASSES['analytics']['max_time_ms']
+        )
         mock_cursor.sort.assert_called_once_with('created_at', -1)
         mock_cursor.limit.assert_called_once_with(10)
     
@@ -326,8 +351,8 @@ class TestDatabaseManager:
         assert 'auto_post' in settings
         assert 'preferred_platforms' in settings
         
-        # בדיקה שנשמרו הגדרות ברירת מחדל
-        mock_collections['users'].update_one.assert_called_once()
+        # ברירת מחדל לא נכתבת למסד עד שהמשתמש משנה משהו
+        mock_collections['users'].update_one.assert_not_called()
     
     @patch('database.MongoClient')
     def test_get_statistics(self, mock_mongo_client_class):
@@ -335,17 +360,17 @@ class TestDatabaseManager:
         mock_client, mock_db, mock_collections = self.mock_mongo_client()
         mock_mongo_client_class.return_value = mock_client
         
-        # הגדרת תגובות מדומות
-        mock_collections['posts'].count_documents.side_effect = [100, 5, 80]  # total, today, successful
-        mock_collections['users'].count_documents.return_value = 25
-        
-        # סטטיסטיקות פלטפורמות
-        platform_stats = [
-            {'_id': 'TikTok', 'count': 45},
-            {'_id': 'Twitter', 'count': 30},
-            {'_id': 'Instagram', 'count': 25}
+        # דליי סטטיסטיקות מחושבים מראש
+        mock_collections['statistics'].find.return_value = [
+            {
+                '_id': 'all', 'total': 100, 'by_status': {'completed': 80},
+                'by_platform': {
+                    'TikTok': {'total': 45}, 'Twitter': {'total': 30}, 'Instagram': {'total': 25}
+                }
+            },
+            {'_id': datetime.now().strftime('%Y-%m-%d'), 'total': 5, 'by_status': {}, 'by_platform': {}}
         ]
-        mock_collections['posts'].aggregate.return_value = platform_stats
+        mock_collections['user_counters'].estimated_document_count.return_value = 25
         
         db_manager = DatabaseManager()
         
@@ -360,52 +385,6 @@ class TestDatabaseManager:
         assert stats['popular_platforms']['TikTok'] == 45
         assert stats['popular_platforms']['Twitter'] == 30
     
-    @patch('database.MongoClient')
-    def test_cleanup_old_posts(self, mock_mongo_client_class):
-        """בדיקת ניקוי פוסטים ישנים"""
-        mock_client, mock_db, mock_collections = self.mock_mongo_client()
-        mock_mongo_client_class.return_value = mock_client
-        
-        mock_result = Mock()
-        mock_result.deleted_count = 15
-        mock_collections['posts'].delete_many.return_value = mock_result
-        
-        db_manager = DatabaseManager()
-        
-        # ניקוי פוסטים
-        db_manager.cleanup_old_posts(days_old=30)
-        
-        # בדיקות
-        mock_collections['posts'].delete_many.assert_called_once()
-        
-        call_args = mock_collections['posts'].delete_many.call_args[0][0]
-        assert 'created_at' in call_args
-        assert '$lt' in call_args['created_at']
-        assert 'status' in call_args
-        assert call_args['status']['$in'] == ['completed', 'failed']
-    
-    @patch('database.MongoClient')
-    def test_cleanup_old_logs(self, mock_mongo_client_class):
-        """בדיקת ניקוי לוגים ישנים"""
-        mock_client, mock_db, mock_collections = self.mock_mongo_client()
-        mock_mongo_client_class.return_value = mock_client
-        
-        mock_result = Mock()
-        mock_result.deleted_count = 50
-        mock_collections['logs'].delete_many.return_value = mock_result
-        
-        db_manager = DatabaseManager()
-        
-        # ניקוי לוגים
-        db_manager.cleanup_old_logs(days_old=7)
-        
-        # בדיקות
-        mock_collections['logs'].delete_many.assert_called_once()
-        
-        call_args = mock_collections['logs'].delete_many.call_args[0][0]
-        assert 'timestamp' in call_args
-        assert '$lt' in call_args['timestamp']
-    
     @patch('database.MongoClient')
     def test_health_check_success(self, mock_mongo_client_class):
         """בדיקת health check מוצלח"""
@@ -474,23 +453,22 @@ class TestDatabaseManager:
         mock_collections['logs'].insert_one.assert_called_once()
         
         call_args = mock_collections['logs'].insert_one.call_args[0][0]
-        assert call_args['user_id'] == 12345
-        assert call_args['action'] == "video_uploaded"
+        assert call_args['meta'] == {'user_id': 12345, 'action': "video_uploaded", 'level': "info"}
         assert call_args['details']['filename'] == "test.mp4"
-        assert call_args['level'] == "info"
         assert 'timestamp' in call_args
 
 class TestDatabaseHelperFunctions:
     """בדיקות לפונקציות עזר של מסד הנתונים"""
     
-    @patch('database.get_database')
-    def test_save_post_helper(self, mock_get_db):
+    @patch('database.get_async_database')
+    @pytest.mark.asyncio
+    async def test_save_post_helper(self, mock_get_db):
         """בדיקת פונקציית עזר לשמירת פוסט"""
         mock_db = Mock()
-        mock_db.save_post.return_value = "post_123"
+        mock_db.save_post = AsyncMock(return_value="post_123")
         mock_get_db.return_value = mock_db
         
-        result = save_post(
+        result = await save_post(
             user_id=12345,
             filename="test.mp4",
             text="טקסט",
@@ -499,17 +477,1768 @@ class TestDatabaseHelperFunctions:
         )
         
         assert result == "post_123"
-        mock_db.save_post.assert_called_once_with(12345, "test.mp4", "טקסט", ["TikTok"], 1.0)
+        mock_db.save_post.assert_awaited_once_with(12345, "test.mp4", "טקסט", ["TikTok"], 1.0)
     
-    @patch('database.get_database')
-    def test_update_post_status_helper(self, mock_get_db):
+    @patch('database.get_async_database')
+    @pytest.mark.asyncio
+    async def test_update_post_status_helper(self, mock_get_db):
         """בדיקת פונקציית עזר לעדכון סטטוס"""
         mock_db = Mock()
+        mock_db.update_post_status = AsyncMock()
         mock_get_db.return_value = mock_db
         
-        update_post_status("post_123", "completed", {"TikTok": "success"})
+        await update_post_status("post_123", "completed", {"TikTok": "success"})
+        
+        mock_db.update_post_status.assert_awaited_once_with("post_123", "completed", {"TikTok": "success"}, None)
+    
+    @patch('database.get_async_database')
+    @pytest.mark.asyncio
+    async def test_get_user_settings_helper(self, mock_get_db):
+        """בדיקת פונקציית עזר לקבלת הגדרות משתמש"""
+        mock_db = Mock()
+        mock_db.get_user_settings = AsyncMock(return_value={'mock_mode': True})
+        mock_get_db.return_value = mock_db
+        
+        settings = await get_user_settings(12345)
+        
+        assert settings == {'mock_mode': True}
+        mock_db.get_user_settings.assert_awaited_once_with(12345)
+
+class TestAsyncDatabaseManager:
+    """בדיקות למנהל מסד הנתונים האסינכרוני"""
+    
+    @pytest.fixture
+    def async_db(self, tmp_path):
+        """AsyncDatabaseManager עם לקוח motor מדומה (יומן הכתיבות בתיקייה זמנית)"""
+        mock_collections = {
+            'posts': Mock(),
+            'users': Mock(),
+            'logs': Mock(),
+            'user_counters': Mock(),
+            'statistics': Mock(),
+            'hashtag_counts': Mock(),
+            'schema_migrations': Mock(),
+            'sessions': Mock()
+        }
+        for collection in mock_collections.values():
+            for method in ('insert_one', 'update_one', 'replace_one', 'find_one', 'find_one_and_update',
+                           'count_documents', 'estimated_document_count', 'bulk_write',
+                           'delete_one', 'delete_many', 'create_index', 'drop_index', 'index_information'):
+                setattr(collection, method, AsyncMock())
+            # כל סוגי הפעולות מנותבים לאותו קולקשן מדומה
+            collection.with_options.return_value = collection
+        
+        # מסד חדש - אין גרסת סכימה, פוסטים או משתמשים כפולים, והאינדקסים של המיגרציות קיימים
+        mock_collections['schema_migrations'].find_one.return_value = None
+        mock_collections['users'].aggregate = Mock(return_value=Mock(to_list=AsyncMock(return_value=[])))
+        mock_collections['posts'].aggregate = Mock(return_value=Mock(to_list=AsyncMock(return_value=[])))
+        mock_collections['posts'].index_information.return_value = {
+            'user_history': {'key': [('user_id', 1), ('created_at', -1), ('_id', -1)]},
+            'user_status': {'key': [('user_id', 1), ('status', 1)]},
+            'user_hashtags': {'key': [('user_id', 1), ('hashtags', 1), ('created_at', -1), ('_id', -1)]},
+            'user_text_search': {'key': [('user_id', 1), ('_fts', 'text'), ('_ftsx', 1)]}
+        }
+        mock_collections['hashtag_counts'].index_information.return_value = {
+            'user_top': {'key': [('_id.user_id', 1), ('count', -1)]}
+        }
+        mock_collections['users'].index_information.return_value = {
+            'user_id_1': {'key': [('user_id', 1)], 'unique': True}
+        }
+        mock_collections['logs'].index_information.return_value = {
+            'user_logs': {'key': [('meta.user_id', 1), ('timestamp', -1)]}
+        }
+        
+        mock_db = Mock()
+        mock_db.posts = mock_collections['posts']
+        mock_db.users = mock_collections['users']
+        mock_db.logs = mock_collections['logs']
+        mock_db.user_counters = mock_collections['user_counters']
+        mock_db.statistics = mock_collections['statistics']
+        mock_db.hashtag_counts = mock_collections['hashtag_counts']
+        mock_db.schema_migrations = mock_collections['schema_migrations']
+        mock_db.sessions = mock_collections['sessions']
+        
+        # קולקשן הלוגים עדיין לא קיים
+        logs_cursor = Mock()
+        logs_cursor.to_list = AsyncMock(return_value=[])
+        mock_db.list_collections = AsyncMock(return_value=logs_cursor)
+        mock_db.create_collection = AsyncMock()
+        mock_db.command = AsyncMock()
+        
+        mock_client = MagicMock()
+        mock_client.__getitem__.return_value = mock_db
+        mock_client.admin.command = AsyncMock(return_value={'ok': 1})
+        
+        with patch('database.AsyncIOMotorClient', return_value=mock_client), \
+             patch.object(Config, 'DB_JOURNAL_FILE', str(tmp_path / 'journal.jsonl')):
+            db_manager = AsyncDatabaseManager()
+        
+        # change streams נבדקים ב-TestChangeStreamInvalidator
+        db_manager.cache_invalidator.start = Mock()
+        
+        return db_manager, mock_client, mock_collections
+    
+    def test_init_does_not_touch_network(self, async_db):
+        """יצירת המנהל לא מבצעת פעולות רשת"""
+        db_manager, mock_client, mock_collections = async_db
+        
+        assert {'posts', 'users', 'logs', 'user_counters', 'statistics'} <= set(db_manager.collections)
+        mock_client.admin.command.assert_not_called()
+        mock_collections['posts'].create_index.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_connect_pings_and_creates_indexes(self, async_db):
+        """connect מבצע ping ויוצר אינדקסים"""
+        db_manager, mock_client, mock_collections = async_db
+        
+        await db_manager.connect()
+        
+        mock_client.admin.command.assert_awaited_with('ping')
+        mock_collections['posts'].create_index.assert_awaited()
+        mock_collections['logs'].create_index.assert_awaited()
+        
+        await db_manager.flush_logs()
+    
+    def test_operation_class_routing(self, async_db):
+        """כל סוג פעולה מקבל read preference ו-write concern משלו"""
+        db_manager, _, mock_collections = async_db
+        
+        routed = {call.kwargs['read_preference'].mode: call.kwargs['write_concern']
+                  for call in mock_collections['posts'].with_options.call_args_list}
+        
+        assert set(db_manager.routes) == {'hot_write', 'hot_read', 'analytics', 'logs'}
+        assert ReadPreference.SECONDARY_PREFERRED.mode in routed
+        assert ReadPreference.PRIMARY.mode in routed
+    
+    def test_operation_options_write_concern(self):
+        """w מספרי / majority, ו-wtimeout רק לכתיבה עם אישור"""
+        with patch.dict(Config.DB_OPERATION_CLASSES, {
+            'logs': {'read_preference': 'primary', 'write_concern': '0', 'max_time_ms': 5000},
+            'hot_write': {'read_preference': 'primary', 'write_concern': 'majority', 'max_time_ms': 3000}
+        }):
+            logs_options = _operation_options('logs')
+            write_options = _operation_options('hot_write')
+        
+        assert logs_options['write_concern'].document == {'w': 0}
+        assert write_options['write_concern'].document == {'w': 'majority', 'wtimeout': 3000}
+        assert write_options['read_preference'] == ReadPreference.PRIMARY
+    
+    @pytest.mark.asyncio
+    async def test_connect_failure(self, async_db):
+        """כישלון ping מתורגם ל-ConnectionError"""
+        db_manager, mock_client, _ = async_db
+        mock_client.admin.command.side_effect = ConnectionFailure("Connection failed")
+        
+        with pytest.raises(ConnectionError):
+            await db_manager.connect()
+    
+    @pytest.mark.asyncio
+    async def test_save_post(self, async_db):
+        """שמירת פוסט אסינכרונית"""
+        db_manager, _, mock_collections = async_db
+        
+        post_id = await db_manager.save_post(12345, "test.mp4", "טקסט בדיקה", ["TikTok"], 1.5)
+        
+        # ה-ID נקבע בצד הלקוח
+        post_data = mock_collections['posts'].insert_one.call_args[0][0]
+        assert post_id == str(post_data['_id'])
+        assert post_data['user_id'] == 12345
+        assert post_data['status'] == 'created'
+    
+    @pytest.mark.asyncio
+    async def test_save_post_error(self, async_db):
+        """שגיאה בשמירת פוסט מתורגמת ל-SaveError"""
+        db_manager, _, mock_collections = async_db
+        mock_collections['posts'].insert_one.side_effect = OperationFailure("Insert failed")
+        
+        with pytest.raises(SaveError):
+            await db_manager.save_post(12345, "test.mp4", "test", ["TikTok"], 1.0)
+    
+    @pytest.mark.asyncio
+    async def test_update_post_status(self, async_db):
+        """עדכון סטטוס פוסט אסינכרוני"""
+        db_manager, _, mock_collections = async_db
+        mock_collections['posts'].find_one_and_update.return_value = {'user_id': 12345, 'status': 'processing'}
+        
+        await db_manager.update_post_status("507f1f77bcf86cd799439011", "completed", {"TikTok": {"status": "success"}})
+        
+        filter_arg, update_arg = mock_collections['posts'].find_one_and_update.call_args[0]
+        assert isinstance(filter_arg['_id'], ObjectId)
+        assert update_arg[0]['$set']['status'] == 'completed'
+        
+        # מזהה הפעולה נרשם בפוסט עם הסטטוס הקודם, ובמסמך המונים
+        op_id = filter_arg['applied_ops.op_id']['$ne']
+        assert update_arg[0]['$set']['applied_ops']['$slice'][0]['$concatArrays'][1] == [
+            {'op_id': op_id, 'from_status': '$status'}
+        ]
+        
+        # מעבר סטטוס מעדכן את מוני המשתמש
+        counters_filter, counters_update = mock_collections['user_counters'].update_one.call_args[0]
+        assert counters_filter == {'_id': 12345, 'applied_ops': {'$ne': op_id}}
+        assert counters_update['$inc'] == {'by_status.completed': 1, 'by_status.processing': -1}
+    
+    @pytest.mark.asyncio
+    async def test_record_platform_result(self, async_db):
+        """תוצאת פלטפורמה נשמרת בעדכון אטומי אחד של posting_results.<platform> ומוני progress"""
+        db_manager, _, mock_collections = async_db
+        result = {'status': 'failed', 'error': '$quota exceeded'}
+        
+        await db_manager.record_platform_result("507f1f77bcf86cd799439011", "TikTok", result)
+        
+        filter_arg, pipeline = mock_collections['posts'].update_one.call_args[0]
+        assert filter_arg['_id'] == ObjectId("507f1f77bcf86cd799439011")
+        
+        # הרצה חוזרת של אותה תוצאה (מהיומן) לא תתאים לסינון - progress לא נספר פעמיים
+        op_id = filter_arg['applied_ops.op_id']['$ne']
+        assert isinstance(op_id, ObjectId)
+        
+        stage = pipeline[0]['$set']
+        assert stage['posting_results.TikTok'] == {'$literal': result}
+        assert {'progress.succeeded', 'progress.failed', 'updated_at', 'applied_ops'} <= set(stage)
+    
+    @pytest.mark.asyncio
+    async def test_get_completed_platforms(self, async_db):
+        """רק פלטפורמות שהצליחו נחשבות כבוצעו"""
+        db_manager, _, mock_collections = async_db
+        mock_collections['posts'].find_one.return_value = {'posting_results': {
+            'TikTok': {'status': 'success'},
+            'Twitter': {'status': 'failed', 'error': 'timeout'},
+            'YouTube': {'status': 'mock_success'}
+        }}
+        
+        completed = await db_manager.get_completed_platforms("507f1f77bcf86cd799439011")
+        
+        assert completed == ['TikTok', 'YouTube']
+        assert mock_collections['posts'].find_one.call_args[0][1] == {'posting_results': 1}
+    
+    @pytest.mark.asyncio
+    async def test_final_status_sets_expiry(self, async_db):
+        """סטטוס סופי קובע expires_at, וסטטוס ביניים מסיר אותו"""
+        db_manager, _, mock_collections = async_db
+        mock_collections['posts'].find_one_and_update.return_value = {'user_id': 12345, 'status': 'processing'}
+        
+        await db_manager.update_post_status("507f1f77bcf86cd799439011", "failed")
+        update_arg = mock_collections['posts'].find_one_and_update.call_args[0][1]
+        
+        expected = datetime.utcnow() + timedelta(days=Config.POST_RETENTION_DAYS)
+        assert abs(update_arg[0]['$set']['expires_at'] - expected) < timedelta(minutes=1)
+        assert len(update_arg) == 1
+        
+        await db_manager.update_post_status("507f1f77bcf86cd799439011", "processing")
+        update_arg = mock_collections['posts'].find_one_and_update.call_args[0][1]
+        
+        assert 'expires_at' not in update_arg[0]['$set']
+        assert update_arg[1] == {'$unset': 'expires_at'}
+    
+    @pytest.mark.asyncio
+    async def test_connect_creates_ttl_indexes(self, async_db):
+        """connect יוצר אינדקס TTL לפוסטים וקולקשן לוגים time-series עם תפוגה מובנית"""
+        db_manager, _, mock_collections = async_db
+        
+        await db_manager.connect()
+        await db_manager.flush_logs()
+        
+        mock_collections['posts'].create_index.assert_any_await([("expires_at", 1)], expireAfterSeconds=0)
+        db_manager.db.create_collection.assert_awaited_once_with(
+            'logs',
+            timeseries={'timeField': 'timestamp', 'metaField': 'meta', 'granularity': 'seconds'},
+            expireAfterSeconds=Config.LOG_RETENTION_DAYS * 24 * 3600
+        )
+        mock_collections['logs'].create_index.assert_any_await([("meta.user_id", 1), ("timestamp", -1)])
+    
+    @pytest.mark.asyncio
+    async def test_migrations_applied_and_recorded(self, async_db):
+        """במסד חדש כל המיגרציות רצות, כולל אינדקס ייחודי על users.user_id, ונרשמות לפי גרסה"""
+        db_manager, _, mock_collections = async_db
+        
+        await db_manager._create_indexes()
+        
+        mock_collections['users'].create_index.assert_awaited_once_with("user_id", unique=True)
+        mock_collections['sessions'].create_index.assert_awaited_once_with([("expires_at", 1)], expireAfterSeconds=0)
+        recorded = [call.args[0]['_id'] for call in mock_collections['schema_migrations'].update_one.await_args_list]
+        assert recorded == [version for version, _ in SCHEMA_MIGRATIONS]
+    
+    @pytest.mark.asyncio
+    async def test_migrations_wait_for_lock(self, async_db):
+        """מופע אחר מחזיק בנעילה - ממתינים, ואם בינתיים הוא החיל את המיגרציות לא מריצים אותן שוב"""
+        db_manager, _, mock_collections = async_db
+        migrations = mock_collections['schema_migrations']
+        migrations.find_one_and_update.side_effect = [DuplicateKeyError("lock held"), {'_id': 'lock'}]
+        migrations.find_one.side_effect = [None, {'_id': SCHEMA_VERSION}]
+        
+        with patch('database.asyncio.sleep', AsyncMock()) as sleep:
+            await db_manager._create_indexes()
+        
+        sleep.assert_awaited_once()
+        assert migrations.find_one.call_args.args[0] == {'_id': {'$type': 'number'}}
+        migrations.update_one.assert_not_awaited()
+        mock_collections['users'].create_index.assert_not_awaited()
+        
+        # הנעילה משוחררת רק אם היא שלנו
+        owner = migrations.find_one_and_update.call_args.args[1]['$set']['owner']
+        migrations.delete_one.assert_awaited_once_with({'_id': 'lock', 'owner': owner})
+    
+    @pytest.mark.asyncio
+    async def test_sessions_persisted_by_post_id(self, async_db):
+        """סשן נשמר לפי post_id, נמחק כשנסגר, ונטען רק אם עוד לא פג"""
+        db_manager, _, mock_collections = async_db
+        session = {'post_id': 'p1', 'user_id': 12345, 'expires_at': datetime.utcnow() + timedelta(hours=1)}
+        mock_collections['sessions'].find = Mock(return_value=Mock(to_list=AsyncMock(return_value=[session])))
+        
+        await db_manager.save_session(session)
+        await db_manager.delete_session('p1')
+        loaded = await db_manager.load_sessions()
+        
+        mock_collections['sessions'].replace_one.assert_awaited_once_with({'_id': 'p1'}, {'_id': 'p1', **session}, upsert=True)
+        mock_collections['sessions'].delete_one.assert_awaited_once_with({'_id': 'p1'})
+        query = mock_collections['sessions'].find.call_args.args[0]
+        assert set(query['expires_at']) == {'$gt'}
+        assert loaded == [session]
+    
+    @pytest.mark.asyncio
+    async def test_current_schema_skips_index_creation(self, async_db):
+        """כשהגרסה עדכנית לא נוצרים אינדקסים - רק בדיקת האינדקסים"""
+        db_manager, _, mock_collections = async_db
+        mock_collections['schema_migrations'].find_one.return_value = {'_id': SCHEMA_VERSION}
+        cursor = await db_manager.db.list_collections()
+        cursor.to_list.return_value = [
+            {'name': 'logs', 'type': 'timeseries', 'options': {'expireAfterSeconds': Config.LOG_RETENTION_DAYS * 24 * 3600}}
+        ]
+        
+        await db_manager._create_indexes()
         
-        mock_db.update_post_status.assert_called_once_with("post_123", "completed", {"TikTok": "success"})
+        mock_collections['posts'].create_index.assert_not_awaited()
+        mock_collections['users'].create_index.assert_not_awaited()
+        mock_collections['schema_migrations'].update_one.assert_not_awaited()
+        mock_collections['posts'].index_information.assert_awaited()
+    
+    @pytest.mark.asyncio
+    async def test_duplicate_users_removed_before_unique_index(self, async_db):
+        """משתמשים כפולים מוסרים (נשאר המעודכן ביותר) לפני יצירת האינדקס הייחודי"""
+        db_manager, _, mock_collections = async_db
+        newest, older, oldest = ObjectId(), ObjectId(), ObjectId()
+        mock_collections['users'].aggregate.return_value.to_list.return_value = [
+            {'_id': 12345, 'ids': [newest, older, oldest], 'count': 3}
+        ]
+        
+        await db_manager._run(db_manager._migrate_v2_ops())
+        
+        mock_collections['users'].delete_many.assert_awaited_once_with({'_id': {'$in': [older, oldest]}})
+        mock_collections['users'].create_index.assert_awaited_once_with("user_id", unique=True)
+    
+    @pytest.mark.asyncio
+    async def test_legacy_history_index_dropped(self, async_db):
+        """מיגרציה 6 מסירה את אינדקס (user_id, created_at) הישן, וממשיכה אם הוא לא קיים"""
+        db_manager, _, mock_collections = async_db
+        
+        await db_manager._run(db_manager._migrate_v6_ops())
+        mock_collections['posts'].drop_index.assert_awaited_once_with([("user_id", 1), ("created_at", -1)])
+        
+        mock_collections['posts'].drop_index.side_effect = OperationFailure("index not found", code=27)
+        await db_manager._run(db_manager._migrate_v6_ops())
+    
+    @pytest.mark.asyncio
+    async def test_missing_hot_index_fails_startup(self, async_db):
+        """אתחול נכשל אם לשאילתה חמה אין אינדקס תומך"""
+        db_manager, _, mock_collections = async_db
+        mock_collections['users'].index_information.return_value = {'_id_': {'key': [('_id', 1)]}}
+        
+        with pytest.raises(DatabaseError, match="users"):
+            await db_manager.connect()
+    
+    @pytest.mark.asyncio
+    async def test_timeseries_logs_expiry_updated(self, async_db):
+        """שינוי LOG_RETENTION_DAYS מעדכן את התפוגה של קולקשן time-series קיים"""
+        db_manager, _, _ = async_db
+        cursor = await db_manager.db.list_collections()
+        cursor.to_list.return_value = [{'name': 'logs', 'type': 'timeseries', 'options': {'expireAfterSeconds': 60}}]
+        
+        await db_manager._run(db_manager._ensure_logs_collection_ops())
+        
+        db_manager.db.create_collection.assert_not_awaited()
+        db_manager.db.command.assert_awaited_once_with(
+            {'collMod': 'logs', 'expireAfterSeconds': Config.LOG_RETENTION_DAYS * 24 * 3600}
+        )
+    
+    @pytest.mark.asyncio
+    async def test_legacy_logs_keep_ttl_index(self, async_db):
+        """קולקשן לוגים רגיל (לפני migrate-logs) ממשיך עם אינדקס TTL"""
+        db_manager, _, mock_collections = async_db
+        cursor = await db_manager.db.list_collections()
+        cursor.to_list.return_value = [{'name': 'logs', 'type': 'collection', 'options': {}}]
+        
+        await db_manager._run(db_manager._ensure_logs_collection_ops())
+        
+        db_manager.db.create_collection.assert_not_awaited()
+        mock_collections['logs'].create_index.assert_any_await(
+            [("timestamp", -1)], expireAfterSeconds=Config.LOG_RETENTION_DAYS * 24 * 3600
+        )
+    
+    @pytest.mark.asyncio
+    async def test_log_action_uses_timeseries_meta(self, async_db):
+        """רשומת לוג נשמרת עם meta (user_id, action, level)"""
+        db_manager, _, _ = async_db
+        
+        await db_manager.log_action(12345, "post_created", {"post_id": "p1"}, level="info")
+        
+        record = db_manager.log_writer._buffer[0]
+        assert record['meta'] == {'user_id': 12345, 'action': "post_created", 'level': "info"}
+        assert record['details'] == {"post_id": "p1"}
+        assert isinstance(record['timestamp'], datetime)
+    
+    @pytest.mark.asyncio
+    async def test_existing_index_converted_with_coll_mod(self, async_db):
+        """אינדקס לוגים קיים (ללא TTL / תפוגה אחרת) מעודכן ב-collMod"""
+        db_manager, _, mock_collections = async_db
+        db_manager.db.command = AsyncMock()
+        mock_collections['logs'].create_index.side_effect = OperationFailure("conflict", code=85)
+        
+        await db_manager._run(db_manager._ensure_ttl_index_ops('logs', [("timestamp", -1)], 3600))
+        
+        db_manager.db.command.assert_awaited_once_with({
+            'collMod': 'logs',
+            'index': {'keyPattern': {'timestamp': -1}, 'expireAfterSeconds': 3600}
+        })
+    
+    @pytest.mark.asyncio
+    async def test_save_post_increments_counters(self, async_db):
+        """שמירת פוסט מגדילה את המונים - מסמך המונים נוצר ב-upsert, בלי קריאה מקדימה"""
+        db_manager, _, mock_collections = async_db
+        mock_collections['posts'].insert_one.return_value = Mock(inserted_id=ObjectId())
+        
+        post_id = ObjectId(await db_manager.save_post(12345, "test.mp4", "טקסט", ["TikTok"], 1.0))
+        
+        # מזהה הפעולה (ה-_id של הפוסט) נרשם במסמך המונים - הרצה חוזרת לא תספור שוב
+        mock_collections['user_counters'].update_one.assert_awaited_once_with(
+            {'_id': 12345, 'applied_ops': {'$ne': post_id}},
+            {'$inc': {'by_status.created': 1, 'total': 1},
+             '$push': {'applied_ops': {'$each': [post_id], '$slice': -APPLIED_OPS_KEPT}}},
+            upsert=True
+        )
+        mock_collections['user_counters'].find_one.assert_not_awaited()
+    
+    @pytest.mark.asyncio
+    async def test_save_post_journaled_when_unreachable(self, async_db):
+        """מסד לא זמין - הפוסט נרשם ביומן, וכתיבות הבאות נכנסות אחריו ביומן לפי הסדר"""
+        db_manager, _, mock_collections = async_db
+        db_manager._start_journal_replay = Mock()
+        mock_collections['posts'].insert_one.side_effect = ConnectionFailure("Connection lost")
+        
+        with patch('database.asyncio.to_thread', wraps=asyncio.to_thread) as to_thread:
+            post_id = await db_manager.save_post(12345, "test.mp4", "טקסט", ["TikTok"], 1.0)
+            await db_manager.record_platform_result(post_id, 'TikTok', {'status': 'success'})
+        
+        # ה-fsync של היומן רץ בת'רד, לא בלולאת האירועים
+        assert [call.args[0] for call in to_thread.call_args_list] == [db_manager.journal.sync] * 2
+        
+        entries = db_manager.journal.pending_entries()
+        assert [entry['operation'] for entry in entries] == ['save_post', 'record_platform_result']
+        assert str(entries[0]['payload']['post']['_id']) == post_id
+        
+        # הכתיבה השנייה לא נוסתה ישירות - היא חייבת לחכות לפוסט שלפניה
+        mock_collections['posts'].update_one.assert_not_called()
+        mock_collections['user_counters'].update_one.assert_not_called()
+        db_manager._start_journal_replay.assert_called()
+    
+    @pytest.mark.asyncio
+    async def test_completed_platforms_include_journal(self, async_db):
+        """מסד לא זמין - תוצאות שממתינות ביומן נחשבות כדי לא לפרסם פעמיים"""
+        db_manager, _, mock_collections = async_db
+        post_id = str(ObjectId())
+        db_manager.journal.append('record_platform_result', {
+            'post_id': post_id, 'platform': 'TikTok', 'result': {'status': 'success'}
+        })
+        mock_collections['posts'].find_one.side_effect = ConnectionFailure("Connection lost")
+        
+        assert await db_manager.get_completed_platforms(post_id) == ['TikTok']
+    
+    @pytest.mark.asyncio
+    async def test_replay_journal_in_order(self, async_db):
+        """העברת היומן - לפי הסדר, פוסט שכבר נשמר לא נוסף שוב (המונים מושלמים פעם אחת), והקובץ נמחק בסוף"""
+        db_manager, _, mock_collections = async_db
+        db_manager._start_journal_replay = Mock()
+        mock_collections['posts'].insert_one.side_effect = ConnectionFailure("Connection lost")
+        mock_collections['posts'].update_one.return_value = Mock(matched_count=1)
+        
+        post_id = await db_manager.save_post(12345, "test.mp4", "טקסט", ["TikTok"], 1.0)
+        await db_manager.record_platform_result(post_id, 'TikTok', {'status': 'success'})
+        
+        # ההוספה הראשונה הגיעה לשרת לפני שהחיבור נפל
+        mock_collections['posts'].insert_one.side_effect = DuplicateKeyError("duplicate")
+        
+        assert await db_manager.replay_journal() == 2
+        
+        assert db_manager.journal.pending() == 0
+        assert not os.path.exists(db_manager.journal.path)
+        mock_collections['posts'].update_one.assert_awaited_once()
+        mock_collections['user_counters'].update_one.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_replay_completes_counters_after_insert(self, async_db):
+        """החיבור נפל בין הוספת הפוסט למונים - ההרצה מהיומן משלימה את המונים, והרצה נוספת לא סופרת שוב"""
+        db_manager, _, mock_collections = async_db
+        db_manager._start_journal_replay = Mock()
+        mock_collections['user_counters'].update_one.side_effect = ConnectionFailure("Connection lost")
+        
+        post_id = ObjectId(await db_manager.save_post(12345, "test.mp4", "טקסט", ["TikTok"], 1.0))
+        
+        # ההוספה הגיעה לשרת, המונים לא - הכתיבה כולה ביומן
+        mock_collections['posts'].insert_one.assert_awaited_once()
+        assert db_manager.journal.pending() == 1
+        payload = db_manager.journal.peek()['payload']
+        
+        mock_collections['posts'].insert_one.side_effect = DuplicateKeyError("duplicate")
+        mock_collections['user_counters'].update_one.side_effect = None
+        
+        assert await db_manager.replay_journal() == 1
+        
+        counters_filter, counters_update = mock_collections['user_counters'].update_one.call_args[0]
+        assert counters_filter == {'_id': 12345, 'applied_ops': {'$ne': post_id}}
+        assert counters_update['$inc'] == {'by_status.created': 1, 'total': 1}
+        statistics = mock_collections['statistics'].bulk_write.call_args[0][0]
+        assert statistics[1]._filter == {'_id': 'all', 'applied_ops': {'$ne': post_id}}
+        
+        # המונים כבר עודכנו בפעולה הזו - ה-upsert נכשל במפתח כפול, וזו לא שגיאה
+        mock_collections['user_counters'].update_one.side_effect = DuplicateKeyError("duplicate")
+        mock_collections['statistics'].bulk_write.side_effect = BulkWriteError({
+            'writeErrors': [{'index': 0, 'code': 11000, 'errmsg': 'duplicate'}], 'writeConcernErrors': []
+        })
+        db_manager.journal.append('save_post', payload)
+        
+        assert await db_manager.replay_journal() == 1
+        assert db_manager.journal.pending() == 0
+    
+    @pytest.mark.asyncio
+    async def test_status_replay_uses_recorded_previous_status(self, async_db):
+        """עדכון סטטוס שכבר הוחל על הפוסט - המונים מחושבים מהסטטוס הקודם שנשמר עם מזהה הפעולה"""
+        db_manager, _, mock_collections = async_db
+        op_id = ObjectId()
+        mock_collections['posts'].find_one_and_update.return_value = None
+        mock_collections['posts'].find_one.return_value = {
+            'user_id': 12345, 'status': 'completed', 'applied_ops': [{'op_id': op_id, 'from_status': 'processing'}]
+        }
+        
+        await db_manager._apply_status_update("507f1f77bcf86cd799439011", "completed", op_id=op_id)
+        
+        counters_filter, counters_update = mock_collections['user_counters'].update_one.call_args[0]
+        assert counters_filter == {'_id': 12345, 'applied_ops': {'$ne': op_id}}
+        assert counters_update['$inc'] == {'by_status.completed': 1, 'by_status.processing': -1}
+    
+    @pytest.mark.asyncio
+    async def test_replay_journal_stops_on_connection_failure(self, async_db):
+        """החיבור נפל שוב באמצע - הרשומה נשארת ביומן לניסיון הבא"""
+        db_manager, _, mock_collections = async_db
+        db_manager.journal.append('update_post_status', {
+            'post_id': str(ObjectId()), 'status': 'completed', 'posting_results': None, 'error': None
+        })
+        mock_collections['posts'].find_one_and_update.side_effect = ConnectionFailure("Connection lost")
+        
+        assert await db_manager.replay_journal() == 0
+        assert db_manager.journal.pending() == 1
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('error', [
+        ExecutionTimeout("operation exceeded time limit", 50),
+        WTimeoutError("waiting for replication timed out", 64),
+        OperationFailure("not primary", 10107, {'errorLabels': ['RetryableWriteError']})
+    ])
+    async def test_replay_journal_stops_on_transient_error(self, async_db, error):
+        """timeout, write concern ותקלה עם RetryableWriteError - הרשומה נשארת ביומן, לא נדחית"""
+        db_manager, _, mock_collections = async_db
+        db_manager.journal.append('update_post_status', {
+            'post_id': str(ObjectId()), 'status': 'completed', 'posting_results': None, 'error': None
+        })
+        mock_collections['posts'].find_one_and_update.side_effect = error
+        
+        assert await db_manager.replay_journal() == 0
+        assert db_manager.journal.pending() == 1
+        assert not os.path.exists(db_manager.journal.rejected_path)
+    
+    @pytest.mark.asyncio
+    async def test_replay_journal_rejects_deterministic_error(self, async_db):
+        """שגיאה קבועה (ולידציה, פעולה לא מוכרת) - הרשומה עוברת לדחויות וההעברה ממשיכה"""
+        db_manager, _, mock_collections = async_db
+        db_manager.journal.append('update_post_status', {
+            'post_id': str(ObjectId()), 'status': 'completed', 'posting_results': None, 'error': None
+        })
+        db_manager.journal.append('unknown_operation', {})
+        mock_collections['posts'].find_one_and_update.side_effect = WriteError("Document failed validation", 121)
+        
+        assert await db_manager.replay_journal() == 0
+        assert db_manager.journal.pending() == 0
+        with open(db_manager.journal.rejected_path, encoding='utf-8') as rejected_file:
+            assert len(rejected_file.readlines()) == 2
+    
+    @pytest.mark.asyncio
+    async def test_count_user_posts_from_counters(self, async_db):
+        """ספירת פוסטים - קריאה אחת של מסמך המונים"""
+        db_manager, _, mock_collections = async_db
+        mock_collections['user_counters'].find_one.return_value = {
+            '_id': 12345, 'total': 250, 'by_status': {'completed': 240, 'failed': 10}
+        }
+        
+        assert await db_manager.count_user_posts(12345) == 250
+        assert await db_manager.count_user_posts(12345, 'failed') == 10
+        mock_collections['posts'].aggregate.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_count_user_posts_without_counters(self, async_db):
+        """ללא מסמך מונים (משתמש בלי פוסטים) - אפס, בלי ספירה מהפוסטים"""
+        db_manager, _, mock_collections = async_db
+        mock_collections['user_counters'].find_one.return_value = None
+        
+        assert await db_manager.get_user_post_counts(12345) == {'total': 0, 'by_status': {}}
+        mock_collections['posts'].aggregate.assert_not_called()
+        mock_collections['user_counters'].update_one.assert_not_awaited()
+    
+    @pytest.mark.asyncio
+    async def test_counters_seeded_in_migration(self, async_db):
+        """מיגרציה 7 מאתחלת את המונים של כל המשתמשים מהפוסטים, בלי לדרוס מונים קיימים"""
+        db_manager, _, mock_collections = async_db
+        mock_collections['posts'].aggregate.return_value.to_list.return_value = [
+            {'_id': {'user_id': 1, 'status': 'completed'}, 'count': 3},
+            {'_id': {'user_id': 1, 'status': 'failed'}, 'count': 1},
+            {'_id': {'user_id': 2, 'status': 'created'}, 'count': 2}
+        ]
+        
+        await db_manager._run(db_manager._migrate_v7_ops())
+        
+        seeds = mock_collections['user_counters'].bulk_write.call_args[0][0]
+        assert [(seed._filter, seed._doc) for seed in seeds] == [
+            ({'_id': 1}, {'$setOnInsert': {'total': 4, 'by_status': {'completed': 3, 'failed': 1}}}),
+            ({'_id': 2}, {'$setOnInsert': {'total': 2, 'by_status': {'created': 2}}})
+        ]
+        assert all(seed._upsert for seed in seeds)
+    
+    @pytest.mark.asyncio
+    async def test_get_user_posts(self, async_db):
+        """קבלת פוסטים דרך cursor אסינכרוני"""
+        db_manager, _, mock_collections = async_db
+        mock_cursor = Mock()
+        mock_cursor.sort.return_value = mock_cursor
+        mock_cursor.limit.return_value = mock_cursor
+        mock_cursor.to_list = AsyncMock(return_value=[{'_id': ObjectId(), 'user_id': 12345}])
+        mock_collections['posts'].find.return_value = mock_cursor
+        
+        posts = await db_manager.get_user_posts(12345, limit=5)
+        
+        assert len(posts) == 1
+        assert isinstance(posts[0]['_id'], str)
+        mock_cursor.limit.assert_called_once_with(5)
+    
+    @pytest.mark.asyncio
+    async def test_get_user_posts_page(self, async_db):
+        """עמוד היסטוריה - projection, מיון keyset ונשלף פוסט נוסף לזיהוי עמוד הבא"""
+        db_manager, _, mock_collections = async_db
+        created_at = datetime(2024, 3, 1, 9, 30, 0, 123000)
+        post_ids = [ObjectId() for _ in range(3)]
+        mock_cursor = Mock()
+        mock_cursor.sort.return_value = mock_cursor
+        mock_cursor.limit.return_value = mock_cursor
+        mock_cursor.to_list = AsyncMock(return_value=[
+            {'_id': post_id, 'created_at': created_at, 'status': 'completed'} for post_id in post_ids
+        ])
+        mock_collections['posts'].find.return_value = mock_cursor
+        
+        page = await db_manager.get_user_posts_page(12345, limit=2)
+        
+        query, projection = mock_collections['posts'].find.call_args[0]
+        assert query == {'user_id': 12345}
+        assert 'text' not in projection and 'posting_results' not in projection
+        assert projection['created_at'] == 1
+        mock_cursor.sort.assert_called_once_with([('created_at', -1), ('_id', -1)])
+        mock_cursor.limit.assert_called_once_with(3)
+        
+        assert [post['_id'] for post in page['posts']] == [str(post_id) for post_id in post_ids[:2]]
+        assert page['next_cursor'] == f"{int(created_at.replace(tzinfo=timezone.utc).timestamp() * 1000)}.{post_ids[1]}"
+    
+    @pytest.mark.asyncio
+    async def test_save_post_stores_hashtags(self, async_db):
+        """האשטגים נשמרים מנורמלים בפוסט וכל תגית מגדילה את המונה שלה"""
+        db_manager, _, mock_collections = async_db
+        
+        await db_manager.save_post(12345, "test.mp4", "חג שמח #פסח #Family #family", ["TikTok"], 1.0)
+        
+        post_data = mock_collections['posts'].insert_one.call_args[0][0]
+        assert post_data['hashtags'] == ['פסח', 'family']
+        
+        requests = mock_collections['hashtag_counts'].bulk_write.call_args[0][0]
+        assert [request._filter['_id'] for request in requests] == [
+            {'user_id': 12345, 'tag': 'פסח'}, {'user_id': 12345, 'tag': 'family'}
+        ]
+        assert requests[0]._doc['$inc'] == {'count': 1}
+    
+    @pytest.mark.asyncio
+    async def test_get_posts_by_hashtag(self, async_db):
+        """חיפוש לפי האשטג - תגית מנורמלת, אותו מיון keyset כמו בהיסטוריה"""
+        db_manager, _, mock_collections = async_db
+        mock_cursor = Mock()
+        mock_cursor.sort.return_value = mock_cursor
+        mock_cursor.limit.return_value = mock_cursor
+        mock_cursor.to_list = AsyncMock(return_value=[])
+        mock_collections['posts'].find.return_value = mock_cursor
+        
+        await db_manager.get_posts_by_hashtag(12345, '#Family', limit=5)
+        
+        query = mock_collections['posts'].find.call_args[0][0]
+        assert query == {'user_id': 12345, 'hashtags': 'family'}
+        mock_cursor.sort.assert_called_once_with([('created_at', -1), ('_id', -1)])
+    
+    @pytest.mark.asyncio
+    async def test_search_posts_ranked_pages(self, async_db):
+        """חיפוש טקסט - $text עם user_id בשלב הראשון, מיון לפי ציון ו-_id, וסמן מהציון המעוגל"""
+        db_manager, _, mock_collections = async_db
+        posts = [
+            {'_id': ObjectId(), 'score': 2.5, 'created_at': datetime.now()},
+            {'_id': ObjectId(), 'score': 1.333333, 'created_at': datetime.now()},
+            {'_id': ObjectId(), 'score': 1.0, 'created_at': datetime.now()}
+        ]
+        mock_collections['posts'].aggregate = Mock(return_value=Mock(to_list=AsyncMock(return_value=posts)))
+        
+        page = await db_manager.search_posts(12345, '  עוגת   שוקולד ', limit=2)
+        
+        pipeline = mock_collections['posts'].aggregate.call_args[0][0]
+        assert pipeline[0] == {'$match': {'user_id': 12345, '$text': {'$search': 'עוגת שוקולד'}}}
+        assert {'$sort': {'score': -1, '_id': -1}} in pipeline
+        assert pipeline[-1]['$project']['text_preview'] == 1 and 'text' not in pipeline[-1]['$project']
+        assert page['next_cursor'] == f"1.333333_{posts[1]['_id']}"
+        assert len(page['posts']) == 2
+        
+        await db_manager.search_posts(12345, 'שוקולד', limit=2, cursor=page['next_cursor'])
+        keyset = mock_collections['posts'].aggregate.call_args[0][0][2]['$match']['$or']
+        assert keyset == [{'score': {'$lt': 1.333333}}, {'score': 1.333333, '_id': {'$lt': ObjectId(posts[1]['_id'])}}]
+        
+        assert await db_manager.search_posts(12345, '   ') == {'posts': [], 'next_cursor': None}
+    
+    @pytest.mark.asyncio
+    async def test_get_user_hashtags_from_counters(self, async_db):
+        """ההאשטגים הנפוצים - מהמונים, לפי count יורד"""
+        db_manager, _, mock_collections = async_db
+        mock_cursor = Mock()
+        mock_cursor.sort.return_value = mock_cursor
+        mock_cursor.limit.return_value = mock_cursor
+        mock_cursor.to_list = AsyncMock(return_value=[{'_id': {'user_id': 12345, 'tag': 'פסח'}, 'count': 7}])
+        mock_collections['hashtag_counts'].find.return_value = mock_cursor
+        
+        hashtags = await db_manager.get_user_hashtags(12345)
+        
+        assert hashtags == [{'tag': 'פסח', 'count': 7}]
+        assert mock_collections['hashtag_counts'].find.call_args[0][0] == {'_id.user_id': 12345}
+        mock_cursor.sort.assert_called_once_with('count', -1)
+    
+    @pytest.mark.asyncio
+    async def test_get_user_posts_page_with_cursor(self, async_db):
+        """סמן מתורגם לתנאי keyset על (created_at, _id), ועמוד אחרון בלי סמן המשך"""
+        db_manager, _, mock_collections = async_db
+        post_id = ObjectId()
+        mock_cursor = Mock()
+        mock_cursor.sort.return_value = mock_cursor
+        mock_cursor.limit.return_value = mock_cursor
+        mock_cursor.to_list = AsyncMock(return_value=[])
+        mock_collections['posts'].find.return_value = mock_cursor
+        
+        page = await db_manager.get_user_posts_page(12345, limit=2, cursor=f"1709285400123.{post_id}")
+        
+        query = mock_collections['posts'].find.call_args[0][0]
+        created_at = datetime(2024, 3, 1, 9, 30, 0, 123000)
+        assert query['$or'] == [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, '_id': {'$lt': post_id}}
+        ]
+        assert page == {'posts': [], 'next_cursor': None}
+    
+    @pytest.mark.asyncio
+    async def test_get_user_settings_existing_user(self, async_db):
+        """קבלת הגדרות משתמש קיים"""
+        db_manager, _, mock_collections = async_db
+        mock_collections['users'].find_one.return_value = {'user_id': 12345, 'settings': {'mock_mode': False}}
+        
+        settings = await db_manager.get_user_settings(12345)
+        
+        assert settings == {'mock_mode': False}
+    
+    @pytest.mark.asyncio
+    async def test_health_check(self, async_db):
+        """בדיקת בריאות אסינכרונית"""
+        db_manager, mock_client, _ = async_db
+        
+        assert await db_manager.health_check() is True
+        
+        mock_client.admin.command.side_effect = Exception("Connection lost")
+        assert await db_manager.health_check() is False
+
+class TestLogsMigration:
+    """בדיקות להמרת קולקשן הלוגים הרגיל ל-time-series"""
+    
+    @pytest.fixture
+    def sync_db(self):
+        """DatabaseManager עם לקוח pymongo מדומה וקולקשן לוגים רגיל"""
+        mock_collections = {
+            name: MagicMock()
+            for name in ('posts', 'users', 'logs', 'user_counters', 'statistics', 'logs_legacy')
+        }
+        for collection in mock_collections.values():
+            collection.with_options.return_value = collection
+        
+        mock_db = MagicMock()
+        mock_db.__getitem__.side_effect = lambda key: mock_collections[key]
+        for name, collection in mock_collections.items():
+            setattr(mock_db, name, collection)
+        mock_db.list_collections.side_effect = lambda **kwargs: iter([{'name': 'logs', 'type': 'collection'}])
+        mock_db.list_collection_names.return_value = []
+        
+        mock_client = MagicMock()
+        mock_client.__getitem__.return_value = mock_db
+        
+        with patch('database.MongoClient', return_value=mock_client), \
+             patch.object(DatabaseManager, '_create_indexes'):
+            db_manager = DatabaseManager()
+        
+        return db_manager, mock_db, mock_collections
+    
+    def test_migrate_moves_records_in_batches(self, sync_db):
+        """הקולקשן הישן מועבר הצידה, הרשומות מועתקות בפורמט meta והישן נמחק"""
+        db_manager, mock_db, mock_collections = sync_db
+        legacy = mock_collections['logs_legacy']
+        recent = {'_id': ObjectId(), 'user_id': 1, 'action': 'post_created', 'level': 'info',
+                  'details': {'post_id': 'p1'}, 'timestamp': datetime.now()}
+        expired = {'_id': ObjectId(), 'user_id': 2, 'action': 'old', 'level': 'info',
+                   'timestamp': datetime.now() - timedelta(days=Config.LOG_RETENTION_DAYS + 1)}
+        legacy.find.return_value.sort.return_value.limit.side_effect = [[recent, expired], []]
+        
+        migrated = db_manager.migrate_logs_to_timeseries(batch_size=2)
+        
+        assert migrated == 1
+        mock_collections['logs'].rename.assert_called_once_with('logs_legacy')
+        mock_db.create_collection.assert_called_with(
+            'logs',
+            timeseries={'timeField': 'timestamp', 'metaField': 'meta', 'granularity': 'seconds'},
+            expireAfterSeconds=Config.LOG_RETENTION_DAYS * 24 * 3600
+        )
+        inserted = mock_collections['logs'].insert_many.call_args[0][0]
+        assert inserted == [{
+            '_id': recent['_id'], 'timestamp': recent['timestamp'],
+            'meta': {'user_id': 1, 'action': 'post_created', 'level': 'info'},
+            'details': {'post_id': 'p1'}
+        }]
+        legacy.delete_many.assert_called_once_with({'_id': {'$in': [recent['_id'], expired['_id']]}})
+        legacy.drop.assert_called_once()
+    
+    def test_migrate_refuses_two_plain_collections(self, sync_db):
+        """אם נוצר logs רגיל חדש בזמן שקיים logs_legacy - ההמרה נעצרת"""
+        db_manager, mock_db, mock_collections = sync_db
+        mock_db.list_collection_names.return_value = ['logs_legacy']
+        
+        with pytest.raises(DatabaseError):
+            db_manager.migrate_logs_to_timeseries()
+        
+        mock_collections['logs'].rename.assert_not_called()
+
+class TestWriteJournal:
+    """בדיקות ליומן הכתיבות המקומי"""
+    
+    def test_entries_survive_restart(self, tmp_path):
+        """רשומות שלא הועברו נטענות מחדש לפי הסדר, כולל ObjectId ותאריכים"""
+        path = str(tmp_path / 'journal.jsonl')
+        post_id = ObjectId()
+        
+        journal = WriteJournal(path)
+        journal.append('save_post', {'post': {'_id': post_id, 'created_at': datetime(2024, 1, 1)}})
+        journal.append('update_post_status', {'post_id': str(post_id), 'status': 'completed'})
+        journal.commit()
+        
+        reloaded = WriteJournal(path)
+        
+        # commit לא כותב לדיסק - אחרי קריסה הרשומה מועברת שוב (הפעולות בטוחות להרצה חוזרת)
+        assert reloaded.pending() == 2
+        assert reloaded.peek()['payload']['post']['_id'] == post_id
+        
+        reloaded.append('record_platform_result', {'post_id': str(post_id)})
+        assert reloaded.pending_entries()[-1]['sequence'] == 3
+    
+    def test_deferred_sync(self, tmp_path):
+        """append בלי sync כותב לקובץ מיד, ו-sync מסנכרן אותו (גם אחרי שהיומן התרוקן והקובץ נמחק)"""
+        path = str(tmp_path / 'journal.jsonl')
+        journal = WriteJournal(path)
+        
+        with patch('journal.os.fsync') as fsync:
+            journal.append('save_post', {'post': {'_id': ObjectId()}}, sync=False)
+            fsync.assert_not_called()
+            
+            assert WriteJournal(path).pending() == 1
+            journal.sync()
+            fsync.assert_called_once()
+        
+        journal.commit()
+        journal.sync()
+    
+    def test_drained_journal_removes_file(self, tmp_path):
+        """כשכל הרשומות הועברו הקובץ נמחק"""
+        journal = WriteJournal(str(tmp_path / 'journal.jsonl'))
+        journal.append('save_post', {'post': {}})
+        
+        journal.commit()
+        
+        assert journal.pending() == 0
+        assert not os.path.exists(journal.path)
+    
+    def test_corrupt_line_skipped(self, tmp_path):
+        """שורה חלקית מכתיבה שנקטעה לא מונעת טעינה"""
+        path = tmp_path / 'journal.jsonl'
+        journal = WriteJournal(str(path))
+        journal.append('save_post', {'post': {}})
+        with open(path, 'a', encoding='utf-8') as journal_file:
+            journal_file.write('{"sequence": 2, "opera')
+        
+        assert WriteJournal(str(path)).pending() == 1
+    
+    def test_reject_moves_entry_aside(self, tmp_path):
+        """רשומה שהשרת דחה עוברת לקובץ הדחויות עם השגיאה"""
+        journal = WriteJournal(str(tmp_path / 'journal.jsonl'))
+        journal.append('save_post', {'post': {}})
+        
+        journal.reject(ValueError("bad document"))
+        
+        assert journal.pending() == 0
+        with open(journal.rejected_path, encoding='utf-8') as rejected_file:
+            assert json_util.loads(rejected_file.readline())['error'] == "bad document"
+
+class TestStatisticsRollup:
+    """בדיקות לסטטיסטיקות המצטברות"""
+    
+    @pytest.fixture
+    def async_db(self):
+        """AsyncDatabaseManager עם קולקשנים מדומים"""
+        collections = {name: Mock() for name in ('posts', 'users', 'user_counters', 'statistics')}
+        for collection in collections.values():
+            for method in ('insert_one', 'update_one', 'find_one_and_update',
+                           'bulk_write', 'estimated_document_count'):
+                setattr(collection, method, AsyncMock())
+            collection.with_options.return_value = collection
+        
+        mock_db = Mock(**collections)
+        mock_client = MagicMock()
+        mock_client.__getitem__.return_value = mock_db
+        
+        with patch('database.AsyncIOMotorClient', return_value=mock_client):
+            db_manager = AsyncDatabaseManager()
+        
+        return db_manager, collections
+    
+    @pytest.mark.asyncio
+    async def test_save_post_increments_day_and_totals(self, async_db):
+        """פוסט חדש מעדכן את הדלי היומי ואת דלי הסה"כ ב-bulk אחד"""
+        db_manager, collections = async_db
+        collections['posts'].insert_one.return_value = Mock(inserted_id=ObjectId())
+        
+        await db_manager.save_post(12345, "test.mp4", "טקסט", ["TikTok", "Twitter"], 1.0)
+        
+        requests = collections['statistics'].bulk_write.call_args[0][0]
+        assert len(requests) == 2
+        day_update = requests[0]._doc
+        assert requests[0]._filter['_id'] == datetime.now().strftime('%Y-%m-%d')
+        assert requests[1]._filter['_id'] == 'all'
+        assert day_update['$inc'] == {
+            'total': 1, 'by_status.created': 1,
+            'by_platform.TikTok.total': 1, 'by_platform.TikTok.created': 1,
+            'by_platform.Twitter.total': 1, 'by_platform.Twitter.created': 1
+        }
+    
+    @pytest.mark.asyncio
+    async def test_status_change_moves_between_buckets(self, async_db):
+        """מעבר סטטוס מעביר ספירה בדלי של יום יצירת הפוסט"""
+        db_manager, collections = async_db
+        created_at = datetime(2026, 1, 15, 10, 30)
+        collections['posts'].find_one_and_update.return_value = {
+            'user_id': 12345, 'status': 'processing', 'platforms': ['TikTok'], 'created_at': created_at
+        }
+        
+        await db_manager.update_post_status("507f1f77bcf86cd799439011", "completed")
+        
+        requests = collections['statistics'].bulk_write.call_args[0][0]
+        assert requests[0]._filter['_id'] == '2026-01-15'
+        assert requests[0]._doc['$inc'] == {
+            'by_status.processing': -1, 'by_status.completed': 1,
+            'by_platform.TikTok.processing': -1, 'by_platform.TikTok.completed': 1
+        }
+    
+    @pytest.mark.asyncio
+    async def test_get_statistics_reads_buckets(self, async_db):
+        """get_statistics קורא רק את דלי הסה"כ ודלי היום, ומשתמשים לפי מסמכי המונים"""
+        db_manager, collections = async_db
+        today = datetime.now().strftime('%Y-%m-%d')
+        mock_cursor = Mock()
+        mock_cursor.to_list = AsyncMock(return_value=[
+            {'_id': 'all', 'total': 10, 'by_status': {'completed': 7},
+             'by_platform': {'TikTok': {'total': 6}, 'Twitter': {'total': 9}}},
+            {'_id': today, 'total': 2}
+        ])
+        collections['statistics'].find = Mock(return_value=mock_cursor)
+        collections['user_counters'].estimated_document_count.return_value = 4
+        
+        stats = await db_manager.get_statistics()
+        
+        assert collections['statistics'].find.call_args[0][0] == {'_id': {'$in': ['all', today]}}
+        assert stats == {
+            'total_posts': 10,
+            'posts_today': 2,
+            'successful_posts': 7,
+            'total_users': 4,
+            'popular_platforms': {'Twitter': 9, 'TikTok': 6}
+        }
+    
+    def test_buckets_from_rebuild_groups(self):
+        """בניית דליים מתוצאות הקיבוץ של rebuild"""
+        from database import _statistics_buckets_from_groups
+        
+        groups = [
+            {'_id': {'day': '2026-01-01', 'status': 'completed', 'platforms': ['TikTok', 'Twitter']}, 'count': 3},
+            {'_id': {'day': '2026-01-02', 'status': 'failed', 'platforms': ['TikTok']}, 'count': 1}
+        ]
+        
+        buckets = {bucket['_id']: bucket for bucket in _statistics_buckets_from_groups(groups)}
+        
+        assert buckets['all']['total'] == 4
+        assert buckets['all']['by_status'] == {'completed': 3, 'failed': 1}
+        assert buckets['all']['by_platform']['TikTok'] == {'total': 4, 'completed': 3, 'failed': 1}
+        assert buckets['2026-01-01']['by_platform']['Twitter'] == {'total': 3, 'completed': 3}
+        assert buckets['2026-01-02']['date'] == datetime(2026, 1, 2)
+    
+    def test_rebuild_sets_each_bucket(self):
+        """הבנייה מחדש מחליפה כל דלי במקומו ($set עם upsert) - בלי להחליף את הקולקשן"""
+        from database import _statistics_rebuild_updates
+        
+        bucket = {'_id': '2026-01-01', 'date': datetime(2026, 1, 1), 'total': 3, 'by_status': {'completed': 3}, 'by_platform': {}}
+        
+        [update] = _statistics_rebuild_updates([bucket])
+        
+        assert update._filter == {'_id': '2026-01-01'}
+        assert update._doc == {'$set': {
+            'date': datetime(2026, 1, 1), 'total': 3, 'by_status': {'completed': 3}, 'by_platform': {}
+        }}
+        assert update._upsert
+
+    def test_rebuild_user_counters_sets_counts(self):
+        """בנייה מחדש של מוני המשתמשים - $set מהפוסטים השמורים, גם למשתמש שכבר יש לו מונים"""
+        posts, user_counters = MagicMock(), MagicMock()
+        for collection in (posts, user_counters):
+            collection.with_options.return_value = collection
+        posts.aggregate.return_value = [
+            {'_id': {'user_id': 1, 'status': 'completed'}, 'count': 3},
+            {'_id': {'user_id': 1, 'status': 'failed'}, 'count': 1}
+        ]
+        mock_client = MagicMock()
+        mock_client.__getitem__.return_value = MagicMock(posts=posts, user_counters=user_counters)
+        
+        with patch('database.MongoClient', return_value=mock_client), \
+             patch.object(DatabaseManager, '_create_indexes'):
+            db_manager = DatabaseManager()
+        
+        assert db_manager.rebuild_user_counters() == 1
+        
+        [update] = user_counters.bulk_write.call_args[0][0]
+        assert update._filter == {'_id': 1}
+        assert update._doc == {'$set': {'total': 4, 'by_status': {'completed': 3, 'failed': 1}}}
+        assert update._upsert
+
+class TestArchive:
+    """בדיקות לארכוב פוסטים ולוגים לקבצים דחוסים"""
+    
+    @pytest.fixture
+    def sync_db(self):
+        """DatabaseManager עם לקוח pymongo מדומה"""
+        mock_collections = {
+            name: MagicMock()
+            for name in ('posts', 'users', 'logs', 'user_counters', 'statistics', 'schema_migrations', 'archive_state')
+        }
+        for collection in mock_collections.values():
+            collection.with_options.return_value = collection
+        
+        mock_db = MagicMock()
+        for name, collection in mock_collections.items():
+            setattr(mock_db, name, collection)
+        
+        mock_client = MagicMock()
+        mock_client.__getitem__.return_value = mock_db
+        
+        with patch('database.MongoClient', return_value=mock_client), \
+             patch.object(DatabaseManager, '_create_indexes'):
+            db_manager = DatabaseManager()
+        
+        return db_manager, mock_collections
+    
+    @staticmethod
+    def read_archive(path):
+        """קריאת קובץ ארכיון"""
+        with gzip.open(path, 'rt', encoding='utf-8') as archive_file:
+            return [json_util.loads(line) for line in archive_file]
+    
+    def test_write_batch_partitions_by_day(self, tmp_path):
+        """כל יום נכתב לתיקייה משלו, והקובץ משמר את סוגי BSON"""
+        archive = PartitionedArchive(str(tmp_path))
+        first = {'_id': ObjectId(), 'created_at': datetime(2024, 3, 1, 10, 0), 'text': 'שלום'}
+        second = {'_id': ObjectId(), 'created_at': datetime(2024, 3, 2, 9, 0), 'text': 'עולם'}
+        
+        paths = archive.write_batch('posts', [first, second], 'created_at')
+        
+        assert [os.path.basename(os.path.dirname(path)) for path in paths] == ['date=2024-03-01', 'date=2024-03-02']
+        assert self.read_archive(paths[0]) == [first]
+        assert not any(name.endswith('.tmp') for name in os.listdir(os.path.dirname(paths[0])))
+    
+    def test_posts_deleted_after_verified_write(self, sync_db, tmp_path):
+        """פוסטים נמחקים באצוות - רק אחרי שהאצווה נכתבה לארכיון"""
+        db_manager, mock_collections = sync_db
+        posts = [{'_id': ObjectId(), 'created_at': datetime(2024, 3, 1), 'status': 'completed'} for _ in range(3)]
+        mock_collections['posts'].find.return_value = iter(posts)
+        
+        archived = db_manager.archive_expired_posts(PartitionedArchive(str(tmp_path)), batch_size=2, lead_hours=24)
+        
+        assert archived == 3
+        query = mock_collections['posts'].find.call_args[0][0]
+        assert '$lte' in query['expires_at']
+        deleted = [call.args[0]['_id']['$in'] for call in mock_collections['posts'].delete_many.call_args_list]
+        assert deleted == [[posts[0]['_id'], posts[1]['_id']], [posts[2]['_id']]]
+    
+    def test_failed_verification_keeps_posts(self, sync_db, tmp_path):
+        """אם אימות הקובץ נכשל - שום דבר לא נמחק והקובץ הזמני מוסר"""
+        db_manager, mock_collections = sync_db
+        mock_collections['posts'].find.return_value = iter([{'_id': ObjectId(), 'created_at': datetime(2024, 3, 1)}])
+        
+        with patch.object(PartitionedArchive, '_verify', side_effect=ArchiveError("mismatch")):
+            with pytest.raises(ArchiveError):
+                db_manager.archive_expired_posts(PartitionedArchive(str(tmp_path)))
+        
+        mock_collections['posts'].delete_many.assert_not_called()
+        assert not any(files for _, _, files in os.walk(tmp_path))
+    
+    def test_logs_continue_from_checkpoint(self, sync_db, tmp_path):
+        """ארכוב לוגים ממשיך מנקודת הסיום הקודמת ושומר נקודה חדשה - בלי למחוק לוגים"""
+        db_manager, mock_collections = sync_db
+        previous = datetime(2024, 3, 1)
+        mock_collections['archive_state'].find_one.return_value = {'_id': 'logs', 'archived_until': previous}
+        record = {'_id': ObjectId(), 'timestamp': datetime(2024, 3, 1, 12, 0), 'meta': {'user_id': 1}}
+        mock_collections['logs'].find.return_value = iter([record])
+        
+        archived = db_manager.archive_expiring_logs(PartitionedArchive(str(tmp_path)))
+        
+        assert archived == 1
+        assert mock_collections['logs'].find.call_args[0][0]['timestamp']['$gte'] == previous
+        mock_collections['logs'].delete_many.assert_not_called()
+        checkpoint = mock_collections['archive_state'].update_one.call_args[0][1]['$set']['archived_until']
+        assert checkpoint == mock_collections['logs'].find.call_args[0][0]['timestamp']['$lt']
+
+class FakeChangeStream:
+    """change stream מדומה - מחזיר את האירועים שקיבל ונסגר"""
+    
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.resume_token = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return False
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        if not self.changes:
+            raise StopAsyncIteration
+        change = self.changes.pop(0)
+        self.resume_token = change['_id']
+        return change
+
+class TestChangeStreamInvalidator:
+    """בדיקות לביטול רשומות במטמון לפי change streams"""
+    
+    @pytest.fixture
+    def invalidator(self):
+        """מאזין עם מטמון הגדרות רשום על users"""
+        cache = TTLCache(max_size=10, ttl_seconds=300)
+        users = Mock()
+        db = MagicMock()
+        db.__getitem__.return_value = users
+        
+        invalidator = ChangeStreamInvalidator(db, retry_interval=60)
+        invalidator.register('users', cache, 'user_id', live_ttl=3600)
+        return invalidator, cache, users
+    
+    def test_update_invalidates_only_changed_user(self, invalidator):
+        """עדכון מסמך מוחק רק את המשתמש שהשתנה"""
+        invalidator, cache, _ = invalidator
+        cache.set(1, {'mock_mode': True})
+        cache.set(2, {'mock_mode': True})
+        
+        invalidator._apply('users', {'operationType': 'update', 'fullDocument': {'user_id': 1}})
+        
+        assert 1 not in cache
+        assert 2 in cache
+    
+    def test_delete_clears_cache(self, invalidator):
+        """מחיקה (אין מסמך מלא) מרוקנת את כל המטמון"""
+        invalidator, cache, _ = invalidator
+        cache.set(1, {'mock_mode': True})
+        
+        invalidator._apply('users', {'operationType': 'delete'})
+        
+        assert len(cache) == 0
+    
+    @pytest.mark.asyncio
+    async def test_stream_events_invalidate_and_use_long_ttl(self, invalidator):
+        """כשה-stream פעיל המטמון עובר ל-TTL הארוך ואירועים מוחקים רשומות"""
+        invalidator, cache, users = invalidator
+        cache.set(1, {'mock_mode': True})
+        stream = FakeChangeStream([{'_id': {'_data': 'token'}, 'operationType': 'update', 'fullDocument': {'user_id': 1}}])
+        users.watch.side_effect = [stream, OperationFailure("stopped")]
+        
+        invalidator.start()
+        await asyncio.sleep(0.05)
+        
+        assert users.watch.call_args_list[0].kwargs['full_document'] == 'updateLookup'
+        assert 1 not in cache
+        assert invalidator.invalidations == 1
+        
+        invalidator.stop()
+    
+    @pytest.mark.asyncio
+    async def test_unavailable_stream_falls_back_to_ttl(self, invalidator):
+        """בלי replica set - המטמון נשאר עם ה-TTL הקצר ורשומות עם TTL ארוך נמחקות"""
+        invalidator, cache, users = invalidator
+        invalidator._go_live('users')
+        cache.set(1, {'mock_mode': True})
+        users.watch.side_effect = OperationFailure(
+            "The $changeStream stage is only supported on replica sets", code=40573
+        )
+        
+        invalidator.start()
+        await asyncio.sleep(0.05)
+        
+        assert cache.ttl_seconds == 300
+        assert len(cache) == 0
+        assert 'users' not in invalidator.live
+        
+        invalidator.stop()
+
+class TestDatabaseMetrics:
+    """בדיקות למדדי פקודות MongoDB"""
+    
+    @staticmethod
+    def run_command(metrics, command_name, command, duration_ms, request_id=1, failed=False):
+        """הדמיית פקודה - אירוע התחלה ואירוע סיום"""
+        started = Mock(command_name=command_name, command=command, database_name='social_media_bot',
+                       connection_id=('localhost', 27017), request_id=request_id)
+        finished = Mock(command_name=command_name, database_name='social_media_bot',
+                        connection_id=('localhost', 27017), request_id=request_id,
+                        duration_micros=int(duration_ms * 1000))
+        metrics.started(started)
+        (metrics.failed if failed else metrics.succeeded)(finished)
+    
+    def test_latency_recorded_per_collection_and_operation(self):
+        """כל פקודה נרשמת בהיסטוגרמה של הקולקשן והפעולה שלה"""
+        metrics = DatabaseMetrics(slow_query_ms=100)
+        
+        self.run_command(metrics, 'find', {'find': 'posts', 'filter': {'user_id': 1}}, 3, request_id=1)
+        self.run_command(metrics, 'find', {'find': 'posts', 'filter': {'user_id': 2}}, 7, request_id=2)
+        self.run_command(metrics, 'update', {'update': 'users', 'updates': [{'q': {'user_id': 1}}]}, 2,
+                         request_id=3, failed=True)
+        
+        snapshot = metrics.snapshot()
+        assert snapshot['operations']['posts.find']['count'] == 2
+        assert snapshot['operations']['posts.find']['max_ms'] == 7
+        assert snapshot['operations']['users.update']['failures'] == 1
+        assert snapshot['slow_queries'] == []
+    
+    def test_slow_query_sampled_with_filter_shape(self):
+        """שאילתה איטית נדגמת עם צורת הסינון בלבד - בלי הערכים"""
+        metrics = DatabaseMetrics(slow_query_ms=100)
+        command = {'find': 'posts', 'filter': {'user_id': 12345, 'created_at': {'$lt': datetime.now()}},
+                   'lsid': {'id': 'session'}, '$db': 'social_media_bot'}
+        
+        self.run_command(metrics, 'find', command, 250)
+        
+        sample = metrics.snapshot()['slow_queries'][0]
+        assert sample['filter_shape'] == {'user_id': '?', 'created_at': {'$lt': '?'}}
+        assert sample['duration_ms'] == 250
+        assert '_command' not in sample
+        
+        target = metrics.explain_targets()[0]
+        assert explain_command(target['_command']) == {
+            'explain': {'find': 'posts', 'filter': command['filter']}, 'verbosity': 'queryPlanner'
+        }
+    
+    def test_pool_wait_measured(self):
+        """זמן ההמתנה לחיבור נמדד מתחילת ה-checkout ועד שהחיבור התקבל"""
+        metrics = DatabaseMetrics()
+        
+        metrics.connection_check_out_started(Mock())
+        metrics.connection_checked_out(Mock())
+        
+        assert metrics.snapshot()['pool_wait']['count'] == 1
+    
+    def test_histogram_percentiles(self):
+        """האחוזונים הם הגבול העליון של הדלי"""
+        histogram = LatencyHistogram()
+        for duration_ms in [1] * 90 + [40] * 9 + [300]:
+            histogram.observe(duration_ms)
+        
+        assert histogram.percentile(0.5) == 1
+        assert histogram.percentile(0.95) == 50
+        assert histogram.percentile(0.999) == 500
+    
+    def test_plan_summary(self):
+        """סיכום תוכנית ביצוע - find ו-aggregate"""
+        find_explain = {'queryPlanner': {'winningPlan': {
+            'stage': 'LIMIT', 'inputStage': {
+                'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'user_id_1_status_1'}
+            }
+        }}}
+        aggregate_explain = {'stages': [{'$cursor': {'queryPlanner': {'winningPlan': {'stage': 'COLLSCAN'}}}}]}
+        
+        assert plan_summary(find_explain) == 'LIMIT > FETCH > IXSCAN(user_id_1_status_1)'
+        assert plan_summary(aggregate_explain) == 'COLLSCAN'
+
+class TestSettingsCache:
+    """בדיקות למטמון הגדרות המשתמש"""
+    
+    def test_ttl_cache_returns_copies(self):
+        """שינוי של ערך שהוחזר לא משנה את המטמון"""
+        cache = TTLCache(max_size=10, ttl_seconds=60)
+        cache.set(1, {'mock_mode': True})
+        
+        value = cache.get(1)
+        value['mock_mode'] = False
+        
+        assert cache.get(1) == {'mock_mode': True}
+    
+    def test_ttl_cache_expiry(self):
+        """רשומה שפג תוקפה לא מוחזרת"""
+        cache = TTLCache(max_size=10, ttl_seconds=60)
+        
+        with patch('cache.time.monotonic', return_value=1000.0):
+            cache.set(1, 'value')
+        with patch('cache.time.monotonic', return_value=1059.0):
+            assert cache.get(1) == 'value'
+        with patch('cache.time.monotonic', return_value=1061.0):
+            assert cache.get(1) is None
+            assert len(cache) == 0
+    
+    def test_ttl_cache_lru_eviction(self):
+        """הרשומה שלא נעשה בה שימוש הכי הרבה זמן מפונה ראשונה"""
+        cache = TTLCache(max_size=2, ttl_seconds=60)
+        cache.set(1, 'a')
+        cache.set(2, 'b')
+        cache.get(1)
+        cache.set(3, 'c')
+        
+        assert 1 in cache
+        assert 2 not in cache
+        assert 3 in cache
+    
+    @pytest.fixture
+    def async_db(self):
+        """AsyncDatabaseManager עם קולקשן users מדומה"""
+        users = Mock()
+        users.find_one = AsyncMock(return_value=None)
+        users.update_one = AsyncMock()
+        users.with_options.return_value = users
+        
+        mock_db = Mock()
+        mock_db.users = users
+        mock_client = MagicMock()
+        mock_client.__getitem__.return_value = mock_db
+        
+        with patch('database.AsyncIOMotorClient', return_value=mock_client):
+            db_manager = AsyncDatabaseManager()
+        
+        return db_manager, users
+    
+    @pytest.mark.asyncio
+    async def test_defaults_not_written_and_cached(self, async_db):
+        """משתמש חדש מקבל ברירת מחדל ללא כתיבה, וקריאה שנייה לא פונה למסד"""
+        db_manager, users = async_db
+        
+        first = await db_manager.get_user_settings(12345)
+        second = await db_manager.get_user_settings(12345)
+        
+        assert first == second
+        assert 'mock_mode' in first
+        users.find_one.assert_awaited_once()
+        users.update_one.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_save_is_write_through(self, async_db):
+        """שמירה מעדכנת את המטמון - הקריאה הבאה לא פונה למסד"""
+        db_manager, users = async_db
+        
+        await db_manager.save_user_settings(12345, {'mock_mode': False, 'auto_post': True})
+        settings = await db_manager.get_user_settings(12345)
+        
+        assert settings == {'mock_mode': False, 'auto_post': True}
+        users.update_one.assert_awaited_once()
+        users.find_one.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_failed_save_invalidates_cache(self, async_db):
+        """כתיבה שנכשלה מוחקת את הרשומה מהמטמון"""
+        db_manager, users = async_db
+        await db_manager.get_user_settings(12345)
+        users.update_one.side_effect = OperationFailure("write failed")
+        
+        with pytest.raises(SaveError):
+            await db_manager.save_user_settings(12345, {'mock_mode': False})
+        
+        assert 12345 not in db_manager.settings_cache
+    
+    @pytest.mark.asyncio
+    async def test_invalidation_during_read_skips_cache(self, async_db):
+        """ביטול שמגיע בין הקריאה מהמסד לשמירה במטמון - המסמך הישן לא נשמר, והקריאה הבאה פונה למסד"""
+        db_manager, users = async_db
+        
+        async def find_then_invalidate(*args, **kwargs):
+            db_manager.settings_cache.invalidate(12345)
+            return {'user_id': 12345, 'settings': {'mock_mode': True}}
+        
+        users.find_one.side_effect = find_then_invalidate
+        
+        assert await db_manager.get_user_settings(12345) == {'mock_mode': True}
+        assert 12345 not in db_manager.settings_cache
+        
+        users.find_one.side_effect = None
+        users.find_one.return_value = {'user_id': 12345, 'settings': {'mock_mode': False}}
+        
+        assert await db_manager.get_user_settings(12345) == {'mock_mode': False}
+        assert 12345 in db_manager.settings_cache
+
+class TestBufferedLogWriter:
+    """בדיקות לכותב הלוגים המצטבר"""
+    
+    @pytest.fixture
+    def logs(self):
+        """קולקשן logs מדומה"""
+        collection = Mock()
+        collection.insert_many = AsyncMock()
+        return collection
+    
+    @pytest.mark.asyncio
+    async def test_flush_sends_batches(self, logs):
+        """flush שולח את התור באצוות בגודל batch_size"""
+        writer = BufferedLogWriter(logs, batch_size=2)
+        for i in range(5):
+            writer.enqueue({'action': f'a{i}'})
+        
+        written = await writer.flush()
+        
+        assert written == 5
+        assert writer.pending() == 0
+        assert [len(call.args[0]) for call in logs.insert_many.await_args_list] == [2, 2, 1]
+    
+    @pytest.mark.asyncio
+    async def test_background_flush_on_batch_size(self, logs):
+        """הגעה לגודל אצווה מעירה את משימת הרקע"""
+        writer = BufferedLogWriter(logs, batch_size=2, flush_interval=60, spill_path=None)
+        writer.start()
+        
+        writer.enqueue({'action': 'a'})
+        writer.enqueue({'action': 'b'})
+        await asyncio.sleep(0.05)
+        
+        logs.insert_many.assert_awaited_once()
+        await writer.close()
+    
+    @pytest.mark.asyncio
+    async def test_close_flushes_remaining(self, logs):
+        """סגירה שולחת את מה שנשאר בתור"""
+        writer = BufferedLogWriter(logs, batch_size=100, flush_interval=60, spill_path=None)
+        writer.start()
+        writer.enqueue({'action': 'a'})
+        
+        await writer.close()
+        
+        logs.insert_many.assert_awaited_once()
+        assert writer.pending() == 0
+    
+    def test_overflow_drop(self, logs):
+        """תור מלא עם מדיניות drop משליך רשומות"""
+        writer = BufferedLogWriter(logs, max_queue_size=1, overflow_policy='drop')
+        
+        assert writer.enqueue({'action': 'a'}) is True
+        assert writer.enqueue({'action': 'b'}) is False
+        assert writer.dropped == 1
+        assert writer.pending() == 1
+    
+    @pytest.mark.asyncio
+    async def test_overflow_spill_and_replay(self, logs):
+        """תור מלא עם מדיניות spill כותב לקובץ, והקובץ נשלח בהפעלה הבאה"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            spill_path = os.path.join(temp_dir, 'spill.jsonl')
+            writer = BufferedLogWriter(logs, max_queue_size=1, overflow_policy='spill',
+                                       spill_path=spill_path)
+            writer.enqueue({'action': 'a', 'timestamp': datetime(2024, 1, 1)})
+            writer.enqueue({'action': 'b', 'timestamp': datetime(2024, 1, 1)})
+            await writer._spill_task
+            
+            assert writer.spilled == 1
+            assert os.path.exists(spill_path)
+            
+            await writer._replay_spill()
+            
+            replayed = logs.insert_many.await_args.args[0]
+            assert replayed == [{'action': 'b', 'timestamp': datetime(2024, 1, 1)}]
+            assert not os.path.exists(spill_path)
+    
+    @pytest.mark.asyncio
+    async def test_replay_keeps_only_unsent_tail(self, logs, tmp_path):
+        """כישלון באמצע השליחה משאיר בקובץ רק את מה שלא נשלח - ההפעלה הבאה לא שולחת פעמיים"""
+        spill_path = str(tmp_path / 'spill.jsonl')
+        with open(spill_path, 'w', encoding='utf-8') as spill_file:
+            for action in ('a', 'b', 'c'):
+                spill_file.write(json_util.dumps({'action': action}) + '\n')
+        writer = BufferedLogWriter(logs, batch_size=1, spill_path=spill_path)
+        logs.insert_many.side_effect = [None, OperationFailure("write failed")]
+        
+        await writer._replay_spill()
+        logs.insert_many.side_effect = None
+        logs.insert_many.reset_mock()
+        await writer._replay_spill()
+        
+        assert [call.args[0] for call in logs.insert_many.await_args_list] == [[{'action': 'b'}], [{'action': 'c'}]]
+        assert not os.path.exists(spill_path)
+    
+    @pytest.mark.asyncio
+    async def test_failed_insert_is_not_raised(self, logs):
+        """כישלון כתיבה לא זורק - הרשומות מטופלות לפי מדיניות הגלישה"""
+        logs.insert_many.side_effect = OperationFailure("write failed")
+        writer = BufferedLogWriter(logs, overflow_policy='drop')
+        writer.enqueue({'action': 'a'})
+        
+        with patch('log_writer.logger') as logger:
+            written = await writer.flush()
+        
+        assert written == 0
+        assert writer.dropped == 1
+        # הסיבה האמיתית - לא "תור מלא"
+        assert logger.warning.call_args.args[0] == "כתיבת אצוות הלוגים נכשלה - 1 רשומות הושלכו"
+    
+    @pytest.mark.asyncio
+    async def test_failed_insert_spills_off_the_loop(self, logs, tmp_path):
+        """אצווה שנכשלה נכתבת לקובץ הגלישה ב-thread, ו-close מחכה לכתיבה"""
+        logs.insert_many.side_effect = OperationFailure("write failed")
+        spill_path = str(tmp_path / 'spill.jsonl')
+        writer = BufferedLogWriter(logs, overflow_policy='spill', spill_path=spill_path)
+        writer.enqueue({'action': 'a'})
+        
+        with patch('log_writer.asyncio.to_thread', wraps=asyncio.to_thread) as to_thread:
+            await writer.close()
+        
+        assert to_thread.call_args.args == (writer._append_spill, [{'action': 'a'}])
+        assert writer.spilled == 1 and writer.dropped == 0
+        with open(spill_path, encoding='utf-8') as spill_file:
+            assert [json_util.loads(line)['action'] for line in spill_file] == ['a']
+
+class TestSQLiteBackend:
+    """בדיקות ל-backend המקומי - מול קובץ SQLite אמיתי, ללא שרת"""
+    
+    @pytest_asyncio.fixture
+    async def sqlite_db(self, tmp_path):
+        """SQLiteDatabaseManager פתוח על קובץ זמני"""
+        db_manager = SQLiteDatabaseManager(str(tmp_path / 'bot.db'))
+        await db_manager.connect()
+        yield db_manager
+        db_manager.close_connection()
+    
+    @pytest.mark.asyncio
+    async def test_wal_mode(self, sqlite_db):
+        """הקובץ נפתח במצב WAL"""
+        assert sqlite_db.conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert await sqlite_db.health_check()
+    
+    @pytest.mark.asyncio
+    async def test_post_lifecycle(self, sqlite_db):
+        """שמירה, תוצאות פלטפורמה (כולל ניסיון חוזר) וסטטוס סופי"""
+        post_id = await sqlite_db.save_post(12345, 'video.mp4', 'טקסט', ['TikTok', 'Twitter'], 5.0)
+        
+        await sqlite_db.record_platform_result(post_id, 'TikTok', {'status': 'success'})
+        await sqlite_db.record_platform_result(post_id, 'Twitter', {'status': 'failed', 'error': 'timeout'})
+        await sqlite_db.record_platform_result(post_id, 'Twitter', {'status': 'success'})
+        await sqlite_db.update_post_status(post_id, 'completed')
+        
+        post = await sqlite_db.get_post_by_id(post_id)
+        assert post['status'] == 'completed'
+        assert post['progress'] == {'succeeded': 2, 'failed': 0}
+        assert post['expires_at'] > datetime.utcnow()
+        assert await sqlite_db.get_completed_platforms(post_id) == ['TikTok', 'Twitter']
+        assert await sqlite_db.count_user_posts(12345, 'completed') == 1
+    
+    @pytest.mark.asyncio
+    async def test_history_pages(self, sqlite_db):
+        """עימוד keyset עובר על כל הפוסטים בלי כפילויות, עם השדות המבוקשים בלבד"""
+        post_ids = [await sqlite_db.save_post(12345, f'v{i}.mp4', f'טקסט {i}', ['TikTok'], 1.0) for i in range(5)]
+        
+        seen, cursor = [], None
+        while True:
+            page = await sqlite_db.get_user_posts_page(12345, limit=2, cursor=cursor)
+            seen.extend(post['_id'] for post in page['posts'])
+            assert all('text' not in post for post in page['posts'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        
+        assert sorted(seen) == sorted(post_ids)
+        assert len(seen) == 5
+    
+    @pytest.mark.asyncio
+    async def test_hashtag_search(self, sqlite_db):
+        """חיפוש לפי האשטג בעמודים ומוני תגיות - שורות התגיות נמחקות עם הפוסט"""
+        tagged = [await sqlite_db.save_post(12345, f'v{i}.mp4', f'טקסט {i} #פסח', ['TikTok'], 1.0) for i in range(3)]
+        other = await sqlite_db.save_post(12345, 'o.mp4', 'טקסט #Travel #פסח', ['TikTok'], 1.0)
+        await sqlite_db.save_post(99999, 'x.mp4', 'משתמש אחר #פסח', ['TikTok'], 1.0)
+        
+        first = await sqlite_db.get_posts_by_hashtag(12345, '#פסח', limit=3)
+        second = await sqlite_db.get_posts_by_hashtag(12345, 'פסח', limit=3, cursor=first['next_cursor'])
+        
+        assert sorted(post['_id'] for post in first['posts'] + second['posts']) == sorted(tagged + [other])
+        assert second['next_cursor'] is None
+        assert await sqlite_db.get_user_hashtags(12345) == [{'tag': 'פסח', 'count': 4}, {'tag': 'travel', 'count': 1}]
+        
+        with sqlite_db.conn:
+            sqlite_db.conn.execute("DELETE FROM posts WHERE id = ?", (other,))
+        assert await sqlite_db.get_user_hashtags(12345) == [{'tag': 'פסח', 'count': 3}]
+    
+    @pytest.mark.asyncio
+    async def test_text_search(self, sqlite_db):
+        """חיפוש טקסט - רק בפוסטים של המשתמש, הרלוונטי קודם, עמודים בלי כפילויות ומחיקה מהאינדקס"""
+        best = await sqlite_db.save_post(12345, 'b.mp4', 'Chocolate cake, chocolate שוקולד', ['TikTok'], 1.0)
+        matches = [await sqlite_db.save_post(12345, f'v{i}.mp4', f'עוגת שוקולד {i}', ['TikTok'], 1.0) for i in range(3)]
+        for i in range(20):
+            await sqlite_db.save_post(12345, f'o{i}.mp4', f'פוסט אחר {i}', ['TikTok'], 1.0)
+        await sqlite_db.save_post(99999, 'x.mp4', 'chocolate של משתמש אחר', ['TikTok'], 1.0)
+        
+        first = await sqlite_db.search_posts(12345, 'CHOCOLATE "עוגת', limit=2)
+        second = await sqlite_db.search_posts(12345, 'CHOCOLATE "עוגת', limit=2, cursor=first['next_cursor'])
+        
+        assert first['posts'][0]['_id'] == best
+        assert 'text' not in first['posts'][0] and first['posts'][0]['score'] > 0
+        assert sorted(post['_id'] for post in first['posts'] + second['posts']) == sorted([best] + matches)
+        assert second['next_cursor'] is None
+        
+        with sqlite_db.conn:
+            sqlite_db.conn.execute("DELETE FROM posts WHERE id = ?", (best,))
+        page = await sqlite_db.search_posts(12345, 'chocolate')
+        assert page['posts'] == []
+    
+    @pytest.mark.asyncio
+    async def test_text_search_survives_vacuum(self, sqlite_db):
+        """VACUUM אחרי מחיקה לא מזיז את seq - תוצאות החיפוש נשארות מחוברות לפוסטים הנכונים"""
+        removed = await sqlite_db.save_post(12345, 'a.mp4', 'פוסט שנמחק', ['TikTok'], 1.0)
+        kept = await sqlite_db.save_post(12345, 'b.mp4', 'chocolate', ['TikTok'], 1.0)
+        with sqlite_db.conn:
+            sqlite_db.conn.execute("DELETE FROM posts WHERE id = ?", (removed,))
+        sqlite_db.conn.execute("VACUUM")
+        
+        page = await sqlite_db.search_posts(12345, 'chocolate')
+        
+        assert [post['_id'] for post in page['posts']] == [kept]
+        assert 'seq' not in (await sqlite_db.get_post_by_id(kept))
+    
+    @pytest.mark.asyncio
+    async def test_posts_without_seq_are_rebuilt(self, tmp_path):
+        """קובץ מלפני seq - הטבלה נבנית מחדש בפתיחה, והחיפוש וההאשטגים נשארים על אותם פוסטים"""
+        db_manager = SQLiteDatabaseManager(str(tmp_path / 'bot.db'))
+        await db_manager.connect()
+        await db_manager.save_post(12345, 'a.mp4', 'פוסט ראשון #פסח', ['TikTok'], 1.0)
+        post_id = await db_manager.save_post(12345, 'b.mp4', 'chocolate #פסח', ['TikTok'], 1.0)
+        old_table = _POSTS_TABLE.format(name='posts_old').replace(
+            'seq INTEGER PRIMARY KEY,\n    id TEXT NOT NULL UNIQUE', 'id TEXT PRIMARY KEY'
+        )
+        db_manager.conn.execute("PRAGMA foreign_keys=OFF")
+        db_manager.conn.executescript(
+            f"""{old_table};
+                INSERT INTO posts_old (rowid, {_POSTS_COLUMNS}) SELECT seq, {_POSTS_COLUMNS} FROM posts;
+                DROP TABLE posts;
+                ALTER TABLE posts_old RENAME TO posts;"""
+        )
+        db_manager.close_connection()
+        
+        await db_manager.connect()
+        try:
+            columns = [row['name'] for row in db_manager.conn.execute("PRAGMA table_info(posts)")]
+            assert columns[0] == 'seq'
+            page = await db_manager.search_posts(12345, 'chocolate')
+            assert [post['_id'] for post in page['posts']] == [post_id]
+            assert await db_manager.get_user_hashtags(12345) == [{'tag': 'פסח', 'count': 2}]
+        finally:
+            db_manager.close_connection()
+    
+    @pytest.mark.asyncio
+    async def test_user_settings(self, sqlite_db):
+        """משתמש חדש מקבל ברירת מחדל בלי כתיבה, ושמירה חוזרת מעדכנת"""
+        defaults = await sqlite_db.get_user_settings(12345)
+        assert 'mock_mode' in defaults
+        assert sqlite_db.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+        
+        await sqlite_db.save_user_settings(12345, {'mock_mode': True})
+        await sqlite_db.save_user_settings(12345, {'mock_mode': False})
+        
+        assert await sqlite_db.get_user_settings(12345) == {'mock_mode': False}
+    
+    @pytest.mark.asyncio
+    async def test_statistics_and_purge(self, sqlite_db):
+        """סטטיסטיקות מטבלת הסיכום (מצטברות - לא יורדות במחיקה), ופוסטים שפג תוקפם נמחקים"""
+        first = await sqlite_db.save_post(1, 'a.mp4', 'a', ['TikTok', 'Twitter'], 1.0)
+        await sqlite_db.save_post(2, 'b.mp4', 'b', ['TikTok'], 1.0)
+        await sqlite_db.update_post_status(first, 'completed')
+        await sqlite_db.save_user_settings(1, {})
+        
+        stats = await sqlite_db.get_statistics()
+        assert stats['total_posts'] == 2
+        assert stats['posts_today'] == 2
+        assert stats['successful_posts'] == 1
+        assert stats['total_users'] == 2
+        assert stats['popular_platforms'] == {'TikTok': 2, 'Twitter': 1}
+        
+        sqlite_db.conn.execute("UPDATE posts SET expires_at = '2000-01-01 00:00:00.000' WHERE id = ?", (first,))
+        await sqlite_db.purge_expired()
+        
+        assert await sqlite_db.get_post_by_id(first) is None
+        assert await sqlite_db.get_statistics() == stats
+    
+    @pytest.mark.asyncio
+    async def test_purge_runs_in_batches_off_the_loop(self, sqlite_db):
+        """המחיקה רצה ב-thread באצוות של PURGE_BATCH_SIZE עד שלא נשאר מה למחוק"""
+        post_ids = [await sqlite_db.save_post(1, f'v{i}.mp4', f'#tag{i}', ['TikTok'], 1.0) for i in range(5)]
+        kept = await sqlite_db.save_post(1, 'k.mp4', 'נשאר', ['TikTok'], 1.0)
+        sqlite_db.conn.execute("UPDATE posts SET expires_at = '2000-01-01 00:00:00.000' WHERE id != ?", (kept,))
+        
+        with patch('sqlite_storage.PURGE_BATCH_SIZE', 2), \
+             patch('sqlite_storage.asyncio.to_thread', wraps=asyncio.to_thread) as to_thread:
+            deleted = await sqlite_db.purge_expired()
+        
+        assert deleted == 5
+        # 2 + 2 + 1 פוסטים, ואצווה אחת (ריקה) של לוגים
+        assert to_thread.call_count == 4
+        assert [await sqlite_db.get_post_by_id(post_id) for post_id in post_ids] == [None] * 5
+        assert await sqlite_db.get_user_hashtags(1) == []
+        assert (await sqlite_db.get_post_by_id(kept))['_id'] == kept
+    
+    @pytest.mark.asyncio
+    async def test_statistics_seeded_from_existing_posts(self, tmp_path):
+        """קובץ מלפני טבלת הסיכום - הסטטיסטיקות נבנות מהפוסטים הקיימים בפתיחה"""
+        db_manager = SQLiteDatabaseManager(str(tmp_path / 'bot.db'))
+        await db_manager.connect()
+        post_id = await db_manager.save_post(1, 'a.mp4', 'a', ['TikTok'], 1.0)
+        await db_manager.update_post_status(post_id, 'completed')
+        expected = await db_manager.get_statistics()
+        db_manager.conn.executescript("DROP TABLE statistics; DROP TABLE statistics_users;")
+        db_manager.close_connection()
+        
+        await db_manager.connect()
+        try:
+            assert await db_manager.get_statistics() == expected
+            assert expected['successful_posts'] == 1
+        finally:
+            db_manager.close_connection()
 
 class TestDatabaseSingleton:
     """בדיקות לpattern של Singleton"""
@@ -532,6 +2261,36 @@ class TestDatabaseSingleton:
         
         # בדיקה שהconstructor נקרא רק פעם אחת
         mock_db_manager.assert_called_once()
+    
+    @patch('database.AsyncDatabaseManager')
+    def test_get_async_database_singleton(self, mock_db_manager):
+        """בדיקה שget_async_database מחזיר אותו instance"""
+        mock_instance = Mock()
+        mock_db_manager.return_value = mock_instance
+        
+        import database
+        database._async_db_manager = None
+        
+        db1 = get_async_database()
+        db2 = get_async_database()
+        
+        assert db1 is db2
+        assert db1 is mock_instance
+        mock_db_manager.assert_called_once()
+        
+        database._async_db_manager = None
+    
+    def test_get_async_database_sqlite_backend(self, tmp_path):
+        """STORAGE_BACKEND=sqlite מחזיר את ה-backend המקומי"""
+        import database
+        database._async_db_manager = None
+        
+        with patch.object(Config, 'STORAGE_BACKEND', 'sqlite'), \
+             patch.object(Config, 'SQLITE_PATH', str(tmp_path / 'bot.db')):
+            db = get_async_database()
+        
+        assert isinstance(db, SQLiteDatabaseManager)
+        database._async_db_manager = None
 
 class TestDatabaseIntegration:
     """בדיקות אינטגרציה - דורשות MongoDB אמיתי"""
@@ -581,6 +2340,116 @@ class TestDatabaseIntegration:
         except ConnectionError:
             pytest.skip("MongoDB not available for integration tests")
 
+class TestQueryPlans:
+    """תוכניות ביצוע וזמני בסיס לכל שאילתה של DatabaseManager"""
+    
+    def test_every_public_method_has_scenario(self):
+        """מתודה חדשה שפונה למסד חייבת תרחיש (או סיבה ב-UNPLANNED_METHODS)"""
+        methods = {
+            name for name in dir(DatabaseManager)
+            if not name.startswith('_') and callable(getattr(DatabaseManager, name))
+        }
+        scenarios = {scenario.name for scenario in query_plans.QUERY_SCENARIOS}
+        
+        assert methods == scenarios | set(query_plans.UNPLANNED_METHODS)
+    
+    def test_collection_scan_flagged(self):
+        """COLLSCAN נחשב בעיה, סריקה תחומה על אינדקס מקובץ (time-series) לא"""
+        collscan = {
+            'queryPlanner': {'winningPlan': {'stage': 'COLLSCAN'}},
+            'executionStats': {'nReturned': 10, 'totalDocsExamined': 1000000}
+        }
+        bounded = {
+            'stages': [{'$cursor': {
+                'queryPlanner': {'winningPlan': {'stage': 'COLLSCAN', 'maxRecord': 'x'}},
+                'executionStats': {'nReturned': 40, 'totalDocsExamined': 42}
+            }}]
+        }
+        
+        assert query_plans.plan_problems(collscan, 10)['problems'][0] == "סריקה מלאה (COLLSCAN)"
+        assert query_plans.plan_problems(bounded, None)['problems'] == []
+    
+    def test_docs_examined_bound(self):
+        """אינדקס שלא מכסה את הסינון - יותר מסמכים נבדקו מהמותר"""
+        explain = {
+            'queryPlanner': {'winningPlan': {
+                'stage': 'LIMIT', 'inputStage': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'status_1'}}
+            }},
+            'executionStats': {'nReturned': 10, 'totalDocsExamined': 5000, 'totalKeysExamined': 5000}
+        }
+        
+        result = query_plans.plan_problems(explain, 10)
+        
+        assert result['plan'] == 'LIMIT > FETCH > IXSCAN(status_1)'
+        assert result['problems'] == ["נבדקו 5000 מסמכים (מותר 10)"]
+    
+    def test_bulk_update_split_for_explain(self):
+        """bulk_write עם כמה הוראות מפוצל להוראה אחת לכל explain"""
+        command = {'update': 'statistics', 'updates': [{'q': {'_id': 'all'}}, {'q': {'_id': '2024-01-01'}}]}
+        
+        statements = query_plans._single_statements('update', command)
+        
+        assert [statement['updates'] for statement in statements] == [[{'q': {'_id': 'all'}}], [{'q': {'_id': '2024-01-01'}}]]
+    
+    def test_latency_regressions(self, tmp_path):
+        """חריגה מהבסיס (פי tolerance ועוד slack) מדווחת; בסיס בנפח אחר לא נטען"""
+        path = str(tmp_path / 'baseline.json')
+        volumes = {'posts': 1000, 'logs': 1000, 'users': 10}
+        query_plans.save_baseline(path, {'get_user_posts': {'p50_ms': 1.0, 'p95_ms': 2.0}}, volumes)
+        
+        baseline = query_plans.load_baseline(path, volumes)
+        
+        assert query_plans.latency_regressions({'get_user_posts': {'p50_ms': 1.0, 'p95_ms': 4.5}}, baseline) == []
+        assert len(query_plans.latency_regressions({'get_user_posts': {'p50_ms': 9.0, 'p95_ms': 12.0}}, baseline)) == 1
+        assert query_plans.load_baseline(path, dict(volumes, posts=2000)) is None
+    
+    @pytest.fixture(scope="class")
+    def seeded_db(self, tmp_path_factory):
+        """מסד בדיקה זרוע (QUERY_PLAN_POSTS / QUERY_PLAN_LOGS / QUERY_PLAN_USERS) - נזרע מחדש רק כשהנפח משתנה"""
+        volumes = {
+            'posts': int(os.getenv('QUERY_PLAN_POSTS', str(query_plans.DEFAULT_SEED_POSTS))),
+            'logs': int(os.getenv('QUERY_PLAN_LOGS', str(query_plans.DEFAULT_SEED_LOGS))),
+            'users': int(os.getenv('QUERY_PLAN_USERS', str(query_plans.DEFAULT_SEED_USERS)))
+        }
+        
+        with patch.object(Config, 'DATABASE_NAME', f"{Config.DATABASE_NAME}{query_plans.QUERY_PLAN_DATABASE_SUFFIX}"):
+            try:
+                db = query_plans.open_seeded_database(**volumes)
+            except ConnectionError:
+                pytest.skip("MongoDB not available for integration tests")
+            
+            yield db, query_plans.build_sample(db, str(tmp_path_factory.mktemp('archive'))), volumes
+            db.close_connection()
+    
+    @pytest.mark.integration
+    @pytest.mark.skipif(not os.getenv('INTEGRATION_TESTS'), 
+                       reason="Integration tests disabled")
+    def test_queries_use_indexes(self, seeded_db):
+        """כל פקודה של כל תרחיש - בלי COLLSCAN ובתוך גבול המסמכים שנבדקים"""
+        db, sample, _ = seeded_db
+        
+        results = query_plans.check_query_plans(db, sample)
+        
+        failures = [
+            f"{result['scenario']} {result['collection']}.{result['operation']}: {result['plan']} - {result['problems']}"
+            for result in results if result['problems']
+        ]
+        assert failures == []
+    
+    @pytest.mark.integration
+    @pytest.mark.skipif(not os.getenv('INTEGRATION_TESTS'), 
+                       reason="Integration tests disabled")
+    def test_latency_within_baseline(self, seeded_db):
+        """זמני p95 לא חורגים מהבסיס (python manage.py query-plans --update-baseline)"""
+        db, sample, volumes = seeded_db
+        baseline = query_plans.load_baseline(query_plans.BASELINE_FILE, volumes)
+        if baseline is None:
+            pytest.skip(f"אין זמני בסיס לנפח {volumes}")
+        
+        latencies = query_plans.measure_latencies(db, sample)
+        
+        assert query_plans.latency_regressions(latencies, baseline) == []
+
 class TestDatabaseErrorHandling:
     """בדיקות לטיפול בשגיאות"""
     
@@ -664,3 +2533,4 @@ if __name__ == "__main__":
 # pytest test_database.py -m integration -v            # רק בדיקות אינטגרציה
 # pytest test_database.py --cov=database               # עם coverage
 # INTEGRATION_TESTS=1 pytest test_database.py -v      # עם בדיקות אינטגרציה
+# INTEGRATION_TESTS=1 pytest test_database.py -k QueryPlans  # תוכניות ביצוע על מסד זרוע (QUERY_PLAN_POSTS=...)
@@ -4,6 +4,7 @@ pytest test_social_media.py -v
 """
 import pytest
 import os
+import json
 import asyncio
 import tempfile
 from unittest.mock import Mock, AsyncMock, patch, MagicMock, mock_open
@@ -444,6 +445,37 @@ class TestTelegramChannelAPI:
                     await telegram_api.post(temp_file.name, "test")
                 
                 assert "HTTP 404" in str(exc_info.value)
+    
+    @pytest.mark.asyncio
+    async def test_telegram_post_batch_media_group(self, telegram_api, tmp_path):
+        """אלבום בערוץ - בקשות sendMediaGroup של עד 10 על חיבור אחד, והכיתוב רק על הסרטון הראשון"""
+        video_paths = []
+        for index in range(12):
+            video = tmp_path / f'video_{index}.mp4'
+            video.write_bytes(b'fake video')
+            video_paths.append(str(video))
+        
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'ok': True}
+        
+        with patch('social_media_handler.requests.Session') as mock_session_class:
+            session = mock_session_class.return_value.__enter__.return_value
+            session.post.return_value = mock_response
+            
+            results = await telegram_api.post_batch(video_paths, "album caption")
+        
+        assert results == [True] * 12
+        assert mock_session_class.call_count == 1
+        assert session.post.call_count == 2
+        
+        first_media = json.loads(session.post.call_args_list[0].kwargs['data']['media'])
+        assert len(first_media) == 10
+        assert first_media[0]['caption'] == "album caption"
+        assert all('caption' not in item for item in first_media[1:])
+        
+        second_media = json.loads(session.post.call_args_list[1].kwargs['data']['media'])
+        assert [item['media'] for item in second_media] == ['attach://video0', 'attach://video1']
 
 class TestSocialMediaManager:
     """בדיקות למנהל רשתות החברתיות"""
@@ -519,6 +551,22 @@ class TestSocialMediaManager:
         assert result == False
         assert social_manager.apis['TikTok'].post.call_count >= 2  # ניסיונות חוזרים
     
+    @pytest.mark.asyncio
+    async def test_post_batch_shared_retry_budget(self, social_manager):
+        """אלבום לפלטפורמה בלי פרסום אצווה - סרטון אחרי סרטון, עם תקציב ניסיונות חוזרים אחד לכל האצווה"""
+        api = social_manager.apis['TikTok']
+        api.supports_batch = False
+        api.post.side_effect = [Exception("fail"), True, Exception("fail"), Exception("fail"), Exception("fail")]
+        
+        with patch('social_media_handler.asyncio.sleep', new=AsyncMock()):
+            results = await social_manager.post_batch_to_platform(
+                "TikTok", ["a.mp4", "b.mp4", "c.mp4"], "test", max_retries=2
+            )
+        
+        # a הצליח בניסיון השני, b ניצל את הניסיון האחרון ונכשל, ול-c לא נשארו ניסיונות חוזרים
+        assert results == [True, False, False]
+        assert api.post.call_count == 5
+    
     @pytest.mark.asyncio
     async def test_post_to_all_platforms(self, social_manager):
         """בדיקת פרסום לכל הפלטפורמות"""
@@ -0,0 +1,73 @@
+"""
+עיבוד עדכונים במקביל עם סדר לכל משתמש - עדכונים של משתמשים שונים רצים יחד, של אותו משתמש אחד אחרי השני
+"""
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+def _user_key(update: object) -> Optional[int]:
+    """מפתח הסדר - המשתמש של העדכון (None - עדכון בלי משתמש, רץ בלי המתנה לתור)"""
+    user = getattr(update, 'effective_user', None)
+    return user.id if user else None
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """עד max_concurrent_updates עדכונים רצים במקביל, ולכל משתמש עדכון אחד בכל רגע (לפי סדר ההגעה)
+
+    ה-semaphore של המחלקה הבסיסית מגביל את העדכונים שבתהליך (רצים + ממתינים לתור של המשתמש) ל-max_pending_updates;
+    מגבלת ההרצה נלקחת רק אחרי שהגיע תור המשתמש - משתמש עם הרבה עדכונים לא תופס מקומות של אחרים.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int):
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.concurrency_limit = max_concurrent_updates
+
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        # כמה עדכונים מחזיקים / ממתינים למנעול של כל משתמש - המנעול נמחק כשאין אף אחד
+        self._user_waiters: Dict[int, int] = {}
+
+        # מונים לניטור
+        self.active = 0
+        self.processed = 0
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        """המתנה לתור של המשתמש, ואז למקום פנוי בהרצה"""
+        await self.run_for_user(_user_key(update), coroutine)
+
+    async def run_for_user(self, user_id: Optional[int], coroutine: Awaitable[Any]):
+        """הרצת עבודה בתור של המשתמש ובמגבלה הגלובלית - גם לעבודה שלא הגיעה כעדכון (למשל אלבום שנאסף)"""
+        if user_id is None:
+            await self._run(coroutine)
+            return
+
+        lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+        self._user_waiters[user_id] = self._user_waiters.get(user_id, 0) + 1
+        try:
+            async with lock:
+                await self._run(coroutine)
+        finally:
+            self._user_waiters[user_id] -= 1
+            if not self._user_waiters[user_id]:
+                del self._user_waiters[user_id]
+                del self._user_locks[user_id]
+
+    async def _run(self, coroutine: Awaitable[Any]):
+        """הרצת העדכון במסגרת המגבלה הגלובלית"""
+        async with self._running:
+            self.active += 1
+            try:
+                await coroutine
+            finally:
+                self.active -= 1
+                self.processed += 1
+
+    async def initialize(self):
+        logger.info(f"עיבוד עדכונים במקביל: עד {self.concurrency_limit} בו-זמנית, לפי הסדר לכל משתמש")
+
+    async def shutdown(self):
+        """אין משאבים לשחרר - האפליקציה ממתינה לעדכונים שרצים"""
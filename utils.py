@@ -2,6 +2,7 @@
 פונקציות עזר כלליות לבוט הפרסום
 """
 import os
+import re
 import magic
 import hashlib
 from datetime import datetime
@@ -103,6 +104,12 @@ class FileHelper:
 class TextHelper:
     """עזרים לטיפול בטקסט"""
     
+    # האשטג: # ואחריו אותיות (כולל עברית), ספרות או _
+    HASHTAG_PATTERN = re.compile(r'#[\w\u0590-\u05FF]+')
+    
+    # מקסימום האשטגים שנשמרים לפוסט (כל אחד הוא רשומה באינדקס)
+    MAX_HASHTAGS = 30
+    
     @staticmethod
     def clean_text(text: str) -> str:
         """מנקה טקסט מתווים מיותרים"""
@@ -141,9 +148,18 @@ class TextHelper:
     @staticmethod
     def extract_hashtags(text: str) -> List[str]:
         """מחלץ האשטגים מטקסט"""
-        import re
-        hashtags = re.findall(r'#[\w\u0590-\u05FF]+', text)
-        return hashtags
+        return TextHelper.HASHTAG_PATTERN.findall(text)
+    
+    @staticmethod
+    def normalize_hashtag(tag: str) -> str:
+        """צורה אחידה לשמירה ולחיפוש - בלי # ובאותיות קטנות"""
+        return tag.strip().lstrip('#').casefold()
+    
+    @staticmethod
+    def normalize_hashtags(text: str) -> List[str]:
+        """האשטגים מנורמלים וללא כפילויות, לפי סדר ההופעה"""
+        tags = dict.fromkeys(TextHelper.normalize_hashtag(tag) for tag in TextHelper.extract_hashtags(text or ''))
+        return list(tags)[:TextHelper.MAX_HASHTAGS]
     
     @staticmethod
     def get_text_preview(text: str, max_chars: int = 100) -> str:
@@ -191,6 +207,8 @@ class MessageHelper:
             return Messages.ERROR_NO_VIDEO
         elif isinstance(error, NoTextError):
             return Messages.ERROR_NO_TEXT
+        elif isinstance(error, ResourceLimitError):
+            return Messages.ERROR_BUSY
         elif isinstance(error, SocialMediaAPIError):
             return Messages.ERROR_POSTING_FAILED.format(error=str(error))
         else:
@@ -236,6 +254,69 @@ class MessageHelper:
             
             return message
 
+    @staticmethod
+    def create_history_message(posts: List[Dict], title: str = "📜 היסטוריית פוסטים") -> str:
+        """יוצר הודעת היסטוריית פוסטים (עמוד אחד)"""
+        if not posts:
+            return "📭 אין פוסטים להצגה"
+        
+        status_emoji = {'completed': '✅', 'failed': '❌', 'processing': '🔄', 'cancelled': '🚫'}
+        
+        lines = [title, ""]
+        for post in posts:
+            emoji = status_emoji.get(post.get('status'), '📝')
+            created_at = post['created_at'].strftime('%d/%m/%Y %H:%M')
+            platforms = ', '.join(post.get('platforms', []))
+            
+            lines.append(f"{emoji} {created_at} • {platforms}")
+            lines.append(f"   {post.get('text_preview', '')}")
+        
+        return '\n'.join(lines)
+    
+    @staticmethod
+    def create_hashtags_message(hashtags: List[Dict]) -> str:
+        """יוצר הודעת ההאשטגים הנפוצים של המשתמש"""
+        if not hashtags:
+            return "🏷️ עוד לא השתמשתם בהאשטגים"
+        
+        lines = ["🏷️ ההאשטגים שלכם", ""]
+        for hashtag in hashtags:
+            lines.append(f"#{hashtag['tag']} • {hashtag['count']}")
+        
+        lines.append("")
+        lines.append("לפוסטים עם האשטג: /tag <האשטג>")
+        
+        return '\n'.join(lines)
+    
+    @staticmethod
+    def create_db_metrics_message(metrics: Dict, max_operations: int = 8, max_slow: int = 5) -> str:
+        """יוצר הודעת מדדי מסד נתונים - הפעולות האיטיות ביותר, המתנה ל-pool ושאילתות איטיות"""
+        if not metrics:
+            return "📉 אין מדדים עבור האחסון הנוכחי"
+        
+        lines = ["🗄️ מדדי מסד נתונים (p50 / p95 / max במילישניות)", ""]
+        
+        for key, summary in list(metrics['operations'].items())[:max_operations]:
+            failures = f" ❌{summary['failures']}" if summary['failures'] else ""
+            lines.append(
+                f"• {key}: {summary['count']} | {summary['p50_ms']:g} / {summary['p95_ms']:g} / {summary['max_ms']:g}{failures}"
+            )
+        
+        pool_wait = metrics['pool_wait']
+        lines.append("")
+        lines.append(f"⏳ המתנה לחיבור: p95 {pool_wait['p95_ms']:g}ms | max {pool_wait['max_ms']:g}ms")
+        
+        slow_queries = metrics['slow_queries'][-max_slow:]
+        if slow_queries:
+            lines.append("")
+            lines.append("🐢 שאילתות איטיות אחרונות:")
+            for sample in reversed(slow_queries):
+                lines.append(f"• {sample['collection']}.{sample['operation']} {sample['duration_ms']:g}ms")
+                lines.append(f"   סינון: {sample['filter_shape']}")
+                lines.append(f"   תוכנית: {sample['plan'] or '?'}")
+        
+        return '\n'.join(lines)
+
 class ValidationHelper:
     """עזרים לבדיקות שונות"""
     
@@ -252,6 +333,18 @@ class ValidationHelper:
         
         return message.video, TextHelper.clean_text(text)
     
+    @staticmethod
+    def validate_telegram_album(messages: List) -> Tuple[List, str]:
+        """בודק הודעות של אלבום ומחזיר את הסרטונים והטקסט (הכיתוב של הפריט הראשון שיש לו כיתוב)"""
+        videos = [message.video for message in messages if message.video]
+        if not videos:
+            raise NoVideoError()
+        
+        text = next((message.caption for message in messages if message.caption), "")
+        TextHelper.validate_text(text)
+        
+        return videos, TextHelper.clean_text(text)
+    
     @staticmethod
     def validate_platform_tokens(platforms: List[str]) -> Dict[str, bool]:
         """בודק אילו פלטפורמות זמינות (יש להן טוקנים)"""
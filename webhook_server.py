@@ -0,0 +1,155 @@
+"""
+שרת HTTP אסינכרוני מוטמע (asyncio, ללא תלויות) - עדכוני טלגרם ב-webhook, ו-/health ו-/ready על אותו פורט
+"""
+import asyncio
+import hmac
+import json
+from typing import Awaitable, Callable, Dict, Tuple
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# טלגרם שולח את ה-secret_token שהוגדר ב-setWebhook בכותרת הזו
+SECRET_TOKEN_HEADER = 'x-telegram-bot-api-secret-token'
+
+HEALTH_PATH = '/health'
+READY_PATH = '/ready'
+
+# גבולות לבקשה - עדכון טלגרם הוא JSON קטן
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+REQUEST_TIMEOUT = 10.0  # שניות
+
+_REASONS = {
+    200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+    408: 'Request Timeout', 413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'
+}
+
+def _response(status: int, payload: Dict) -> bytes:
+    """תגובת HTTP/1.1 עם גוף JSON (החיבור נסגר אחרי כל בקשה)"""
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (
+        f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n"
+    )
+    return head.encode('latin-1') + body
+
+def _parse_head(head: bytes) -> Tuple[str, str, Dict[str, str]]:
+    """שורת הבקשה והכותרות - (method, path בלי query string, כותרות באותיות קטנות)"""
+    request_line, *header_lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+    method, target, _ = request_line.split(' ', 2)
+
+    headers = {}
+    for line in header_lines:
+        name, separator, value = line.partition(':')
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+
+    return method, target.split('?', 1)[0], headers
+
+class WebhookServer:
+    """מקבל עדכונים ב-POST ל-webhook_path (רק עם ה-secret token), /health - התהליך חי, /ready - בדיקות מוכנות"""
+
+    def __init__(self, host: str, port: int, webhook_path: str, secret_token: str,
+                 on_update: Callable[[Dict], Awaitable[None]],
+                 readiness: Callable[[], Awaitable[Dict[str, bool]]]):
+        self.host = host
+        self.port = port
+        self.webhook_path = webhook_path
+        self.secret_token = secret_token.encode('utf-8')
+        self.on_update = on_update
+        self.readiness = readiness
+
+        self._server = None
+
+        # מונים לניטור
+        self.updates_received = 0
+        self.requests_rejected = 0
+
+    async def start(self):
+        """פתיחת הפורט (port=0 - פורט פנוי, מתעדכן ב-self.port)"""
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"שרת webhook מאזין ב-{self.host}:{self.port} ({self.webhook_path}, {HEALTH_PATH}, {READY_PATH})")
+
+    async def stop(self):
+        """סגירת הפורט"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            logger.info("שרת webhook נסגר")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """בקשה אחת לחיבור - כל שגיאה הופכת לתגובת HTTP ולא מפילה את השרת"""
+        try:
+            status, payload = await asyncio.wait_for(self._handle_request(reader), REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            status, payload = 408, {'error': 'timeout'}
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            status, payload = 400, {'error': 'bad request'}
+        except Exception as e:
+            logger.error(f"שגיאה בטיפול בבקשת HTTP: {e}")
+            status, payload = 500, {'error': 'internal error'}
+
+        if status >= 400 and status != 503:
+            self.requests_rejected += 1
+
+        try:
+            writer.write(_response(status, payload))
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader: asyncio.StreamReader) -> Tuple[int, Dict]:
+        """ניתוב לפי נתיב - מחזיר (status, גוף JSON)"""
+        method, path, headers = _parse_head(await reader.readuntil(b'\r\n\r\n'))
+
+        if path == HEALTH_PATH:
+            return (200, {'status': 'ok'}) if method == 'GET' else (405, {'error': 'method not allowed'})
+
+        if path == READY_PATH:
+            return await self._ready() if method == 'GET' else (405, {'error': 'method not allowed'})
+
+        if path != self.webhook_path:
+            return 404, {'error': 'not found'}
+
+        if method != 'POST':
+            return 405, {'error': 'method not allowed'}
+
+        # השוואה בזמן קבוע - לפני קריאת הגוף
+        if not hmac.compare_digest(headers.get(SECRET_TOKEN_HEADER, '').encode('utf-8'), self.secret_token):
+            logger.warning("בקשת webhook עם secret token שגוי נדחתה")
+            return 403, {'error': 'forbidden'}
+
+        length = int(headers.get('content-length', '0'))
+        if length > MAX_BODY_BYTES:
+            return 413, {'error': 'payload too large'}
+
+        update = json.loads(await reader.readexactly(length))
+        if not isinstance(update, dict):
+            return 400, {'error': 'bad request'}
+
+        # שגיאה כאן מחזירה 500 - טלגרם ישלח את העדכון שוב
+        await self.on_update(update)
+        self.updates_received += 1
+
+        return 200, {'ok': True}
+
+    async def _ready(self) -> Tuple[int, Dict]:
+        """200 רק כשכל הבדיקות עוברות, אחרת 503 עם פירוט"""
+        try:
+            checks = await self.readiness()
+        except Exception as e:
+            logger.warning(f"בדיקת מוכנות נכשלה: {e}")
+            return 503, {'ready': False, 'error': str(e)}
+
+        ready = all(checks.values())
+        return (200 if ready else 503), {'ready': ready, 'checks': checks}